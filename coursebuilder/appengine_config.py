@@ -16,11 +16,13 @@
 
 __author__ = 'psimakov@google.com (Pavel Simakov)'
 
+import collections
 import datetime
 import importlib
 import logging
 import os
 import sys
+import time
 
 from common import manifests
 
@@ -168,6 +170,16 @@ def webapp_add_wsgi_middleware(app):
     return app
 
 
+# Seconds spent importing, registering and enabling each module, by name of
+# its main Python module, in the order the modules were loaded.
+_MODULE_STARTUP_TIMES = collections.OrderedDict()
+
+# Enabled modules whose manifests ask for lazy loading, by name of their main
+# Python module, and which of them have been loaded.
+_LAZY_MODULES = collections.OrderedDict()
+_LOADED_LAZY_MODULES = {}
+
+
 def _import_and_enable_modules(env_var, reraise=False):
     for module_name in os.environ.get(env_var, '').split():
         enabled = True
@@ -178,18 +190,83 @@ def _import_and_enable_modules(env_var, reraise=False):
 
 
 def _import_module_by_name(module_name, enabled, reraise=False):
+    times = _MODULE_STARTUP_TIMES.setdefault(
+        module_name, {'import': 0.0, 'register': 0.0, 'enable': 0.0})
+    custom_module = None
     try:
         operation = 'importing'
+        start = time.time()
         module = importlib.import_module(module_name)
+        times['import'] = time.time() - start
         operation = 'registering'
+        start = time.time()
         custom_module = module.register_module()
+        times['register'] = time.time() - start
         if enabled:
             operation = 'enabling'
+            start = time.time()
             custom_module.enable()
+            times['enable'] = time.time() - start
     except Exception, ex:  # pylint: disable=broad-except
         logging.exception('Problem %s module "%s"', operation, module_name)
         if reraise:
             raise ex
+    return custom_module
+
+
+def get_module_startup_times():
+    """Returns a list of (main module name, dict of seconds by phase).
+
+    Phases are 'import', 'register' and 'enable'. Modules are listed in the
+    order they were loaded. Libraries first imported by a module count
+    towards that module's import time.
+    """
+    return [(name, dict(times))
+            for name, times in _MODULE_STARTUP_TIMES.iteritems()]
+
+
+def log_module_startup_times(limit=10):
+    """Logs total module startup time and the slowest modules."""
+    times = sorted(
+        get_module_startup_times(),
+        key=lambda item: sum(item[1].values()), reverse=True)
+    total = sum(sum(phases.values()) for _, phases in times)
+    logging.info(
+        'Loaded %d modules in %dms; %d lazy modules not yet loaded.',
+        len(times), total * 1000,
+        len(_LAZY_MODULES) - len(_LOADED_LAZY_MODULES))
+    for name, phases in times[:limit]:
+        logging.info(
+            '  %s: %dms (import %dms, register %dms, enable %dms)', name,
+            sum(phases.values()) * 1000, phases['import'] * 1000,
+            phases['register'] * 1000, phases['enable'] * 1000)
+
+
+def get_lazy_modules():
+    """Returns a list of (main module name, list of global routes)."""
+    return _LAZY_MODULES.items()
+
+
+def import_lazy_module(module_name):
+    """Imports, registers and enables a lazy module, once.
+
+    Args:
+        module_name: string. The name of the main Python module of an enabled
+            module whose manifest asks for lazy loading.
+    Returns:
+        The custom_modules.Module registered by the module.
+    Raises:
+        ValueError: module_name does not name an enabled lazy module.
+    """
+    if module_name not in _LAZY_MODULES:
+        raise ValueError('Not an enabled lazy module: %s' % module_name)
+    if module_name not in _LOADED_LAZY_MODULES:
+        _LOADED_LAZY_MODULES[module_name] = _import_module_by_name(
+            module_name, True, reraise=True)
+        logging.info(
+            'Loaded lazy module %s in %dms.', module_name,
+            sum(_MODULE_STARTUP_TIMES[module_name].values()) * 1000)
+    return _LOADED_LAZY_MODULES[module_name]
 
 
 def _import_and_enable_modules_by_manifest():
@@ -200,6 +277,13 @@ def _import_and_enable_modules_by_manifest():
             enabled = (
                 registration.enabled or
                 (registration.enabled_for_tests and gcb_test_mode()))
+            if registration.lazy:
+                # Neither imported nor registered until a request needs it,
+                # or at all if disabled.
+                if enabled:
+                    _LAZY_MODULES[registration.main_module] = list(
+                        registration.global_routes or [])
+                continue
             _import_module_by_name(registration.main_module, enabled)
 
 
@@ -211,6 +295,7 @@ def import_and_enable_modules():
     _import_and_enable_modules('GCB_THIRD_PARTY_MODULES')
     _import_and_enable_modules_by_manifest()
     MODULE_REGISTRATION_IN_PROGRESS = False
+    log_module_startup_times()
 
 
 def time_delta_to_millis(delta):
@@ -22,7 +22,9 @@ import datetime
 import logging
 import sys
 import threading
+import types
 import unittest
+import weakref
 
 import appengine_config
 from models.counters import PerfCounter
@@ -125,12 +127,85 @@ class RequestScopedSingleton(AbstractScopedSingleton):
     CONTAINER = _request_scoped_singleton.__dict__
 
 
+# Upper bound on the number of objects get_deep_size() visits for one value.
+DEEP_SIZE_MAX_OBJECTS = 10000
+
+# Objects that are shared rather than owned by a cached value; their size is
+# not attributed to it.
+_DEEP_SIZE_SHARED_TYPES = (
+    type, types.ClassType, types.ModuleType, types.FunctionType,
+    types.BuiltinFunctionType, types.MethodType)
+_DEEP_SIZE_ATOMIC_TYPES = (basestring, int, long, float, bool, bytearray,
+                           type(None), datetime.datetime, datetime.date)
+
+# Named LRUCache instances, for memory reporting.
+_NAMED_LRU_CACHES = weakref.WeakValueDictionary()
+
+
+def get_deep_size(value, max_objects=DEEP_SIZE_MAX_OBJECTS):
+    """Estimates the bytes held by a value and everything it references.
+
+    Walks containers and instance attributes, counting each object once.
+    Classes, modules and functions are shared with the rest of the process
+    and are not counted.  The walk stops after max_objects objects, so very
+    large values are underestimated rather than walked without bound.
+
+    Args:
+        value: object. The value to measure.
+        max_objects: int. The maximum number of objects to visit.
+    Returns:
+        int. Estimated size in bytes.
+    """
+    total = 0
+    seen = set()
+    pending = [value]
+    while pending and len(seen) < max_objects:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, _DEEP_SIZE_SHARED_TYPES):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item, 0)
+        if isinstance(item, _DEEP_SIZE_ATOMIC_TYPES):
+            continue
+        if isinstance(item, dict):
+            pending.extend(item.iterkeys())
+            pending.extend(item.itervalues())
+        elif isinstance(item, (list, tuple, set, frozenset, collections.deque)):
+            pending.extend(item)
+        if hasattr(item, '__dict__'):
+            pending.append(item.__dict__)
+        for slot in getattr(type(item), '__slots__', ()):
+            if hasattr(item, slot):
+                pending.append(getattr(item, slot))
+    return total
+
+
+def get_lru_cache_stats():
+    """Returns a list of usage statistics dicts for all named LRU caches."""
+    stats = []
+    for name, cache in sorted(_NAMED_LRU_CACHES.items()):
+        stats.append({
+            'name': name,
+            'items': len(cache.items),
+            'size_bytes': cache.total_size,
+            'max_size_bytes': cache.max_size_bytes,
+            'puts': cache.put_count,
+            'hits': cache.hit_count,
+            'misses': cache.miss_count,
+            'evictions': cache.eviction_count,
+            'eviction_rate': (
+                float(cache.eviction_count) / cache.put_count
+                if cache.put_count else 0.0),
+        })
+    return stats
+
+
 class LRUCache(object):
     """A dict that supports capped size and LRU eviction of items."""
 
     def __init__(
         self, max_item_count=None,
-        max_size_bytes=None, max_item_size_bytes=None):
+        max_size_bytes=None, max_item_size_bytes=None, name=None):
         assert max_item_count or max_size_bytes
         if max_item_count:
             assert max_item_count > 0
@@ -141,22 +216,37 @@ class LRUCache(object):
         self.max_size_bytes = max_size_bytes
         self.max_item_size_bytes = max_item_size_bytes
         self.items = collections.OrderedDict([])
+        # Sizes are computed once, when an item is put, and remembered so
+        # that evicting or replacing an item does not walk it again.
+        self.entry_sizes = {}
+        self.put_count = 0
+        self.hit_count = 0
+        self.miss_count = 0
+        self.eviction_count = 0
+        if name:
+            _NAMED_LRU_CACHES[name] = self
 
     def get_entry_size(self, key, value):
         """Computes item size. Override and compute properly for your items."""
-        return sys.getsizeof(key) + sys.getsizeof(value)
+        return sys.getsizeof(key) + get_deep_size(value)
 
     def _compute_current_size(self):
-        total = 0
-        for key, item in self.items.iteritems():
-            total += sys.getsizeof(key) + self.get_item_size(item)
-        return total
+        return sum(self.entry_sizes.itervalues())
+
+    def _remove(self, key):
+        del self.items[key]
+        self.total_size -= self.entry_sizes.pop(key)
+        assert self.total_size >= 0
 
     def _allocate_space(self, key, value):
-        """Remove items in FIFO order until size constraints are met."""
+        """Remove items in FIFO order until size constraints are met.
+
+        Returns:
+            The size of the new entry, or None if it does not fit.
+        """
         entry_size = self.get_entry_size(key, value)
         if self.max_item_size_bytes and entry_size > self.max_item_size_bytes:
-            return False
+            return None
         while True:
             over_count = False
             over_size = False
@@ -165,18 +255,13 @@ class LRUCache(object):
             if self.max_size_bytes:
                 over_size = self.total_size + entry_size >= self.max_size_bytes
             if not (over_count or over_size):
-                if self.max_size_bytes:
-                    self.total_size += entry_size
-                    assert self.total_size < self.max_size_bytes
-                return True
+                return entry_size
             if self.items:
-                _key, _value = self.items.popitem(last=False)
-                if self.max_size_bytes:
-                    self.total_size -= self.get_entry_size(_key, _value)
-                    assert self.total_size >= 0
+                self._remove(next(iter(self.items)))
+                self.eviction_count += 1
             else:
                 break
-        return False
+        return None
 
     def _record_access(self, key):
         """Pop and re-add the item."""
@@ -190,23 +275,33 @@ class LRUCache(object):
 
     def put(self, key, value):
         assert key
-        if self._allocate_space(key, value):
-            self.items[key] = value
-            return True
-        return False
+        self.put_count += 1
+        if key in self.items:
+            self._remove(key)
+        entry_size = self._allocate_space(key, value)
+        if entry_size is None:
+            return False
+        self.items[key] = value
+        self.entry_sizes[key] = entry_size
+        self.total_size += entry_size
+        if self.max_size_bytes:
+            assert self.total_size < self.max_size_bytes
+        return True
 
     def get(self, key):
         """Accessing item makes it less likely to be evicted."""
         assert key
         if key in self.items:
+            self.hit_count += 1
             self._record_access(key)
             return True, self.items[key]
+        self.miss_count += 1
         return False, None
 
     def delete(self, key):
         assert key
         if key in self.items:
-            del self.items[key]
+            self._remove(key)
             return True
         return False
 
@@ -488,6 +583,52 @@ class LRUCacheTests(unittest.TestCase):
         found, _ = cache.get('a')
         self.assertTrue(found)
 
+    def test_size_is_deep(self):
+        cache = LRUCache(max_item_count=3)
+        value = {'a': ['x' * 1000, 'y' * 1000]}
+        self.assertTrue(cache.put('a', value))
+        self.assertGreater(cache.total_size, 2000)
+        self.assertEquals(
+            cache.total_size, sys.getsizeof('a') + get_deep_size(value))
+
+    def test_deep_size_counts_shared_objects_once(self):
+        item = 'x' * 1000
+        self.assertEquals(
+            sys.getsizeof([item, item]) + sys.getsizeof(item),
+            get_deep_size([item, item]))
+
+    def test_deep_size_is_bounded(self):
+        value = [[i] for i in xrange(100)]
+        self.assertLess(
+            get_deep_size(value, max_objects=10), get_deep_size(value))
+
+    def test_size_accounting_on_delete_and_replace(self):
+        cache = LRUCache(max_size_bytes=50000)
+        self.assertTrue(cache.put('a', 'x' * 1000))
+        self.assertTrue(cache.put('b', 'y' * 2000))
+        self.assertTrue(cache.put('a', 'z' * 10))
+        self.assertEquals(cache._compute_current_size(), cache.total_size)
+        self.assertTrue(cache.delete('b'))
+        self.assertEquals(
+            sys.getsizeof('a') + sys.getsizeof('z' * 10), cache.total_size)
+        self.assertTrue(cache.delete('a'))
+        self.assertEquals(0, cache.total_size)
+
+    def test_stats(self):
+        cache = LRUCache(max_item_count=1, name='test_stats')
+        cache.put('a', '1')
+        cache.put('b', '2')
+        cache.get('a')
+        cache.get('b')
+        stats = [item for item in get_lru_cache_stats()
+                 if item['name'] == 'test_stats'][0]
+        self.assertEquals(1, stats['items'])
+        self.assertEquals(2, stats['puts'])
+        self.assertEquals(1, stats['hits'])
+        self.assertEquals(1, stats['misses'])
+        self.assertEquals(1, stats['evictions'])
+        self.assertEquals(0.5, stats['eviction_rate'])
+
 
 class SingletonTests(unittest.TestCase):
 
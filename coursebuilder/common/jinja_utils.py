@@ -16,7 +16,6 @@
 
 __author__ = 'John Orr (jorr@google.com)'
 
-import sys
 import traceback
 import jinja2
 import safe_dom
@@ -116,11 +115,7 @@ class ProcessScopedJinjaCache(caching.ProcessScopedSingleton):
 
     def __init__(self):
         self.cache = caching.LRUCache(
-            max_size_bytes=MAX_GLOBAL_CACHE_SIZE_BYTES)
-        self.cache.get_entry_size = self._get_entry_size
-
-    def _get_entry_size(self, key, value):
-        return sys.getsizeof(key) + sys.getsizeof(value)
+            max_size_bytes=MAX_GLOBAL_CACHE_SIZE_BYTES, name='jinja')
 
 
 class JinjaBytecodeCache(jinja2.BytecodeCache):
@@ -49,6 +49,13 @@ class ModuleManifest(object):
         registration.add_property(schema_fields.SchemaField(
             'enabled_for_tests', 'Is Enabled When Running Tests', 'bool',
             optional=True, default_value=False))
+        registration.add_property(schema_fields.SchemaField(
+            'lazy', 'Is Imported On First Request', 'bool', optional=True,
+            default_value=False))
+        registration.add_property(schema_fields.FieldArray(
+            'global_routes', 'Global routes served before import',
+            item_type=schema_fields.SchemaField('route', 'Route', 'string'),
+            optional=True))
 
         self.files = schema_fields.FieldArray(
             'files', 'Module files',
@@ -331,17 +331,25 @@ class Registry(object):
     """A class that holds all dynamically registered tags."""
 
     _bindings = {}
+    _version = 0
 
     @classmethod
     def add_tag_binding(cls, tag_name, clazz):
         """Registers a tag name to class binding."""
         cls._bindings[tag_name] = clazz
+        cls._version += 1
 
     @classmethod
     def remove_tag_binding(cls, tag_name):
         """Unregisters a tag binding."""
         if tag_name in cls._bindings:
             del cls._bindings[tag_name]
+            cls._version += 1
+
+    @classmethod
+    def get_version(cls):
+        """Returns a number that changes whenever the bindings change."""
+        return cls._version
 
     @classmethod
     def get_all_tags(cls):
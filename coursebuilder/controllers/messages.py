@@ -23,3 +23,10 @@ SITE_SETTINGS_DEBUG_INFORMATION = """
 If "True", debugging information is available in the web pages. This may be
 useful if you develop custom Course Builder features or extensions.
 """
+
+SITE_SETTINGS_ALL_COURSES_CRON_FAN_OUT = """
+If "True", cron jobs that do work for every course run that work in a
+separate task for each course, several courses at a time, instead of one
+course after another within the cron request. Enable this on installations
+with many courses where these cron jobs run out of time.
+"""
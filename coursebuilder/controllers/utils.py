@@ -56,6 +56,8 @@ from models.models import StudentProfileDAO
 from models.models import TransientStudent
 from models.roles import Roles
 
+from google.appengine.ext import deferred
+
 # The name of the template dict key that stores a course's base location.
 COURSE_BASE_KEY = 'gcb_course_base'
 
@@ -94,6 +96,12 @@ ConfigProperty(
     'suppress warnings about unknown legacy settings.  Replaced by per-course '
     'setting Enable Student Analytics.', deprecated=True)
 
+# Whether AbstractAllCoursesCronHandler runs each course in its own task.
+CAN_FAN_OUT_ALL_COURSES_CRON = ConfigProperty(
+    'gcb_can_fan_out_all_courses_cron', bool,
+    messages.SITE_SETTINGS_ALL_COURSES_CRON_FAN_OUT, False,
+    label='Run Course Cron Jobs In Parallel')
+
 # Date format string for displaying datetimes in UTC.
 # Example: 2013-03-21 13:00 UTC
 HUMAN_READABLE_DATETIME_FORMAT = '%Y-%m-%d, %H:%M UTC'
@@ -492,8 +500,25 @@ class AbstractAllCoursesCronHandler(CronHandler):
 
     Use by extending is_globally_enabled(), is_enabled_for_course() and
     putting the business logic in cron_action().
+
+    When CAN_FAN_OUT_ALL_COURSES_CRON is set, the cron request only enqueues
+    a deferred task per enabled course on FAN_OUT_QUEUE_NAME, whose
+    max_concurrent_requests in queue.yaml bounds how many courses are worked
+    on at once.  A failing task is retried by the queue up to MAX_ATTEMPTS
+    times.  In this mode the value returned by global_setup() is pickled into
+    each task, so it must be picklable.  Handlers whose cron_action() cannot
+    run in a task set CAN_FAN_OUT to False.
+
+    In either mode, derived classes may extend get_course_state_version() to
+    let courses whose relevant state is unchanged since their last successful
+    run be skipped.  The outcome for each course is recorded in a
+    jobs.CronCourseStatusEntity; see get_run_summary().
     """
 
+    CAN_FAN_OUT = True
+    FAN_OUT_QUEUE_NAME = 'all-courses-cron'
+    MAX_ATTEMPTS = 3
+
     @classmethod
     def is_globally_enabled(cls):
         """Derived classes tell base class whether feature is enabled."""
@@ -512,6 +537,25 @@ class AbstractAllCoursesCronHandler(CronHandler):
         """Do work for courses where is_enabled_for_course() returned true."""
         raise NotImplementedError()
 
+    @classmethod
+    def get_course_state_version(cls, app_context):
+        """Summarizes the course state that cron_action() depends on.
+
+        Called in the course's namespace.  If this returns the same string as
+        it did before the course's last successful cron_action(), the course
+        is skipped.
+
+        Returns:
+            A string, or None to always run cron_action() for the course.
+        """
+        return None
+
+    @classmethod
+    def get_run_summary(cls, run_id):
+        """Returns a dict of outcome -> number of courses for one run."""
+        return jobs.CronCourseStatusEntity.get_run_summary(
+            cls.__name__, run_id)
+
     def get(self):
         # Allow AppEngine owner to manually force cron jobs to run, but
         # otherwise insist that we are being run from AppEngine's cron engine.
@@ -533,12 +577,18 @@ class AbstractAllCoursesCronHandler(CronHandler):
 
         if self.is_globally_enabled():
             global_state = self.global_setup()
+            run_id = datetime.datetime.utcnow().isoformat()
+            fan_out = self.CAN_FAN_OUT and CAN_FAN_OUT_ALL_COURSES_CRON.value
             for app_context in sites.get_all_courses():
                 if self.is_enabled_for_course(app_context):
                     namespace = app_context.get_namespace_name()
+                    if fan_out:
+                        self._enqueue_course(namespace, global_state, run_id)
+                        continue
                     with common_utils.Namespace(namespace):
                         try:
-                            self.cron_action(app_context, global_state)
+                            self._run_course(
+                                app_context, global_state, run_id)
                         except Exception, ex:  # pylint: disable=broad-except
                             logging.critical(
                                 'Cron handler %s for course %s: %s',
@@ -556,6 +606,83 @@ class AbstractAllCoursesCronHandler(CronHandler):
             self.response.write('Disabled.')
         self.response.set_status(200)
 
+    def _enqueue_course(self, namespace, global_state, run_id):
+        status = jobs.CronCourseStatusEntity.get_or_new(
+            self.__class__.__name__, namespace)
+        status.run_id = run_id
+        status.outcome = jobs.CronCourseStatusEntity.OUTCOME_QUEUED
+        status.attempts = 0
+        status.error = None
+        status.save()
+        deferred.defer(
+            _run_all_courses_cron_task, self.__class__, namespace,
+            global_state, run_id, _queue=self.FAN_OUT_QUEUE_NAME)
+
+    def _run_course(self, app_context, global_state, run_id):
+        """Runs cron_action() unless the course is unchanged; records outcome.
+
+        Must be called in the course's namespace.  Exceptions from
+        cron_action() are recorded and then re-raised.
+        """
+        status = jobs.CronCourseStatusEntity.get_or_new(
+            self.__class__.__name__, app_context.get_namespace_name())
+        if status.run_id != run_id:
+            status.run_id = run_id
+            status.attempts = 0
+        status.attempts += 1
+
+        state_version = self.get_course_state_version(app_context)
+        if (state_version is not None and status.succeeded_on and
+            state_version == status.state_version):
+            logging.info(
+                'Skipping cron handler %s for course %s; unchanged since %s',
+                self.__class__.__name__, app_context.get_slug(),
+                status.succeeded_on)
+            status.outcome = jobs.CronCourseStatusEntity.OUTCOME_UNCHANGED
+            status.save()
+            return
+
+        try:
+            self.cron_action(app_context, global_state)
+        except Exception, ex:  # pylint: disable=broad-except
+            status.outcome = jobs.CronCourseStatusEntity.OUTCOME_FAILED
+            status.error = str(ex)
+            status.save()
+            raise
+
+        status.outcome = jobs.CronCourseStatusEntity.OUTCOME_SUCCEEDED
+        status.error = None
+        status.state_version = state_version
+        status.succeeded_on = datetime.datetime.utcnow()
+        status.save()
+
+
+def _run_all_courses_cron_task(handler_class, namespace, global_state, run_id):
+    """Deferred task running one course's AbstractAllCoursesCronHandler work."""
+    app_context = sites.get_app_context_for_namespace(namespace)
+    if not app_context:
+        logging.warning(
+            'Cron handler %s: no course for namespace "%s"',
+            handler_class.__name__, namespace)
+        return
+
+    handler = handler_class()
+    handler.response = webapp2.Response()
+    with common_utils.Namespace(namespace):
+        try:
+            # pylint: disable=protected-access
+            handler._run_course(app_context, global_state, run_id)
+        except Exception, ex:  # pylint: disable=broad-except
+            logging.critical(
+                'Cron handler %s for course %s: %s', handler_class.__name__,
+                app_context.get_slug(), str(ex))
+            common_utils.log_exception_origin()
+            status = jobs.CronCourseStatusEntity.get_or_new(
+                handler_class.__name__, namespace)
+            if status.attempts >= handler_class.MAX_ATTEMPTS:
+                raise deferred.PermanentTaskFailure(str(ex))
+            raise
+
 
 class ApplicationHandler(webapp2.RequestHandler):
     """A handler that is aware of the application context."""
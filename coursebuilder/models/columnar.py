@@ -0,0 +1,342 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Typed, compressed, columnar files of rows described by a JSON schema.
+
+The layout follows Parquet's, in pure Python so that it works both in the App
+Engine container and in tools. Rows are buffered into row groups; when a row
+group is full, each of its columns is encoded by type and compressed on its
+own, and the chunks are appended to the file. A footer at the end lists the
+columns, and for each row group the row count and the position and encoding
+of each column chunk. Readers can so fetch only the columns they need.
+
+    MAGIC
+    row group 0: chunk of column 0, chunk of column 1, ...
+    row group 1: ...
+    footer: zlib-compressed JSON
+    footer length: 4 bytes, little-endian
+    MAGIC
+
+Each chunk holds a bitmap of which rows have a non-null value, followed by
+the non-null values. How values are encoded depends on the column's schema
+type: 'integer' as 64-bit integers, 'number' as doubles, 'boolean' as bytes
+and other scalars as UTF-8 strings. Arrays, objects and any chunk whose values
+do not match the column's type are stored as JSON strings.
+
+Usage:
+
+    writer = ColumnarWriter(open('path', 'wb'), schema['properties'])
+    for row in rows:
+        writer.write(row)  # A dict; keys that are not columns are ignored.
+    writer.close()
+    reader = ColumnarReader(open('path', 'rb'))
+    for value in reader.iter_column('score'):  # Reads only that column.
+        do_something_with(value)
+    for row in reader.iter_rows():
+        do_something_with(row)
+"""
+
+import array
+import struct
+import zlib
+
+from models import transforms
+
+# Bytes at the start and end of every columnar file.
+MAGIC = 'GCBC'
+
+# Default number of rows buffered per row group.
+DEFAULT_ROW_GROUP_ROWS = 5000
+
+# File name suffix for columnar files.
+SUFFIX = '.columnar'
+
+# String. MIME type of columnar files.
+CONTENT_TYPE = 'application/x-gcb-columnar'
+
+_ENCODING_BOOLEAN = 'boolean'
+_ENCODING_FLOAT64 = 'float64'
+_ENCODING_INT64 = 'int64'
+_ENCODING_JSON = 'json'
+_ENCODING_UTF8 = 'utf8'
+
+_ENCODINGS_BY_TYPE = {
+    'boolean': _ENCODING_BOOLEAN,
+    'date': _ENCODING_UTF8,
+    'datetime': _ENCODING_UTF8,
+    'html': _ENCODING_UTF8,
+    'integer': _ENCODING_INT64,
+    'number': _ENCODING_FLOAT64,
+    'string': _ENCODING_UTF8,
+    'text': _ENCODING_UTF8,
+    'timestamp': _ENCODING_INT64,
+    'url': _ENCODING_UTF8,
+}
+
+_FOOTER_LENGTH = struct.Struct('<I')
+_INT64_MIN = -(2 ** 63)
+_INT64_MAX = 2 ** 63 - 1
+_VERSION = 1
+
+
+class ColumnarFormatError(Exception):
+    """Raised when a file is not a readable columnar file."""
+
+
+def _pack(code, values):
+    return struct.pack('<%d%s' % (len(values), code), *values)
+
+
+def _unpack(code, data):
+    count = len(data) / struct.calcsize('<' + code)
+    return list(struct.unpack('<%d%s' % (count, code), data))
+
+
+def _is_int64(value):
+    return (isinstance(value, (int, long)) and not isinstance(value, bool) and
+            _INT64_MIN <= value <= _INT64_MAX)
+
+
+def _encode_values(encoding, values):
+    """Returns the bytes for non-null values, or None if they do not fit."""
+    if encoding == _ENCODING_INT64:
+        if all(_is_int64(v) for v in values):
+            return _pack('q', values)
+    elif encoding == _ENCODING_FLOAT64:
+        if all(isinstance(v, (int, long, float)) and not isinstance(v, bool)
+               for v in values):
+            return _pack('d', [float(v) for v in values])
+    elif encoding == _ENCODING_BOOLEAN:
+        if all(isinstance(v, bool) for v in values):
+            return ''.join('\x01' if v else '\x00' for v in values)
+    elif encoding == _ENCODING_UTF8:
+        if all(isinstance(v, basestring) for v in values):
+            return _encode_strings(
+                [v.encode('utf-8') if isinstance(v, unicode) else v
+                 for v in values])
+    elif encoding == _ENCODING_JSON:
+        return _encode_strings([transforms.dumps(v) for v in values])
+    return None
+
+
+def _encode_strings(strings):
+    return _pack('I', [len(s) for s in strings]) + ''.join(strings)
+
+
+def _decode_values(encoding, data, count):
+    if encoding == _ENCODING_INT64:
+        return _unpack('q', data)
+    elif encoding == _ENCODING_FLOAT64:
+        return _unpack('d', data)
+    elif encoding == _ENCODING_BOOLEAN:
+        return [c == '\x01' for c in data]
+    strings = _decode_strings(data, count)
+    if encoding == _ENCODING_UTF8:
+        return [s.decode('utf-8') for s in strings]
+    elif encoding == _ENCODING_JSON:
+        return [transforms.loads(s) for s in strings]
+    raise ColumnarFormatError('Unknown column encoding %s.' % encoding)
+
+
+def _decode_strings(data, count):
+    lengths_size = count * struct.calcsize('<I')
+    lengths = _unpack('I', data[:lengths_size])
+    strings = []
+    position = lengths_size
+    for length in lengths:
+        strings.append(data[position:position + length])
+        position += length
+    return strings
+
+
+class ColumnarWriter(object):
+    """Writes rows to a file-like object, one row group at a time.
+
+    At most one row group of rows is held in memory. The file object is not
+    closed by close(); it need only support write().
+    """
+
+    def __init__(self, fileobj, schema_properties, metadata=None,
+                 row_group_rows=DEFAULT_ROW_GROUP_ROWS):
+        """Constructs a new writer.
+
+        Args:
+            fileobj: file-like object to write to.
+            schema_properties: dict. The 'properties' of a JSON schema as
+                produced by FieldRegistry.get_json_schema_dict(); each becomes
+                a column, in order.
+            metadata: JSON-serializable object stored in the footer.
+            row_group_rows: int. Number of rows per row group.
+        """
+        assert row_group_rows > 0
+        self._columns = [
+            {'name': name, 'type': prop.get('type')}
+            for name, prop in schema_properties.iteritems()]
+        self._closed = False
+        self._file = fileobj
+        self._metadata = metadata
+        self._num_rows = 0
+        self._position = len(MAGIC)
+        self._row_group_rows = row_group_rows
+        self._row_groups = []
+        self._rows = []
+        self._file.write(MAGIC)
+
+    @property
+    def num_rows(self):
+        return self._num_rows
+
+    def write(self, row):
+        """Adds a row; a dict from column name to JSON-compatible value."""
+        assert not self._closed
+        self._rows.append(row)
+        self._num_rows += 1
+        if len(self._rows) >= self._row_group_rows:
+            self._flush_row_group()
+
+    def close(self):
+        """Writes any buffered rows and the footer."""
+        if self._closed:
+            return
+        self._flush_row_group()
+        footer = zlib.compress(transforms.dumps({
+            'columns': self._columns,
+            'metadata': self._metadata,
+            'num_rows': self._num_rows,
+            'row_groups': self._row_groups,
+            'version': _VERSION,
+        }))
+        self._file.write(footer)
+        self._file.write(_FOOTER_LENGTH.pack(len(footer)))
+        self._file.write(MAGIC)
+        self._closed = True
+
+    def _flush_row_group(self):
+        if not self._rows:
+            return
+        chunks = []
+        for column in self._columns:
+            data, encoding = self._encode_column(column)
+            self._file.write(data)
+            chunks.append({
+                'encoding': encoding,
+                'length': len(data),
+                'offset': self._position})
+            self._position += len(data)
+        self._row_groups.append({'chunks': chunks, 'rows': len(self._rows)})
+        self._rows = []
+
+    def _encode_column(self, column):
+        name = column['name']
+        values = [row.get(name) for row in self._rows]
+        bitmap = array.array('B', [0] * ((len(values) + 7) / 8))
+        present = []
+        for index, value in enumerate(values):
+            if value is not None:
+                bitmap[index / 8] |= 1 << (index % 8)
+                present.append(value)
+        encoding = _ENCODINGS_BY_TYPE.get(column['type'], _ENCODING_JSON)
+        encoded = _encode_values(encoding, present)
+        if encoded is None:
+            encoding = _ENCODING_JSON
+            encoded = _encode_values(encoding, present)
+        return zlib.compress(bitmap.tostring() + encoded), encoding
+
+
+class ColumnarReader(object):
+    """Reads a columnar file from a seekable file-like object."""
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._file.seek(0, 2)
+        size = self._file.tell()
+        trailer_size = _FOOTER_LENGTH.size + len(MAGIC)
+        if size < len(MAGIC) + trailer_size:
+            raise ColumnarFormatError('File is too short.')
+        self._file.seek(0)
+        head = self._file.read(len(MAGIC))
+        self._file.seek(size - trailer_size)
+        trailer = self._file.read(trailer_size)
+        if head != MAGIC or trailer[_FOOTER_LENGTH.size:] != MAGIC:
+            raise ColumnarFormatError('Not a columnar file.')
+        footer_length, = _FOOTER_LENGTH.unpack(trailer[:_FOOTER_LENGTH.size])
+        self._file.seek(size - trailer_size - footer_length)
+        footer = transforms.loads(
+            zlib.decompress(self._file.read(footer_length)))
+        if footer['version'] != _VERSION:
+            raise ColumnarFormatError(
+                'Unsupported version %s.' % footer['version'])
+        self._footer = footer
+        self._column_indexes = dict(
+            (column['name'], index)
+            for index, column in enumerate(footer['columns']))
+
+    @property
+    def column_names(self):
+        return [column['name'] for column in self._footer['columns']]
+
+    @property
+    def metadata(self):
+        return self._footer['metadata']
+
+    @property
+    def num_rows(self):
+        return self._footer['num_rows']
+
+    def get_schema_properties(self):
+        """Returns the column names and types as JSON schema properties."""
+        return dict(
+            (column['name'], {'type': column['type']})
+            for column in self._footer['columns'])
+
+    def iter_column(self, name, skip=0):
+        """Yields the values of one column, reading only its chunks."""
+        index = self._column_indexes[name]
+        for row_group, skip in self._iter_row_groups(skip):
+            values = self._read_chunk(row_group, index)
+            for value in values[skip:]:
+                yield value
+
+    def iter_rows(self, skip=0):
+        """Yields rows as dicts, after skipping the first skip rows."""
+        names = self.column_names
+        for row_group, skip in self._iter_row_groups(skip):
+            columns = [
+                self._read_chunk(row_group, index)
+                for index in xrange(len(names))]
+            for row_index in xrange(skip, row_group['rows']):
+                yield dict(
+                    (name, column[row_index])
+                    for name, column in zip(names, columns))
+
+    def _iter_row_groups(self, skip):
+        for row_group in self._footer['row_groups']:
+            if skip >= row_group['rows']:
+                skip -= row_group['rows']
+                continue
+            yield row_group, skip
+            skip = 0
+
+    def _read_chunk(self, row_group, index):
+        chunk = row_group['chunks'][index]
+        self._file.seek(chunk['offset'])
+        data = zlib.decompress(self._file.read(chunk['length']))
+        num_rows = row_group['rows']
+        bitmap_size = (num_rows + 7) / 8
+        bitmap = array.array('B', data[:bitmap_size])
+        present = [
+            bool(bitmap[i / 8] & (1 << (i % 8))) for i in xrange(num_rows)]
+        values = iter(_decode_values(
+            chunk['encoding'], data[bitmap_size:], sum(present)))
+        return [next(values) if is_present else None for is_present in present]
@@ -25,6 +25,7 @@ import pickle
 import re
 import sys
 import threading
+import time
 import custom_units
 
 import messages
@@ -37,6 +38,7 @@ import vfs
 import yaml
 
 import appengine_config
+from common import caching
 from common import locales
 from common import safe_dom
 from common import schema_fields
@@ -128,6 +130,40 @@ def deep_dict_merge(*args):
     _deep_merge(result, default_values_dict)
     return result
 
+
+class _EnvironCopy(dict):
+    """A full copy of a course environ that shares only immutable values.
+
+    Nested dicts are copied into _EnvironCopy and other mutable values are
+    deep-copied, so nothing done to the copy reaches the environ it was made
+    from. Strings and numbers, most of an environ, are shared rather than
+    visited by copy.deepcopy(), which makes this the cheaper of the two.
+    """
+
+    _IMMUTABLE_TYPES = (basestring, bool, int, long, float, type(None))
+
+    def __init__(self, base):
+        super(_EnvironCopy, self).__init__()
+        for key, value in base.iteritems():
+            if isinstance(value, dict):
+                value = _EnvironCopy(value)
+            elif not isinstance(value, self._IMMUTABLE_TYPES):
+                value = copy.deepcopy(value)
+            dict.__setitem__(self, key, value)
+
+    def copy(self):
+        return _EnvironCopy(self)
+
+    def __reduce__(self):
+        # Pickles and deep copies are plain dicts, like the base.
+        return dict, (dict(self),)
+
+
+for _dumper in (yaml.Dumper, yaml.SafeDumper):
+    yaml.add_representer(
+        _EnvironCopy, yaml.representer.SafeRepresenter.represent_dict,
+        Dumper=_dumper)
+
 # The template dict for all courses
 yaml_path = os.path.join(appengine_config.BUNDLE_ROOT, 'course_template.yaml')
 with open(yaml_path) as course_template_yaml:
@@ -194,6 +230,9 @@ REVIEW_WINDOW_MINS_KEY = 'review_window_mins'
 DEFAULT_REVIEW_MIN_COUNT = 2
 DEFAULT_REVIEW_WINDOW_MINS = 60
 
+# Bytes of parsed workflows kept in the process-wide cache.
+MAX_WORKFLOW_CACHE_SIZE_BYTES = 1024 * 1024
+
 # Keys specific to human-graded assessments.
 HUMAN_GRADED_ASSESSMENT_KEY_LIST = [
     MATCHER_KEY, REVIEW_MIN_COUNT_KEY, REVIEW_WINDOW_MINS_KEY,
@@ -569,7 +608,7 @@ class Unit12(object):
     @property
     def workflow(self):
         """Returns the workflow as an object."""
-        return Workflow(self.workflow_yaml)
+        return Workflow.get_cached(self.workflow_yaml)
 
     @property
     def pre_assessment(self):
@@ -787,6 +826,10 @@ class CourseModel12(object):
     def get_lessons(self, unit_id):
         return self._unit_id_to_lessons.get(str(unit_id), [])
 
+    def get_content_version(self):
+        # Version 1.2 courses are read only; they change only on deployment.
+        return self.VERSION
+
     def find_unit_by_id(self, unit_id):
         """Finds a unit given its id."""
         for unit in self._units:
@@ -956,8 +999,7 @@ class Unit13(object):
     def workflow(self):
         """Returns the workflow as an object."""
         assert self.is_assessment() or self.is_custom_unit()
-        workflow = Workflow(self.workflow_yaml)
-        return workflow
+        return Workflow.get_cached(self.workflow_yaml)
 
     @property
     def custom_unit_url(self):
@@ -1240,6 +1282,9 @@ class CourseModel13(object):
 
     VERSION = COURSE_MODEL_VERSION_1_3
 
+    # Memcache key, in the course namespace, of the content version stamp.
+    _CONTENT_VERSION_KEY = 'course-content-version'
+
     @classmethod
     def load(cls, app_context):
         """Loads course from memcache or persistence."""
@@ -1348,6 +1393,30 @@ class CourseModel13(object):
         """Checks if course object has been modified and needs to be saved."""
         return self._dirty_units or self._dirty_lessons
 
+    def get_content_version(self):
+        """Returns a stamp that changes whenever the course is saved.
+
+        Returns None if this object has unsaved changes, or if memcache is
+        disabled.
+        """
+        if (self._dirty_units or self._dirty_lessons or
+            self._deleted_units or self._deleted_lessons):
+            return None
+        version = MemcacheManager.get(
+            self._CONTENT_VERSION_KEY,
+            namespace=self._app_context.get_namespace_name())
+        if version is None:
+            version = self._bump_content_version()
+        return version
+
+    def _bump_content_version(self):
+        # Starts from the clock, like BaseJsonDao._invalidate_all_mapped(), so
+        # that an evicted stamp does not come back with an old value.
+        return MemcacheManager.incr(
+            self._CONTENT_VERSION_KEY, 1,
+            namespace=self._app_context.get_namespace_name(),
+            initial_value=int(time.time() * 1000 * 1000))
+
     def _is_unit_or_lesson_available(self, unit_or_lesson):
         if unit_or_lesson.availability == AVAILABILITY_AVAILABLE:
             return True
@@ -1477,6 +1546,7 @@ class CourseModel13(object):
         self._index()
         PersistentCourse13.save(self._app_context, self)
         CachedCourse13.delete(self._app_context)
+        self._bump_content_version()
 
     def get_units(self):
         return self._units[:]
@@ -1625,6 +1695,7 @@ class CourseModel13(object):
             self._app_context.fs.impl.delete(entity)
         assert not self._app_context.fs.impl.list(appengine_config.BUNDLE_ROOT)
         CachedCourse13.delete(self._app_context)
+        self._bump_content_version()
 
     def delete_lesson(self, lesson):
         """Delete a lesson."""
@@ -2191,59 +2262,114 @@ class CourseModel13(object):
             default=lambda o: o.__dict__)
 
 
+class ProcessScopedWorkflowCache(caching.ProcessScopedSingleton):
+    """This class holds in-process cache of parsed Workflow objects."""
+
+    def __init__(self):
+        self.cache = caching.LRUCache(
+            max_size_bytes=MAX_WORKFLOW_CACHE_SIZE_BYTES, name='workflows')
+
+
 class Workflow(object):
     """Stores workflow specifications for assessments."""
 
+    # Workflow keys whose values are dates; these are parsed along with the
+    # YAML text.
+    _DATE_KEYS = (SUBMISSION_DUE_DATE_KEY, REVIEW_DUE_DATE_KEY)
+
     def __init__(self, yaml_str):
         """Sets yaml_str (the workflow spec), without doing any validation."""
         self._yaml_str = yaml_str
+        self._dict = None
+        self._dates = None
+
+    @classmethod
+    def get_cached(cls, yaml_str):
+        """Returns a Workflow for yaml_str shared by everyone in the process.
+
+        Workflows are keyed by their YAML text, so a course version reuses
+        the same parsed objects until an edit changes the text. Callers must
+        not modify the returned object.
+
+        Args:
+            yaml_str: string. The workflow spec.
+        Returns:
+            A Workflow.
+        """
+        if not yaml_str:
+            return cls(yaml_str)
+        cache = ProcessScopedWorkflowCache.instance().cache
+        found, workflow = cache.get(yaml_str)
+        if not found:
+            workflow = cls(yaml_str)
+            workflow._parse()  # pylint: disable=protected-access
+            cache.put(yaml_str, workflow)
+        return workflow
 
     def to_yaml(self):
         return self._yaml_str
 
-    def to_dict(self):
+    def _parse(self):
+        """Parses the YAML text and its dates once, on first use."""
+        if self._dict is not None:
+            return self._dict
         if not self._yaml_str:
-            return {}
-        obj = yaml.safe_load(self._yaml_str)
-        assert isinstance(obj, dict)
+            obj = {}
+        else:
+            obj = yaml.safe_load(self._yaml_str)
+            assert isinstance(obj, dict)
+        dates = {}
+        for key in self._DATE_KEYS:
+            try:
+                dates[key] = self._convert_date_string_to_datetime(
+                    obj.get(key))
+            except (TypeError, ValueError):
+                pass  # The getter raises it; validate() reports it on save.
+        self._dates = dates
+        self._dict = obj
         return obj
 
+    def to_dict(self):
+        return dict(self._parse())
+
     def _convert_date_string_to_datetime(self, date_str):
         """Returns a datetime object."""
         if not date_str:
             return None
         return datetime.strptime(date_str, ISO_8601_DATE_FORMAT)
 
+    def _get_date(self, key):
+        date_str = self._parse().get(key)
+        if date_str is None:
+            return None
+        if key in self._dates:
+            return self._dates[key]
+        return self._convert_date_string_to_datetime(date_str)
+
     def get_grader(self):
         """Returns the associated grader."""
-        return self.to_dict().get(GRADER_KEY)
+        return self._parse().get(GRADER_KEY)
 
     def get_matcher(self):
-        return self.to_dict().get(MATCHER_KEY)
+        return self._parse().get(MATCHER_KEY)
 
     def is_single_submission(self):
-        return self.to_dict().get(SINGLE_SUBMISSION_KEY, False)
+        return self._parse().get(SINGLE_SUBMISSION_KEY, False)
 
     def get_submission_due_date(self):
-        date_str = self.to_dict().get(SUBMISSION_DUE_DATE_KEY)
-        if date_str is None:
-            return None
-        return self._convert_date_string_to_datetime(date_str)
+        return self._get_date(SUBMISSION_DUE_DATE_KEY)
 
     def show_feedback(self):
-        return self.to_dict().get(SHOW_FEEDBACK_KEY, False)
+        return self._parse().get(SHOW_FEEDBACK_KEY, False)
 
     def get_review_due_date(self):
-        date_str = self.to_dict().get(REVIEW_DUE_DATE_KEY)
-        if date_str is None:
-            return None
-        return self._convert_date_string_to_datetime(date_str)
+        return self._get_date(REVIEW_DUE_DATE_KEY)
 
     def get_review_min_count(self):
-        return self.to_dict().get(REVIEW_MIN_COUNT_KEY)
+        return self._parse().get(REVIEW_MIN_COUNT_KEY)
 
     def get_review_window_mins(self):
-        return self.to_dict().get(REVIEW_WINDOW_MINS_KEY)
+        return self._parse().get(REVIEW_WINDOW_MINS_KEY)
 
     def _ensure_value_is_nonnegative_int(self, workflow_dict, key, errors):
         """Checks that workflow_dict[key] is a non-negative integer."""
@@ -2406,6 +2532,10 @@ class Course(object):
     # saved.
     COURSE_ENV_POST_SAVE_HOOKS = []
 
+    # Holds callback functions which are passed the course object after its
+    # units and lessons are saved.
+    POST_SAVE_HOOKS = []
+
     # Data which is patched onto the course environment - for testing use only.
     ENVIRON_TEST_OVERRIDES = {}
 
@@ -2429,6 +2559,9 @@ class Course(object):
     # here we keep current course available to thread
     INSTANCE = threading.local()
 
+    # here we keep the env that hooks are processing on this thread
+    _ENVIRON_IN_HOOKS = threading.local()
+
     @classmethod
     def get_schema_sections(cls):
         ret = set([
@@ -2450,38 +2583,40 @@ class Course(object):
             os.environ.get('CURRENT_VERSION_ID'), locale)
 
     @classmethod
-    def _run_env_post_copy_hooks(cls, app_context, env):
-        env = copy.deepcopy(env)
-
-        # Monkey patch to defend against infinite recursion. Downstream
-        # calls do not reload the env but just return the copy we have here.
-        old_get_environ = cls.get_environ
+    def _run_env_hooks(cls, env, hooks, *args):
+        # Defend against infinite recursion: while hooks run, get_environ()
+        # on this thread returns the env being processed instead of reloading
+        # it. The env is kept in a thread-local so other threads are unaware.
+        outer_env = getattr(cls._ENVIRON_IN_HOOKS, 'env', None)
+        cls._ENVIRON_IN_HOOKS.env = env
         try:
-            cls.get_environ = classmethod(lambda cl, ac: env)
-            common_utils.run_hooks(
-                cls.COURSE_ENV_POST_COPY_HOOKS, app_context, env)
+            common_utils.run_hooks(hooks, *args)
         finally:
-            # Restore the original method from monkey-patch
-            cls.get_environ = old_get_environ
+            cls._ENVIRON_IN_HOOKS.env = outer_env
+
+    @classmethod
+    def _run_env_post_copy_hooks(cls, app_context, env):
+        # The cached env is shared by all callers; hooks and callers change
+        # only their own copy of it.
+        env = _EnvironCopy(env)
+        cls._run_env_hooks(
+            env, cls.COURSE_ENV_POST_COPY_HOOKS, app_context, env)
         return env
 
     @classmethod
     def _run_env_post_load_hooks(cls, env):
-        old_get_environ = cls.get_environ
-        try:
-            cls.get_environ = classmethod(lambda cl, ac: env)
-            common_utils.run_hooks(
-                cls.COURSE_ENV_POST_LOAD_HOOKS, env)
-        finally:
-            # Restore the original method from monkey-patch
-            cls.get_environ = old_get_environ
-
+        cls._run_env_hooks(env, cls.COURSE_ENV_POST_LOAD_HOOKS, env)
 
     @classmethod
     def get_environ(cls, app_context):
         """Returns currently defined course settings as a dictionary."""
         # pylint: disable=protected-access
 
+        # called back from a hook that is processing the env
+        env = getattr(cls._ENVIRON_IN_HOOKS, 'env', None)
+        if env is not None:
+            return env
+
         # get from local cache
         env = app_context._cached_environ
         if env:
@@ -3131,7 +3266,17 @@ class Course(object):
         return None
 
     def save(self):
-        return self._model.save()
+        retval = self._model.save()
+        common_utils.run_hooks(self.POST_SAVE_HOOKS, self)
+        return retval
+
+    def get_content_version(self):
+        """Returns a stamp of the saved units and lessons, or None if unknown.
+
+        Data derived from the course outline can be cached under this stamp;
+        it changes whenever the course is saved.
+        """
+        return self._model.get_content_version()
 
     def find_unit_by_id(self, unit_id):
         return self._model.find_unit_by_id(unit_id)
@@ -21,8 +21,12 @@ ALL_LOCALES_PERMISSION = 'can_pick_all_locales'
 SEE_DRAFTS_PERMISSION = 'can_see_draft_content'
 
 import collections
+import logging
 import messages
 import roles
+import webapp2
+
+import appengine_config
 
 class Module(object):
     """A class that holds module information."""
@@ -94,9 +98,65 @@ class Registry(object):
                 # Only populate the routing table with enabled modules.
                 global_routes += registered_module.global_routes
                 namespaced_routes += registered_module.namespaced_routes
+        for main_module, routes in appengine_config.get_lazy_modules():
+            for route in routes:
+                global_routes.append(
+                    (route, LazyModuleHandler.for_route(main_module, route)))
         return global_routes, namespaced_routes
 
 
+class LazyModuleHandler(webapp2.RequestHandler):
+    """Serves a global route of a module that is imported on first use.
+
+    Modules whose manifests set 'lazy' are not imported at instance startup.
+    Their 'global_routes' are bound to subclasses of this handler instead;
+    the first request to any of them imports, registers and enables the
+    module, and every request is then dispatched to the module's own handler
+    for the route.  Lazy modules can have neither namespaced routes nor
+    effects of registration that other requests rely on, e.g., hooks.
+    """
+
+    MAIN_MODULE = None
+    ROUTE = None
+
+    @classmethod
+    def for_route(cls, main_module, route):
+        return type('LazyModuleHandler', (cls,), {
+            'MAIN_MODULE': main_module, 'ROUTE': route})
+
+    @classmethod
+    def _get_handler_class(cls):
+        module = appengine_config.import_lazy_module(cls.MAIN_MODULE)
+        if module.namespaced_routes:
+            logging.error(
+                'Namespaced routes of lazy module %s are not served.',
+                cls.MAIN_MODULE)
+        for route, handler_class in module.global_routes:
+            if route == cls.ROUTE:
+                return handler_class
+        return None
+
+    @classmethod
+    def can_handle_route_method_path_now(cls, route, method, path):
+        handler_class = cls._get_handler_class()
+        if not handler_class:
+            return False
+        can_handle = getattr(
+            handler_class, 'can_handle_route_method_path_now', None)
+        if callable(can_handle):
+            return can_handle(route, method, path)
+        return True
+
+    def dispatch(self):
+        handler_class = self._get_handler_class()
+        if not handler_class:
+            logging.error(
+                'Lazy module %s has no handler for %s listed in its manifest.',
+                self.MAIN_MODULE, self.ROUTE)
+            self.abort(404)
+        return handler_class(self.request, self.response).dispatch()
+
+
 core_module = None
 
 def register_core_module(global_handlers, namespaced_handlers):
@@ -19,6 +19,7 @@ __author__ = 'Mike Gainer (mgainer@google.com)'
 from common import catch_and_log
 from common import crypto
 from controllers import utils
+from models import columnar
 from models import roles
 from models import transforms
 from models.data_sources import utils as data_sources_utils
@@ -51,8 +52,14 @@ class _AbstractRestDataSourceHandler(
           Further, the "last" page may not always be last -- over time,
           more data may accumulate in the store being accessed.
           If this value is not provided, it is assumed to be zero.
+      format=columnar: Return the page as a models.columnar file rather than
+          as JSON; the schema gives the columns, and the other fields of the
+          JSON response are in the file's metadata.  When the data cannot be
+          fetched, the JSON response is returned instead, for its log.
     """
 
+    FORMAT_COLUMNAR = 'columnar'
+
     @classmethod
     def get_data_source_class(cls):
         raise NotImplementedError(
@@ -129,6 +136,11 @@ class _AbstractRestDataSourceHandler(
         output['log'] = catch_and_log_.get()
         output['source'] = data_source_class.get_name()
 
+        if (self.request.get('format') == self.FORMAT_COLUMNAR and
+            'data' in output):
+            self._write_columnar(output)
+            return
+
         self.response.headers['Content-Type'] = (
             'application/javascript; charset=utf-8')
         self.response.headers['X-Content-Type-Options'] = 'nosniff'
@@ -136,6 +148,22 @@ class _AbstractRestDataSourceHandler(
         self.response.write(transforms.JSON_XSSI_PREFIX +
                             transforms.dumps(output))
 
+    def _write_columnar(self, output):
+        """Writes the page of data in output as a columnar file."""
+        metadata = dict(
+            (key, value) for key, value in output.iteritems()
+            if key not in ('data', 'schema'))
+        self.response.headers['Content-Type'] = columnar.CONTENT_TYPE
+        self.response.headers['X-Content-Type-Options'] = 'nosniff'
+        self.response.headers['Content-Disposition'] = (
+            'attachment; filename="%s-%d%s"' % (
+                output['source'], output['page_number'], columnar.SUFFIX))
+        writer = columnar.ColumnarWriter(
+            self.response, output['schema'], metadata=metadata)
+        for row in output['data']:
+            writer.write(row)
+        writer.close()
+
     def _encode_context(self, source_context):
         """Save context as opaque string for use as arg to next call."""
         context_class = self.get_data_source_class().get_context_class()
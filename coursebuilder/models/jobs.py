@@ -24,6 +24,7 @@ import time
 import traceback
 import urllib
 
+import appengine_config
 from common import utils as common_utils
 import entities
 from mapreduce import base_handler
@@ -842,3 +843,62 @@ class DurableJobEntity(entities.BaseEntity):
     @property
     def has_finished(self):
         return self.status_code in [STATUS_CODE_COMPLETED, STATUS_CODE_FAILED]
+
+
+class CronCourseStatusEntity(entities.BaseEntity):
+    """Outcome of one all-courses cron handler's action for one course.
+
+    Stored in the default namespace, one entity per (handler, course). Used
+    by controllers.utils.AbstractAllCoursesCronHandler to count retries, to
+    skip courses whose relevant state has not changed since the last
+    successful run, and to summarize each run.
+    """
+
+    OUTCOME_QUEUED = 'queued'
+    OUTCOME_SUCCEEDED = 'succeeded'
+    OUTCOME_FAILED = 'failed'
+    OUTCOME_UNCHANGED = 'unchanged'
+
+    handler_name = db.StringProperty(indexed=True)
+    namespace = db.StringProperty(indexed=False)
+    run_id = db.StringProperty(indexed=True)
+    outcome = db.StringProperty(indexed=False)
+    attempts = db.IntegerProperty(indexed=False, default=0)
+    updated_on = db.DateTimeProperty(indexed=False, auto_now=True)
+    error = db.TextProperty(indexed=False)
+
+    # Course state version recorded by the last successful run, and when
+    # that run was.
+    state_version = db.TextProperty(indexed=False)
+    succeeded_on = db.DateTimeProperty(indexed=False)
+
+    @classmethod
+    def key_name(cls, handler_name, namespace):
+        return '(%s:%s)' % (handler_name, namespace)
+
+    @classmethod
+    def get_or_new(cls, handler_name, namespace):
+        with Namespace(appengine_config.DEFAULT_NAMESPACE_NAME):
+            key_name = cls.key_name(handler_name, namespace)
+            entity = cls.get_by_key_name(key_name)
+            if not entity:
+                entity = cls(key_name=key_name, handler_name=handler_name,
+                             namespace=namespace)
+            return entity
+
+    def save(self):
+        with Namespace(appengine_config.DEFAULT_NAMESPACE_NAME):
+            self.put()
+
+    @classmethod
+    def get_run_summary(cls, handler_name, run_id):
+        """Returns a dict of outcome -> number of courses for one run."""
+        summary = dict.fromkeys([
+            cls.OUTCOME_QUEUED, cls.OUTCOME_SUCCEEDED, cls.OUTCOME_FAILED,
+            cls.OUTCOME_UNCHANGED], 0)
+        with Namespace(appengine_config.DEFAULT_NAMESPACE_NAME):
+            query = cls.all().filter('handler_name =', handler_name).filter(
+                'run_id =', run_id)
+            for entity in common_utils.iter_all(query):
+                summary[entity.outcome] += 1
+        return summary
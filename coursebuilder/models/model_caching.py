@@ -91,13 +91,14 @@ class CacheFactory(object):
                 return cls.instance()._cache.total_size
 
             def __init__(self):
-                self._cache = caching.LRUCache(max_size_bytes=max_size_bytes)
+                self._cache = caching.LRUCache(
+                    max_size_bytes=max_size_bytes, name=name)
                 self._cache.get_entry_size = self._get_entry_size
 
             def _get_entry_size(self, key, value):
                 if not value:
                     return 0
-                return sys.getsizeof(key) + sys.getsizeof(value)
+                return sys.getsizeof(key) + value.getsizeof()
 
             @property
             def cache(self):
@@ -112,7 +113,7 @@ class CacheFactory(object):
 
             def getsizeof(self):
                 return (
-                    dao_class.ENTITY.getsizeof(self.entity) +
+                    caching.get_deep_size(self.entity) +
                     sys.getsizeof(self.created_on))
 
             def has_expired(self):
@@ -21,6 +21,7 @@ import copy
 import datetime
 import logging
 import os
+import pickle
 import sys
 import time
 import webapp2
@@ -35,6 +36,7 @@ from entities import delete
 from entities import get
 from entities import put
 import data_removal
+import jobs
 import messages
 import services
 import transforms
@@ -45,6 +47,7 @@ from common import utils as common_utils
 from common import users
 
 from google.appengine.api import app_identity
+from google.appengine.api import datastore
 from google.appengine.api import mail
 from google.appengine.api import memcache
 from google.appengine.api import namespace_manager
@@ -63,6 +66,11 @@ DEFAULT_CACHE_TTL_SECS = 60 * 5
 MEMCACHE_MAX = (1000 * 1000 - 96 - 250)
 MEMCACHE_MULTI_MAX = 32 * 1000 * 1000
 
+# BaseJsonDao.get_all_mapped() results are cached split across at most this
+# many memcache entries of MEMCACHE_MAX bytes, so all of them fit in one
+# set_multi() call.
+GET_ALL_CACHE_MAX_SHARDS = MEMCACHE_MULTI_MAX // MEMCACHE_MAX - 1
+
 # Update frequency for Student.last_seen_on.
 STUDENT_LAST_SEEN_ON_UPDATE_SEC = 24 * 60 * 60  # 1 day.
 
@@ -353,12 +361,22 @@ class MemcacheManager(object):
                 key_list, namespace=cls._get_namespace(namespace))
 
     @classmethod
-    def incr(cls, key, delta, namespace=None):
-        """Incr an item in memcache if memcache is enabled."""
+    def incr(cls, key, delta, namespace=None, initial_value=0):
+        """Incr an item in memcache if memcache is enabled.
+
+        Returns the new value, or None if memcache is disabled or the
+        increment failed.  Inside a readonly section the new value is also
+        kept locally, so that a get() of a key that was missing does not keep
+        answering None for the rest of the section.
+        """
         if CAN_USE_MEMCACHE.value:
-            memcache.incr(
-                key, delta,
-                namespace=cls._get_namespace(namespace), initial_value=0)
+            _namespace = cls._get_namespace(namespace)
+            value = memcache.incr(
+                key, delta, namespace=_namespace, initial_value=initial_value)
+            if value is not None:
+                cls._local_cache_put(key, _namespace, value)
+            return value
+        return None
 
 
 CAN_AGGREGATE_COUNTERS = config.ConfigProperty(
@@ -1065,6 +1083,7 @@ class StudentProfileDAO(object):
             key_name = student.key().name()
         student = cls._add_new_student_for_current_user_in_txn(
           key_name, user_id, email, nick_name, additional_fields, labels)
+        StudentCache.remove(user_id)
         return student
 
     @classmethod
@@ -1199,6 +1218,7 @@ class StudentProfileDAO(object):
         cls._update_in_txn(
             key_name, user_id, email, legal_name, nick_name, date_of_birth,
             is_enrolled, final_grade, course_info, labels, profile_only)
+        StudentCache.remove(user_id)
 
     @classmethod
     @db.transactional(xg=True)
@@ -1238,7 +1258,16 @@ class StudentProfileDAO(object):
 
 
 class StudentCache(caching.RequestScopedSingleton):
-    """Class that manages optimized loading of Students from datastore."""
+    """Class that manages optimized loading of Students from datastore.
+
+    Students are cached per request and in memcache. A user_id that has no
+    Student is cached as well, so that pages viewed by visitors who are not
+    enrolled do not go to the datastore on every request.
+    """
+
+    # Namespaces where LegacyStudentKeyMigrationJob has completed, so that no
+    # Student is keyed by email and no fallback query by user_id is needed.
+    _MIGRATED_NAMESPACES = set()
 
     def __init__(self):
         self._key_name_to_student = {}
@@ -1248,15 +1277,40 @@ class StudentCache(caching.RequestScopedSingleton):
         """Make key specific to user_id and current namespace."""
         return '%s-%s' % (MemcacheManager.get_namespace(), user_id)
 
-    def _get_by_user_id_from_datastore(self, user_id):
+    @classmethod
+    def _memcache_key(cls, user_id):
+        """Makes a memcache key from user_id."""
+        return 'entity:student-by-user-id:%s' % user_id
+
+    @classmethod
+    def _get_by_user_id_from_datastore(cls, user_id):
         """Load Student by user_id. Fail if user_id is not unique."""
         # In the CB 1.8 and below email was the key_name. This is no longer
         # true. To support legacy Student entities do a double look up here:
         # first by the key_name value and then by the user_id field value.
-        student = Student.get_by_key_name(user_id)
+        # Once LegacyStudentKeyMigrationJob has re-keyed all such Students
+        # in a course, the second look up is skipped.
+        namespace = namespace_manager.get_namespace()
+        if namespace in cls._MIGRATED_NAMESPACES:
+            return Student.get_by_key_name(user_id)
+
+        student, migration = get([
+            db.Key.from_path(Student.kind(), user_id),
+            db.Key.from_path(
+                jobs.DurableJobEntity.kind(),
+                LegacyStudentKeyMigrationJob.get_job_name(namespace))])
+        if (migration and
+            migration.status_code == jobs.STATUS_CODE_COMPLETED and
+            not Student._LEGACY_EMAIL_AS_KEY_NAME_ENABLED):
+            cls._MIGRATED_NAMESPACES.add(namespace)
+            return student
         if student:
             return student
+        return cls._get_legacy_by_user_id(user_id)
 
+    @classmethod
+    def _get_legacy_by_user_id(cls, user_id):
+        """Load a Student still keyed by email by its user_id field."""
         students = Student.all().filter(
             Student.user_id.name, user_id).fetch(limit=2)
         if len(students) > 1:
@@ -1270,26 +1324,187 @@ class StudentCache(caching.RequestScopedSingleton):
         key = self._key(user_id)
         if key in self._key_name_to_student:
             return self._key_name_to_student[key]
-        student = self._get_by_user_id_from_datastore(user_id)
+        student = MemcacheManager.get(self._memcache_key(user_id))
+        if student == NO_OBJECT:
+            student = None
+        elif not student:
+            student = self._get_by_user_id_from_datastore(user_id)
+            MemcacheManager.set(
+                self._memcache_key(user_id),
+                student if student else NO_OBJECT)
         self._key_name_to_student[key] = student
         return student
 
+    def _get_by_user_id_in_namespaces(self, user_id, namespaces):
+        """Get cached Students of one user_id in many courses at once.
+
+        Students not yet cached for this request are loaded with a single
+        datastore get across all of the namespaces, rather than with one
+        memcache lookup per namespace.
+
+        Args:
+          user_id: string. The user ID of the Students.
+          namespaces: list of the namespaces of the courses.
+        Returns:
+          A dict from namespace to Student, or to None for courses in which
+          the user has no Student.
+        """
+        ret = {}
+        to_load = []
+        for namespace in namespaces:
+            key = '%s-%s' % (
+                namespace or appengine_config.DEFAULT_NAMESPACE_NAME, user_id)
+            if key in self._key_name_to_student:
+                ret[namespace] = self._key_name_to_student[key]
+            else:
+                to_load.append(namespace)
+        if not to_load:
+            return ret
+
+        keys = []
+        for namespace in to_load:
+            keys.append(db.Key.from_path(
+                Student.kind(), user_id, namespace=namespace))
+            if namespace not in self._MIGRATED_NAMESPACES:
+                keys.append(db.Key.from_path(
+                    jobs.DurableJobEntity.kind(),
+                    LegacyStudentKeyMigrationJob.get_job_name(namespace),
+                    namespace=namespace))
+        loaded = iter(get(keys))
+        for namespace in to_load:
+            student = next(loaded)
+            if namespace not in self._MIGRATED_NAMESPACES:
+                migration = next(loaded)
+                if (migration and
+                    migration.status_code == jobs.STATUS_CODE_COMPLETED and
+                    not Student._LEGACY_EMAIL_AS_KEY_NAME_ENABLED):
+                    self._MIGRATED_NAMESPACES.add(namespace)
+                elif not student:
+                    with common_utils.Namespace(namespace):
+                        student = self._get_legacy_by_user_id(user_id)
+            key = '%s-%s' % (
+                namespace or appengine_config.DEFAULT_NAMESPACE_NAME, user_id)
+            self._key_name_to_student[key] = student
+            ret[namespace] = student
+        return ret
+
     def _remove(self, user_id):
         """Remove cached value by user_id."""
         key = self._key(user_id)
         if key in self._key_name_to_student:
             del self._key_name_to_student[key]
+        MemcacheManager.delete(self._memcache_key(user_id))
+
+    def _remove_multi(self, user_ids):
+        """Remove cached values for a list of user_ids."""
+        for user_id in user_ids:
+            self._key_name_to_student.pop(self._key(user_id), None)
+        MemcacheManager.delete_multi(
+            [self._memcache_key(user_id) for user_id in user_ids])
 
     @classmethod
     def remove(cls, user_id):
         # pylint: disable=protected-access
         return cls.instance()._remove(user_id)
 
+    @classmethod
+    def remove_multi(cls, user_ids):
+        # pylint: disable=protected-access
+        return cls.instance()._remove_multi(user_ids)
+
     @classmethod
     def get_by_user_id(cls, user_id):
         # pylint: disable=protected-access
         return cls.instance()._get_by_user_id(user_id)
 
+    @classmethod
+    def get_by_user_id_in_namespaces(cls, user_id, namespaces):
+        # pylint: disable=protected-access
+        return cls.instance()._get_by_user_id_in_namespaces(
+            user_id, namespaces)
+
+
+class LegacyStudentKeyMigrationJob(jobs.AbstractCountingMapReduceJob):
+    """Re-keys Students created in CB 1.8 and below by user_id.
+
+    Such Students have their email as key_name and can only be found by a
+    query on user_id. Each one is copied to a new entity keyed by user_id
+    and the legacy entity is deleted. Once the job has completed in a
+    course, StudentCache stops issuing that query. Run it once per course.
+
+    Peer review entities refer to Students by key, and the key names of
+    Submissions and Reviews embed it, so Students with any of them are left
+    keyed by email. The job then fails, so that StudentCache keeps finding
+    them with the query.
+    """
+
+    # Kinds and properties, from models/student_work.py and
+    # modules/review/peer.py, that hold the str() of a Student's key.
+    _STUDENT_KEY_REFERENCES = (
+        ('Submission', 'reviewee_key'),
+        ('Review', 'reviewee_key'),
+        ('Review', 'reviewer_key'),
+        ('ReviewSummary', 'reviewee_key'),
+        ('ReviewStep', 'reviewee_key'),
+        ('ReviewStep', 'reviewer_key'),
+    )
+
+    @staticmethod
+    def get_description():
+        return 'migrate legacy student keys'
+
+    @classmethod
+    def get_job_name(cls, namespace):
+        return 'job-%s-%s' % (cls.__name__, namespace)
+
+    @staticmethod
+    def entity_class():
+        return Student
+
+    @staticmethod
+    @db.transactional(xg=True)
+    def _rekey(key, user_id):
+        legacy = Student.get(key)
+        if not legacy:
+            return False
+        if Student.get_by_key_name(user_id):
+            raise Exception(
+                'There is more than one student with user_id "%s"' % user_id)
+        values = dict(
+            (name, getattr(legacy, name)) for name in Student.properties())
+        Student(key_name=user_id, **values).put()
+        legacy.delete()
+        return True
+
+    @classmethod
+    def _has_review_data(cls, key):
+        for kind, name in cls._STUDENT_KEY_REFERENCES:
+            query = datastore.Query(
+                kind, {'%s =' % name: str(key)}, keys_only=True)
+            if query.Get(1):
+                return True
+        return False
+
+    @staticmethod
+    def map(student):
+        if not student.user_id:
+            yield ('no_user_id', 1)
+        elif student.key().name() != student.user_id:
+            if LegacyStudentKeyMigrationJob._has_review_data(student.key()):
+                yield ('skipped_review_data', 1)
+            elif LegacyStudentKeyMigrationJob._rekey(
+                student.key(), student.user_id):
+                StudentCache.remove(student.user_id)
+                yield ('migrated', 1)
+
+    @classmethod
+    def complete(cls, unused_kwargs, results):
+        for key, count in results:
+            if key == 'skipped_review_data':
+                raise Exception(
+                    '%s students with peer review data are still keyed by '
+                    'email.' % count)
+
 
 class _EmailProperty(db.StringProperty):
     """Class that provides dual look up of email property value."""
@@ -1402,9 +1617,10 @@ class Student(BaseEntity):
     failure is expected as we have extra datastore lookup in get() by email.
 
     We did not optimize get() by email RPC performance as this call is used
-    rarely. To optimize dual datastore lookup in get_by_user_id() we tried
-    memcache and request-scope cache for Student. Request-scoped cache provided
-    much better results and this is what we implemented.
+    rarely. The dual datastore lookup in get_by_user_id() is cached per request
+    and in memcache, including the lookups that find no Student. Running
+    LegacyStudentKeyMigrationJob in a course re-keys the legacy entities by
+    user_id, after which the second lookup is no longer made.
 
     We are confident that core CB components, including peer review system, use
     user_id as foreign key and will continue working with no changes. Any custom
@@ -1830,27 +2046,104 @@ class BaseJsonDao(object):
         return '(entity:%s:%s)' % (cls.ENTITY.kind(), obj_id)
 
     @classmethod
-    def _memcache_all_key(cls):
-        """Makes a memcache key for caching get_all()."""
+    def _memcache_all_version_key(cls):
+        """Makes a memcache key for the version stamp of get_all() shards."""
         # Keeping case-sensitivity in kind() because Foo(object) != foo(object).
-        return '(entity-get-all:%s)' % cls.ENTITY.kind()
+        return '(entity-get-all-version:%s)' % cls.ENTITY.kind()
+
+    @classmethod
+    def _memcache_all_keys(cls, version):
+        """Makes the memcache keys of all get_all() shards for a version."""
+        return [
+            '(entity-get-all:%s:%s:%d)' % (cls.ENTITY.kind(), version, shard)
+            for shard in xrange(GET_ALL_CACHE_MAX_SHARDS)]
+
+    @classmethod
+    def _invalidate_all_mapped(cls):
+        """Retires all cached get_all() shards with one memcache operation.
+
+        Shards are keyed by the version stamp, so bumping it orphans them; they
+        then age out of memcache on their own.  A reader that began loading
+        from the datastore before the bump writes its results under the old
+        version, where they are never read.  If the stamp itself was evicted,
+        it is recreated from the clock rather than from zero, so that it cannot
+        coincide with a version whose shards are still in memcache.
+        """
+        return MemcacheManager.incr(
+            cls._memcache_all_version_key(), 1,
+            initial_value=int(time.time() * 1000 * 1000))
+
+    @classmethod
+    def get_all_mapped_version(cls):
+        """Returns a stamp that changes whenever an entity of this kind does.
+
+        Callers that cache data derived from get_all() can key it on this
+        stamp; read the stamp before the entities.  Returns None if memcache
+        is disabled, in which case there is nothing to key such caches on.
+        """
+        version = MemcacheManager.get(cls._memcache_all_version_key())
+        if version is None:
+            version = cls._invalidate_all_mapped()
+        return version
+
+    @classmethod
+    def _get_all_mapped_from_cache(cls, version):
+        shard_keys = cls._memcache_all_keys(version)
+        shards = MemcacheManager.get_multi(shard_keys)
+        shard_0 = shards.get(shard_keys[0])
+        if not shard_0:
+            return None
+        num_shards = ord(shard_0[0])
+        data = [shard_0[1:]]
+        for shard_key in shard_keys[1:num_shards]:
+            if shard_key not in shards:
+                return None
+            data.append(shards[shard_key])
+        try:
+            return pickle.loads(''.join(data))
+        except Exception as e:  # pylint: disable=broad-except
+            logging.error(
+                'Failed to load all %s from memcache. %s', cls.ENTITY.kind(), e)
+            return None
+
+    @classmethod
+    def _put_all_mapped_in_cache(cls, version, result):
+        try:
+            data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:  # pylint: disable=broad-except
+            logging.error(
+                'Failed to pickle all %s for memcache. %s',
+                cls.ENTITY.kind(), e)
+            return
+        # One leading byte records the number of shards.
+        num_shards = (len(data) + MEMCACHE_MAX) // MEMCACHE_MAX
+        if num_shards > GET_ALL_CACHE_MAX_SHARDS:
+            CACHE_PUT_TOO_BIG.inc()
+            return
+        data = chr(num_shards) + data
+        shard_keys = cls._memcache_all_keys(version)
+        MemcacheManager.set_multi({
+            shard_keys[i]: data[i * MEMCACHE_MAX:(i + 1) * MEMCACHE_MAX]
+            for i in xrange(num_shards)})
 
     @classmethod
     def get_all_mapped(cls):
         # try to get from memcache
-        entities = MemcacheManager.get(cls._memcache_all_key())
-        if entities is not None and entities != NO_OBJECT:
-            cls._maybe_apply_post_load_hooks(entities.itervalues())
-            return entities
+        version = MemcacheManager.get(cls._memcache_all_version_key())
+        if version is not None:
+            result = cls._get_all_mapped_from_cache(version)
+            if result is not None:
+                cls._maybe_apply_post_load_hooks(result.itervalues())
+                return result
+        else:
+            version = cls._invalidate_all_mapped()
 
         # get from datastore
         result = {dto.id: dto for dto in cls.get_all_iter()}
 
         # put into memcache
-        result_to_cache = NO_OBJECT
-        if result:
-            result_to_cache = result
-        MemcacheManager.set(cls._memcache_all_key(), result_to_cache)
+        if version is not None:
+            cls._put_all_mapped_in_cache(version, result)
 
         cls._maybe_apply_post_load_hooks(result.itervalues())
         return result
@@ -2005,7 +2298,7 @@ class BaseJsonDao(object):
         entity = cls._create_if_necessary(dto)
         cls.before_put(dto, entity)
         entity.put()
-        MemcacheManager.delete(cls._memcache_all_key())
+        cls._invalidate_all_mapped()
         id_or_name = entity.key().id_or_name()
         MemcacheManager.set(cls._memcache_key(id_or_name), entity)
         cls._maybe_apply_post_save_hooks([(id_or_name, dto)])
@@ -2021,7 +2314,7 @@ class BaseJsonDao(object):
             cls.before_put(dto, entity)
 
         keys = put(entities)
-        MemcacheManager.delete(cls._memcache_all_key())
+        cls._invalidate_all_mapped()
         for key, entity in zip(keys, entities):
             MemcacheManager.set(cls._memcache_key(key.id_or_name()), entity)
 
@@ -2033,7 +2326,7 @@ class BaseJsonDao(object):
     def delete(cls, dto):
         entity = cls._load_entity(dto.id)
         entity.delete()
-        MemcacheManager.delete(cls._memcache_all_key())
+        cls._invalidate_all_mapped()
         MemcacheManager.delete(cls._memcache_key(entity.key().id_or_name()))
 
     @classmethod
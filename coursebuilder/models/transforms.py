@@ -18,7 +18,7 @@ __author__ = 'Pavel Simakov (psimakov@google.com)'
 
 
 import json
-from StringIO import StringIO
+import re
 from xml.etree import ElementTree
 
 import yaml
@@ -86,12 +86,41 @@ def dict_to_json(source_dict, schema=None, recurse=False):
         recurse=recurse)
 
 
+class _CustomJSONEncoder(json.JSONEncoder):
+    """Encoder that consults CUSTOM_JSON_ENCODERS and serializes sets."""
+
+    def default(self, obj):
+        for f in CUSTOM_JSON_ENCODERS:
+            value = f(obj)
+            if value is not None:
+                return value
+        if isinstance(obj, set):
+            return list(obj)
+        return super(_CustomJSONEncoder, self).default(obj)
+
+
+# Shared encoder for the common call dumps(obj). Encoders hold only their
+# settings, so one instance can safely be used by concurrent requests.
+_JSON_ENCODER = _CustomJSONEncoder()
+
+# Shared decoder for the common call loads(s).
+_JSON_DECODER = json.JSONDecoder()
+
+# Characters that dumps() escapes when output is not already pure ASCII.
+_UNSAFE_JSON_CHARS = re.compile(u'[^\x00-\x7f]|[<>]')
+
+
+def _escape_unsafe_json_char(match):
+    return '\\u%04X' % ord(match.group(0))
+
+
 def dumps(*args, **kwargs):
     """Wrapper around json.dumps.
 
-    No additional behavior; present here so this module is a drop-in replacement
-    for json.dumps|loads. Clients should never use json.dumps|loads directly.
-    See usage docs at http://docs.python.org/2/library/json.html.
+    Serializes sets and objects handled by CUSTOM_JSON_ENCODERS, and escapes
+    <, > and non-ASCII characters in the output to defend against XSS. Clients
+    should never use json.dumps|loads directly. See usage docs at
+    http://docs.python.org/2/library/json.html.
 
     Args:
         *args: positional arguments delegated to json.dumps.
@@ -100,36 +129,20 @@ def dumps(*args, **kwargs):
     Returns:
         string. The converted JSON.
     """
+    if len(args) == 1 and not kwargs:
+        result = _JSON_ENCODER.encode(args[0])
+    else:
+        if 'cls' not in kwargs:
+            kwargs['cls'] = _CustomJSONEncoder
+        result = json.dumps(*args, **kwargs)
 
-    def set_encoder(obj):
-        if isinstance(obj, set):
-            return list(obj)
-        return None
-
-    def string_escape(in_str):
-        # Defend against XSS by escaping <, > and non-ASCII chars
-        out = StringIO()
-        for c in in_str.decode('utf8'):
-            char_val = ord(c)
-            if char_val > 0x7f or c == '<' or c == '>':
-                out.write('\\u%04X' % char_val)
-            else:
-                out.write(c)
-        return out.getvalue()
-
-    class CustomJSONEncoder(json.JSONEncoder):
-
-        def default(self, obj):
-            for f in CUSTOM_JSON_ENCODERS + [set_encoder]:
-                value = f(obj)
-                if value is not None:
-                    return value
-            return super(CustomJSONEncoder, self).default(obj)
-
-    if 'cls' not in kwargs:
-        kwargs['cls'] = CustomJSONEncoder
-
-    return string_escape(json.dumps(*args, **kwargs))
+    if kwargs.get('ensure_ascii', True):
+        # json has already escaped non-ASCII characters as \uXXXX, so only
+        # < and > are left; escaping them with str.replace() stays in C.
+        return unicode(
+            result.replace('<', '\\u003C').replace('>', '\\u003E'))
+    return _UNSAFE_JSON_CHARS.sub(
+        _escape_unsafe_json_char, result.decode('utf8'))
 
 
 def loads(s, prefix=JSON_XSSI_PREFIX, strict=True, **kwargs):
@@ -154,6 +167,8 @@ def loads(s, prefix=JSON_XSSI_PREFIX, strict=True, **kwargs):
     if s.startswith(prefix):
         s = s.lstrip(prefix)
     if strict:
+        if not kwargs:
+            return _JSON_DECODER.decode(s)
         return json.loads(s, **kwargs)
     else:
         return yaml.safe_load(s, **kwargs)
@@ -260,6 +275,23 @@ class JsonFile(object):
         self._file = None
         self._path = path
 
+    @classmethod
+    def for_stream(cls, stream):
+        """Returns a reader over an already-open file-like object.
+
+        Lets content that is not a plain file, like a member of a .zip
+        archive, be iterated a line at a time. close() closes the stream.
+
+        Args:
+            stream: file-like object supporting readline() and close().
+
+        Returns:
+            JsonFile opened for read.
+        """
+        json_file = cls(getattr(stream, 'name', None))
+        json_file._file = stream
+        return json_file
+
     def __iter__(self):
         assert self._file
         return self
@@ -290,7 +322,7 @@ class JsonFile(object):
         line = self._file.readline()
         if line.startswith(self._PREFIX):
             line = self._file.readline()
-        if line.endswith(self._SUFFIX):
+        if not line or line.endswith(self._SUFFIX):
             raise StopIteration()
         line = line.strip()
         if line.endswith(','):
@@ -315,6 +347,16 @@ class JsonFile(object):
         assert self._file
         return loads(self._file.read())
 
+    def skip(self, count):
+        """Advances past up to count objects without deserializing them."""
+        assert self._file
+        for _ in xrange(count):
+            line = self._file.readline()
+            if line.startswith(self._PREFIX):
+                line = self._file.readline()
+            if not line or line.endswith(self._SUFFIX):
+                break
+
     def reset(self):
         """Resets file's position to head."""
         assert self._file
@@ -316,7 +316,7 @@ class ProcessScopedVfsCache(caching.ProcessScopedSingleton):
     def __init__(self):
         self._cache = caching.LRUCache(
             max_size_bytes=MAX_GLOBAL_CACHE_SIZE_BYTES,
-            max_item_size_bytes=MAX_GLOBAL_CACHE_ITEM_SIZE_BYTES)
+            max_item_size_bytes=MAX_GLOBAL_CACHE_ITEM_SIZE_BYTES, name='vfs')
         self._cache.get_entry_size = self._get_entry_size
 
     def _get_entry_size(self, key, value):
@@ -350,7 +350,7 @@ class CacheFileEntry(caching.AbstractCacheEntry):
     def getsizeof(self):
         return (
             sys.getsizeof(self.filename) +
-            sys.getsizeof(self.metadata) +
+            caching.get_deep_size(self.metadata) +
             sys.getsizeof(self.body) +
             sys.getsizeof(self.created_on))
 
@@ -28,6 +28,7 @@ import urllib
 import uuid
 
 import appengine_config
+from common import caching
 from common import crypto
 from common import jinja_utils
 from common import safe_dom
@@ -272,7 +273,7 @@ class BaseAdminHandler(ConfigPropertyEditor):
 
     default_action = 'courses'
     get_actions = ['courses', 'config_edit', 'settings', 'deployment',
-        'console']
+        'console', 'memory']
     post_actions = ['config_reset', 'console_run']
 
     class AbstractDbTypeDescriber(object):
@@ -420,6 +421,9 @@ class BaseAdminHandler(ConfigPropertyEditor):
         cls.add_menu_item(
             'analytics', 'console', 'Console', action='console',
             contents=cls.get_console, sub_group_name='advanced')
+        cls.add_menu_item(
+            'analytics', 'memory', 'Memory', action='memory',
+            contents=cls.get_memory, sub_group_name='advanced')
 
         def can_view_appstats(app_context):
             return appengine_config.gcb_appstats_enabled()
@@ -652,6 +656,43 @@ class BaseAdminHandler(ConfigPropertyEditor):
 
         return table
 
+    def _render_lru_caches(self):
+        columns = [
+            ('name', 'Cache'), ('items', 'Items'), ('size_bytes', 'Bytes'),
+            ('max_size_bytes', 'Max Bytes'), ('hits', 'Hits'),
+            ('misses', 'Misses'), ('evictions', 'Evictions'),
+            ('eviction_rate', 'Eviction Rate')]
+        content = safe_dom.NodeList()
+        content.append(
+            safe_dom.Element('h3').add_text('In-Process Caches'))
+        table = safe_dom.Element('table', className='gcb-memory')
+        content.append(table)
+        tr = safe_dom.Element('tr')
+        table.add_child(tr)
+        for _, title in columns:
+            tr.add_child(safe_dom.Element('th').add_text(title))
+
+        total_size = 0
+        for stats in caching.get_lru_cache_stats():
+            total_size += stats['size_bytes']
+            stats['eviction_rate'] = '%.2f' % stats['eviction_rate']
+            tr = safe_dom.Element('tr')
+            table.add_child(tr)
+            for key, _ in columns:
+                value = stats[key]
+                tr.add_child(safe_dom.Element('td').add_text(
+                    'NA' if value is None else str(value)))
+        content.append(safe_dom.Element('p').add_text(
+            'Total: %s bytes' % total_size))
+        return content
+
+    def get_memory(self):
+        """Shows sizes and usage of in-process caches."""
+        template_values = {}
+        template_values['page_title'] = self.format_title('Memory')
+        template_values['main_content'] = self._render_lru_caches()
+        self.render_page(template_values)
+
     def _render_about_courses(self):
         courses_list = (
             courses.Course(None, app_context=app_context)
@@ -174,6 +174,21 @@ class AdminDashboardTabTests(actions.TestBase):
             courses.Course.get(app_context).set_course_availability(policy)
             self.assertEqual(settings['title'], get_availability_text())
 
+    def test_memory_page_lists_named_caches(self):
+        actions.login(self.ADMIN_EMAIL, is_admin=True)
+        self.get('/%s/course' % self.COURSE_NAME)
+        response = self.get('admin?action=memory')
+        self.assertEqual(200, response.status_int)
+        dom = self.parse_html_string_to_soup(response.body)
+        names = [row.select('td')[0].text
+                 for row in dom.select('table.gcb-memory tr')[1:]]
+        self.assertIn('jinja', names)
+        self.assertIn('vfs', names)
+
+        actions.login(self.ADMIN_EMAIL, is_admin=False)
+        response = self.get('admin?action=memory')
+        self.assertEqual(302, response.status_int)
+
 
 class TestAdditionalAllCoursesColumn(object):
 
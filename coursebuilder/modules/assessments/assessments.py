@@ -420,6 +420,7 @@ class AnswerHandler(AssignmentsModuleMixin, utils.BaseHandler):
         # Record assessment transaction.
         student = self.update_assessment_transaction(
             student.key().name(), assessment_type, answers, score)
+        models.StudentCache.remove(student.user_id)
 
         if grader == courses.HUMAN_GRADER:
             rp = course.get_reviews_processor()
@@ -28,6 +28,14 @@ possible if the content no longer exists, so none is taken.
 
 Any triggers that are missing required content are similarly logged and then
 removed from the course settings.
+
+Rather than examining every course every hour, the earliest pending trigger
+time of each course is kept in a global AvailabilityTriggerSchedule index.
+The index is refreshed whenever course settings are saved and at the end of
+every UpdateAvailability run. The hourly cron only starts jobs for courses
+whose next trigger is due, and each future trigger time within the task ETA
+limit also gets a deferred task with a matching ETA, so that triggers fire
+close to their exact time.
 """
 
 __author__ = 'Todd Larsen (tlarsen@google.com)'
@@ -48,6 +56,10 @@ from google.appengine.api import namespace_manager
 from google.appengine.ext import db
 from google.appengine.ext import deferred
 
+# Task queues reject tasks with an ETA further out than 30 days; triggers
+# beyond this are left to the hourly cron instead of a deferred task.
+MAX_DEFERRED_ETA = datetime.timedelta(days=29)
+
 
 class UpdateAvailability(jobs.DurableJob):
     """Examines date/time triggers and updates course and content availability.
@@ -69,6 +81,17 @@ class UpdateAvailability(jobs.DurableJob):
 
     RUN_HOOKS = {}
 
+    # Modules that keep their own date/time triggers outside of the course
+    # settings register here so that those triggers are also scheduled.
+    # Callbacks are registered like this:
+    #
+    #     availability_cron.UpdateAvailability.PENDING_WHEN_HOOKS[
+    #         'my_module'] = my_pending_whens
+    #
+    # Hooks are called in the course namespace with the course app_context
+    # and return an iterable of the UTC datetimes of their pending triggers.
+    PENDING_WHEN_HOOKS = {}
+
     @classmethod
     def get_description(cls):
         return "Update course and content availability via date/time triggers."
@@ -105,6 +128,103 @@ class UpdateAvailability(jobs.DurableJob):
 
         common_utils.run_hooks(self.RUN_HOOKS.itervalues(), course)
 
+        # Triggers consumed above no longer count; find the next one due.
+        update_schedule(app_context, env=env)
+
+
+def get_pending_whens(app_context, env=None):
+    """Returns UTC datetimes of all pending availability triggers of a course.
+
+    Args:
+        app_context: the course app_context; must be called in its namespace.
+        env: (optional) course settings to read course-level triggers from,
+            when they are newer than those returned by app_context.
+    """
+    if env is None:
+        env = app_context.get_environ()
+    whens = triggers.ContentTrigger.pending_whens(env)
+    whens.extend(triggers.MilestoneTrigger.pending_whens(env))
+    for hook in UpdateAvailability.PENDING_WHEN_HOOKS.itervalues():
+        whens.extend(hook(app_context))
+    return whens
+
+
+def update_schedule(app_context, env=None):
+    """Refreshes the AvailabilityTriggerSchedule entry for a single course."""
+    whens = get_pending_whens(app_context, env=env)
+    AvailabilityTriggerSchedule.set_next_when(
+        app_context.get_namespace_name(), min(whens) if whens else None)
+
+
+def _update_schedule_on_settings_save(course_settings):
+    namespace = namespace_manager.get_namespace()
+    app_context = sites.get_app_context_for_namespace(namespace)
+    if app_context:
+        update_schedule(app_context, env=course_settings)
+
+
+def on_module_enabled():
+    courses.Course.COURSE_ENV_POST_SAVE_HOOKS.append(
+        _update_schedule_on_settings_save)
+
+
+class AvailabilityTriggerSchedule(db.Model):
+    """Global index of the earliest pending availability trigger per course.
+
+    There is one entity per course that has any pending triggers, stored in
+    the default namespace. Entities are ordered by `when`, so finding all
+    courses with due triggers is a single query rather than a scan of every
+    course's settings.
+    """
+
+    when = db.DateTimeProperty(indexed=True)
+    namespace = db.StringProperty(indexed=False)
+
+    @classmethod
+    def key_name(cls, namespace):
+        # The default course namespace is the empty string, which is not a
+        # legal key name on its own.
+        return '(namespace:%s)' % namespace
+
+    @classmethod
+    def set_next_when(cls, namespace, when):
+        """Records the next trigger time of a course, or None if there is none.
+
+        When the recorded time changes to a time in the future, a deferred
+        task is also enqueued to start the course's job at exactly that time,
+        unless it is too far out for a task ETA; such triggers are started by
+        the hourly cron.
+        """
+        with common_utils.Namespace(appengine_config.DEFAULT_NAMESPACE_NAME):
+            key_name = cls.key_name(namespace)
+            entity = cls.get_by_key_name(key_name)
+            if when is None:
+                if entity:
+                    entity.delete()
+                return
+            if entity and entity.when == when:
+                return
+            cls(key_name=key_name, namespace=namespace, when=when).put()
+
+        now = utc.now_as_datetime()
+        if now < when <= now + MAX_DEFERRED_ETA:
+            deferred.defer(
+                StartAvailabilityJobs.maybe_start_job_for_namespace,
+                namespace, when, _eta=when)
+
+    @classmethod
+    def get_due_namespaces(cls, now):
+        """Returns namespaces of courses with triggers due at or before now."""
+        with common_utils.Namespace(appengine_config.DEFAULT_NAMESPACE_NAME):
+            query = cls.all().filter('when <=', now).order('when')
+            return [entity.namespace for entity in query.run()]
+
+    @classmethod
+    def get_next_when(cls, namespace):
+        with common_utils.Namespace(appengine_config.DEFAULT_NAMESPACE_NAME):
+            entity = cls.get_by_key_name(cls.key_name(namespace))
+            return entity.when if entity else None
+
 
 class StartAvailabilityJobsStatus(db.Model):
 
@@ -112,6 +232,11 @@ class StartAvailabilityJobsStatus(db.Model):
 
     last_run = db.DateTimeProperty(indexed=False)
 
+    # Whether every course has had its AvailabilityTriggerSchedule entry
+    # populated. Until then, jobs are started for all courses, since courses
+    # with triggers saved before the schedule index existed are not in it.
+    schedule_populated = db.BooleanProperty(indexed=False, default=False)
+
     @classmethod
     def get_singleton(cls):
         with common_utils.Namespace(appengine_config.DEFAULT_NAMESPACE_NAME):
@@ -147,6 +272,11 @@ class StartAvailabilityJobs(utils.CronHandler):
     return normally, indicating to the queue manager that the task can be
     dropped.  We don't need to re-enqueue work for ourselves, since we are
     guaranteed to be tickled by cron anyhow.
+
+    Jobs are only started for courses that AvailabilityTriggerSchedule says
+    have a trigger due.  Normally such triggers have already been handled by
+    the ETA task enqueued by AvailabilityTriggerSchedule.set_next_when(); the
+    hourly pass is a backstop for tasks that were lost or failed.
     """
 
     URL = '/cron/availability/update'
@@ -168,17 +298,55 @@ class StartAvailabilityJobs(utils.CronHandler):
             last_run = utc.hour_start(
                 utc.datetime_to_timestamp(status.last_run))
             if now_timestamp > last_run:
+                populated = status.schedule_populated
                 status.last_run = utc.timestamp_to_datetime(now_timestamp)
+                status.schedule_populated = True
                 StartAvailabilityJobsStatus.update_singleton(status)
-                return True
-            return False
-
-        if should_start_jobs():
-            logging.info('StartAvailabilityJobs: running jobs')
-            for app_context in sites.get_all_courses():
-                job = UpdateAvailability(app_context)
-                if job.is_active():
-                    job.cancel()
-                job.submit()
-        else:
+                return True, populated
+            return False, None
+
+        start_jobs, schedule_populated = should_start_jobs()
+        if not start_jobs:
             logging.info('StartAvailabilityJobs: skipping jobs')
+            return
+
+        if schedule_populated:
+            due_namespaces = set(AvailabilityTriggerSchedule.get_due_namespaces(
+                utc.now_as_datetime()))
+            app_contexts = [
+                app_context for app_context in sites.get_all_courses()
+                if app_context.get_namespace_name() in due_namespaces]
+        else:
+            # Every UpdateAvailability run ends by refreshing its course's
+            # schedule entry, so one full pass populates the index.
+            app_contexts = sites.get_all_courses()
+
+        logging.info(
+            'StartAvailabilityJobs: running jobs for %d courses',
+            len(app_contexts))
+        for app_context in app_contexts:
+            job = UpdateAvailability(app_context)
+            if job.is_active():
+                job.cancel()
+            job.submit()
+
+    @classmethod
+    def maybe_start_job_for_namespace(cls, namespace, when):
+        """Deferred callback run at the ETA of a single course's next trigger.
+
+        Does nothing if the course's schedule has changed since the task was
+        enqueued (e.g. the trigger was edited or already acted on), or if the
+        course's job is already running.
+        """
+        if AvailabilityTriggerSchedule.get_next_when(namespace) != when:
+            logging.info(
+                'StartAvailabilityJobs: schedule for %s changed; skipping',
+                namespace)
+            return
+        app_context = sites.get_app_context_for_namespace(namespace)
+        if not app_context:
+            return
+        job = UpdateAvailability(app_context)
+        if not job.is_active():
+            logging.info('StartAvailabilityJobs: running job for %s', namespace)
+            job.submit()
@@ -63,6 +63,7 @@ def register_module():
         assets.on_module_enabled()
         admin_preferences_editor.on_module_enabled()
         availability.on_module_enabled(custom_module, permissions)
+        availability_cron.on_module_enabled()
         course_roles.on_module_enabled(custom_module, permissions)
         graphql.notify_module_enabled()
         lessons.on_module_enabled(custom_module)
@@ -460,6 +460,24 @@ class DateTimeTrigger(object):
                 else cls.copy_triggers_from(
                     courses.Course.get_publish_from_environ(settings)))
 
+    @classmethod
+    def pending_whens(cls, settings, now=None):
+        """Returns the `when` of each of the class triggers in settings.
+
+        Args:
+            settings: passed, untouched, through to copy_from_settings().
+            now: (optional) UTC time as a datetime; see now().
+
+        Returns:
+            A list of UTC datetimes, one per trigger, in no particular order.
+            Triggers with a missing or invalid `when` are reported as `now`,
+            so that whatever acts on them next will also discard them.
+        """
+        now = cls.now(now=now)
+        field = DateTimeTrigger.FIELD_NAME
+        return [cls.validate_when(encoded.get(field)) or now
+                for encoded in cls.copy_from_settings(settings)]
+
     @classmethod
     def for_form(cls, settings, **kwargs):
         """Returns encoded availability triggers from settings as form values.
@@ -1871,3 +1871,59 @@ class CronHackTests(actions.TestBase):
         # And again, we're deduped.
         tasks = self.taskq.GetTasks('default')
         self.assertEquals(0, len(tasks))
+
+    def test_start_jobs_only_for_courses_with_due_triggers(self):
+        status = availability_cron.StartAvailabilityJobsStatus.get_singleton()
+        old_timestamp = utc.now_as_timestamp() - utc._SECONDS_PER_HOUR
+        status.last_run = utc.timestamp_to_datetime(old_timestamp)
+        status.schedule_populated = True
+        availability_cron.StartAvailabilityJobsStatus.update_singleton(status)
+
+        # Nothing scheduled for this course, so no job is started.
+        availability_cron.StartAvailabilityJobs.maybe_start_jobs()
+        self._assert_job_state(is_active=None)  # None => never run.
+
+        # Once a trigger for this course is due, its job is started.
+        status = availability_cron.StartAvailabilityJobsStatus.get_singleton()
+        status.last_run = utc.timestamp_to_datetime(old_timestamp)
+        availability_cron.StartAvailabilityJobsStatus.update_singleton(status)
+        availability_cron.AvailabilityTriggerSchedule.set_next_when(
+            self.app_context.get_namespace_name(),
+            utc.timestamp_to_datetime(old_timestamp))
+        availability_cron.StartAvailabilityJobs.maybe_start_jobs()
+        self._assert_job_state(is_active=True)
+
+    def test_future_trigger_enqueues_task_at_exact_time(self):
+        namespace = self.app_context.get_namespace_name()
+        when = utc.timestamp_to_datetime(
+            utc.now_as_timestamp() + 3 * utc._SECONDS_PER_HOUR)
+        availability_cron.AvailabilityTriggerSchedule.set_next_when(
+            namespace, when)
+        self.assertEquals(
+            when,
+            availability_cron.AvailabilityTriggerSchedule.get_next_when(
+                namespace))
+        self.assertEquals(1, len(self.taskq.GetTasks('default')))
+
+        # Recording the same time again does not enqueue another task.
+        availability_cron.AvailabilityTriggerSchedule.set_next_when(
+            namespace, when)
+        self.assertEquals(1, len(self.taskq.GetTasks('default')))
+
+        # Running the task after the trigger has gone away does nothing.
+        availability_cron.AvailabilityTriggerSchedule.set_next_when(
+            namespace, None)
+        self.execute_all_deferred_tasks()
+        self._assert_job_state(is_active=None)  # None => never run.
+
+    def test_far_future_trigger_is_left_to_cron(self):
+        namespace = self.app_context.get_namespace_name()
+        when = utc.timestamp_to_datetime(
+            utc.now_as_timestamp() + 60 * 24 * utc._SECONDS_PER_HOUR)
+        availability_cron.AvailabilityTriggerSchedule.set_next_when(
+            namespace, when)
+        self.assertEquals(
+            when,
+            availability_cron.AvailabilityTriggerSchedule.get_next_when(
+                namespace))
+        self.assertEquals(0, len(self.taskq.GetTasks('default')))
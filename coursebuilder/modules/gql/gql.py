@@ -63,6 +63,23 @@ clients. The current model is:
           +-- Relay connection for courses
     +-- currentUser
 
+Data behind the nodes (the course, its settings, the current user's Student
+and their view of the course outline) is loaded once per course per request
+and shared by all nodes of that course. The Students of all courses listed by
+allCourses are loaded with a single datastore call. To protect the service,
+queries nested deeper than MAX_QUERY_DEPTH or selecting more than
+MAX_QUERY_FIELDS fields are rejected before they are executed.
+
+Queries are parsed and validated once per instance and kept by the SHA-256
+hash of their text. Clients sending the same documents on every page load may
+use persisted queries: send the hex digest as the "query_hash" parameter
+instead of "q". If the server answers with the error PersistedQueryNotFound,
+resend with both "q" and "query_hash" to register the query. Query variables
+are passed as a JSON object in the "variables" parameter. When the response
+cache is enabled in the Advanced Site Settings page, successful responses to
+signed-out users are kept in memcache, keyed by query, variables and the
+requested locale, until course settings or content are next saved.
+
 This module includes a lightwight front-end for exploring the GraphQL service.
 Connect to:
     https://<your_cb_instance>/modules/gql/_static/query/index.html
@@ -82,12 +99,19 @@ __author__ = [
 import graphene
 import graphene.relay
 import graphql
+from graphql.core import validation as graphql_validation
+from graphql.core.language import ast as graphql_ast
+from graphql.core.language import parser as graphql_parser
+from graphql.core.language import source as graphql_source
 from graphql_relay.node import node as graphql_node
+import hashlib
 import logging
 import os
+import time
 
 import appengine_config
 
+from common import caching
 from common import jinja_utils
 from common import utils as common_utils
 from common import users
@@ -96,6 +120,7 @@ from controllers import utils
 from models import config
 from models import courses
 from models import custom_modules
+from models import models
 from models import roles
 from models import transforms
 from modules.courses import unit_outline
@@ -107,6 +132,29 @@ _TEMPLATES_DIR = os.path.join(
 # Character used as separator for compound id's
 ID_SEP = ':'
 
+# Limits on the size of queries; larger queries are rejected unexecuted.
+MAX_QUERY_DEPTH = 15
+MAX_QUERY_FIELDS = 500
+
+# Most selections (fields, fragment spreads and inline fragments, counted at
+# each place where fragments are spread) looked at to measure a query.
+MAX_QUERY_SELECTIONS = 4 * MAX_QUERY_FIELDS
+
+# Largest size of the in-process cache of parsed queries.
+PARSED_QUERY_CACHE_MAX_SIZE_BYTES = 1024 * 1024
+
+# Error returned for a query_hash that is not registered; the client should
+# send the query text along with the hash.
+PERSISTED_QUERY_NOT_FOUND = 'PersistedQueryNotFound'
+
+# Seconds for which registered query texts are kept in memcache.
+PERSISTED_QUERY_TTL_SECS = 60 * 60 * 24
+
+# Seconds for which cached responses are served. Saving the settings or
+# content of any course retires them sooner; other changes, such as to the
+# list of courses, are seen once they expire.
+RESPONSE_CACHE_TTL_SECS = 60 * 5
+
 custom_module = None
 
 
@@ -117,6 +165,291 @@ def _resolve_id(cls, node_id):
     return resolved_id.id
 
 
+def _get_query_size(document):
+    """Returns the depth, fields and selections of a parsed query.
+
+    Fragments are counted at each place where they are spread. Counting stops
+    once MAX_QUERY_SELECTIONS is exceeded, so that fragments spread many
+    times over cannot make this expensive, even when they select no fields.
+    """
+    fragments = {}
+    pending = []
+    for definition in document.definitions:
+        if isinstance(definition, graphql_ast.FragmentDefinition):
+            fragments[definition.name.value] = definition
+        elif isinstance(definition, graphql_ast.OperationDefinition):
+            pending.append((definition.selection_set, 1, frozenset()))
+
+    max_depth = 0
+    num_fields = 0
+    num_selections = 0
+    while pending and num_selections <= MAX_QUERY_SELECTIONS:
+        selection_set, depth, spread_names = pending.pop()
+        if not selection_set:
+            continue
+        for selection in selection_set.selections:
+            num_selections += 1
+            if num_selections > MAX_QUERY_SELECTIONS:
+                break
+            if isinstance(selection, graphql_ast.Field):
+                num_fields += 1
+                max_depth = max(max_depth, depth)
+                pending.append(
+                    (selection.selection_set, depth + 1, spread_names))
+            elif isinstance(selection, graphql_ast.FragmentSpread):
+                # Unknown and cyclic fragments are reported by validation.
+                name = selection.name.value
+                if name in fragments and name not in spread_names:
+                    pending.append((
+                        fragments[name].selection_set, depth,
+                        spread_names | frozenset([name])))
+            else:
+                pending.append((selection.selection_set, depth, spread_names))
+    return max_depth, num_fields, num_selections
+
+
+def _check_query_size(document):
+    """Returns an error message if the query is too large, else None."""
+    depth, num_fields, num_selections = _get_query_size(document)
+    if num_selections > MAX_QUERY_SELECTIONS:
+        return 'Query is too complex.'
+    if depth > MAX_QUERY_DEPTH:
+        return 'Query is nested more than %d levels deep.' % MAX_QUERY_DEPTH
+    if num_fields > MAX_QUERY_FIELDS:
+        return 'Query selects more than %d fields.' % MAX_QUERY_FIELDS
+    return None
+
+
+def _get_query_hash(query_str):
+    if isinstance(query_str, unicode):
+        query_str = query_str.encode('utf-8')
+    return hashlib.sha256(query_str).hexdigest()
+
+
+class _ParsedQueryCache(caching.ProcessScopedSingleton):
+    """Parsed queries that passed validation, by the hash of their text."""
+
+    def __init__(self):
+        self.cache = caching.LRUCache(
+            max_size_bytes=PARSED_QUERY_CACHE_MAX_SIZE_BYTES,
+            name='gql_parsed_queries')
+
+    @classmethod
+    def get_document(cls, schema, query_hash, query_str=None):
+        """Parses and validates a query, or gets it from the cache.
+
+        Args:
+            schema: graphene.Schema. The schema to validate the query against.
+            query_hash: string. The hash of the text of the query.
+            query_str: string. The text of the query, or None to look it up
+                among persisted queries if it is not cached.
+        Returns:
+            A pair of the parsed query and a list of error messages; the
+            query is valid only if the list is empty.
+        Raises:
+            GraphQLError: the query has a syntax error.
+        """
+        found, document = cls.instance().cache.get(query_hash)
+        if found:
+            return document, []
+        if query_str is None:
+            query_str = _PersistedQueries.get(query_hash)
+            if query_str is None:
+                return None, [PERSISTED_QUERY_NOT_FOUND]
+        document = graphql_parser.parse(
+            graphql_source.Source(query_str, 'GraphQL request'))
+        size_error = _check_query_size(document)
+        if size_error:
+            logging.warning('Rejected GraphQL query: %s', size_error)
+            return document, [size_error]
+        errors = graphql_validation.validate(schema.schema, document)
+        for err in errors:
+            logging.error('GraphQL schema.execute error: %s', err)
+        if errors:
+            return document, [err.message for err in errors]
+        cls.instance().cache.put(query_hash, document)
+        return document, []
+
+
+class _PersistedQueries(object):
+    """Registry of query texts by hash, shared by all instances."""
+
+    @classmethod
+    def _memcache_key(cls, query_hash):
+        return '(gql-persisted-query:%s)' % query_hash
+
+    @classmethod
+    def register(cls, query_hash, query_str):
+        models.MemcacheManager.set(
+            cls._memcache_key(query_hash), query_str,
+            ttl=PERSISTED_QUERY_TTL_SECS,
+            namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+
+    @classmethod
+    def get(cls, query_hash):
+        """Returns the text of a registered query, or None."""
+        return models.MemcacheManager.get(
+            cls._memcache_key(query_hash),
+            namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+
+
+class _ResponseCache(object):
+    """Responses to signed-out users, shared by all instances.
+
+    Cached responses are keyed by a version stamp, which is bumped whenever
+    the settings or content of a course are saved.
+    """
+
+    @classmethod
+    def _version_key(cls):
+        return '(gql-response-cache-version)'
+
+    @classmethod
+    def _get_version(cls):
+        version = models.MemcacheManager.get(
+            cls._version_key(),
+            namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+        if version is None:
+            version = cls.bump_version()
+        return version
+
+    @classmethod
+    def bump_version(cls, *unused_args):
+        """Retires all cached responses."""
+        return models.MemcacheManager.incr(
+            cls._version_key(), 1,
+            namespace=appengine_config.DEFAULT_NAMESPACE_NAME,
+            initial_value=int(time.time() * 1000 * 1000))
+
+    @classmethod
+    def get_key(cls, handler, query_hash, variables, expanded_gcb_tags):
+        """Returns the memcache key of a response, or None if not cacheable.
+
+        Only responses to signed-out users are cached. Of the request, the
+        response depends on the query and its variables, and on the
+        parameters, cookie and headers that select the locale.
+        """
+        if not GQL_RESPONSE_CACHE_ENABLED.value or users.get_current_user():
+            return None
+        version = cls._get_version()
+        if version is None:
+            return None
+        request_hash = _get_query_hash(transforms.dumps([
+            query_hash, variables, expanded_gcb_tags,
+            handler.request.get('hl'),
+            handler.request.cookies.get(utils.GUEST_LOCALE_COOKIE),
+            handler.request.headers.get('Accept-Language')], sort_keys=True))
+        return '(gql-response:%s:%s)' % (version, request_hash)
+
+    @classmethod
+    def get(cls, key):
+        return models.MemcacheManager.get(
+            key, namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+
+    @classmethod
+    def set(cls, key, response_dict):
+        models.MemcacheManager.set(
+            key, response_dict, ttl=RESPONSE_CACHE_TTL_SECS,
+            namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+
+
+class _RequestLoader(caching.RequestScopedSingleton):
+    """Loads the data behind the nodes of the tree once per request.
+
+    Resolvers run one node at a time, and the nodes of a course each need the
+    course, its environ, the current user's Student and a StudentCourseView.
+    These are kept here per course, so sibling nodes share them. Courses that
+    are about to be resolved together are registered with add_courses(), and
+    the current user's Students in all of them are then fetched in one batch
+    when the first is asked for.
+    """
+
+    def __init__(self):
+        self._courses = {}
+        self._course_views = {}
+        self._environs = {}
+        self._students = {}
+        self._pending_namespaces = set()
+
+    def _add_courses(self, app_contexts):
+        for app_context in app_contexts:
+            namespace = app_context.get_namespace_name()
+            if namespace not in self._students:
+                self._pending_namespaces.add(namespace)
+
+    def _load_students(self):
+        namespaces = list(self._pending_namespaces)
+        self._pending_namespaces = set()
+        user = users.get_current_user()
+        if user:
+            students = models.StudentCache.get_by_user_id_in_namespaces(
+                user.user_id(), namespaces)
+        else:
+            students = {}
+        for namespace in namespaces:
+            student = students.get(namespace)
+            if not student or not student.is_enrolled:
+                student = utils.TRANSIENT_STUDENT
+            self._students[namespace] = student
+
+    def _get_student(self, app_context):
+        namespace = app_context.get_namespace_name()
+        if namespace not in self._students:
+            self._pending_namespaces.add(namespace)
+            self._load_students()
+        return self._students[namespace]
+
+    def _get_course(self, app_context):
+        namespace = app_context.get_namespace_name()
+        if namespace not in self._courses:
+            self._courses[namespace] = courses.Course(None, app_context)
+        return self._courses[namespace]
+
+    def _get_environ(self, app_context):
+        namespace = app_context.get_namespace_name()
+        if namespace not in self._environs:
+            # Environ hooks may look up the Student; load it in the batch.
+            self._get_student(app_context)
+            with common_utils.Namespace(namespace):
+                self._environs[namespace] = courses.Course.get_environ(
+                    app_context)
+        return self._environs[namespace]
+
+    def _get_course_view(self, app_context):
+        namespace = app_context.get_namespace_name()
+        if namespace not in self._course_views:
+            self._course_views[namespace] = (
+                CourseAwareObjectType.get_course_view(
+                    self._get_course(app_context),
+                    self._get_student(app_context)))
+        return self._course_views[namespace]
+
+    @classmethod
+    def add_courses(cls, app_contexts):
+        # pylint: disable=protected-access
+        cls.instance()._add_courses(app_contexts)
+
+    @classmethod
+    def get_student(cls, app_context):
+        # pylint: disable=protected-access
+        return cls.instance()._get_student(app_context)
+
+    @classmethod
+    def get_course(cls, app_context):
+        # pylint: disable=protected-access
+        return cls.instance()._get_course(app_context)
+
+    @classmethod
+    def get_environ(cls, app_context):
+        # pylint: disable=protected-access
+        return cls.instance()._get_environ(app_context)
+
+    @classmethod
+    def get_course_view(cls, app_context):
+        # pylint: disable=protected-access
+        return cls.instance()._get_course_view(app_context)
+
+
 class CourseAwareObjectType(object):
     """Mixin providing methods for Graphene objects having a course context."""
 
@@ -128,15 +461,15 @@ class CourseAwareObjectType(object):
 
     @property
     def course(self):
-        return self._course or courses.Course(None, self.app_context)
+        return self._course or _RequestLoader.get_course(self.app_context)
 
     @property
     def course_view(self):
         # StudentCourseView is expensive to build, so only construct it when
-        # needed, and inherit from the parent if possible.
+        # needed, and share it with other nodes of the course if possible.
         if not self._course_view:
-            self._course_view = self.get_course_view(
-                self.course, self.get_student(self.app_context))
+            self._course_view = _RequestLoader.get_course_view(
+                self.app_context)
         return self._course_view
 
     @classmethod
@@ -184,9 +517,7 @@ class CourseAwareObjectType(object):
 
     @classmethod
     def get_student(cls, app_context):
-        with common_utils.Namespace(app_context.namespace):
-            _, student = utils.CourseHandler.get_user_and_student_or_transient()
-            return student
+        return _RequestLoader.get_student(app_context)
 
 
 class Lesson(CourseAwareObjectType, graphene.relay.Node):
@@ -227,8 +558,7 @@ class Lesson(CourseAwareObjectType, graphene.relay.Node):
     def get_lesson(cls, lesson_id):
         course_id, unit_id, lesson_id = lesson_id.split(ID_SEP)
         course = Course.get_course(course_id).course
-        student = cls.get_student(course.app_context)
-        course_view = cls.get_course_view(course, student)
+        course_view = _RequestLoader.get_course_view(course.app_context)
         unit = course_view.find_element([unit_id]).course_element
         lesson = course_view.find_element([unit_id, lesson_id]).course_element
         if lesson:
@@ -283,8 +613,7 @@ class Unit(CourseAwareObjectType, graphene.relay.Node):
     def get_unit(cls, unit_id):
         course_id, unit_id = unit_id.split(ID_SEP)
         course = Course.get_course(course_id).course
-        student = cls.get_student(course.app_context)
-        course_view = cls.get_course_view(course, student)
+        course_view = _RequestLoader.get_course_view(course.app_context)
         unit = course_view.find_element([unit_id]).course_element
         if unit:
             return Unit(
@@ -403,8 +732,7 @@ class Course(CourseAwareObjectType, graphene.relay.Node):
 
     @property
     def course_environ(self):
-        with common_utils.Namespace(self.app_context.namespace):
-            return courses.Course.get_environ(self.app_context)
+        return _RequestLoader.get_environ(self.app_context)
 
     @classmethod
     def get_node(cls, node_id, info):
@@ -416,6 +744,8 @@ class Course(CourseAwareObjectType, graphene.relay.Node):
 
     @classmethod
     def _is_visible(cls, app_context):
+        # Environ hooks may look up the Student; load it in the batch.
+        _RequestLoader.get_student(app_context)
         with common_utils.Namespace(app_context.namespace):
             return sites.can_handle_course_requests(app_context)
 
@@ -431,7 +761,9 @@ class Course(CourseAwareObjectType, graphene.relay.Node):
     @classmethod
     def get_all_courses(cls):
         all_courses = []
-        for app_context in sites.get_all_courses():
+        app_contexts = sites.get_all_courses()
+        _RequestLoader.add_courses(app_contexts)
+        for app_context in app_contexts:
             if cls._is_visible(app_context):
                 all_courses.append(Course(
                     app_context=app_context, id=app_context.get_slug()))
@@ -512,17 +844,42 @@ class Query(graphene.ObjectType):
 class GraphQLRestHandler(utils.BaseRESTHandler):
     URL = '/modules/gql/query'
 
-    def _get_response_dict(self, query_str, expanded_gcb_tags):
-        if not query_str:
+    def _get_response_dict(self, query_str, expanded_gcb_tags,
+                           query_hash=None, variables=None):
+        if not query_str and not query_hash:
             return {
                 'data': None,
                 'errors': ['Missing required query parameter "q"']
             }
 
+        persist_query = False
+        if query_str:
+            if query_hash and query_hash != _get_query_hash(query_str):
+                return {
+                    'data': None,
+                    'errors': ['Query does not match "query_hash"']
+                }
+            if query_hash:
+                persist_query = True
+            else:
+                query_hash = _get_query_hash(query_str)
+
         schema = graphene.Schema(query=Query)
         try:
+            document, errors = _ParsedQueryCache.get_document(
+                schema, query_hash, query_str=query_str or None)
+            if errors:
+                return {
+                    'data': None,
+                    'errors': errors
+                }
+            if persist_query:
+                _PersistedQueries.register(query_hash, query_str)
+            # The document was validated when it was parsed.
             result = schema.execute(
-                request=query_str,
+                request=document,
+                args=variables,
+                validate_ast=False,
                 request_context={
                     'handler': self,
                     'expanded_gcb_tags': expanded_gcb_tags,
@@ -538,7 +895,7 @@ class GraphQLRestHandler(utils.BaseRESTHandler):
                 log_level = logging.exception
             else:
                 log_level = logging.error
-            log_level('GraphQL error with query: %s', query_str)
+            log_level('GraphQL error with query: %s', query_str or query_hash)
             return {
                 'data': None,
                 'errors': [err.message]
@@ -559,9 +916,36 @@ class GraphQLRestHandler(utils.BaseRESTHandler):
             return
 
         query_str = self.request.get('q')
+        query_hash = self.request.get('query_hash')
         expanded_gcb_tags = self.request.get('expanded_gcb_tags')
-        response_dict = self._get_response_dict(query_str, expanded_gcb_tags)
+        try:
+            variables = transforms.loads(self.request.get('variables') or '{}')
+        except ValueError:
+            variables = None
+        if not isinstance(variables, dict):
+            self._send_response(400, {
+                'data': None,
+                'errors': ['Parameter "variables" must be a JSON object']
+            })
+            return
+
+        cache_key = None
+        if query_str or query_hash:
+            cache_key = _ResponseCache.get_key(
+                self, query_hash or _get_query_hash(query_str), variables,
+                expanded_gcb_tags)
+        if cache_key:
+            response_dict = _ResponseCache.get(cache_key)
+            if response_dict is not None:
+                self._send_response(200, response_dict)
+                return
+
+        response_dict = self._get_response_dict(
+            query_str, expanded_gcb_tags, query_hash=query_hash,
+            variables=variables)
         status_code = 400 if response_dict['errors'] else 200
+        if cache_key and status_code == 200:
+            _ResponseCache.set(cache_key, response_dict)
         self._send_response(status_code, response_dict)
 
 
@@ -569,6 +953,20 @@ GQL_SERVICE_ENABLED = config.ConfigProperty(
     'gcb_gql_service_enabled', bool, 'Enable the GraphQL REST endpoint.',
     default_value=True, label='GraphQL')
 
+GQL_RESPONSE_CACHE_ENABLED = config.ConfigProperty(
+    'gcb_gql_response_cache_enabled', bool,
+    'Cache responses of the GraphQL REST endpoint to signed-out users. '
+    'Cached responses are refreshed when the settings or content of any '
+    'course are saved, and otherwise after %d minutes.' % (
+        RESPONSE_CACHE_TTL_SECS / 60),
+    default_value=False, label='GraphQL Response Cache')
+
+
+def notify_module_enabled():
+    courses.Course.POST_SAVE_HOOKS.append(_ResponseCache.bump_version)
+    courses.Course.COURSE_ENV_POST_SAVE_HOOKS.append(
+        _ResponseCache.bump_version)
+
 
 def register_module():
 
@@ -580,6 +978,7 @@ def register_module():
     custom_module = custom_modules.Module(
         'GraphQL',
         'Handles queries for Course Builder in GraphQL.',
-        global_routes, namespaced_routes)
+        global_routes, namespaced_routes,
+        notify_module_enabled=notify_module_enabled)
 
     return custom_module
@@ -20,6 +20,8 @@ __author__ = [
 
 import graphene
 from graphql_relay.node import node as graphql_node
+import hashlib
+import logging
 import urllib
 
 import appengine_config
@@ -27,6 +29,7 @@ from common import utils as common_utils
 from controllers import sites
 from models import config
 from models import courses
+from models import models
 from models import transforms
 from modules.gql import gql
 from tests.functional import actions
@@ -886,5 +889,277 @@ class LessonTests(GraphQLTreeTests):
             body)
 
 
+class RequestLoaderTests(GraphQLTreeTests):
+    """Tests that node data is loaded once per request, and query limits."""
 
+    NUM_COURSES = 25
 
+    ALL_COURSES_QUERY = (
+        '{allCourses {edges {node {... on Course {'
+        '  url title openForRegistration enrollment {enrolled}'
+        '  allUnits {edges {node {... on Unit {title header}}}}}}}}}')
+
+    def setUp(self):
+        super(RequestLoaderTests, self).setUp()
+        self.set_course_availability(
+            courses.COURSE_AVAILABILITY_REGISTRATION_OPTIONAL)
+        self.unit_ids = []
+        for index in xrange(self.NUM_COURSES):
+            name = '%s%d' % (COURSE_NAME, index)
+            app_context = actions.simple_add_course(name, ADMIN_EMAIL, name)
+            course = courses.Course(None, app_context)
+            unit = course.add_unit()
+            unit.title = 'Unit %d' % index
+            unit.availability = courses.AVAILABILITY_AVAILABLE
+            course.save()
+            self.unit_ids.append(unit.unit_id)
+        actions.login(STUDENT_EMAIL)
+        actions.register(self, STUDENT_NAME, course=COURSE_NAME + '0')
+
+    def tearDown(self):
+        sites.reset_courses()
+        super(RequestLoaderTests, self).tearDown()
+
+    def test_students_are_loaded_in_one_batch(self):
+        gets = []
+        student_gets = []
+
+        def counting_get(keys, *args, **kwargs):
+            gets.append(keys)
+            key_list = keys if isinstance(keys, list) else [keys]
+            if any(isinstance(key, db.Key) and
+                   key.kind() == models.Student.kind() for key in key_list):
+                student_gets.append(keys)
+            return real_get(keys, *args, **kwargs)
+
+        real_get = db.get
+        self.swap(db, 'get', counting_get)
+        with actions.OverriddenConfig(models.CAN_USE_MEMCACHE.name, True):
+            self.get_response(self.ALL_COURSES_QUERY)  # Warm caches.
+            del gets[:]
+            del student_gets[:]
+            memcache_reads = (
+                models.CACHE_HIT.value + models.CACHE_MISS.value)
+            response = self.get_response(self.ALL_COURSES_QUERY)
+            memcache_reads = (
+                models.CACHE_HIT.value + models.CACHE_MISS.value -
+                memcache_reads)
+        logging.info(
+            'allCourses over %d courses: %d datastore gets, '
+            '%d memcache reads.', self.NUM_COURSES, len(gets), memcache_reads)
+
+        self.assertEquals(1, len(student_gets))
+        enrolled = dict(
+            (edge['node']['url'], edge['node']['enrollment']['enrolled'])
+            for edge in response['data']['allCourses']['edges'])
+        for index in xrange(self.NUM_COURSES):
+            self.assertEquals(
+                index == 0, enrolled['/%s%d' % (COURSE_NAME, index)])
+
+    def test_course_view_is_built_once_per_course(self):
+        course_views = []
+        get_course_view = gql.CourseAwareObjectType.get_course_view
+
+        def counting_get_course_view(unused_cls, course, student):
+            course_views.append(course.app_context.get_slug())
+            return get_course_view(course, student)
+
+        self.swap(
+            gql.CourseAwareObjectType, 'get_course_view',
+            classmethod(counting_get_course_view))
+        base = '/%s0' % COURSE_NAME
+        unit_id = get_unit_id(base, self.unit_ids[0])
+        response = self.get_response(
+            '{course(id: "%s") {allUnits {edges {node {... on Unit {title}}}}'
+            '  unit(id: "%s") {title header}}'
+            ' node(id: "%s") {... on Unit {footer}}}' % (
+                get_course_id(base), unit_id, unit_id))
+        self.assertEquals(
+            'Unit 0', response['data']['course']['unit']['title'])
+        self.assertEquals([base], course_views)
+
+    def test_deeply_nested_query_is_rejected(self):
+        query = '{__type(name: "Course") {%sname%s}}' % (
+            'ofType {' * gql.MAX_QUERY_DEPTH, '}' * gql.MAX_QUERY_DEPTH)
+        response = self.get_response(query, expect_errors=True)
+        self.assertEquals(
+            ['Query is nested more than %d levels deep.' % (
+                gql.MAX_QUERY_DEPTH)],
+            response['errors'])
+
+        # Queries as deep as the limit are accepted.
+        query = '{__type(name: "Course") {%sname%s}}' % (
+            'ofType {' * (gql.MAX_QUERY_DEPTH - 2),
+            '}' * (gql.MAX_QUERY_DEPTH - 2))
+        self.get_response(query)
+
+    def test_query_with_too_many_fields_is_rejected(self):
+        expected_errors = [
+            'Query selects more than %d fields.' % gql.MAX_QUERY_FIELDS]
+        query = '{%s}' % ' '.join(
+            'u%d: currentUser {email}' % i
+            for i in xrange(gql.MAX_QUERY_FIELDS / 2 + 1))
+        response = self.get_response(query, expect_errors=True)
+        self.assertEquals(expected_errors, response['errors'])
+
+        # Fields of fragments count each time the fragment is spread.
+        query = '{%s} fragment F on CurrentUser {email loggedIn}' % ' '.join(
+            'u%d: currentUser {...F}' % i
+            for i in xrange(gql.MAX_QUERY_FIELDS / 3 + 1))
+        response = self.get_response(query, expect_errors=True)
+        self.assertEquals(expected_errors, response['errors'])
+
+        query = '{%s}' % ' '.join(
+            'u%d: currentUser {email}' % i
+            for i in xrange(gql.MAX_QUERY_FIELDS / 2))
+        self.get_response(query)
+
+    def test_fragments_spread_exponentially_are_rejected(self):
+        # Each fragment spreads the next twice; the last spreads an undefined
+        # fragment, so that no fields are ever selected.
+        num_fragments = 40
+        query = '{...F0} %s fragment F%d on Query {...Undefined}' % (
+            ' '.join(
+                'fragment F%d on Query {...F%d ...F%d}' % (i, i + 1, i + 1)
+                for i in xrange(num_fragments)),
+            num_fragments)
+        response = self.get_response(query, expect_errors=True)
+        self.assertEquals(['Query is too complex.'], response['errors'])
+
+
+class QueryCacheTests(GraphQLTreeTests):
+    """Tests for persisted queries and the response cache."""
+
+    def setUp(self):
+        super(QueryCacheTests, self).setUp()
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        config.Registry.test_overrides[
+            gql.GQL_RESPONSE_CACHE_ENABLED.name] = True
+        actions.simple_add_course(COURSE_NAME, ADMIN_EMAIL, COURSE_NAME)
+        self.set_course_availability(courses.COURSE_AVAILABILITY_PUBLIC)
+        self.course_id = get_course_id('/' + COURSE_NAME)
+        self.query_str = '{course(id: "%s") {title}}' % self.course_id
+        self.query_hash = hashlib.sha256(self.query_str).hexdigest()
+        # pylint: disable=protected-access
+        gql._ParsedQueryCache.clear_instance()
+
+        self.executions = []
+        get_response_dict = gql.GraphQLRestHandler._get_response_dict
+
+        def counting_get_response_dict(handler, *args, **kwargs):
+            self.executions.append(args)
+            return get_response_dict(handler, *args, **kwargs)
+
+        self.swap(
+            gql.GraphQLRestHandler, '_get_response_dict',
+            counting_get_response_dict)
+
+    def tearDown(self):
+        sites.reset_courses()
+        super(QueryCacheTests, self).tearDown()
+
+    def get_with_params(self, params, expected_status=200):
+        response = self.get('%s?%s' % (
+            self.GRAPHQL_REST_HANDLER_URL, urllib.urlencode(params)),
+            expect_errors=True)
+        self.assertEquals(expected_status, response.status_int)
+        return transforms.loads(response.body)
+
+    def get_title(self, **params):
+        params.setdefault('q', self.query_str)
+        response = self.get_with_params(params)
+        return response['data']['course']['title']
+
+    def test_persisted_query(self):
+        actions.login(STUDENT_EMAIL)  # Not served from the response cache.
+        response = self.get_with_params(
+            {'query_hash': self.query_hash}, expected_status=400)
+        self.assertEquals([gql.PERSISTED_QUERY_NOT_FOUND], response['errors'])
+
+        self.assertEquals(
+            COURSE_NAME, self.get_title(query_hash=self.query_hash))
+        response = self.get_with_params({'query_hash': self.query_hash})
+        self.assertEquals(
+            COURSE_NAME, response['data']['course']['title'])
+
+        response = self.get_with_params(
+            {'q': self.query_str, 'query_hash': 'abc'}, expected_status=400)
+        self.assertEquals(
+            ['Query does not match "query_hash"'], response['errors'])
+
+    def test_invalid_query_is_not_persisted(self):
+        query_str = '{course(id: "%s") {no_such_field}}' % self.course_id
+        query_hash = hashlib.sha256(query_str).hexdigest()
+        response = self.get_with_params(
+            {'q': query_str, 'query_hash': query_hash}, expected_status=400)
+        self.assertTrue(response['errors'])
+        response = self.get_with_params(
+            {'query_hash': query_hash}, expected_status=400)
+        self.assertEquals([gql.PERSISTED_QUERY_NOT_FOUND], response['errors'])
+
+    def test_query_is_parsed_once(self):
+        parsed = []
+        parse = gql.graphql_parser.parse
+
+        def counting_parse(source, *args, **kwargs):
+            parsed.append(source)
+            return parse(source, *args, **kwargs)
+
+        self.swap(gql.graphql_parser, 'parse', counting_parse)
+        actions.login(STUDENT_EMAIL)
+        for _ in xrange(3):
+            self.assertEquals(COURSE_NAME, self.get_title())
+        self.assertEquals(1, len(parsed))
+        self.assertEquals(3, len(self.executions))
+
+    def test_variables(self):
+        query_str = 'query Q($id: String) {course(id: $id) {title}}'
+        self.assertEquals(COURSE_NAME, self.get_title(
+            q=query_str, variables=transforms.dumps({'id': self.course_id})))
+
+        for variables in ('[]', '{'):
+            response = self.get_with_params(
+                {'q': query_str, 'variables': variables}, expected_status=400)
+            self.assertEquals(
+                ['Parameter "variables" must be a JSON object'],
+                response['errors'])
+
+    def test_responses_to_signed_out_users_are_cached(self):
+        self.assertEquals(COURSE_NAME, self.get_title())
+        self.assertEquals(COURSE_NAME, self.get_title())
+        self.assertEquals(1, len(self.executions))
+
+        # The locale requested is part of the key.
+        self.assertEquals(COURSE_NAME, self.get_title(hl='fr'))
+        self.assertEquals(2, len(self.executions))
+
+        # Errors are not cached.
+        self.get_with_params({'q': '{course'}, expected_status=400)
+        self.get_with_params({'q': '{course'}, expected_status=400)
+        self.assertEquals(4, len(self.executions))
+
+        # Signed-in users are never served from the cache.
+        actions.login(STUDENT_EMAIL)
+        self.assertEquals(COURSE_NAME, self.get_title())
+        self.assertEquals(5, len(self.executions))
+
+    def test_cache_is_disabled_by_default(self):
+        del config.Registry.test_overrides[
+            gql.GQL_RESPONSE_CACHE_ENABLED.name]
+        self.assertEquals(COURSE_NAME, self.get_title())
+        self.assertEquals(COURSE_NAME, self.get_title())
+        self.assertEquals(2, len(self.executions))
+
+    def test_cache_is_refreshed_on_course_saves(self):
+        self.assertEquals(COURSE_NAME, self.get_title())
+
+        actions.update_course_config(COURSE_NAME, {'course': {'title': 'New'}})
+        self.assertEquals('New', self.get_title())
+        self.assertEquals(2, len(self.executions))
+
+        self.assertEquals('New', self.get_title())
+        self.assertEquals(2, len(self.executions))
+        app_context = sites.get_course_for_path('/' + COURSE_NAME)
+        courses.Course(None, app_context).save()
+        self.assertEquals('New', self.get_title())
+        self.assertEquals(3, len(self.executions))
@@ -21,18 +21,21 @@ import cgi
 import collections
 import cStringIO
 import datetime
+import hashlib
 import logging
 import os
 import re
 import StringIO
-import sys
+import time
 import urllib
 from xml.dom import minidom
 import zipfile
+import zlib
 
 from babel import localedata
 from babel.messages import catalog
 from babel.messages import pofile
+import cloudstorage
 import jinja2
 from webapp2_extras import i18n
 
@@ -48,10 +51,12 @@ from common import utils as common_utils
 from common import xcontent
 from controllers import sites
 from controllers import utils
+from models import counters
 from models import courses
 from models import resources_display
 from models import custom_modules
 from models import custom_units
+from models import entities
 from models import jobs
 from models import model_caching
 from models import models
@@ -64,7 +69,10 @@ from modules.i18n_dashboard import messages
 from modules.oeditor import oeditor
 from tools import verify
 
+from google.appengine.api import app_identity
+from google.appengine.ext import blobstore
 from google.appengine.ext import db
+from google.appengine.ext import deferred
 
 MODULE_TITLE = 'Translations'
 RESOURCES_PATH = '/modules/i18n_dashboard/resources'
@@ -104,6 +112,33 @@ RESOURCE_BUNDLE_CACHE_NAME = 'resource_bundle'
 RESOURCE_BUNDLE_CACHE_MAX_SIZE_BYTES = 16 * 1024 * 1024
 RESOURCE_BUNDLE_CACHE_TTL_SEC = 5 * 60
 
+# Translated HTML is cached under a digest of everything it is computed from,
+# so entries never go stale; the TTL only bounds memcache usage.
+TRANSLATED_HTML_CACHE_MAX_SIZE_BYTES = 8 * 1024 * 1024
+TRANSLATED_HTML_CACHE_TTL_SEC = 24 * 60 * 60
+
+TRANSLATED_HTML_CACHE_HIT = counters.PerfCounter(
+    'gcb-i18n-translated-html-cache-hit',
+    'Number of times translated HTML was found in the in-process cache or '
+    'in memcache.')
+TRANSLATED_HTML_CACHE_MISS = counters.PerfCounter(
+    'gcb-i18n-translated-html-cache-miss',
+    'Number of times translated HTML had to be rendered.')
+
+# Translation import and export work through course resources this many at a
+# time, so only that many resource bundles are held in memory at once.
+TRANSFER_CHUNK_SIZE = 50
+# Imports and exports touching more than this many (resource, locale) pairs
+# are run as a chain of background tasks rather than within the request.
+BACKGROUND_TRANSFER_MIN_ITEMS = 2000
+# Seconds of work one background transfer task does before checkpointing and
+# handing off to a continuation task.
+TRANSFER_TASK_BUDGET_SECONDS = 60
+# Uploaded messages are staged in parts of at most this many messages.
+TRANSFER_MESSAGES_PER_PART = 1000
+# At most this many warnings are kept for display after a background import.
+TRANSFER_MAX_MESSAGES = 500
+
 custom_module = None
 
 
@@ -155,6 +190,20 @@ class NamedJsonDAO(models.BaseJsonDao):
     def create_blank(cls, resource_key):
         return cls.DTO(str(resource_key), {})
 
+    @classmethod
+    def get_by_keys(cls, keys):
+        """Load DTOs for the named keys straight from the datastore.
+
+        Like ResourceBundleDAO.get_all_for_locale(), this bypasses memcache,
+        so it sees deletions made by delete_all_for_locale().  Keys with no
+        stored entity are omitted from the result.
+        """
+        found = entities.get([
+            db.Key.from_path(cls.ENTITY.kind(), str(key)) for key in keys])
+        return [
+            cls.DTO(entity.key().id_or_name(), transforms.loads(entity.data))
+            for entity in found if entity]
+
 
 class I18nProgressEntity(models.BaseEntity):
     """The base entity for storing i18n workflow information.
@@ -215,14 +264,6 @@ class ResourceBundleEntity(models.BaseEntity):
     created_on = db.DateTimeProperty(auto_now_add=True, indexed=False)
     updated_on = db.DateTimeProperty(indexed=True)
 
-    @classmethod
-    def getsizeof(cls, entity):
-        return (
-            sys.getsizeof(entity.data) +
-            sys.getsizeof(entity.locale) +
-            sys.getsizeof(entity.created_on) +
-            sys.getsizeof(entity.updated_on))
-
 
 class ResourceBundleDTO(object):
     """The lightweight data transfer object for resource bundles.
@@ -633,27 +674,40 @@ class TranslationContents(object):
           app_context: Standard Course Builder application context instance.
           out_stream: The stream to which to write content.
         """
+        zf = zipfile.ZipFile(out_stream, 'w', allowZip64=True)
+        try:
+            for locale, file_name, content in self.iter_po_files(app_context):
+                zf.writestr(self.get_zip_path(locale, file_name), content)
+        finally:
+            zf.close()
+
+    def iter_po_files(self, app_context):
+        """Render this instance's contents as .po files, one at a time.
+
+        Args:
+          app_context: Standard Course Builder application context instance.
+        Yields:
+          A 3-tuple of (locale, file name, .po file content) per file.
+        """
         with common_utils.ZipAwareOpen():
             # Load metadata for 'en', which Babel uses internally.
             localedata.load('en')
             # Load metadata for source language for course.
             localedata.load(app_context.default_locale)
-        zf = zipfile.ZipFile(out_stream, 'w', allowZip64=True)
-        try:
-            # pylint: disable=protected-access
-            for translation_file in self._files.itervalues():
-                cat = translation_file._build_babel_catalog(app_context)
-                filename = os.path.join(
-                    'locale', translation_file.locale, 'LC_MESSAGES',
-                    translation_file.file_name)
-                content = cStringIO.StringIO()
-                try:
-                    pofile.write_po(content, cat, include_previous=True)
-                    zf.writestr(filename, content.getvalue())
-                finally:
-                    content.close()
-        finally:
-            zf.close()
+        # pylint: disable=protected-access
+        for translation_file in self._files.itervalues():
+            cat = translation_file._build_babel_catalog(app_context)
+            content = cStringIO.StringIO()
+            try:
+                pofile.write_po(content, cat, include_previous=True)
+                yield (translation_file.locale, translation_file.file_name,
+                       content.getvalue())
+            finally:
+                content.close()
+
+    @staticmethod
+    def get_zip_path(locale, file_name):
+        return os.path.join('locale', locale, 'LC_MESSAGES', file_name)
 
     def encode_angle_to_square_brackets(self):
         # pylint: disable=protected-access
@@ -1151,50 +1205,75 @@ class TranslationDownloadRestHandler(utils.BaseRESTHandler):
         transformer = xcontent.ContentTransformer(config=config)
         resource_key_map = TranslatableResourceRegistry.get_resources_and_keys(
             course)
+        for locale in locales:
+            for start in xrange(0, len(resource_key_map), TRANSFER_CHUNK_SIZE):
+                TranslationDownloadRestHandler.build_translations_for_resources(
+                    course, locale,
+                    resource_key_map[start:start + TRANSFER_CHUNK_SIZE],
+                    export_what, exporter, transformer)
 
-        # Preload all I18N progress DTOs; we'll need all of them.
-        i18n_progress_dtos = I18nProgressDAO.get_all()
+    @staticmethod
+    def build_translations_for_resources(
+        course, locale, resources_and_keys, export_what, exporter,
+        transformer):
+        """Add translations for one locale and a slice of course resources.
+
+        Only the resource bundles and progress records of the given
+        resources are loaded and saved, so callers working through a large
+        course can bound memory by passing successive slices of
+        TranslatableResourceRegistry.get_resources_and_keys().
+
+        Args:
+          course: The course for whose contents we are building translations.
+          locale: The locale for which translations are desired.
+          resources_and_keys: A list of (resource, ResourceKey) pairs.
+          export_what: 'all' or 'new'; see build_translations().
+          exporter: An instance of TranslationContents to populate.
+          transformer: An xcontent.ContentTransformer.
+        """
+        bundle_keys = [
+            ResourceBundleKey(resource_key.type, resource_key.key, locale)
+            for _, resource_key in resources_and_keys]
+        resource_bundle_dtos = ResourceBundleDAO.get_by_keys(bundle_keys)
+        bundle_by_key = {b.id: b for b in resource_bundle_dtos}
+        i18n_progress_dtos = I18nProgressDAO.get_by_keys(
+            [resource_key for _, resource_key in resources_and_keys])
         progress_by_key = {p.id: p for p in i18n_progress_dtos}
-        for locale in locales:
-            # Preload all resource bundles for this locale; we need all of them.
-            resource_bundle_dtos = ResourceBundleDAO.get_all_for_locale(locale)
-            bundle_by_key = {b.id: b for b in resource_bundle_dtos}
-            for rsrc, resource_key in resource_key_map:
-                key = ResourceBundleKey(
-                    resource_key.type, resource_key.key, locale)
-
-                # If we don't already have a resource bundle, make it.
-                resource_bundle_dto = bundle_by_key.get(str(key))
-                if not resource_bundle_dto:
-                    resource_bundle_dto = ResourceBundleDAO.create_blank(key)
-                    resource_bundle_dtos.append(resource_bundle_dto)
-                    bundle_by_key[resource_bundle_dto.id] = resource_bundle_dto
-
-                # If we don't already have a progress record, make it.
-                i18n_progress_dto = progress_by_key.get(str(resource_key))
-                if not i18n_progress_dto:
-                    i18n_progress_dto = I18nProgressDAO.create_blank(
-                        resource_key)
-                    i18n_progress_dtos.append(i18n_progress_dto)
-                    progress_by_key[i18n_progress_dto.id] = i18n_progress_dto
-
-                # Act as though we are loading the interactive translation
-                # page and then clicking 'save'.  This has the side-effect of
-                # forcing us to have created the resource bundle and progress
-                # DTOs, and ensures that the operation here has identical
-                # behavior with manual operation, and there are thus fewer
-                # opportunities to go sideways and slip between the cracks.
-                binding, sections = (
-                    TranslationConsoleRestHandler.build_sections_for_key(
-                        key, course, resource_bundle_dto, transformer))
-                TranslationConsoleRestHandler.update_dtos_with_section_data(
-                    key, sections, resource_bundle_dto, i18n_progress_dto)
-
-                TranslationDownloadRestHandler._collect_section_translations(
-                    exporter, sections, binding, export_what, key, rsrc)
 
+        for (rsrc, resource_key), key in zip(resources_and_keys, bundle_keys):
+            # If we don't already have a resource bundle, make it.
+            resource_bundle_dto = bundle_by_key.get(str(key))
+            if not resource_bundle_dto:
+                resource_bundle_dto = ResourceBundleDAO.create_blank(key)
+                resource_bundle_dtos.append(resource_bundle_dto)
+                bundle_by_key[resource_bundle_dto.id] = resource_bundle_dto
+
+            # If we don't already have a progress record, make it.
+            i18n_progress_dto = progress_by_key.get(str(resource_key))
+            if not i18n_progress_dto:
+                i18n_progress_dto = I18nProgressDAO.create_blank(resource_key)
+                i18n_progress_dtos.append(i18n_progress_dto)
+                progress_by_key[i18n_progress_dto.id] = i18n_progress_dto
+
+            # Act as though we are loading the interactive translation
+            # page and then clicking 'save'.  This has the side-effect of
+            # forcing us to have created the resource bundle and progress
+            # DTOs, and ensures that the operation here has identical
+            # behavior with manual operation, and there are thus fewer
+            # opportunities to go sideways and slip between the cracks.
+            binding, sections = (
+                TranslationConsoleRestHandler.build_sections_for_key(
+                    key, course, resource_bundle_dto, transformer))
+            TranslationConsoleRestHandler.update_dtos_with_section_data(
+                key, sections, resource_bundle_dto, i18n_progress_dto)
+
+            TranslationDownloadRestHandler._collect_section_translations(
+                exporter, sections, binding, export_what, key, rsrc)
+
+        if resource_bundle_dtos:
             ResourceBundleDAO.save_all(resource_bundle_dtos)
-        I18nProgressDAO.save_all(i18n_progress_dtos)
+        if i18n_progress_dtos:
+            I18nProgressDAO.save_all(i18n_progress_dtos)
 
     @staticmethod
     def _collect_section_translations(exporter, sections, binding,
@@ -1336,9 +1415,22 @@ class TranslationDownloadRestHandler(utils.BaseRESTHandler):
         """Verify inputs and return 200 OK to OEditor when all is well."""
 
         course = self.get_course()
-        locales, _, _, _, _ = self._validate_inputs(course)
+        locales, export_what, file_name, separate_files, encoded_brackets = (
+            self._validate_inputs(course))
         if not locales:
             return
+        if use_background_transfer(course, len(locales)):
+            # Too big to build within this request; hand off to background
+            # tasks, and let the client pick up the result from the dashboard.
+            start_background_export(
+                course, locales, export_what, file_name, separate_files,
+                encoded_brackets)
+            transforms.send_json_response(
+                self, 200, 'Export started.', payload_dict={
+                    'background': True,
+                    'dashboard_url': self.canonicalize_url(
+                        '/dashboard?action=%s' % I18nDashboardHandler.ACTION)})
+            return
         transforms.send_json_response(self, 200, 'Success.')
 
     def post(self):
@@ -1489,8 +1581,6 @@ class TranslationUploadRestHandler(utils.BaseRESTHandler):
         app_context = course.app_context
         config = config or I18nTranslationContext.get(app_context)
         transformer = xcontent.ContentTransformer(config=config)
-        i18n_progress_dtos = I18nProgressDAO.get_all()
-        progress_by_key = {p.id: p for p in i18n_progress_dtos}
         resource_key_map = TranslatableResourceRegistry.get_resources_and_keys(
             course)
 
@@ -1500,76 +1590,22 @@ class TranslationUploadRestHandler(utils.BaseRESTHandler):
         used_message_locations = collections.defaultdict(set)
 
         for locale in importer.get_locales():
-            used_resource_translations = set()
-            num_resources = 0
             num_replacements = 0
             num_blank_translations = 0
-            resource_bundle_dtos = ResourceBundleDAO.get_all_for_locale(locale)
-            bundle_by_key = {b.id: b for b in resource_bundle_dtos}
-
-            for _, resource_key in resource_key_map:
-                num_resources += 1
-                key = ResourceBundleKey(
-                    resource_key.type, resource_key.key, locale)
-                key_str = str(key)
-
-                # Here, be permissive: just create the bundle or progress DTO
-                # if it does not currently exist.  Guaranteed we won't have
-                # translations for this resource, since we'd have created the
-                # bundle on export, but this makes us 1:1 with the behavior on
-                # manual edit and on export.
-                resource_bundle_dto = bundle_by_key.get(key_str)
-                if not resource_bundle_dto:
-                    resource_bundle_dto = ResourceBundleDAO.create_blank(key)
-                    resource_bundle_dtos.append(resource_bundle_dto)
-                    bundle_by_key[resource_bundle_dto.id] = resource_bundle_dto
-
-                i18n_progress_dto = progress_by_key.get(str(key.resource_key))
-                if not i18n_progress_dto:
-                    i18n_progress_dto = I18nProgressDAO.create_blank(
-                        resource_key)
-                    i18n_progress_dtos.append(i18n_progress_dto)
-                    progress_by_key[i18n_progress_dto.id] = i18n_progress_dto
-
-                _, sections = (
-                    TranslationConsoleRestHandler.build_sections_for_key(
-                        key, course, resource_bundle_dto, transformer))
-                for section in sections:
-                    for item in section['data']:
-                        source_value = unicode(item['source_value'] or '')
-                        if not isinstance(source_value, basestring):
-                            source_value = unicode(source_value)  # convert num
-
-                        message_element = importer.get_message(key,
-                                                               source_value)
-                        if (not message_element or
-                            not key_str in message_element.locations):
-
-                            if warn_not_found:
-                                translation_messages.append(
-                                    'Did not find translation for "%s" at %s' %
-                                    (source_value, resource_key))
-                            continue
-
-                        translated_value = message_element.get_any_translation()
-                        if translated_value:
-                            item['target_value'] = translated_value
-                            item['changed'] = True
-                            num_replacements += 1
-                        else:
-                            num_blank_translations += 1
-                        used_message_locations[source_value].add(key_str)
-
-                TranslationConsoleRestHandler.update_dtos_with_section_data(
-                    key, sections, resource_bundle_dto, i18n_progress_dto)
-
+            for start in xrange(0, len(resource_key_map), TRANSFER_CHUNK_SIZE):
+                replaced, blank = (
+                    TranslationUploadRestHandler.
+                    update_translations_for_resources(
+                        course, locale,
+                        resource_key_map[start:start + TRANSFER_CHUNK_SIZE],
+                        importer, transformer, translation_messages,
+                        used_message_locations, warn_not_found=warn_not_found))
+                num_replacements += replaced
+                num_blank_translations += blank
             translation_messages.append(
-                ('For %s, made %d total replacements in %d resources.  '
-                 '%d items in the uploaded file did not have translations.') % (
-                    common_locales.get_locale_display_name(locale),
-                    num_replacements, num_resources, num_blank_translations))
-            ResourceBundleDAO.save_all(resource_bundle_dtos)
-        I18nProgressDAO.save_all(i18n_progress_dtos)
+                TranslationUploadRestHandler.format_locale_summary(
+                    locale, num_replacements, len(resource_key_map),
+                    num_blank_translations))
 
         if warn_not_used:
             # Here, we are intentionally using the API on the importer that
@@ -1590,6 +1626,104 @@ class TranslationUploadRestHandler(utils.BaseRESTHandler):
                                     ' '.join(unused_locations)))
         return translation_messages
 
+    @staticmethod
+    def update_translations_for_resources(
+        course, locale, resources_and_keys, importer, transformer,
+        translation_messages, used_message_locations, warn_not_found=False):
+        """Apply imported translations for one locale to a slice of resources.
+
+        Args:
+          course: The course whose translations are being updated.
+          locale: The locale being imported.
+          resources_and_keys: A list of (resource, ResourceKey) pairs.
+          importer: A TranslationContents holding the uploaded messages.
+          transformer: An xcontent.ContentTransformer.
+          translation_messages: A list to which warnings are appended.
+          used_message_locations: A map from message to the set of location
+              strings where the message was used; updated in place.
+          warn_not_found: Whether to warn about course items that have no
+              translation in the importer.
+        Returns:
+          A 2-tuple of the number of replacements made and the number of
+          matched items whose uploaded translation was blank.
+        """
+        num_replacements = 0
+        num_blank_translations = 0
+        bundle_keys = [
+            ResourceBundleKey(resource_key.type, resource_key.key, locale)
+            for _, resource_key in resources_and_keys]
+        resource_bundle_dtos = ResourceBundleDAO.get_by_keys(bundle_keys)
+        bundle_by_key = {b.id: b for b in resource_bundle_dtos}
+        i18n_progress_dtos = I18nProgressDAO.get_by_keys(
+            [resource_key for _, resource_key in resources_and_keys])
+        progress_by_key = {p.id: p for p in i18n_progress_dtos}
+
+        for (_, resource_key), key in zip(resources_and_keys, bundle_keys):
+            key_str = str(key)
+
+            # Here, be permissive: just create the bundle or progress DTO
+            # if it does not currently exist.  Guaranteed we won't have
+            # translations for this resource, since we'd have created the
+            # bundle on export, but this makes us 1:1 with the behavior on
+            # manual edit and on export.
+            resource_bundle_dto = bundle_by_key.get(key_str)
+            if not resource_bundle_dto:
+                resource_bundle_dto = ResourceBundleDAO.create_blank(key)
+                resource_bundle_dtos.append(resource_bundle_dto)
+                bundle_by_key[resource_bundle_dto.id] = resource_bundle_dto
+
+            i18n_progress_dto = progress_by_key.get(str(key.resource_key))
+            if not i18n_progress_dto:
+                i18n_progress_dto = I18nProgressDAO.create_blank(resource_key)
+                i18n_progress_dtos.append(i18n_progress_dto)
+                progress_by_key[i18n_progress_dto.id] = i18n_progress_dto
+
+            _, sections = (
+                TranslationConsoleRestHandler.build_sections_for_key(
+                    key, course, resource_bundle_dto, transformer))
+            for section in sections:
+                for item in section['data']:
+                    source_value = unicode(item['source_value'] or '')
+                    if not isinstance(source_value, basestring):
+                        source_value = unicode(source_value)  # convert num
+
+                    message_element = importer.get_message(key, source_value)
+                    if (not message_element or
+                        not key_str in message_element.locations):
+
+                        if warn_not_found:
+                            translation_messages.append(
+                                'Did not find translation for "%s" at %s' %
+                                (source_value, resource_key))
+                        continue
+
+                    translated_value = message_element.get_any_translation()
+                    if translated_value:
+                        item['target_value'] = translated_value
+                        item['changed'] = True
+                        num_replacements += 1
+                    else:
+                        num_blank_translations += 1
+                    used_message_locations[source_value].add(key_str)
+
+            TranslationConsoleRestHandler.update_dtos_with_section_data(
+                key, sections, resource_bundle_dto, i18n_progress_dto)
+
+        if resource_bundle_dtos:
+            ResourceBundleDAO.save_all(resource_bundle_dtos)
+        if i18n_progress_dtos:
+            I18nProgressDAO.save_all(i18n_progress_dtos)
+        return num_replacements, num_blank_translations
+
+    @staticmethod
+    def format_locale_summary(
+        locale, num_replacements, num_resources, num_blank_translations):
+        return (
+            'For %s, made %d total replacements in %d resources.  '
+            '%d items in the uploaded file did not have translations.') % (
+                common_locales.get_locale_display_name(locale),
+                num_replacements, num_resources, num_blank_translations)
+
     @staticmethod
     def load_file_content(app_context, file_content, importer):
         # Internally, babel uses the 'en' locale, and we must configure it
@@ -1678,13 +1812,453 @@ class TranslationUploadRestHandler(utils.BaseRESTHandler):
                     self, 401, 'Access denied.')
                 return
 
+        course = self.get_course()
+        if use_background_transfer(course, len(importer.get_locales())):
+            start_background_import(course, importer, warn_not_found)
+            translation_messages = [
+                'The translations are being imported in the background.  '
+                'Progress is shown on the Translations page.']
+            if warn_not_used:
+                translation_messages.append(
+                    'Unused translations are not reported for imports run '
+                    'in the background.')
+            transforms.send_file_upload_response(
+                self, 200, 'Success.',
+                payload_dict={'messages': translation_messages})
+            return
+
         translation_messages = self.update_translations(
-            self.get_course(), importer, warn_not_used, warn_not_found)
+            course, importer, warn_not_used, warn_not_found)
         transforms.send_file_upload_response(
             self, 200, 'Success.',
             payload_dict={'messages': translation_messages})
 
 
+class I18nTransferStatusEntity(models.BaseEntity):
+    """Progress of the latest background translation import or export.
+
+    There is at most one entity per course for each kind of transfer; its key
+    name is KIND_EXPORT or KIND_IMPORT.  Starting a new transfer overwrites
+    the entity with a fresh run_id, which stops tasks from the older run at
+    their next checkpoint.
+    """
+
+    KIND_EXPORT = 'export'
+    KIND_IMPORT = 'import'
+
+    STATE_RUNNING = 'running'
+    STATE_DONE = 'done'
+    STATE_FAILED = 'failed'
+
+    run_id = db.StringProperty(indexed=False)
+    state = db.StringProperty(indexed=False)
+    locales = db.StringListProperty(indexed=False)
+    # Checkpoint: the locale and the offset into the course's resource list
+    # from which the next task resumes.
+    locale_index = db.IntegerProperty(indexed=False, default=0)
+    resource_index = db.IntegerProperty(indexed=False, default=0)
+    num_items = db.IntegerProperty(indexed=False, default=0)
+    num_items_done = db.IntegerProperty(indexed=False, default=0)
+    # Running totals for the locale currently being imported.
+    num_replacements = db.IntegerProperty(indexed=False, default=0)
+    num_blank_translations = db.IntegerProperty(indexed=False, default=0)
+    # JSON dict of the options the transfer was started with.
+    options = db.TextProperty(indexed=False)
+    # JSON list of messages to show once the transfer has finished.
+    messages = db.TextProperty(indexed=False)
+    num_messages_dropped = db.IntegerProperty(indexed=False, default=0)
+    file_name = db.StringProperty(indexed=False)
+    output_path = db.StringProperty(indexed=False)
+    error = db.TextProperty(indexed=False)
+    started_on = db.DateTimeProperty(indexed=False)
+    updated_on = db.DateTimeProperty(auto_now=True, indexed=False)
+
+    def get_options(self):
+        return transforms.loads(self.options or '{}')
+
+    def get_messages(self):
+        return transforms.loads(self.messages or '[]')
+
+    def add_messages(self, new_messages):
+        all_messages = self.get_messages()
+        room = max(0, TRANSFER_MAX_MESSAGES - len(all_messages))
+        all_messages.extend(new_messages[:room])
+        self.num_messages_dropped += len(new_messages[room:])
+        self.messages = transforms.dumps(all_messages)
+
+    @property
+    def percent_done(self):
+        if not self.num_items:
+            return 100
+        return min(100, 100 * self.num_items_done / self.num_items)
+
+
+class I18nTransferPartEntity(models.BaseEntity):
+    """One staged piece of a background translation import or export.
+
+    For an export, data is the content of one .po file; for an import, it is
+    a JSON list of uploaded messages for one locale.  Data is zlib-compressed.
+    Parts sort by key name in the order they are to be consumed.
+    """
+
+    run_id = db.StringProperty(indexed=True)
+    locale = db.StringProperty(indexed=True)
+    file_name = db.StringProperty(indexed=False)
+    data = db.BlobProperty()
+
+    @classmethod
+    def iter_for_run(cls, run_id, locale=None):
+        query = cls.all().filter('run_id =', run_id)
+        if locale is not None:
+            query.filter('locale =', locale)
+        # Parts can each be close to the entity size limit; fetch few at once.
+        return common_utils.iter_all(query.order('__key__'), batch_size=10)
+
+    @classmethod
+    def delete_for_run(cls, run_id):
+        query = cls.all(keys_only=True).filter('run_id =', run_id)
+        entities.delete(list(common_utils.iter_all(query)))
+
+
+class _ZipOutputStream(object):
+    """Adapts a write-only cloudstorage file for use by zipfile.ZipFile.
+
+    ZipFile only ever appends when written through writestr(), but it asks
+    for the current position before each member and flushes as it goes.
+    """
+
+    def __init__(self, gcs_file):
+        self._gcs_file = gcs_file
+        self._position = 0
+
+    def write(self, data):
+        self._gcs_file.write(data)
+        self._position += len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+
+def _new_transfer_run_id():
+    return datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+
+
+def _get_transfer_status(kind, run_id):
+    status = I18nTransferStatusEntity.get_by_key_name(kind)
+    if (not status or status.run_id != run_id or
+        status.state != I18nTransferStatusEntity.STATE_RUNNING):
+        logging.info('Translation %s run %s superseded; stopping', kind, run_id)
+        return None
+    return status
+
+
+def _fail_transfer(status, ex):
+    logging.exception('Translation %s run %s failed', status.key().name(),
+                      status.run_id)
+    status.state = I18nTransferStatusEntity.STATE_FAILED
+    status.error = unicode(ex)
+    status.put()
+    I18nTransferPartEntity.delete_for_run(status.run_id)
+
+
+def use_background_transfer(course, num_locales):
+    num_items = num_locales * len(
+        TranslatableResourceRegistry.get_resources_and_keys(course))
+    return num_items > BACKGROUND_TRANSFER_MIN_ITEMS
+
+
+def start_background_export(course, locales, export_what, file_name,
+                            separate_files, encoded_brackets):
+    """Start exporting translations as a chain of background tasks.
+
+    Each task builds translations for TRANSFER_CHUNK_SIZE resources of one
+    locale at a time and stages the resulting .po files as
+    I18nTransferPartEntity rows.  Once all locales are done, the parts are
+    streamed into a .zip file in Cloud Storage, which can then be fetched
+    from TranslationTransferDownloadHandler.  The .zip file of the previous
+    export, if any, is deleted.
+    """
+    _delete_export_zip(I18nTransferStatusEntity.get_by_key_name(
+        I18nTransferStatusEntity.KIND_EXPORT))
+    num_resources = len(
+        TranslatableResourceRegistry.get_resources_and_keys(course))
+    status = I18nTransferStatusEntity(
+        key_name=I18nTransferStatusEntity.KIND_EXPORT,
+        run_id=_new_transfer_run_id(),
+        state=I18nTransferStatusEntity.STATE_RUNNING,
+        locales=locales, num_items=num_resources * len(locales),
+        file_name=file_name, started_on=datetime.datetime.utcnow(),
+        options=transforms.dumps({
+            'export_what': export_what,
+            'separate_files': separate_files,
+            'encoded_angle_brackets': encoded_brackets,
+            }))
+    status.put()
+    deferred.defer(
+        run_background_export, course.app_context.get_namespace_name(),
+        status.run_id)
+    return status
+
+
+def run_background_export(namespace, run_id):
+    """Export the next chunks of translations, resuming from the checkpoint."""
+    with common_utils.Namespace(namespace):
+        status = _get_transfer_status(
+            I18nTransferStatusEntity.KIND_EXPORT, run_id)
+        if not status:
+            return
+        try:
+            if _export_chunks(namespace, status):
+                deferred.defer(run_background_export, namespace, run_id)
+        except Exception as ex:  # pylint: disable=broad-except
+            _fail_transfer(status, ex)
+
+
+def _export_chunks(namespace, status):
+    app_context = sites.get_app_context_for_namespace(namespace)
+    course = courses.Course(None, app_context)
+    options = status.get_options()
+    transformer = xcontent.ContentTransformer(
+        config=I18nTranslationContext.get(app_context))
+    resource_key_map = TranslatableResourceRegistry.get_resources_and_keys(
+        course)
+    deadline = time.time() + TRANSFER_TASK_BUDGET_SECONDS
+
+    while status.locale_index < len(status.locales):
+        locale = status.locales[status.locale_index]
+        chunk = resource_key_map[
+            status.resource_index:status.resource_index + TRANSFER_CHUNK_SIZE]
+        exporter = TranslationContents(
+            separate_files_by_type=options['separate_files'])
+        TranslationDownloadRestHandler.build_translations_for_resources(
+            course, locale, chunk, options['export_what'], exporter,
+            transformer)
+        if options['encoded_angle_brackets']:
+            exporter.encode_angle_to_square_brackets()
+
+        # Files of one chunk may share names with those of another (e.g.,
+        # all questions go to question.po), so number each chunk's files.
+        # Key names are derived from the checkpoint, so a retried chunk
+        # overwrites rather than duplicates its parts.
+        chunk_num = status.resource_index / TRANSFER_CHUNK_SIZE + 1
+        parts = []
+        for _, file_name, content in exporter.iter_po_files(app_context):
+            base_name, extension = file_name.rsplit('.', 1)
+            part_file_name = '%s_%4.4d.%s' % (base_name, chunk_num, extension)
+            parts.append(I18nTransferPartEntity(
+                key_name='%s:%3.3d:%6.6d:%s' % (
+                    status.run_id, status.locale_index, status.resource_index,
+                    part_file_name),
+                run_id=status.run_id, locale=locale, file_name=part_file_name,
+                data=zlib.compress(content)))
+        if parts:
+            entities.put(parts)
+
+        status.resource_index += len(chunk)
+        status.num_items_done += len(chunk)
+        if status.resource_index >= len(resource_key_map):
+            status.locale_index += 1
+            status.resource_index = 0
+        status.put()
+        if (status.locale_index < len(status.locales) and
+            time.time() >= deadline):
+            return True
+
+    status.output_path = _write_export_zip(namespace, status)
+    status.state = I18nTransferStatusEntity.STATE_DONE
+    status.put()
+    I18nTransferPartEntity.delete_for_run(status.run_id)
+    return False
+
+
+def _write_export_zip(namespace, status):
+    bucket_name = app_identity.get_default_gcs_bucket_name()
+    if not bucket_name:
+        raise ValueError(
+            'No default Cloud Storage bucket is configured for this '
+            'application, so the exported translations cannot be saved.')
+    path = '/%s/i18n_dashboard/%s/%s.zip' % (
+        bucket_name, namespace or 'default', status.run_id)
+    with cloudstorage.open(
+        path, 'w', content_type='application/zip') as gcs_file:
+        zf = zipfile.ZipFile(
+            _ZipOutputStream(gcs_file), 'w', allowZip64=True)
+        try:
+            for part in I18nTransferPartEntity.iter_for_run(status.run_id):
+                zf.writestr(
+                    TranslationContents.get_zip_path(
+                        part.locale, part.file_name),
+                    zlib.decompress(part.data))
+        finally:
+            zf.close()
+    return path
+
+
+def _delete_export_zip(status):
+    if not status or not status.output_path:
+        return
+    try:
+        cloudstorage.delete(status.output_path)
+    except cloudstorage.NotFoundError:
+        pass
+
+
+def start_background_import(course, importer, warn_not_found):
+    """Start importing translations as a chain of background tasks.
+
+    The uploaded messages are staged per locale as I18nTransferPartEntity
+    rows.  Each task then applies them to TRANSFER_CHUNK_SIZE resources of
+    one locale at a time, checkpointing its position so that an interrupted
+    task resumes where it left off.
+    """
+    run_id = _new_transfer_run_id()
+    locales = sorted(importer.get_locales())
+    parts = []
+    for translation_file in importer.iterfiles():
+        file_messages = [
+            [message, sorted(message_element.translations),
+             [[key, location.name, location.type]
+              for key, location in message_element.locations.iteritems()]]
+            for message, message_element in translation_file.itermessages()]
+        for start in xrange(
+            0, len(file_messages), TRANSFER_MESSAGES_PER_PART):
+            parts.append(I18nTransferPartEntity(
+                key_name='%s:%s:%s:%6.6d' % (
+                    run_id, translation_file.locale,
+                    translation_file.file_name, start),
+                run_id=run_id, locale=translation_file.locale,
+                file_name=translation_file.file_name,
+                data=zlib.compress(transforms.dumps(
+                    file_messages[start:start + TRANSFER_MESSAGES_PER_PART]))))
+    entities.put(parts)
+
+    num_resources = len(
+        TranslatableResourceRegistry.get_resources_and_keys(course))
+    status = I18nTransferStatusEntity(
+        key_name=I18nTransferStatusEntity.KIND_IMPORT, run_id=run_id,
+        state=I18nTransferStatusEntity.STATE_RUNNING,
+        locales=locales, num_items=num_resources * len(locales),
+        started_on=datetime.datetime.utcnow(),
+        options=transforms.dumps({'warn_not_found': warn_not_found}))
+    status.put()
+    deferred.defer(
+        run_background_import, course.app_context.get_namespace_name(),
+        run_id)
+    return status
+
+
+def run_background_import(namespace, run_id):
+    """Import the next chunks of translations, resuming from the checkpoint."""
+    with common_utils.Namespace(namespace):
+        status = _get_transfer_status(
+            I18nTransferStatusEntity.KIND_IMPORT, run_id)
+        if not status:
+            return
+        try:
+            if _import_chunks(namespace, status):
+                deferred.defer(run_background_import, namespace, run_id)
+        except Exception as ex:  # pylint: disable=broad-except
+            _fail_transfer(status, ex)
+
+
+def _load_staged_messages(run_id, locale):
+    importer = TranslationContents()
+    for part in I18nTransferPartEntity.iter_for_run(run_id, locale=locale):
+        for message, translations, locations in transforms.loads(
+            zlib.decompress(part.data)):
+            for key_str, loc_name, loc_type in locations:
+                resource_bundle_key = ResourceBundleKey.fromstring(key_str)
+                message_element = importer.get_message(
+                    resource_bundle_key, message)
+                for translation in translations:
+                    message_element.add_translation(translation)
+                message_element.add_location(
+                    resource_bundle_key, loc_name, loc_type)
+    return importer
+
+
+def _import_chunks(namespace, status):
+    app_context = sites.get_app_context_for_namespace(namespace)
+    course = courses.Course(None, app_context)
+    options = status.get_options()
+    transformer = xcontent.ContentTransformer(
+        config=I18nTranslationContext.get(app_context))
+    resource_key_map = TranslatableResourceRegistry.get_resources_and_keys(
+        course)
+    deadline = time.time() + TRANSFER_TASK_BUDGET_SECONDS
+    importer = None
+    importer_locale = None
+
+    while status.locale_index < len(status.locales):
+        locale = status.locales[status.locale_index]
+        if locale != importer_locale:
+            importer = _load_staged_messages(status.run_id, locale)
+            importer_locale = locale
+        chunk = resource_key_map[
+            status.resource_index:status.resource_index + TRANSFER_CHUNK_SIZE]
+        translation_messages = []
+        num_replacements, num_blank_translations = (
+            TranslationUploadRestHandler.update_translations_for_resources(
+                course, locale, chunk, importer, transformer,
+                translation_messages, collections.defaultdict(set),
+                warn_not_found=options['warn_not_found']))
+        status.num_replacements += num_replacements
+        status.num_blank_translations += num_blank_translations
+
+        status.resource_index += len(chunk)
+        status.num_items_done += len(chunk)
+        if status.resource_index >= len(resource_key_map):
+            translation_messages.append(
+                TranslationUploadRestHandler.format_locale_summary(
+                    locale, status.num_replacements, len(resource_key_map),
+                    status.num_blank_translations))
+            status.locale_index += 1
+            status.resource_index = 0
+            status.num_replacements = 0
+            status.num_blank_translations = 0
+        status.add_messages(translation_messages)
+        status.put()
+        if (status.locale_index < len(status.locales) and
+            time.time() >= deadline):
+            return True
+
+    status.state = I18nTransferStatusEntity.STATE_DONE
+    status.put()
+    I18nTransferPartEntity.delete_for_run(status.run_id)
+    return False
+
+
+class TranslationTransferDownloadHandler(utils.BaseHandler):
+    """Serves the .zip file written by the latest background export.
+
+    App Engine sends the file straight from Cloud Storage, so it is not bound
+    by the size limit on responses built by the handler.
+    """
+
+    URL = '/modules/i18n_dashboard/transfer_download'
+
+    def get(self):
+        status = I18nTransferStatusEntity.get_by_key_name(
+            I18nTransferStatusEntity.KIND_EXPORT)
+        if not status or any(
+            not has_locale_rights(self.app_context, locale)
+            for locale in status.locales):
+            self.error(401)
+            return
+        if status.state != I18nTransferStatusEntity.STATE_DONE:
+            self.error(404)
+            return
+
+        self.response.content_type = 'application/octet-stream'
+        self.response.content_disposition = (
+            'attachment; filename="%s"' % status.file_name)
+        self.response.headers[blobstore.BLOB_KEY_HEADER] = (
+            blobstore.create_gs_key('/gs' + status.output_path))
+
+
 class I18nProgressManager(caching.RequestScopedSingleton):
 
     def __init__(self, course):
@@ -1716,19 +2290,27 @@ class I18nProgressManager(caching.RequestScopedSingleton):
         return cls.instance(course)._get(rsrc, type_str, key)
 
 
-class I18nTranslationContext(caching.RequestScopedSingleton):
+class I18nTranslationContext(caching.ProcessScopedSingleton):
+    """The xcontent configuration used to translate HTML in this process.
+
+    Building the configuration instantiates every registered tag and indexes
+    its schema. The result only depends on tags.Registry, so it is built once
+    per process and rebuilt only after a tag binding is added or removed.
+    """
 
-    def __init__(self, app_context):
-        self.app_context = app_context
-        self._xcontent_config = None
+    def __init__(self):
+        # (tags.Registry version, configuration, fingerprint); replaced as a
+        # whole so that concurrent requests never see a mismatched pair.
+        self._state = None
 
     @classmethod
-    def _init_xcontent_configuration(cls, app_context):
+    def _init_xcontent_configuration(cls):
         inline_tag_names = list(xcontent.DEFAULT_INLINE_TAG_NAMES)
         opaque_decomposable_tag_names = list(
             xcontent.DEFAULT_OPAQUE_DECOMPOSABLE_TAG_NAMES)
         recomposable_attributes_map = dict(
-            xcontent.DEFAULT_RECOMPOSABLE_ATTRIBUTES_MAP)
+            (name, set(tag_names)) for name, tag_names
+            in xcontent.DEFAULT_RECOMPOSABLE_ATTRIBUTES_MAP.iteritems())
         recomposable_attributes_map['HREF'] = {'A'}
 
         for tag_name, tag_cls in tags.Registry.get_all_tags().items():
@@ -1757,16 +2339,36 @@ class I18nTranslationContext(caching.RequestScopedSingleton):
             omit_empty_opaque_decomposable=False,
             sort_attributes=True)
 
-    def _get_xcontent_configuration(self):
-        if self._xcontent_config is None:
-            self._xcontent_config = self._init_xcontent_configuration(
-                self.app_context)
-        return self._xcontent_config
+    @classmethod
+    def _get_xcontent_fingerprint(cls, config):
+        return hashlib.md5(transforms.dumps([
+            sorted(config.inline_tag_names),
+            sorted(config.opaque_tag_names),
+            sorted(config.opaque_decomposable_tag_names),
+            sorted([name, sorted(tag_names)] for name, tag_names
+                   in config.recomposable_attributes_map.iteritems()),
+            config.omit_empty_opaque_decomposable,
+            config.sort_attributes])).hexdigest()
+
+    def _get_state(self):
+        version = tags.Registry.get_version()
+        state = self._state
+        if state is None or state[0] != version:
+            config = self._init_xcontent_configuration()
+            state = (version, config, self._get_xcontent_fingerprint(config))
+            self._state = state
+        return state
+
+    @classmethod
+    def get(cls, unused_app_context=None):
+        # pylint: disable=protected-access
+        return cls.instance()._get_state()[1]
 
     @classmethod
-    def get(cls, app_context):
+    def get_fingerprint(cls, unused_app_context=None):
+        """Returns a digest that changes whenever the configuration does."""
         # pylint: disable=protected-access
-        return cls.instance(app_context)._get_xcontent_configuration()
+        return cls.instance()._get_state()[2]
 
 
 def swapcase(text):
@@ -2277,6 +2879,7 @@ class I18nDashboardHandler(BaseDashboardExtension):
         template_values = {
             'extra_locales': permitted_locales,
             'tables': tables,
+            'transfers': self._get_transfers(),
             'num_columns': len(permitted_locales) + 1,
             'is_readonly': self.is_readonly(self.course),
         }
@@ -2339,6 +2942,31 @@ class I18nDashboardHandler(BaseDashboardExtension):
             })
 
 
+    def _get_transfers(self):
+        transfers = []
+        for kind in (I18nTransferStatusEntity.KIND_EXPORT,
+                     I18nTransferStatusEntity.KIND_IMPORT):
+            status = I18nTransferStatusEntity.get_by_key_name(kind)
+            if not status:
+                continue
+            transfer = {
+                'kind': kind,
+                'state': status.state,
+                'percent_done': status.percent_done,
+                'locales': ', '.join(status.locales),
+                'started_on': status.started_on,
+                'error': status.error,
+                'messages': status.get_messages(),
+                'num_messages_dropped': status.num_messages_dropped,
+            }
+            if (kind == I18nTransferStatusEntity.KIND_EXPORT and
+                status.state == I18nTransferStatusEntity.STATE_DONE):
+                transfer['download_url'] = self.handler.canonicalize_url(
+                    TranslationTransferDownloadHandler.URL)
+            transfers.append(transfer)
+        return transfers
+
+
 class TranslationConsole(BaseDashboardExtension):
     ACTION = 'i18_console'
 
@@ -2520,6 +3148,7 @@ class TranslationConsoleRestHandler(utils.BaseRESTHandler):
         else:
             I18nProgressDAO.save(i18n_progress_dto)
             ResourceBundleDAO.save(resource_bundle_dto)
+            self._prerender_html_sections(key, resource_bundle_dto)
 
             if (key.resource_key.type ==
                 resources_display.ResourceCourseSettings.TYPE):
@@ -2528,6 +3157,14 @@ class TranslationConsoleRestHandler(utils.BaseRESTHandler):
 
             transforms.send_json_response(self, 200, 'Saved.')
 
+    def _prerender_html_sections(self, key, resource_bundle_dto):
+        # Learners viewing the content will find it already translated.
+        for section in resource_bundle_dto.dict.itervalues():
+            if section['type'] == TYPE_HTML:
+                LazyTranslator(
+                    self.app_context, key, section['source_value'],
+                    section).prerender()
+
     def _get_validation_report(self, key, section_names, resource_bundle_dto):
         report = {}
         for name in section_names:
@@ -2898,6 +3535,36 @@ class I18nProgressDeferredUpdater(jobs.DurableJob):
             key, sections, resource_bundle_dto, i18n_progress_dto)
 
 
+class ProcessScopedTranslatedHtmlCache(caching.ProcessScopedSingleton):
+    """In-process cache of HTML rendered by LazyTranslator."""
+
+    @classmethod
+    def get_cache_len(cls):
+        return len(ProcessScopedTranslatedHtmlCache.instance().cache.items)
+
+    @classmethod
+    def get_cache_size(cls):
+        return ProcessScopedTranslatedHtmlCache.instance().cache.total_size
+
+    def __init__(self):
+        self.cache = caching.LRUCache(
+            max_size_bytes=TRANSLATED_HTML_CACHE_MAX_SIZE_BYTES,
+            name='i18n_translated_html')
+
+
+TRANSLATED_HTML_CACHE_LEN = counters.PerfCounter(
+    'gcb-i18n-translated-html-cache-len',
+    'A total number of items in the in-process translated HTML cache.')
+TRANSLATED_HTML_CACHE_SIZE_BYTES = counters.PerfCounter(
+    'gcb-i18n-translated-html-cache-bytes',
+    'A total size of items in the in-process translated HTML cache in bytes.')
+
+TRANSLATED_HTML_CACHE_LEN.poll_value = (
+    ProcessScopedTranslatedHtmlCache.get_cache_len)
+TRANSLATED_HTML_CACHE_SIZE_BYTES.poll_value = (
+    ProcessScopedTranslatedHtmlCache.get_cache_size)
+
+
 class LazyTranslator(object):
     NOT_STARTED_TRANSLATION = 0
     VALID_TRANSLATION = 1
@@ -2964,58 +3631,110 @@ class LazyTranslator(object):
         return self.translation_dict['data'][0]['target_value']
 
     def _translate_html(self):
-        self._status = self.INVALID_TRANSLATION
         try:
-            context = xcontent.Context(xcontent.ContentIO.fromstring(
-                self.source_value))
-            transformer = xcontent.ContentTransformer(
-                config=I18nTranslationContext.get(self._app_context))
-            transformer.decompose(context)
-
-            data_list = self.translation_dict['data']
-            diff_mapping_list = (
-                xcontent.SourceToTargetDiffMapping.map_lists_source_to_target(
-                    context.resource_bundle, [
-                        data['source_value']
-                        for data in data_list]))
-
-            count_misses = 0
-            if len(context.resource_bundle) < len(data_list):
-                count_misses = len(data_list) - len(context.resource_bundle)
-
-            resource_bundle = []
-            for mapping in diff_mapping_list:
-                if mapping.verb == VERB_CURRENT:
-                    resource_bundle.append(
-                        data_list[mapping.target_value_index]['target_value'])
-                elif mapping.verb in [VERB_CHANGED, VERB_NEW]:
-                    count_misses += 1
-                    resource_bundle.append(
-                        context.resource_bundle[mapping.source_value_index])
-                else:
-                    raise ValueError('Unknown verb: %s' % mapping.verb)
-
-            errors = []
-            transformer.recompose(context, resource_bundle, errors)
-            body = xcontent.ContentIO.tostring(context.tree)
-            if count_misses == 0 and not errors:
-                self._status = self.VALID_TRANSLATION
-                return body
-            else:
-                parts = 'part' if count_misses == 1 else 'parts'
-                are = 'is' if count_misses == 1 else 'are'
-                self._errm = (
-                    'The content has changed and {n} {parts} of the '
-                    'translation {are} out of date.'.format(
-                    n=count_misses, parts=parts, are=are))
-                return self._detailed_error(self._errm, self._fallback(body))
-
+            self._status, self._errm, body = self._get_rendered_html()
         except Exception as ex:  # pylint: disable=broad-except
             logging.exception('Unable to translate: %s', self.source_value)
+            self._status = self.INVALID_TRANSLATION
             self._errm = str(ex)
             return self._detailed_error(
                 str(ex), self._fallback(self.source_value))
 
+        if self._status == self.VALID_TRANSLATION:
+            return body
+        return self._detailed_error(self._errm, body)
+
+    def prerender(self):
+        """Renders HTML into the caches so that later views find it there."""
+        if (self.translation_dict['type'] != TYPE_HTML or
+            self.source_value is None or not self.source_value.strip()):
+            return
+        try:
+            self._get_rendered_html()
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Unable to prerender: %s', self.source_value)
+
+    def _get_rendered_html_key(self):
+        return 'i18n-translated-html:%s' % hashlib.md5(transforms.dumps([
+            self.source_value,
+            self.translation_dict.get('source_value'),
+            [[data['source_value'], data['target_value']]
+             for data in self.translation_dict['data']],
+            I18nTranslationContext.get_fingerprint(self._app_context)
+        ])).hexdigest()
+
+    def _get_rendered_html(self):
+        """Returns (status, errm, body), from cache if possible.
+
+        The result depends only on the source HTML, the translation dict and
+        the xcontent configuration, so it is cached in process and in memcache
+        under a digest of those. Failures raise and are never cached.
+        """
+        key = self._get_rendered_html_key()
+        cache = ProcessScopedTranslatedHtmlCache.instance().cache
+        found, rendered = cache.get(key)
+        if found:
+            TRANSLATED_HTML_CACHE_HIT.inc()
+            return rendered
+
+        namespace = self._app_context.get_namespace_name()
+        rendered = models.MemcacheManager.get(key, namespace=namespace)
+        if rendered is not None:
+            TRANSLATED_HTML_CACHE_HIT.inc()
+            rendered = tuple(rendered)
+        else:
+            TRANSLATED_HTML_CACHE_MISS.inc()
+            rendered = self._render_html()
+            models.MemcacheManager.set(
+                key, rendered, ttl=TRANSLATED_HTML_CACHE_TTL_SEC,
+                namespace=namespace)
+        cache.put(key, rendered)
+        return rendered
+
+    def _render_html(self):
+        context = xcontent.Context(xcontent.ContentIO.fromstring(
+            self.source_value))
+        transformer = xcontent.ContentTransformer(
+            config=I18nTranslationContext.get(self._app_context))
+        transformer.decompose(context)
+
+        data_list = self.translation_dict['data']
+        diff_mapping_list = (
+            xcontent.SourceToTargetDiffMapping.map_lists_source_to_target(
+                context.resource_bundle, [
+                    data['source_value']
+                    for data in data_list]))
+
+        count_misses = 0
+        if len(context.resource_bundle) < len(data_list):
+            count_misses = len(data_list) - len(context.resource_bundle)
+
+        resource_bundle = []
+        for mapping in diff_mapping_list:
+            if mapping.verb == VERB_CURRENT:
+                resource_bundle.append(
+                    data_list[mapping.target_value_index]['target_value'])
+            elif mapping.verb in [VERB_CHANGED, VERB_NEW]:
+                count_misses += 1
+                resource_bundle.append(
+                    context.resource_bundle[mapping.source_value_index])
+            else:
+                raise ValueError('Unknown verb: %s' % mapping.verb)
+
+        errors = []
+        transformer.recompose(context, resource_bundle, errors)
+        body = xcontent.ContentIO.tostring(context.tree)
+        if count_misses == 0 and not errors:
+            return self.VALID_TRANSLATION, '', body
+
+        parts = 'part' if count_misses == 1 else 'parts'
+        are = 'is' if count_misses == 1 else 'are'
+        errm = (
+            'The content has changed and {n} {parts} of the '
+            'translation {are} out of date.'.format(
+            n=count_misses, parts=parts, are=are))
+        return self.INVALID_TRANSLATION, errm, self._fallback(body)
+
     def _fallback(self, default_body):
         """Try to fallback to the last known good translation."""
         source_value = self.translation_dict['source_value']
@@ -3348,6 +4067,8 @@ def register_module():
         (TranslationDeletionRestHandler.URL, TranslationDeletionRestHandler),
         (TranslationDownloadRestHandler.URL, TranslationDownloadRestHandler),
         (TranslationUploadRestHandler.URL, TranslationUploadRestHandler),
+        (TranslationTransferDownloadHandler.URL,
+         TranslationTransferDownloadHandler),
         (IsTranslatableRestHandler.URL, IsTranslatableRestHandler)]
 
     global custom_module  # pylint: disable=global-statement
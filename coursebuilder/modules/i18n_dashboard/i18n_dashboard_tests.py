@@ -22,12 +22,14 @@ import collections
 import cStringIO
 import logging
 import StringIO
+import time
 import traceback
 import unittest
 import urllib
 import zipfile
 
 from babel.messages import pofile
+import cloudstorage
 
 import appengine_config
 
@@ -61,9 +63,11 @@ from modules.i18n_dashboard.i18n_dashboard import VERB_NEW
 from modules.notifications import notifications
 from tests.functional import actions
 
+from google.appengine.api import app_identity
 from google.appengine.api import memcache
 from google.appengine.api import namespace_manager
 from google.appengine.datastore import datastore_rpc
+from google.appengine.ext import blobstore
 
 
 class ResourceBundleKeyTests(unittest.TestCase):
@@ -1404,6 +1408,69 @@ class LazyTranslatorTests(actions.TestBase):
             'of the translation is out of date.',
             lazy_translator.errm)
 
+    def test_lazy_translator_caches_rendered_html(self):
+        source_value = '<p>cached hello</p>'
+        translation_dict = {
+            'type': 'html',
+            'source_value': source_value,
+            'data': [
+                {'source_value': 'cached hello',
+                 'target_value': 'CACHED HELLO'}]}
+        key = ResourceBundleKey(
+            resources_display.ResourceLesson.TYPE, '23', 'el')
+        hits = i18n_dashboard.TRANSLATED_HTML_CACHE_HIT.value
+        misses = i18n_dashboard.TRANSLATED_HTML_CACHE_MISS.value
+
+        # Pre-rendering does the work up front...
+        LazyTranslator(
+            self.app_context, key, source_value, translation_dict).prerender()
+        self.assertEquals(
+            misses + 1, i18n_dashboard.TRANSLATED_HTML_CACHE_MISS.value)
+
+        # ...so that views of the same content only hit the cache.
+        lazy_translator = LazyTranslator(
+            self.app_context, key, source_value, translation_dict)
+        self.assertEquals('<p>CACHED HELLO</p>', str(lazy_translator))
+        self.assertEquals(
+            LazyTranslator.VALID_TRANSLATION, lazy_translator.status)
+        self.assertEquals(
+            hits + 1, i18n_dashboard.TRANSLATED_HTML_CACHE_HIT.value)
+
+        # A different translation is a different cache entry.
+        translation_dict['data'][0]['target_value'] = 'CACHED HI'
+        lazy_translator = LazyTranslator(
+            self.app_context, key, source_value, translation_dict)
+        self.assertEquals('<p>CACHED HI</p>', str(lazy_translator))
+        self.assertEquals(
+            misses + 2, i18n_dashboard.TRANSLATED_HTML_CACHE_MISS.value)
+
+    def test_xcontent_configuration_is_built_once_per_tags_version(self):
+        i18n_dashboard.I18nTranslationContext.clear_instance()
+        start = time.time()
+        config = i18n_dashboard.I18nTranslationContext.get(self.app_context)
+        cold_secs = time.time() - start
+        start = time.time()
+        self.assertIs(
+            config, i18n_dashboard.I18nTranslationContext.get(self.app_context))
+        warm_secs = time.time() - start
+        logging.info(
+            'xcontent configuration for %s tags: built in %.4fs, '
+            'reused in %.6fs.', len(tags.Registry.get_all_tags()), cold_secs,
+            warm_secs)
+
+        fingerprint = i18n_dashboard.I18nTranslationContext.get_fingerprint(
+            self.app_context)
+        tags.Registry.add_tag_binding('gcb-test-memo', tags.BaseTag)
+        try:
+            self.assertIsNot(
+                config,
+                i18n_dashboard.I18nTranslationContext.get(self.app_context))
+        finally:
+            tags.Registry.remove_tag_binding('gcb-test-memo')
+        self.assertEquals(
+            fingerprint, i18n_dashboard.I18nTranslationContext.get_fingerprint(
+                self.app_context))
+
 
 class CourseContentTranslationTests(actions.TestBase):
     ADMIN_EMAIL = 'admin@foo.com'
@@ -2547,6 +2614,139 @@ class TranslationImportExportTests(actions.TestBase):
                 self.COURSE_NAME, self.unit.unit_id, self.lesson.lesson_id))
         self.assertIn('Lektion Titel', response.body)
 
+    def _set_background_transfer_limits(self):
+        """Send every transfer to the background, two resources at a time."""
+        saved = (i18n_dashboard.BACKGROUND_TRANSFER_MIN_ITEMS,
+                 i18n_dashboard.TRANSFER_CHUNK_SIZE)
+
+        def restore():
+            (i18n_dashboard.BACKGROUND_TRANSFER_MIN_ITEMS,
+             i18n_dashboard.TRANSFER_CHUNK_SIZE) = saved
+
+        self.addCleanup(restore)
+        i18n_dashboard.BACKGROUND_TRANSFER_MIN_ITEMS = 0
+        i18n_dashboard.TRANSFER_CHUNK_SIZE = 2
+
+    def test_background_export(self):
+        extra_env = {
+            'extra_locales': [{'locale': 'de', 'availability': 'available'}]
+            }
+        with actions.OverriddenEnvironment(extra_env):
+            self._make_current_and_stale_translation()
+            self._set_background_transfer_limits()
+            response = self._do_download({
+                'locales': [{'locale': 'de', 'checked': True}],
+                'export_what': 'all',
+                'file_name': 'xyzzy.zip',
+                })
+            rsp = transforms.loads(response.body)
+            self.assertEquals(200, rsp['status'])
+            self.assertTrue(transforms.loads(rsp['payload'])['background'])
+
+            response = self.get(self.URL)
+            self.assertIn('in progress (0% done)', response.body)
+            self.execute_all_deferred_tasks()
+            response = self.get(self.URL)
+            self.assertIn('Download .zip file', response.body)
+
+            response = self.get('/%s%s' % (
+                self.COURSE_NAME,
+                i18n_dashboard.TranslationTransferDownloadHandler.URL))
+            self.assertEquals('attachment; filename="xyzzy.zip"',
+                              response.content_disposition)
+            output_path = self._get_export_status().output_path
+            self.assertEquals(
+                blobstore.create_gs_key('/gs' + output_path),
+                response.headers[blobstore.BLOB_KEY_HEADER])
+            with cloudstorage.open(output_path) as gcs_file:
+                zip_data = gcs_file.read()
+            zf = zipfile.ZipFile(cStringIO.StringIO(zip_data), 'r')
+            for name in zf.namelist():
+                self.assertRegexpMatches(
+                    name, r'^locale/de/LC_MESSAGES/messages_\d{4}.po$')
+            translations = {}
+            for catalog in self._parse_zip_data(zip_data):
+                for message in catalog:
+                    translations[message.id] = message.string
+            self.assertEquals('lESSON tITLE', translations['Lesson Title'])
+            self.assertEquals('', translations['Edited Assessment Title'])
+            self.assertIn('mc description', translations)
+            self.assertEquals(
+                0, i18n_dashboard.I18nTransferPartEntity.all().count())
+
+            # Starting the next export deletes the previous .zip file.
+            self._do_download({
+                'locales': [{'locale': 'de', 'checked': True}],
+                'export_what': 'all',
+                'file_name': 'xyzzy.zip',
+                })
+            with self.assertRaises(cloudstorage.NotFoundError):
+                cloudstorage.stat(output_path)
+
+    def test_background_export_without_bucket_fails(self):
+        extra_env = {
+            'extra_locales': [{'locale': 'de', 'availability': 'available'}]
+            }
+        self._set_background_transfer_limits()
+        self.swap(
+            app_identity, 'get_default_gcs_bucket_name', lambda: None)
+        with actions.OverriddenEnvironment(extra_env):
+            self._do_download({
+                'locales': [{'locale': 'de', 'checked': True}],
+                'export_what': 'all',
+                'file_name': 'xyzzy.zip',
+                })
+            self.execute_all_deferred_tasks()
+
+        status = self._get_export_status()
+        self.assertEquals(
+            i18n_dashboard.I18nTransferStatusEntity.STATE_FAILED,
+            status.state)
+        self.assertIn('No default Cloud Storage bucket', status.error)
+        response = self.get('/%s%s' % (
+            self.COURSE_NAME,
+            i18n_dashboard.TranslationTransferDownloadHandler.URL),
+            expect_errors=True)
+        self.assertEquals(404, response.status_int)
+
+    def _get_export_status(self):
+        return i18n_dashboard.I18nTransferStatusEntity.get_by_key_name(
+            i18n_dashboard.I18nTransferStatusEntity.KIND_EXPORT)
+
+    def test_background_import(self):
+        self._set_background_transfer_limits()
+        response = self._do_upload(
+            '# <span class="">1.1 Lesson Title</span>\n'
+            '#: GCB-1|title|string|lesson:4:de:0\n'
+            '#| msgid ""\n'
+            'msgid "Lesson Title"\n'
+            'msgstr "Lektion Titel"\n')
+        self.assertIn('being imported in the background', response.body)
+
+        # With no time budget, each task gets through a single chunk before
+        # checkpointing and handing off to its continuation.
+        saved_budget = i18n_dashboard.TRANSFER_TASK_BUDGET_SECONDS
+        try:
+            i18n_dashboard.TRANSFER_TASK_BUDGET_SECONDS = 0
+            self.execute_all_deferred_tasks()
+        finally:
+            i18n_dashboard.TRANSFER_TASK_BUDGET_SECONDS = saved_budget
+
+        response = self.get(self.URL)
+        self.assertIn('Translation import for de', response.body)
+        self.assertIn(
+            'For Deutsch (de), made 1 total replacements', response.body)
+        self.assertEquals(
+            0, i18n_dashboard.I18nTransferPartEntity.all().count())
+
+        prefs = models.StudentPreferencesDAO.load_or_default()
+        prefs.locale = 'de'
+        models.StudentPreferencesDAO.save(prefs)
+        response = self.get(
+            '/%s/unit?unit=%s&lesson=%s' % (
+                self.COURSE_NAME, self.unit.unit_id, self.lesson.lesson_id))
+        self.assertIn('Lektion Titel', response.body)
+
     def _parse_messages(self, response):
         dom = self.parse_html_string(response.body)
         payload = dom.find('.//payload')
@@ -2787,7 +2987,10 @@ class TranslationImportExportTests(actions.TestBase):
         self.course.save()
 
     def _parse_zip_response(self, response):
-        download_zf = zipfile.ZipFile(cStringIO.StringIO(response.body), 'r')
+        return self._parse_zip_data(response.body)
+
+    def _parse_zip_data(self, zip_data):
+        download_zf = zipfile.ZipFile(cStringIO.StringIO(zip_data), 'r')
         out_stream = StringIO.StringIO()
         out_stream.fp = out_stream
         for item in download_zf.infolist():
@@ -18,6 +18,7 @@ __author__ = [
     'johncox@google.com (John Cox)',
 ]
 
+import copy
 import logging
 import os
 import sys
@@ -79,6 +80,8 @@ class _BaseJob(etl_lib.CourseJob):
     def _build_translation_config(cls, args, app_context):
         cfg = i18n_dashboard.I18nTranslationContext.get(app_context)
         if args.suppress_nondefault_composable_tags:
+            # The configuration is shared by the whole process; modify a copy.
+            cfg = copy.copy(cfg)
             cfg.opaque_decomposable_tag_names = list(
                 xcontent.DEFAULT_OPAQUE_DECOMPOSABLE_TAG_NAMES)
             cfg.RECOMPOSABLE_ATTRIBUTES_MAP = dict(
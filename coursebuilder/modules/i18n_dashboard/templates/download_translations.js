@@ -10,7 +10,13 @@ $(function() {
       .append($('<div/>').text(notes));
 
 
-  cb_global.onSaveComplete = function() {
+  cb_global.onSaveComplete = function(payload) {
+    if (payload && payload.background) {
+      // Large exports are built by background tasks; progress and the
+      // finished download are shown on the translations dashboard.
+      window.location = payload.dashboard_url;
+      return;
+    }
     cbShowMsgAutoHide(
         'Download of .zip file started; open your browser\'s ' +
         'Downloads window to track progress.')
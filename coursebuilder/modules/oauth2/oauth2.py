@@ -55,6 +55,11 @@ http://api-python-client-doc.appspot.com/.
 Finally, a note about dependencies. Oauth2 requires google-api-python-client.
 We bundle version 1.4 with Course Builder, along with its dependencies.
 
+This module is imported on the first request to one of its routes rather than
+at instance startup, so that other requests do not pay for importing those
+dependencies. If you change the callback path, also change it in the
+global_routes listed in manifest.yaml.
+
 Good luck!
 """
 
@@ -18,91 +18,123 @@ __author__ = [
     'johncox@google.com (John Cox)',
 ]
 
+import datetime
 import logging
+import time
 
+from common import utils as common_utils
 from controllers import sites
 from controllers import utils
 from models import courses
+from modules.review import peer
 from modules.review import review
-from google.appengine.api import namespace_manager
+from google.appengine.ext import deferred
 
 _LOG = logging.getLogger('modules.reviews.cron')
 logging.basicConfig()
 
+# Seconds of expiry work a single task does before checkpointing its cursor
+# and handing off to a continuation task. Well under the 10 minute task
+# deadline so that one slow batch cannot push us over.
+_TASK_BUDGET_SECONDS = 60
 
-class ExpireOldAssignedReviewsHandler(utils.BaseHandler):
-    """Iterates through all units in all courses, expiring old review steps.
-
-    The system will run a maximum of one of these jobs at any given time. This
-    is enforced by the 10 minute execution time limit on cron jobs plus the
-    scheduler, which is configured to run this every 15 minutes.
 
-    Write operations done by this handler must be atomic since admins may visit
-    this page at any time, kicking off any number of runs.
+class ExpireOldAssignedReviewsHandler(utils.BaseHandler):
+    """Fans out tasks that expire old review steps in all courses.
+
+    The cron request itself only enumerates courses and enqueues one task per
+    course. That task finds the course's peer-reviewed units and enqueues one
+    task chain per unit. Each task in a chain expires a bounded amount of work
+    in batched transactions, checkpoints its cursor and running totals in
+    peer.ReviewExpiryStatus, and enqueues its own continuation if there is
+    more to do.
+
+    Write operations done by these tasks must be atomic since admins may visit
+    this page at any time, kicking off any number of runs. Each run is tagged
+    with a run id; when a newer run reaches a unit, tasks from older runs for
+    that unit stop at their next checkpoint.
     """
 
     def get(self):
-        """Runs the expiry operation once for each peer-reviwed unit."""
+        """Enqueues the expiry operation once for each course."""
         try:
             self.response.headers['Content-Type'] = 'text/plain'
+            run_id = datetime.datetime.utcnow().isoformat()
+            _LOG.info('Begin expire_old_assigned_reviews cron %s', run_id)
 
-            # namespace_string -> [{
-            #       'id': unit_id_string, 'review_window_mins': int}]
-            namespace_to_units = {}  # namespace_string -> [unit_id_strings]
+            course_count = 0
             for context in sites.get_all_courses():
-                namespace = context.get_namespace_name()
-                namespace_to_units[namespace] = []
-                course = courses.Course(None, context)
-
-                for unit in course.get_peer_reviewed_units():
-                    namespace_to_units[namespace].append({
-                        'review_window_mins': (
-                            unit.workflow.get_review_window_mins()),
-                        'id': str(unit.unit_id),
-                    })
-
-            total_count = 0
-            total_expired_count = 0
-            total_exception_count = 0
-            _LOG.info('Begin expire_old_assigned_reviews cron')
-
-            for namespace, units in namespace_to_units.iteritems():
-                start_namespace_message = (
-                    ('Begin processing course in namespace "%s"; %s unit%s '
-                     'found') % (
-                         namespace, len(units), '' if len(units) == 1 else 's'))
-                _LOG.info(start_namespace_message)
-
-                for unit in units:
-                    begin_unit_message = 'Begin processing unit %s' % unit['id']
-                    _LOG.info(begin_unit_message)
-
-                    namespace_manager.set_namespace(namespace)
-                    expired_keys, exception_keys = (
-                        review.Manager.expire_old_reviews_for_unit(
-                            unit['review_window_mins'], unit['id']))
-
-                    unit_expired_count = len(expired_keys)
-                    unit_exception_count = len(exception_keys)
-                    unit_total_count = unit_expired_count + unit_exception_count
-                    total_expired_count += unit_expired_count
-                    total_exception_count += total_exception_count
-                    total_count += unit_total_count
-
-                    end_unit_message = (
-                        'End processing unit %s. Expired: %s, Exceptions: %s, '
-                        'Total: %s' % (
-                            unit['id'], unit_expired_count,
-                            unit_exception_count, unit_total_count))
-                    _LOG.info(end_unit_message)
-
-                _LOG.info('Done processing namespace "%s"', namespace)
-
-            end_message = (
-                ('End expire_old_assigned_reviews cron. Expired: %s, '
-                 'Exceptions : %s, Total: %s') % (
-                     total_expired_count, total_exception_count, total_count))
-            _LOG.info(end_message)
+                deferred.defer(
+                    expire_old_reviews_for_course,
+                    context.get_namespace_name(), run_id)
+                course_count += 1
+
+            _LOG.info(
+                'End expire_old_assigned_reviews cron %s. Courses enqueued: %s',
+                run_id, course_count)
             self.response.write('OK\n')
         except:  # Hide all errors. pylint: disable=bare-except
             pass
+
+
+def expire_old_reviews_for_course(namespace, run_id):
+    """Enqueues one expiry task chain per peer-reviewed unit in a course."""
+    with common_utils.Namespace(namespace):
+        app_context = sites.get_app_context_for_namespace(namespace)
+        if not app_context:
+            _LOG.warning('No course found for namespace "%s"', namespace)
+            return
+        course = courses.Course(None, app_context)
+        units = course.get_peer_reviewed_units()
+        _LOG.info(
+            'Begin processing course in namespace "%s"; %s unit%s found',
+            namespace, len(units), '' if len(units) == 1 else 's')
+
+        for unit in units:
+            unit_id = str(unit.unit_id)
+            peer.ReviewExpiryStatus(
+                key_name=unit_id, run_id=run_id,
+                start_date=datetime.datetime.utcnow()).put()
+            deferred.defer(
+                expire_old_reviews_for_unit, namespace, unit_id,
+                unit.workflow.get_review_window_mins(), run_id)
+
+
+def expire_old_reviews_for_unit(
+    namespace, unit_id, review_window_mins, run_id,
+    budget_seconds=_TASK_BUDGET_SECONDS):
+    """Expires old review steps for one unit, resuming from the checkpoint."""
+    with common_utils.Namespace(namespace):
+        status = peer.ReviewExpiryStatus.get_by_key_name(unit_id)
+        if not status or status.run_id != run_id or status.done:
+            _LOG.info(
+                'Run %s superseded for unit %s in namespace "%s"; stopping',
+                run_id, unit_id, namespace)
+            return
+
+        status.task_count += 1
+        deadline = time.time() + budget_seconds
+        cursor = status.cursor
+        while True:
+            expired_keys, exception_keys, cursor = (
+                review.Manager.expire_old_reviews_for_unit_page(
+                    review_window_mins, unit_id, cursor=cursor))
+            status.expired_count += len(expired_keys)
+            status.exception_count += len(exception_keys)
+            status.cursor = cursor
+            if not cursor or time.time() >= deadline:
+                break
+
+        if cursor:
+            status.put()
+            deferred.defer(
+                expire_old_reviews_for_unit, namespace, unit_id,
+                review_window_mins, run_id)
+            return
+
+        status.end_date = datetime.datetime.utcnow()
+        status.put()
+        _LOG.info(
+            'End processing unit %s in namespace "%s". Expired: %s, '
+            'Exceptions: %s, Tasks: %s', unit_id, namespace,
+            status.expired_count, status.exception_count, status.task_count)
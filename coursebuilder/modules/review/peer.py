@@ -24,6 +24,7 @@ __author__ = [
 ]
 
 from models import counters
+from models import entities
 from models import models
 from models import student_work
 from modules.review import domain
@@ -274,3 +275,38 @@ class ReviewStep(student_work.BaseEntity):
         query = ReviewStep.all(keys_only=True).filter(
             'reviewee_key =', student_key)
         db.delete(query.run())
+
+
+class ReviewExpiryStatus(entities.BaseEntity):
+    """Progress and results of the expiry cron for one peer-reviewed unit.
+
+    Lives in the course's namespace and is keyed by unit id. The expiry cron
+    fans out one task chain per unit; each task in the chain checkpoints its
+    cursor and running totals here before handing off to the next one.
+    """
+
+    # Identifier of the cron run that last touched this unit. Tasks belonging
+    # to an older run stop as soon as they see a newer run_id.
+    run_id = db.StringProperty(indexed=False)
+    # UTC time the current run started processing this unit.
+    start_date = db.DateTimeProperty(indexed=False)
+    # UTC last modification timestamp.
+    change_date = db.DateTimeProperty(auto_now=True, indexed=False)
+    # UTC time the current run finished this unit, or None if in progress.
+    end_date = db.DateTimeProperty(indexed=False)
+    # Query cursor to resume from, or None to start at the beginning.
+    cursor = db.TextProperty()
+    # Number of review steps expired by the current run.
+    expired_count = db.IntegerProperty(default=0, indexed=False)
+    # Number of review steps the current run failed to expire.
+    exception_count = db.IntegerProperty(default=0, indexed=False)
+    # Number of tasks the current run has used for this unit so far.
+    task_count = db.IntegerProperty(default=0, indexed=False)
+
+    @property
+    def unit_id(self):
+        return self.key().name()
+
+    @property
+    def done(self):
+        return self.end_date is not None
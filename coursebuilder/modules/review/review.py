@@ -30,7 +30,6 @@ from models import entities
 from models import entity_transforms
 from models import student_work
 from models import transforms
-from models import utils
 import models.review
 from modules.dashboard import dashboard
 from modules.review import dashboard as review_dashboard
@@ -40,6 +39,14 @@ from modules.review import stats
 from google.appengine.ext import db
 
 
+# Maximum number of review steps expired in one transaction. Each step touches
+# its own entity group plus that of its review summary, and cross-group
+# transactions are limited to 25 entity groups.
+EXPIRY_BATCH_SIZE = 10
+# Number of review steps fetched from the expiry query per page.
+EXPIRY_PAGE_SIZE = 100
+
+
 # In-process increment-only performance counters.
 COUNTER_ADD_REVIEWER_BAD_SUMMARY_KEY = counters.PerfCounter(
     'gcb-pr-add-reviewer-bad-summary-key',
@@ -130,6 +137,11 @@ COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_SUCCESS = counters.PerfCounter(
     'gcb-pr-expire-old-reviews-for-unit-success',
     'number of times expire_old_reviews_for_unit() completed successfully')
 
+COUNTER_EXPIRE_REVIEWS_BATCH_FAILED = counters.PerfCounter(
+    'gcb-pr-expire-reviews-batch-failed',
+    ('number of times expire_reviews() fell back to one transaction per step '
+     'because the batch transaction failed'))
+
 COUNTER_EXPIRY_QUERY_KEYS_RETURNED = counters.PerfCounter(
     'gcb-pr-expiry-query-keys-returned',
     'number of keys returned by the query returned by get_expiry_query()')
@@ -506,6 +518,84 @@ class Manager(object):
         summary.increment_count(step.state)
         return entities.put([step, summary])[0]
 
+    @classmethod
+    def expire_reviews(cls, review_step_keys):
+        """Puts a batch of review steps in state REVIEW_STATE_EXPIRED.
+
+        All steps are expired in a single cross-group transaction, so callers
+        must keep review_step_keys at or under EXPIRY_BATCH_SIZE. Steps that
+        are missing, removed, or cannot be transitioned are skipped rather
+        than failing the batch. If the batch transaction itself fails (for
+        example, due to contention on a shared review summary), we fall back
+        to expiring each step in its own transaction.
+
+        Args:
+            review_step_keys: list of db.Key of models.student_work.ReviewStep.
+                The review steps to expire.
+
+        Returns:
+            2-tuple of list of db.Key of peer.ReviewStep. 0th element is keys
+            that were written successfully; 1st element is keys that we failed
+            to update.
+        """
+        assert len(review_step_keys) <= EXPIRY_BATCH_SIZE
+        try:
+            return cls._transition_states_to_expired(review_step_keys)
+        except:  # All errors are the same. pylint: disable=bare-except
+            COUNTER_EXPIRE_REVIEWS_BATCH_FAILED.inc()
+
+        expired_keys = []
+        exception_keys = []
+        for review_step_key in review_step_keys:
+            try:
+                expired_keys.append(cls.expire_review(review_step_key))
+            except:  # All errors are the same. pylint: disable=bare-except
+                exception_keys.append(review_step_key)
+        return expired_keys, exception_keys
+
+    @classmethod
+    @db.transactional(xg=True)
+    def _transition_states_to_expired(cls, review_step_keys):
+        COUNTER_EXPIRE_REVIEW_START.inc(increment=len(review_step_keys))
+        steps = []
+        exception_keys = []
+        for review_step_key, step in zip(
+                review_step_keys, entities.get(review_step_keys)):
+            if not step:
+                COUNTER_EXPIRE_REVIEW_STEP_MISS.inc()
+                exception_keys.append(review_step_key)
+            elif step.removed or step.state in (
+                    domain.REVIEW_STATE_COMPLETED, domain.REVIEW_STATE_EXPIRED):
+                COUNTER_EXPIRE_REVIEW_CANNOT_TRANSITION.inc()
+                exception_keys.append(review_step_key)
+            else:
+                steps.append(step)
+
+        # Several steps may share one summary; load each summary only once so
+        # that all count changes accumulate on the same instance.
+        summary_keys = list(set(step.review_summary_key for step in steps))
+        summaries = dict(zip(summary_keys, entities.get(summary_keys)))
+
+        to_put = []
+        for step in steps:
+            summary = summaries[step.review_summary_key]
+            if not summary:
+                COUNTER_EXPIRE_REVIEW_SUMMARY_MISS.inc()
+                exception_keys.append(step.key())
+                continue
+            summary.decrement_count(step.state)
+            step.state = domain.REVIEW_STATE_EXPIRED
+            summary.increment_count(step.state)
+            to_put.append(step)
+
+        expired_keys = [step.key() for step in to_put]
+        to_put.extend(summary for summary in summaries.itervalues() if summary)
+        if expired_keys:
+            entities.put(to_put)
+        COUNTER_EXPIRE_REVIEW_SUCCESS.inc(increment=len(expired_keys))
+        COUNTER_EXPIRE_REVIEW_FAILED.inc(increment=len(exception_keys))
+        return expired_keys, exception_keys
+
     @classmethod
     def expire_old_reviews_for_unit(cls, review_window_mins, unit_id):
         """Finds and expires all old review steps for a single unit.
@@ -520,30 +610,73 @@ class Manager(object):
             that were written successfully; 1st element is keys that we failed
             to update.
         """
-        query = cls.get_expiry_query(review_window_mins, unit_id)
-        mapper = utils.QueryMapper(
-            query, counter=COUNTER_EXPIRY_QUERY_KEYS_RETURNED, report_every=100)
         expired_keys = []
         exception_keys = []
+        cursor = None
+        while True:
+            page_expired_keys, page_exception_keys, cursor = (
+                cls.expire_old_reviews_for_unit_page(
+                    review_window_mins, unit_id, cursor=cursor))
+            expired_keys.extend(page_expired_keys)
+            exception_keys.extend(page_exception_keys)
+            if not cursor:
+                return expired_keys, exception_keys
 
-        def map_fn(review_step_key, expired_keys, exception_keys):
-            try:
-                expired_keys.append(cls.expire_review(review_step_key))
-            except:  # All errors are the same. pylint: disable=bare-except
-                # Skip. Either the entity was updated between the query and
-                # the update, meaning we don't need to expire it; or we ran into
-                # a transient datastore error, meaning we'll expire it next
-                # time.
-                COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_SKIP.inc()
-                exception_keys.append(review_step_key)
+    @classmethod
+    def expire_old_reviews_for_unit_page(
+        cls, review_window_mins, unit_id, cursor=None,
+        page_size=EXPIRY_PAGE_SIZE):
+        """Expires one page of old review steps for a single unit.
 
-        COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_START.inc()
+        Steps are expired in transactions of at most EXPIRY_BATCH_SIZE steps.
+        Callers that need to spread the work over several requests should
+        persist the returned cursor and pass it back in on the next call.
 
-        mapper.run(map_fn, expired_keys, exception_keys)
+        Args:
+            review_window_mins: int. Number of minutes before we expire reviews
+                assigned by domain.ASSIGNER_KIND_AUTO.
+            unit_id: string. Id of the unit to restrict the query to.
+            cursor: string or None. Cursor returned by a previous call, or None
+                to start from the beginning of the expiry query.
+            page_size: int. Maximum number of review steps to process.
+
+        Returns:
+            3-tuple. 0th element is list of db.Key of peer.ReviewStep that were
+            written successfully; 1st element is list of db.Key that we failed
+            to update; 2nd element is a string cursor to continue from, or None
+            if there are no more results.
+        """
+        query = cls.get_expiry_query(review_window_mins, unit_id)
+        if cursor:
+            query.with_cursor(start_cursor=cursor)
+        review_step_keys = query.fetch(limit=page_size)
+        COUNTER_EXPIRY_QUERY_KEYS_RETURNED.inc(increment=len(review_step_keys))
+        next_cursor = None
+        if len(review_step_keys) == page_size:
+            next_cursor = query.cursor()
+
+        if cursor is None:
+            COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_START.inc()
+
+        expired_keys = []
+        exception_keys = []
+        for i in xrange(0, len(review_step_keys), EXPIRY_BATCH_SIZE):
+            batch_expired_keys, batch_exception_keys = cls.expire_reviews(
+                review_step_keys[i:i + EXPIRY_BATCH_SIZE])
+            expired_keys.extend(batch_expired_keys)
+            exception_keys.extend(batch_exception_keys)
+
+        # Exception keys are skipped. Either the entity was updated between
+        # the query and the update, meaning we don't need to expire it; or we
+        # ran into a transient datastore error, meaning we'll expire it next
+        # time.
+        COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_SKIP.inc(
+            increment=len(exception_keys))
         COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_EXPIRE.inc(
             increment=len(expired_keys))
-        COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_SUCCESS.inc()
-        return expired_keys, exception_keys
+        if next_cursor is None:
+            COUNTER_EXPIRE_OLD_REVIEWS_FOR_UNIT_SUCCESS.inc()
+        return expired_keys, exception_keys, next_cursor
 
     @classmethod
     def get_assignment_candidates_query(cls, unit_id):
@@ -31,6 +31,7 @@ from models import data_sources
 from models import models
 from models import student_work
 from models import transforms
+from modules.review import cron
 from modules.review import domain
 from modules.review import peer
 from modules.review import review as review_module
@@ -457,6 +458,84 @@ class ManagerTest(actions.TestBase):
         self.assertEqual(1, summary.completed_count)
         self.assertEqual(1, summary.expired_count)
 
+    def test_expire_old_reviews_for_unit_page_returns_cursor_until_done(self):
+        summary_key = peer.ReviewSummary(
+            assigned_count=3, reviewee_key=self.reviewee_key,
+            submission_key=self.submission_key, unit_id=self.unit_id
+        ).put()
+        step_keys = []
+        for i in xrange(3):
+            reviewer_key = models.Student(
+                key_name='reviewer%s@example.com' % i).put()
+            step_keys.append(peer.ReviewStep(
+                assigner_kind=domain.ASSIGNER_KIND_AUTO,
+                review_key=db.Key.from_path(
+                    student_work.Review.kind(), 'review%s' % i),
+                review_summary_key=summary_key, reviewee_key=self.reviewee_key,
+                reviewer_key=reviewer_key, submission_key=self.submission_key,
+                state=domain.REVIEW_STATE_ASSIGNED, unit_id=self.unit_id
+            ).put())
+
+        expired_keys, exception_keys, cursor = (
+            review_module.Manager.expire_old_reviews_for_unit_page(
+                0, self.unit_id, page_size=2))
+        self.assertEqual(2, len(expired_keys))
+        self.assertEqual([], exception_keys)
+        self.assertTrue(cursor)
+
+        expired_keys, exception_keys, cursor = (
+            review_module.Manager.expire_old_reviews_for_unit_page(
+                0, self.unit_id, cursor=cursor, page_size=2))
+        self.assertEqual(1, len(expired_keys))
+        self.assertEqual([], exception_keys)
+        self.assertIsNone(cursor)
+
+        steps = db.get(step_keys)
+        summary = db.get(summary_key)
+        self.assertEqual(
+            [domain.REVIEW_STATE_EXPIRED] * 3, [step.state for step in steps])
+        self.assertEqual(0, summary.assigned_count)
+        self.assertEqual(3, summary.expired_count)
+
+    def test_expire_reviews_skips_steps_that_cannot_transition(self):
+        summary_key = peer.ReviewSummary(
+            assigned_count=1, completed_count=1,
+            reviewee_key=self.reviewee_key, submission_key=self.submission_key,
+            unit_id=self.unit_id
+        ).put()
+        assigned_step_key = peer.ReviewStep(
+            assigner_kind=domain.ASSIGNER_KIND_AUTO,
+            review_key=db.Key.from_path(student_work.Review.kind(), 'review'),
+            review_summary_key=summary_key, reviewee_key=self.reviewee_key,
+            reviewer_key=self.reviewer_key, submission_key=self.submission_key,
+            state=domain.REVIEW_STATE_ASSIGNED, unit_id=self.unit_id
+        ).put()
+        second_reviewer_key = models.Student(
+            key_name='reviewer2@example.com').put()
+        completed_step_key = peer.ReviewStep(
+            assigner_kind=domain.ASSIGNER_KIND_AUTO,
+            review_key=db.Key.from_path(student_work.Review.kind(), 'review2'),
+            review_summary_key=summary_key, reviewee_key=self.reviewee_key,
+            reviewer_key=second_reviewer_key,
+            submission_key=self.submission_key,
+            state=domain.REVIEW_STATE_COMPLETED, unit_id=self.unit_id
+        ).put()
+        missing_step_key = db.Key.from_path(peer.ReviewStep.kind(), 'missing')
+
+        expired_keys, exception_keys = review_module.Manager.expire_reviews(
+            [assigned_step_key, completed_step_key, missing_step_key])
+        assigned_step, completed_step, summary = db.get(
+            [assigned_step_key, completed_step_key, summary_key])
+
+        self.assertEqual([assigned_step_key], expired_keys)
+        self.assertEqual(
+            set([completed_step_key, missing_step_key]), set(exception_keys))
+        self.assertEqual(domain.REVIEW_STATE_EXPIRED, assigned_step.state)
+        self.assertEqual(domain.REVIEW_STATE_COMPLETED, completed_step.state)
+        self.assertEqual(0, summary.assigned_count)
+        self.assertEqual(1, summary.completed_count)
+        self.assertEqual(1, summary.expired_count)
+
     def test_get_assignment_candidates_query_filters_and_orders_correctly(self):
         unused_wrong_unit_key = peer.ReviewSummary(
             reviewee_key=self.reviewee_key, submission_key=self.submission_key,
@@ -1365,6 +1444,66 @@ class ManagerTest(actions.TestBase):
         self.assertEqual('contents2', updated_review.contents)
 
 
+class ExpiryCronTest(actions.TestBase):
+    """Tests for the task chains started by the review expiry cron."""
+
+    def setUp(self):
+        super(ExpiryCronTest, self).setUp()
+        self.namespace = 'ns_expiry_cron'
+        self.unit_id = '1'
+        self.run_id = 'run'
+        with common_utils.Namespace(self.namespace):
+            reviewee_key = models.Student(key_name='reviewee@example.com').put()
+            reviewer_key = models.Student(key_name='reviewer@example.com').put()
+            submission_key = db.Key.from_path(
+                student_work.Submission.kind(),
+                student_work.Submission.key_name(
+                    reviewee_key=reviewee_key, unit_id=self.unit_id))
+            summary_key = peer.ReviewSummary(
+                assigned_count=1, reviewee_key=reviewee_key,
+                submission_key=submission_key, unit_id=self.unit_id
+            ).put()
+            self.step_key = peer.ReviewStep(
+                assigner_kind=domain.ASSIGNER_KIND_AUTO,
+                review_key=db.Key.from_path(
+                    student_work.Review.kind(), 'review'),
+                review_summary_key=summary_key, reviewee_key=reviewee_key,
+                reviewer_key=reviewer_key, submission_key=submission_key,
+                state=domain.REVIEW_STATE_ASSIGNED, unit_id=self.unit_id
+            ).put()
+
+    def test_unit_task_expires_reviews_and_records_summary(self):
+        with common_utils.Namespace(self.namespace):
+            peer.ReviewExpiryStatus(
+                key_name=self.unit_id, run_id=self.run_id).put()
+        cron.expire_old_reviews_for_unit(
+            self.namespace, self.unit_id, 0, self.run_id)
+
+        with common_utils.Namespace(self.namespace):
+            step = db.get(self.step_key)
+            status = peer.ReviewExpiryStatus.get_by_key_name(self.unit_id)
+        self.assertEqual(domain.REVIEW_STATE_EXPIRED, step.state)
+        self.assertTrue(status.done)
+        self.assertIsNone(status.cursor)
+        self.assertEqual(1, status.expired_count)
+        self.assertEqual(0, status.exception_count)
+        self.assertEqual(1, status.task_count)
+
+    def test_unit_task_from_superseded_run_does_nothing(self):
+        with common_utils.Namespace(self.namespace):
+            peer.ReviewExpiryStatus(
+                key_name=self.unit_id, run_id='newer_run').put()
+        cron.expire_old_reviews_for_unit(
+            self.namespace, self.unit_id, 0, self.run_id)
+
+        with common_utils.Namespace(self.namespace):
+            step = db.get(self.step_key)
+            status = peer.ReviewExpiryStatus.get_by_key_name(self.unit_id)
+        self.assertEqual(domain.REVIEW_STATE_ASSIGNED, step.state)
+        self.assertFalse(status.done)
+        self.assertEqual(0, status.task_count)
+
+
 class SubmissionDataSourceTest(actions.TestBase):
 
     ADMIN_EMAIL = 'admin@foo.com'
@@ -89,14 +89,32 @@ class PeerReviewStatsSource(data_sources.SynchronousQuery):
         # {unit_id, title, stats} dicts used for display.
         serialized_units = []
         course = courses.Course(None, app_context=app_context)
-        for unit in course.get_peer_reviewed_units():
+        units = course.get_peer_reviewed_units()
+        for unit in units:
             if unit.unit_id in counts_by_unit:
                 serialized_units.append({
                     'stats': counts_by_unit[unit.unit_id],
                     'title': unit.title,
                     'unit_id': unit.unit_id,
                 })
+
+        # Summaries of the most recent run of the review expiry cron.
+        expiry_statuses = []
+        statuses = peer.ReviewExpiryStatus.get_by_key_name(
+            [str(unit.unit_id) for unit in units])
+        for unit, status in zip(units, statuses):
+            if status:
+                expiry_statuses.append({
+                    'title': unit.title,
+                    'start_date': status.start_date,
+                    'end_date': status.end_date,
+                    'expired_count': status.expired_count,
+                    'exception_count': status.exception_count,
+                    'task_count': status.task_count,
+                })
+
         template_values.update({
+            'expiry_statuses': expiry_statuses,
             'serialized_units': serialized_units,
             'serialized_units_json': transforms.dumps(serialized_units),
         })
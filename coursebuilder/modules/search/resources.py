@@ -19,6 +19,7 @@ __author__ = 'Ellis Michael (emichael@google.com)'
 import collections
 import datetime
 import gettext
+import hashlib
 import HTMLParser
 import logging
 import operator
@@ -34,6 +35,7 @@ import jinja2
 
 import appengine_config
 from common import jinja_utils
+from models import transforms
 from modules.announcements import announcements
 
 from google.appengine.api import search
@@ -199,15 +201,19 @@ class Resource(object):
 
     @classmethod
     def generate_all(
-        cls, course, timestamps):  # pylint: disable=unused-argument
+        cls, course, timestamps,
+        versions=None):  # pylint: disable=unused-argument
         """A generator returning objects of type cls in the course.
 
         This generator should yield resources based on the last indexed time in
-        timestamps.
+        timestamps, or, for types that track versions, on whether the version
+        recorded in versions is out of date.
 
         Args:
             course: models.courses.course. the course to index.
             timestamps: dict from doc_ids to last indexed datetimes.
+            versions: dict from doc_ids to the versions last indexed, or None
+                if versions are not being tracked.
         Yields:
             A sequence of Resource objects.
         """
@@ -218,11 +224,29 @@ class Resource(object):
         return
         yield  # pylint: disable=unreachable
 
+    @classmethod
+    def get_live_doc_ids(cls, unused_course):
+        """Returns the set of doc_ids this type currently has in the course.
+
+        Documents of this type whose doc_ids are not in the returned set are
+        pruned from the index. Types that cannot cheaply enumerate their
+        documents return None, and are never pruned.
+        """
+        return None
+
     @classmethod
     def _get_doc_id(cls, *unused_vargs):
         """Subclasses should implement this with identifying fields as args."""
         raise NotImplementedError
 
+    @classmethod
+    def _is_up_to_date(cls, timestamps, versions, doc_id, version):
+        """Whether the indexed copy of doc_id can be kept as it is."""
+        if versions is not None:
+            return versions.get(doc_id) == version
+        return cls._indexed_within_num_days(
+            timestamps, doc_id, cls.FRESHNESS_THRESHOLD_DAYS)
+
     @classmethod
     def _indexed_within_num_days(cls, timestamps, doc_id, num_days):
         """Determines whether doc_id was indexed in the last num_days days."""
@@ -242,6 +266,10 @@ class Resource(object):
         """External links to be indexed should be stored in self.links."""
         return self.links if hasattr(self, 'links') else []
 
+    def get_version(self):
+        """A digest of the source of the document, stored in self.version."""
+        return self.version if hasattr(self, 'version') else None
+
     def get_unit_id(self):
         return self.unit_id if hasattr(self, 'unit_id') else None
 
@@ -287,31 +315,48 @@ class LessonResource(Resource):
     FRESHNESS_THRESHOLD_DAYS = 3
 
     @classmethod
-    def generate_all(cls, course, timestamps):
+    def generate_all(cls, course, timestamps, versions=None):
+        for _, lesson in cls._get_available_lessons(course):
+            doc_id = cls._get_doc_id(lesson.unit_id, lesson.lesson_id)
+            if cls._is_up_to_date(
+                    timestamps, versions, doc_id, cls._get_version(lesson)):
+                continue
+            try:
+                yield LessonResource(lesson)
+            except HTMLParser.HTMLParseError as e:
+                logging.info(
+                    'Error parsing objectives for Lesson %s.%s: %s',
+                    lesson.unit_id, lesson.lesson_id, e)
+                continue
+
+    @classmethod
+    def get_live_doc_ids(cls, course):
+        return set(cls._get_doc_id(lesson.unit_id, lesson.lesson_id)
+                   for _, lesson in cls._get_available_lessons(course))
+
+    @classmethod
+    def _get_available_lessons(cls, course):
         for lesson in course.get_lessons_for_all_units():
             unit = course.find_unit_by_id(lesson.unit_id)
-            doc_id = cls._get_doc_id(lesson.unit_id, lesson.lesson_id)
             if (course.is_unit_available(unit) and
-                course.is_lesson_available(unit, lesson) and
-                not cls._indexed_within_num_days(timestamps, doc_id,
-                                                 cls.FRESHNESS_THRESHOLD_DAYS)):
-                try:
-                    yield LessonResource(lesson)
-                except HTMLParser.HTMLParseError as e:
-                    logging.info(
-                        'Error parsing objectives for Lesson %s.%s: %s',
-                        lesson.unit_id, lesson.lesson_id, e)
-                    continue
+                course.is_lesson_available(unit, lesson)):
+                yield unit, lesson
 
     @classmethod
     def _get_doc_id(cls, unit_id, lesson_id):
         return '%s_%s_%s' % (cls.TYPE_NAME, unit_id, lesson_id)
 
+    @classmethod
+    def _get_version(cls, lesson):
+        return hashlib.md5(transforms.dumps([
+            lesson.title, lesson.objectives, lesson.notes])).hexdigest()
+
     def __init__(self, lesson):
         super(LessonResource, self).__init__()
 
         self.unit_id = lesson.unit_id
         self.lesson_id = lesson.lesson_id
+        self.version = self._get_version(lesson)
         self.title = unicode(lesson.title)
         if lesson.notes:
             self.notes = urlparse.urljoin(
@@ -478,7 +523,7 @@ class YouTubeFragmentResource(Resource):
     FRESHNESS_THRESHOLD_DAYS = 30
 
     @classmethod
-    def generate_all(cls, course, timestamps):
+    def generate_all(cls, course, timestamps, versions=None):
         """Generate all YouTubeFragments for a course."""
         # TODO(emichael): Handle the existence of a single video in multiple
         # places in a course.
@@ -671,24 +716,43 @@ class AnnouncementResource(Resource):
     FRESHNESS_THRESHOLD_DAYS = 1
 
     @classmethod
-    def generate_all(cls, course, timestamps):
-        if announcements.custom_module.enabled:
-            for entity in get_locale_filtered_announcement_list(course):
-                doc_id = cls._get_doc_id(entity.key())
-                if not(entity.is_draft or cls._indexed_within_num_days(
-                        timestamps, doc_id, cls.FRESHNESS_THRESHOLD_DAYS)):
-                    try:
-                        yield AnnouncementResource(entity)
-                    except HTMLParser.HTMLParseError as e:
-                        logging.info('Error parsing Announcement %s: %s',
-                                     entity.title, e)
-                        continue
+    def generate_all(cls, course, timestamps, versions=None):
+        for entity in cls._get_published_announcements(course):
+            doc_id = cls._get_doc_id(entity.key())
+            if cls._is_up_to_date(
+                    timestamps, versions, doc_id, cls._get_version(entity)):
+                continue
+            try:
+                yield AnnouncementResource(entity)
+            except HTMLParser.HTMLParseError as e:
+                logging.info('Error parsing Announcement %s: %s',
+                             entity.title, e)
+                continue
+
+    @classmethod
+    def get_live_doc_ids(cls, course):
+        return set(cls._get_doc_id(entity.key())
+                   for entity in cls._get_published_announcements(course))
+
+    @classmethod
+    def _get_published_announcements(cls, course):
+        if not announcements.custom_module.enabled:
+            return []
+        return [entity
+                for entity in get_locale_filtered_announcement_list(course)
+                if not entity.is_draft]
+
+    @classmethod
+    def _get_version(cls, announcement):
+        return hashlib.md5(transforms.dumps([
+            announcement.title, announcement.html])).hexdigest()
 
     def __init__(self, announcement):
         super(AnnouncementResource, self).__init__()
 
         self.title = announcement.title
         self.key = announcement.key()
+        self.version = self._get_version(announcement)
         parser = ResourceHTMLParser(PROTOCOL_PREFIX)
         parser.feed(announcement.html)
         self.content = parser.get_content()
@@ -756,24 +820,29 @@ def get_snippeted_fields():
     return list(snippeted_fields)
 
 
-def generate_all_documents(course, timestamps):
+def generate_all_documents(course, timestamps, versions=None):
     """A generator for all docs for a given course.
 
     Args:
         course: models.courses.Course. the course to be indexed.
         timestamps: dict from doc_ids to last indexed datetimes. An empty dict
             indicates that all documents should be generated.
+        versions: dict from doc_ids to last indexed versions, or None. When
+            given, resources that track versions are only generated if their
+            version changed, and the version of each generated document is
+            recorded here.
     Yields:
         A sequence of search.Document. If a document is within the freshness
-        threshold, no document will be generated. This function does not modify
-        timestamps.
+        threshold or is up to date, no document will be generated. This
+        function does not modify timestamps.
     """
 
     link_dist = {}
     link_unit_id = {}
 
     for resource_type, unused_result_type in RESOURCE_TYPES:
-        for resource in resource_type.generate_all(course, timestamps):
+        for resource in resource_type.generate_all(
+                course, timestamps, versions):
             unit_id = resource.get_unit_id()
             if isinstance(resource, LessonResource) and resource.notes:
                 link_dist[resource.notes] = 0
@@ -782,7 +851,10 @@ def generate_all_documents(course, timestamps):
                 link_dist[link] = 1
                 link_unit_id[resource.notes] = unit_id
 
-            yield resource.get_document()
+            document = resource.get_document()
+            if versions is not None:
+                versions[document.doc_id] = resource.get_version()
+            yield document
 
     for resource in ExternalLinkResource.generate_all_from_dist_dict(
             link_dist, link_unit_id, timestamps):
@@ -18,12 +18,14 @@ __author__ = 'Ellis Michael (emichael@google.com)'
 
 import collections
 import gettext
+import hashlib
 import logging
 import math
 import mimetypes
 import os
 import time
 import traceback
+import zlib
 
 import jinja2
 import messages
@@ -34,15 +36,20 @@ import appengine_config
 from common import crypto
 from common import safe_dom
 from common import schema_fields
+from common import utc
 from controllers import sites
 from controllers import utils
 from models import config
 from models import counters
 from models import courses
 from models import custom_modules
+from models import entities
 from models import jobs
+from models import models
 from models import services
 from models import transforms
+from models import vfs
+from modules.announcements import announcements
 from modules.dashboard import dashboard
 
 from google.appengine.api import namespace_manager
@@ -67,13 +74,29 @@ SEARCH_FAILURES = counters.PerfCounter(
     'gcb-search-failures',
     'The number of search failure messages returned across all student '
     'queries.')
+SEARCH_CACHE_HITS = counters.PerfCounter(
+    'gcb-search-cache-hits',
+    'The number of search queries answered from the result cache.')
+SEARCH_CACHE_MISSES = counters.PerfCounter(
+    'gcb-search-cache-misses',
+    'The number of cacheable search queries that had to query the index.')
 
 INDEX_NAME = 'gcb_search_index_loc_%s'
 RESULTS_LIMIT = 10
+# Number of leading results of a query kept in the result cache; pages that
+# fall within this window are served without querying the index again.
+CACHED_RESULTS_LIMIT = 5 * RESULTS_LIMIT
 GCB_SEARCH_FOLDER_NAME = os.path.normpath('/modules/search/')
 
 MAX_RETRIES = 5
 
+# Number of documents sent to the search service in a single put or delete.
+INDEX_BATCH_SIZE = search.MAXIMUM_DOCUMENTS_PER_PUT_REQUEST
+
+# resources.RESOURCE_TYPES is fixed at import time, so these are too.
+RETURNED_FIELDS = resources.get_returned_fields()
+SNIPPETED_FIELDS = resources.get_snippeted_fields()
+
 # Name of a per-course setting determining whether automatic indexing is enabled
 AUTO_INDEX_SETTING = 'auto_index'
 
@@ -99,11 +122,15 @@ def index_all_docs(course, incremental):
         incremental: boolean. whether or not to index only new or out-of-date
             items.
     Returns:
-        A dict with three keys.
-        'num_indexed_docs' maps to an int, the number of documents added to the
-            index.
+        A dict with five keys.
+        'num_indexed_docs' maps to an int, the number of documents in the
+            index once indexing is done.
+        'num_updated_docs' maps to an int, the number of documents added to
+            the index or refreshed by this call.
+        'deleted_docs' maps to an int, the number of documents pruned from the
+            index because their resource no longer exists.
         'doc_type' maps to a counter with resource types as keys mapping to the
-            number of that resource added to the index.
+            number of that resource in the index.
         'indexing_time_secs' maps to a float representing the number of seconds
             the indexing job took.
     Raises:
@@ -114,38 +141,123 @@ def index_all_docs(course, incremental):
         raise ModuleDisabledException('The search module is disabled.')
 
     start_time = time.time()
-    index = get_index(
-        course.app_context.get_namespace_name(),
-        course.app_context.get_current_locale())
-    timestamps, doc_types = (_get_index_metadata(index) if incremental
-                             else ({}, {}))
-    for doc in resources.generate_all_documents(course, timestamps):
-        retry_count = 0
-        while retry_count < MAX_RETRIES:
-            try:
-                index.put(doc)
-                timestamps[doc.doc_id] = doc['date'][0].value
-                doc_types[doc.doc_id] = doc['type'][0].value
-                break
-            except search.Error, e:
-                if e.results[0].code == search.OperationResult.TRANSIENT_ERROR:
-                    retry_count += 1
-                    if retry_count >= MAX_RETRIES:
-                        logging.error(
-                            'Multiple transient errors indexing doc_id: %s',
-                            doc.doc_id)
-                else:
-                    logging.error('Failed to index doc_id: %s', doc.doc_id)
-                    break
+    locale = course.app_context.get_current_locale()
+    index = get_index(course.app_context.get_namespace_name(), locale)
+    manifest = None
+    if incremental:
+        manifest = IndexManifestEntity.load_metadata(locale)
+    if manifest:
+        timestamps, doc_types, versions = manifest
+    elif incremental:
+        # No manifest was saved by earlier versions; recover what we can from
+        # the index itself. Lessons and announcements are all refreshed once.
+        timestamps, doc_types = _get_index_metadata(index)
+        versions = {}
+    else:
+        timestamps, doc_types, versions = {}, {}, {}
+
+    deleted_docs = _prune_deleted_docs(
+        course, index, timestamps, doc_types, versions)
+
+    num_updated_docs = 0
+    batch = []
+    for doc in resources.generate_all_documents(course, timestamps, versions):
+        batch.append(doc)
+        if len(batch) >= INDEX_BATCH_SIZE:
+            num_updated_docs += _put_docs(
+                index, batch, timestamps, doc_types, versions)
+            batch = []
+    if batch:
+        num_updated_docs += _put_docs(
+            index, batch, timestamps, doc_types, versions)
+    IndexManifestEntity.save_metadata(locale, timestamps, doc_types, versions)
 
     indexed_doc_types = collections.Counter()
     for type_name in doc_types.values():
         indexed_doc_types[type_name] += 1
     return {'num_indexed_docs': len(timestamps),
+            'num_updated_docs': num_updated_docs,
+            'deleted_docs': deleted_docs,
             'doc_types': indexed_doc_types,
             'indexing_time_secs': time.time() - start_time}
 
 
+def _put_docs(index, docs, timestamps, doc_types, versions):
+    """Puts a batch of docs, retrying only the ones that failed transiently.
+
+    The metadata dicts are updated for every document that was indexed. Docs
+    that could not be indexed lose their recorded version, so that the next
+    incremental run tries them again.
+
+    Returns:
+        The number of docs that were indexed.
+    """
+    num_indexed = 0
+    pending = docs
+    retry_count = 0
+    while pending:
+        try:
+            index.put(pending)
+            codes = [search.OperationResult.OK] * len(pending)
+        except search.Error, e:
+            results = getattr(e, 'results', None) or []
+            if len(results) == len(pending):
+                codes = [result.code for result in results]
+            else:
+                # No per-document outcome; retry the whole batch.
+                codes = [search.OperationResult.TRANSIENT_ERROR] * len(pending)
+        retry_count += 1
+
+        retry = []
+        for doc, code in zip(pending, codes):
+            if code == search.OperationResult.OK:
+                timestamps[doc.doc_id] = doc['date'][0].value
+                doc_types[doc.doc_id] = doc['type'][0].value
+                num_indexed += 1
+            elif (code == search.OperationResult.TRANSIENT_ERROR and
+                  retry_count < MAX_RETRIES):
+                retry.append(doc)
+            else:
+                if code == search.OperationResult.TRANSIENT_ERROR:
+                    logging.error(
+                        'Multiple transient errors indexing doc_id: %s',
+                        doc.doc_id)
+                else:
+                    logging.error('Failed to index doc_id: %s', doc.doc_id)
+                versions.pop(doc.doc_id, None)
+        pending = retry
+    return num_indexed
+
+
+def _prune_deleted_docs(course, index, timestamps, doc_types, versions):
+    """Deletes docs whose resource is gone from the course; returns count."""
+
+    stale_doc_ids = []
+    for resource_type, unused_result_type in resources.RESOURCE_TYPES:
+        live_doc_ids = resource_type.get_live_doc_ids(course)
+        if live_doc_ids is None:
+            continue
+        stale_doc_ids += [
+            doc_id for doc_id, type_name in doc_types.iteritems()
+            if type_name == resource_type.TYPE_NAME and
+            doc_id not in live_doc_ids]
+
+    num_deleted = 0
+    for i in xrange(0, len(stale_doc_ids), INDEX_BATCH_SIZE):
+        doc_ids = stale_doc_ids[i:i + INDEX_BATCH_SIZE]
+        try:
+            index.delete(doc_ids)
+        except search.Error, e:
+            logging.error('Failed to prune doc_ids %s: %s', doc_ids, e)
+            continue
+        for doc_id in doc_ids:
+            timestamps.pop(doc_id, None)
+            doc_types.pop(doc_id, None)
+            versions.pop(doc_id, None)
+        num_deleted += len(doc_ids)
+    return num_deleted
+
+
 def clear_index(namespace, locale):
     """Delete all docs in the index for a given models.Course object."""
 
@@ -182,6 +294,83 @@ def _get_index_metadata(index):
     return dict(timestamps), dict(doc_types)
 
 
+class IndexManifestEntity(entities.BaseEntity):
+    """What the last indexing run put in the index for one locale of a course.
+
+    Lives in the course's namespace and is keyed by locale. Incremental runs
+    read it instead of paging through the whole index, and compare the
+    versions recorded here against the course to find what changed. Large
+    manifests are split across the entity keyed by the locale and further
+    shard entities, keeping each under the datastore's entity size limit.
+    """
+
+    # Bytes of compressed manifest kept per entity.
+    SHARD_SIZE = 900 * 1024
+
+    # One slice of a zlib-compressed JSON dict from doc_id to
+    # [type, timestamp, version].
+    data = db.BlobProperty()
+    # Number of entities the manifest is split across; set on the first only.
+    num_shards = db.IntegerProperty(indexed=False, default=1)
+    updated_on = db.DateTimeProperty(auto_now=True, indexed=False)
+
+    @classmethod
+    def _shard_key_names(cls, locale, start, end):
+        return ['%s:%s' % (locale, index) for index in xrange(start, end)]
+
+    @classmethod
+    def load_metadata(cls, locale):
+        """Returns (timestamps, doc_types, versions) dicts, or None."""
+        entity = cls.get_by_key_name(locale)
+        if not entity or not entity.data:
+            return None
+        shards = [entity] + cls.get_by_key_name(
+            cls._shard_key_names(locale, 1, entity.num_shards))
+        if None in shards:
+            return None
+        try:
+            data = transforms.loads(zlib.decompress(
+                ''.join(shard.data for shard in shards)))
+        except (zlib.error, ValueError):
+            # A save by a concurrent run replaced some shards but not others.
+            logging.warning('Discarding inconsistent search index manifest.')
+            return None
+        timestamps, doc_types, versions = {}, {}, {}
+        for doc_id, (type_name, timestamp, version) in data.iteritems():
+            timestamps[doc_id] = utc.timestamp_to_datetime(timestamp)
+            doc_types[doc_id] = type_name
+            if version:
+                versions[doc_id] = version
+        return timestamps, doc_types, versions
+
+    @classmethod
+    def save_metadata(cls, locale, timestamps, doc_types, versions):
+        data = {}
+        for doc_id, timestamp in timestamps.iteritems():
+            data[doc_id] = [
+                doc_types.get(doc_id), utc.datetime_to_timestamp(timestamp),
+                versions.get(doc_id)]
+        blob = zlib.compress(transforms.dumps(data))
+        chunks = [
+            blob[i:i + cls.SHARD_SIZE]
+            for i in xrange(0, len(blob), cls.SHARD_SIZE)]
+        old_entity = cls.get_by_key_name(locale)
+        old_num_shards = old_entity.num_shards if old_entity else 1
+
+        # Each put stays under the RPC size limit; the first entity is written
+        # last, so it never names shards that have not been written yet.
+        for key_name, chunk in zip(
+                cls._shard_key_names(locale, 1, len(chunks)), chunks[1:]):
+            cls(key_name=key_name, data=chunk).put()
+        cls(key_name=locale, data=chunks[0], num_shards=len(chunks)).put()
+        stale_key_names = cls._shard_key_names(
+            locale, len(chunks), old_num_shards)
+        if stale_key_names:
+            db.delete([
+                db.Key.from_path(cls.kind(), key_name)
+                for key_name in stale_key_names])
+
+
 def fetch(course, query_string, offset=0, limit=RESULTS_LIMIT):
     """Return an HTML fragment with the results of a search for query_string.
 
@@ -195,6 +384,8 @@ def fetch(course, query_string, offset=0, limit=RESULTS_LIMIT):
         'results' maps to an ordered list of resources.Result objects.
         'total_found' maps to the total number of results in the index which
             match query_string.
+        Pages within the first CACHED_RESULTS_LIMIT results are served from a
+        cache that is dropped whenever an IndexCourse job completes.
     Raises:
         ModuleDisabledException: The search module is currently disabled.
     """
@@ -202,20 +393,36 @@ def fetch(course, query_string, offset=0, limit=RESULTS_LIMIT):
     if not custom_module.enabled:
         raise ModuleDisabledException('The search module is disabled.')
 
-    index = get_index(
-        course.app_context.get_namespace_name(),
-        course.app_context.get_current_locale())
+    namespace = course.app_context.get_namespace_name()
+    locale = course.app_context.get_current_locale()
+    if offset + limit > CACHED_RESULTS_LIMIT:
+        return _search_index(
+            get_index(namespace, locale), query_string, offset, limit)
+
+    cache_key = _get_results_cache_key(namespace, locale, query_string)
+    response = models.MemcacheManager.get(cache_key, namespace=namespace)
+    if response is not None:
+        SEARCH_CACHE_HITS.inc()
+    else:
+        SEARCH_CACHE_MISSES.inc()
+        response = _search_index(
+            get_index(namespace, locale), query_string, 0,
+            CACHED_RESULTS_LIMIT)
+        if response['results'] is None:
+            return response
+        models.MemcacheManager.set(cache_key, response, namespace=namespace)
+    return {'results': response['results'][offset:offset + limit],
+            'total_found': response['total_found']}
+
 
+def _search_index(index, query_string, offset, limit):
     try:
-        # TODO(emichael): Don't compute these for every query
-        returned_fields = resources.get_returned_fields()
-        snippeted_fields = resources.get_snippeted_fields()
         options = search.QueryOptions(
             limit=limit,
             offset=offset,
-            returned_fields=returned_fields,
+            returned_fields=RETURNED_FIELDS,
             number_found_accuracy=100,
-            snippeted_fields=snippeted_fields)
+            snippeted_fields=SNIPPETED_FIELDS)
         query = search.Query(query_string=query_string, options=options)
         results = index.search(query)
     except search.Error:
@@ -226,6 +433,37 @@ def fetch(course, query_string, offset=0, limit=RESULTS_LIMIT):
     return {'results': processed_results, 'total_found': results.number_found}
 
 
+def _get_index_version_key(locale):
+    return 'search-index-version:%s' % locale
+
+
+def _get_index_version(namespace, locale):
+    """Returns a token that changes whenever the index is rebuilt."""
+    key = _get_index_version_key(locale)
+    version = models.MemcacheManager.get(key, namespace=namespace)
+    if version is None:
+        # Also covers eviction: results cached under the old token become
+        # unreachable, as if they had been invalidated.
+        version = '%x' % int(time.time() * 1000000)
+        models.MemcacheManager.set(
+            key, version, ttl=0, namespace=namespace)
+    return version
+
+
+def _get_results_cache_key(namespace, locale, query_string):
+    if isinstance(query_string, unicode):
+        query_string = query_string.encode('utf-8')
+    return 'search-results:%s:%s:%s' % (
+        locale, _get_index_version(namespace, locale),
+        hashlib.md5(query_string).hexdigest())
+
+
+def invalidate_results_cache(namespace, locale):
+    """Drops all cached results for one locale of a course's index."""
+    models.MemcacheManager.delete(
+        _get_index_version_key(locale), namespace=namespace)
+
+
 class SearchHandler(utils.BaseHandler):
     """Handler for generating the search results page."""
 
@@ -425,6 +663,29 @@ class CronIndexCourse(utils.AbstractAllCoursesCronHandler):
         course_settings = app_context.get_environ().get('course')
         return course_settings and course_settings.get(AUTO_INDEX_SETTING)
 
+    @classmethod
+    def get_course_state_version(cls, app_context):
+        # Always resubmit after an index job that failed or never finished.
+        job_entity = IndexCourse(app_context).load()
+        if (not job_entity or
+            job_entity.status_code != jobs.STATUS_CODE_COMPLETED):
+            return None
+
+        # Locally-backed courses can change without any datastore trace.
+        if not isinstance(app_context.fs.impl, vfs.DatastoreBackedFileSystem):
+            return None
+
+        # Course structure, lessons and settings are all stored as files, so
+        # the most recently written file stands for all of them.
+        latest_file = vfs.FileMetadataEntity.all().order('-updated_on').get()
+        version = [str(latest_file.updated_on) if latest_file else '']
+        if announcements.custom_module.enabled:
+            for item in announcements.AnnouncementEntity.get_announcements():
+                version.append(hashlib.md5(transforms.dumps([
+                    str(item.key()), str(item.date), item.title, item.html,
+                    item.is_draft])).hexdigest())
+        return ','.join(version)
+
     def cron_action(self, app_context, unused_global_state):
         try:
             check_job_and_submit(app_context, incremental=True)
@@ -439,7 +700,7 @@ class CronIndexCourse(utils.AbstractAllCoursesCronHandler):
 @db.transactional(xg=True)
 def check_job_and_submit(app_context, incremental=True):
     """Determines whether an indexing job is running and submits if not."""
-    indexing_job = IndexCourse(app_context, incremental=False)
+    indexing_job = IndexCourse(app_context, incremental=incremental)
     job_entity = IndexCourse(app_context).load()
 
     bad_status_codes = [jobs.STATUS_CODE_STARTED, jobs.STATUS_CODE_QUEUED]
@@ -473,21 +734,26 @@ class IndexCourse(jobs.DurableJob):
         indexing_stats = {
             'deleted_docs': 0,
             'num_indexed_docs': 0,
+            'num_updated_docs': 0,
             'doc_types': collections.Counter(),
             'indexing_time_secs': 0,
             'locales': []
         }
-        for locale in app_context.get_allowed_locales():
-            stats = clear_index(namespace, locale)
-            indexing_stats['deleted_docs'] += stats['deleted_docs']
+        if not self.incremental:
+            for locale in app_context.get_allowed_locales():
+                stats = clear_index(namespace, locale)
+                indexing_stats['deleted_docs'] += stats['deleted_docs']
         for locale in app_context.get_allowed_locales():
             app_context.set_current_locale(locale)
             course = courses.Course(None, app_context=app_context)
             stats = index_all_docs(course, self.incremental)
+            indexing_stats['deleted_docs'] += stats['deleted_docs']
             indexing_stats['num_indexed_docs'] += stats['num_indexed_docs']
+            indexing_stats['num_updated_docs'] += stats['num_updated_docs']
             indexing_stats['doc_types'] += stats['doc_types']
             indexing_stats['indexing_time_secs'] += stats['indexing_time_secs']
             indexing_stats['locales'].append(locale)
+            invalidate_results_cache(namespace, locale)
         return indexing_stats
 
 
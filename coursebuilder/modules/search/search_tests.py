@@ -451,3 +451,129 @@ class SearchTest(search_unit_tests.SearchTestBase):
         self.execute_all_deferred_tasks()
         response = search.fetch(course, 'color')
         self.assertEquals(1, response['total_found'])
+
+    def _add_lessons(self, course, unit, texts):
+        lessons = []
+        for text in texts:
+            lesson = course.add_lesson(unit)
+            lesson.objectives = text
+            lesson.availability = courses.AVAILABILITY_AVAILABLE
+            lessons.append(lesson)
+        return lessons
+
+    def _index_in_namespace(self, app_context, incremental=True):
+        with common_utils.Namespace(app_context.get_namespace_name()):
+            app_context.set_current_locale(app_context.default_locale)
+            course = courses.Course(None, app_context=app_context)
+            return search.index_all_docs(course, incremental)
+
+    def test_incremental_index_updates_changed_and_prunes_deleted(self):
+        context = actions.simple_add_course('test', 'admin@google.com',
+                                            'Test Course')
+        course = courses.Course(None, context)
+        unit = course.add_unit()
+        unit.availability = courses.AVAILABILITY_AVAILABLE
+        lesson1, lesson2 = self._add_lessons(
+            course, unit, ['xyzzy plugh', 'plover frotz'])
+        course.save()
+
+        stats = self._index_in_namespace(context)
+        self.assertEquals(2, stats['num_updated_docs'])
+        self.assertEquals(2, stats['num_indexed_docs'])
+
+        # Nothing changed, so nothing is sent to the index.
+        stats = self._index_in_namespace(context)
+        self.assertEquals(0, stats['num_updated_docs'])
+        self.assertEquals(2, stats['num_indexed_docs'])
+
+        course = courses.Course(None, context)
+        course.delete_lesson(course.find_lesson_by_id(
+            unit.unit_id, lesson1.lesson_id))
+        lesson2 = course.find_lesson_by_id(unit.unit_id, lesson2.lesson_id)
+        lesson2.objectives = 'plover gnusto'
+        course.save()
+
+        stats = self._index_in_namespace(context)
+        self.assertEquals(1, stats['num_updated_docs'])
+        self.assertEquals(1, stats['deleted_docs'])
+        self.assertEquals(1, stats['num_indexed_docs'])
+
+        with common_utils.Namespace('ns_test'):
+            context.set_current_locale(context.default_locale)
+            course = courses.Course(None, context)
+            self.assertEquals(0, search.fetch(course, 'xyzzy')['total_found'])
+            self.assertEquals(0, search.fetch(course, 'frotz')['total_found'])
+            self.assertEquals(1, search.fetch(course, 'gnusto')['total_found'])
+
+    def test_index_manifest_is_sharded(self):
+        num_lessons = 50
+        context = actions.simple_add_course('test', 'admin@google.com',
+                                            'Test Course')
+        course = courses.Course(None, context)
+        unit = course.add_unit()
+        unit.availability = courses.AVAILABILITY_AVAILABLE
+        self._add_lessons(course, unit, [
+            'lesson %s' % lesson_index for lesson_index in xrange(num_lessons)])
+        course.save()
+
+        self.swap(search.IndexManifestEntity, 'SHARD_SIZE', 100)
+        stats = self._index_in_namespace(context, incremental=False)
+        self.assertEquals(num_lessons, stats['num_updated_docs'])
+        with common_utils.Namespace('ns_test'):
+            self.assertTrue(search.IndexManifestEntity.all().count() > 1)
+
+        stats = self._index_in_namespace(context)
+        self.assertEquals(0, stats['num_updated_docs'])
+        self.assertEquals(num_lessons, stats['num_indexed_docs'])
+
+        # Shards no longer needed by a smaller manifest are deleted.
+        self.swap(search.IndexManifestEntity, 'SHARD_SIZE', 1024 * 1024)
+        self._index_in_namespace(context)
+        with common_utils.Namespace('ns_test'):
+            self.assertEquals(1, search.IndexManifestEntity.all().count())
+        stats = self._index_in_namespace(context)
+        self.assertEquals(0, stats['num_updated_docs'])
+        self.assertEquals(num_lessons, stats['num_indexed_docs'])
+
+    def test_search_results_cache(self):
+        context = actions.simple_add_course('test', 'admin@google.com',
+                                            'Test Course')
+        course = courses.Course(None, context)
+        unit = course.add_unit()
+        unit.availability = courses.AVAILABILITY_AVAILABLE
+        lesson1, _ = self._add_lessons(
+            course, unit, ['xyzzy plugh', 'xyzzy plover'])
+        course.save()
+
+        with actions.OverriddenConfig(models.CAN_USE_MEMCACHE.name, True):
+            self.index_test_course()
+            with common_utils.Namespace('ns_test'):
+                context.set_current_locale(context.default_locale)
+                course = courses.Course(None, context)
+                hits = search.SEARCH_CACHE_HITS.value
+                misses = search.SEARCH_CACHE_MISSES.value
+
+                response = search.fetch(course, 'xyzzy')
+                self.assertEquals(2, response['total_found'])
+                self.assertEquals(2, len(response['results']))
+                self.assertEquals(misses + 1, search.SEARCH_CACHE_MISSES.value)
+
+                # Later pages come from the cached result set.
+                response = search.fetch(course, 'xyzzy', offset=1, limit=1)
+                self.assertEquals(2, response['total_found'])
+                self.assertEquals(1, len(response['results']))
+                self.assertEquals(hits + 1, search.SEARCH_CACHE_HITS.value)
+
+                lesson1 = course.find_lesson_by_id(
+                    unit.unit_id, lesson1.lesson_id)
+                lesson1.objectives = 'frotz plugh'
+                course.save()
+
+            # Reindexing invalidates everything cached so far.
+            self.index_test_course()
+            with common_utils.Namespace('ns_test'):
+                context.set_current_locale(context.default_locale)
+                course = courses.Course(None, context)
+                response = search.fetch(course, 'xyzzy')
+                self.assertEquals(1, response['total_found'])
+                self.assertEquals(misses + 2, search.SEARCH_CACHE_MISSES.value)
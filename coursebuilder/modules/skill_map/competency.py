@@ -18,13 +18,23 @@ __author__ = 'John Orr (jorr@google.com)'
 
 import collections
 
+from common import utils as common_utils
+from models import config
 from models import jobs
 from models import models
 from models import transforms
 from models import data_removal
 from modules.skill_map import constants
+from modules.skill_map import messages
 
 from google.appengine.ext import db
+from google.appengine.ext import deferred
+from google.appengine.api import namespace_manager
+
+DEFER_COMPETENCY_UPDATES = config.ConfigProperty(
+    'gcb_skill_map_defer_competency_updates', bool,
+    messages.SITE_SETTINGS_DEFER_COMPETENCY_UPDATES, default_value=False,
+    label='Defer Skill Competency Updates')
 
 
 class BaseCompetencyMeasure(object):
@@ -188,6 +198,14 @@ class CompetencyMeasureDao(models.LastModifiedJsonDao):
     ENTITY = CompetencyMeasureEntity
     ENTITY_KEY_TYPE = models.BaseJsonDao.EntityKeyTypeName
 
+    @classmethod
+    def _create_if_necessary(cls, dto):
+        # The entity holds nothing but data, so a stored copy has nothing to
+        # keep; overwriting it by key name saves a get per saved measure.
+        entity = cls.ENTITY_KEY_TYPE.new_entity(cls.ENTITY, dto.id)
+        entity.data = transforms.dumps(dto.dict)
+        return entity
+
 
 class SuccessRateCompetencyMeasure(BaseCompetencyMeasure):
     """Measure of competency based on the cumulative percentage correct."""
@@ -268,6 +286,31 @@ class CompetencyMeasureRegistry(object):
             competency_measures.append(measure)
         return cls._Updater(competency_measures)
 
+    @classmethod
+    def add_scores(cls, user_id, scores_by_skill):
+        """Adds scores to the measures of many skills of one student.
+
+        All measures are read with one bulk load per registered measure class
+        and written back with a single batched put.
+
+        Args:
+            user_id: the id of the student.
+            scores_by_skill: dict mapping skill id to a list of normalized
+                scores, in the order they were received.
+        """
+        if not scores_by_skill:
+            return
+        skill_ids = scores_by_skill.keys()
+        dtos = []
+        for competency_measure_class in cls._registry:
+            for measure in competency_measure_class.bulk_load(
+                    user_id, skill_ids):
+                for score in scores_by_skill[measure.skill_id]:
+                    measure.add_score(score)
+                dtos.append(measure.competency_dto)
+        if dtos:
+            CompetencyMeasureDao.save_all(dtos)
+
 
 QuestionScore = collections.namedtuple('QuestionScore', ['quid', 'score'])
 
@@ -325,18 +368,31 @@ def record_event_listener(source, user, data):
     else:
         return
 
+    if not question_scores:
+        return
+    questions = models.QuestionDAO.bulk_load(
+        [int(question_score.quid) for question_score in question_scores])
     scores_by_skill = collections.defaultdict(list)
-    for question_score in question_scores:
-        question = models.QuestionDAO.load(question_score.quid)
+    for question_score, question in zip(question_scores, questions):
+        if not question:
+            continue
         for skill_id in question.dict.get(constants.SKILLS_KEY, []):
             scores_by_skill[skill_id].append(question_score.score)
+    if not scores_by_skill:
+        return
+
+    if DEFER_COMPETENCY_UPDATES.value:
+        deferred.defer(
+            add_scores_in_namespace, namespace_manager.get_namespace(),
+            user.user_id(), dict(scores_by_skill))
+    else:
+        CompetencyMeasureRegistry.add_scores(user.user_id(), scores_by_skill)
+
 
-    for skill_id, scores in scores_by_skill.iteritems():
-        updater = CompetencyMeasureRegistry.get_updater(
-            user.user_id(), skill_id)
-        for score in scores:
-            updater.add_score(score)
-        updater.save()
+def add_scores_in_namespace(namespace, user_id, scores_by_skill):
+    """Deferred task to apply the competency updates of one event."""
+    with common_utils.Namespace(namespace):
+        CompetencyMeasureRegistry.add_scores(user_id, scores_by_skill)
 
 
 class GenerateSkillCompetencyHistograms(jobs.MapReduceJob):
@@ -28,3 +28,10 @@ SKILLS_SHOW_SKILLS_DESCRIPTION = """
 If checked, the skills taught in each lesson will be displayed to students
 at the top of the lesson.
 """
+
+SITE_SETTINGS_DEFER_COMPETENCY_UPDATES = """
+If "True", students' skill competency measures are updated by a task queue
+task after each graded event, rather than while the event is being recorded.
+This makes submitting answers faster, but the skill widgets may take a few
+seconds to reflect the latest answers.
+"""
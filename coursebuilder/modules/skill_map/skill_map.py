@@ -79,6 +79,9 @@ MODULE_TITLE = 'Skills'
 # Flag turning faker on
 _USE_FAKE_DATA_IN_SKILL_COMPETENCY_ANALYTICS = False
 
+# Maximum number of skill maps kept in the in-process cache.
+MAX_SKILL_MAP_CACHE_ITEM_COUNT = 32
+
 # Dict of callbacks for adding to expandable section of skills header
 # Each callback will receive the same arguments as the lesson title provider:
 # - Handler
@@ -671,6 +674,8 @@ class SkillInfo(object):
 
     @property
     def competency_measure(self):
+        if self._competency_measure is None:
+            return _CompetencyOverlay.instance().get_measure(self.id)
         return self._competency_measure
 
     @competency_measure.setter
@@ -680,15 +685,15 @@ class SkillInfo(object):
 
     @property
     def score(self):
-        if self._competency_measure:
-            return self._competency_measure.score
+        if self.competency_measure:
+            return self.competency_measure.score
         else:
             return None
 
     @property
     def score_level(self):
-        if self._competency_measure:
-            return self._competency_measure.score_level
+        if self.competency_measure:
+            return self.competency_measure.score_level
         else:
             return competency.BaseCompetencyMeasure.UNKNOWN
 
@@ -734,15 +739,61 @@ class SkillMapError(Exception):
     pass
 
 
+class _CompetencyOverlay(caching.RequestScopedSingleton):
+    """Competency measures of the student a request personalizes skills for.
+
+    Skill maps may be shared by all requests in the process, so they do not
+    hold measures themselves; SkillInfo.competency_measure reads them from
+    here.  They are bulk-loaded on first use.
+    """
+
+    def __init__(self):
+        self.user_id = None
+        self._pending_skill_ids = set()
+        self._measures = {}
+
+    def personalize(self, user_id, skill_ids):
+        """Sets the student; measures of skill_ids are (re)loaded on use."""
+        if user_id != self.user_id:
+            self.user_id = user_id
+            self._measures = {}
+        self._pending_skill_ids.update(skill_ids)
+
+    def get_measure(self, skill_id):
+        if self.user_id is None:
+            return None
+        if skill_id in self._pending_skill_ids:
+            measures = competency.SuccessRateCompetencyMeasure.bulk_load(
+                self.user_id, list(self._pending_skill_ids))
+            for measure in measures:
+                self._measures[measure.skill_id] = measure
+            self._pending_skill_ids = set()
+        return self._measures.get(skill_id)
+
+
+class ProcessScopedSkillMapCache(caching.ProcessScopedSingleton):
+    """This class holds in-process cache of SkillMap objects."""
+
+    def __init__(self):
+        self.cache = caching.LRUCache(
+            max_item_count=MAX_SKILL_MAP_CACHE_ITEM_COUNT, name='skill_maps')
+
+
 class SkillMap(caching.RequestScopedSingleton):
-    """Provides API to access the course skill map."""
+    """Provides API to access the course skill map.
+
+    SkillMap.load() returns a map shared by all requests in the process, as
+    long as the course, its skills and its questions are unchanged; shared
+    maps must not be modified.  Use SkillMap.load_for_update() to get a map
+    of this request's own that can be.
+    """
 
     def __init__(self, skill_graph, course):
+        self._shared = False
         self._rebuild(skill_graph, course)
 
     def _rebuild(self, skill_graph, course):
-        self._user_id = None
-        self._skill_graph = skill_graph
+        self._topo_sort_index_set = False
         self._course = course
 
         self._units = dict([(u.unit_id, u) for u in self._course.get_units()])
@@ -763,7 +814,7 @@ class SkillMap(caching.RequestScopedSingleton):
         self._skill_infos = {}
 
         # add locations and questions
-        for skill in self._skill_graph.skills:
+        for skill in skill_graph.skills:
             locations = []
             for lesson in self._lessons_by_skill.get(skill.id, []):
                 locations.append(LocationInfo(self._course, lesson))
@@ -773,16 +824,16 @@ class SkillMap(caching.RequestScopedSingleton):
             self._skill_infos[skill.id] = SkillInfo(skill, locations, questions)
 
         # add prerequisites
-        for skill in self._skill_graph.skills:
+        for skill in skill_graph.skills:
             prerequisites = []
             for pid in skill.prerequisite_ids:
                 prerequisites.append(self._skill_infos[pid])
             self._skill_infos[skill.id].prerequisites = prerequisites
 
         # add successors
-        for skill in self._skill_graph.skills:
+        for skill in skill_graph.skills:
             successors = []
-            for skill_dto in self._skill_graph.successors(skill.id):
+            for skill_dto in skill_graph.successors(skill.id):
                 successors.append(self._skill_infos[skill_dto.id])
             self._skill_infos[skill.id].successors = successors
 
@@ -823,24 +874,74 @@ class SkillMap(caching.RequestScopedSingleton):
             return ret
 
     def _set_topological_sort_index(self):
+        if self._topo_sort_index_set:
+            return
         chain = []
         for x in self._topo_sort():
             chain.extend(list(x))
-        for skill in self._skill_graph.skills:
-            self._skill_infos[skill.id].set_topo_sort_index(
-                chain.index(skill.id))
+        for skill_id, skill_info in self._skill_infos.iteritems():
+            skill_info.set_topo_sort_index(chain.index(skill_id))
+        self._topo_sort_index_set = True
 
     def personalized(self):
-        return self._user_id is not None
+        return _CompetencyOverlay.instance().user_id is not None
 
     @classmethod
     def load(cls, course, user_id=None):
-        skill_graph = SkillGraph.load()
-        skill_map = cls.instance(skill_graph, course)
+        skill_map = cls._load_shared(course)
+        if skill_map is None:
+            skill_map = cls.instance(SkillGraph.load(), course)
         if user_id:
             skill_map.add_competency_measures(user_id)
         return skill_map
 
+    @classmethod
+    def load_for_update(cls, course):
+        """Returns a skill map of this request's own, which may be modified."""
+        return cls.instance(SkillGraph.load(), course)
+
+    @classmethod
+    def _get_cache_key(cls, course):
+        """Returns the process cache key for the skill map, or None.
+
+        The key changes whenever the course outline, any skill or any question
+        is saved.  The stamp of the outline is read after the course was
+        loaded, so a map cached under this key must not be built from it.
+        """
+        app_context = course.app_context
+        locale = app_context.get_current_locale()
+        versions = [
+            course.get_content_version(),
+            _SkillDao.get_all_mapped_version(),
+            models.QuestionDAO.get_all_mapped_version()]
+        if locale != app_context.default_locale:
+            versions.append(
+                i18n_dashboard.ResourceBundleDAO.get_all_mapped_version())
+        if None in versions:
+            return None
+        return 'skill_map:%s:%s:%s:%s' % (
+            os.environ.get('CURRENT_VERSION_ID'),
+            app_context.get_namespace_name(), locale,
+            ':'.join(str(version) for version in versions))
+
+    @classmethod
+    def _load_shared(cls, course):
+        """Returns the skill map from the process cache, or None."""
+        key = cls._get_cache_key(course)
+        if key is None:
+            return None
+        cache = ProcessScopedSkillMapCache.instance().cache
+        found, skill_map = cache.get(key)
+        if not found:
+            # Neither SkillGraph.load() nor the course passed in: this request
+            # may hold a graph or an outline older than the versions in the
+            # key, so both are read again now that the stamps have been.
+            skill_map = cls(
+                SkillGraph(), courses.Course(None, course.app_context))
+            skill_map._shared = True
+            cache.put(key, skill_map)
+        return skill_map
+
     @classmethod
     def get_nodes_and_links(cls, course):
         skill_data = cls.load(course).skills()
@@ -891,19 +992,15 @@ class SkillMap(caching.RequestScopedSingleton):
         Returns:
             A list of SkillInfo objects.
         """
-        return {
-            self._skill_infos[s.id]
-            for s in self._skill_graph.successors(skill_info.id)}
+        return set(self._skill_infos[skill_info.id].successors)
 
     def add_competency_measures(self, user_id):
-        """Personalize skill map with user's competency measures."""
+        """Personalize skill map with user's competency measures.
 
-        sids = self._skill_infos.keys()
-        measures = competency.SuccessRateCompetencyMeasure.bulk_load(
-            user_id, sids)
-        for measure in measures:
-            self._skill_infos[measure.skill_id].competency_measure = measure
-        self._user_id = user_id
+        The measures are loaded when first read, for the rest of the request.
+        """
+        _CompetencyOverlay.instance().personalize(
+            user_id, self._skill_infos.keys())
 
     def skills(self, sort_by='name'):
         if sort_by == 'name':
@@ -1017,9 +1114,16 @@ class SkillMap(caching.RequestScopedSingleton):
     def get_skill(self, skill_id):
         return self._skill_infos[skill_id]
 
+    def _assert_not_shared(self):
+        if self._shared:
+            raise AssertionError(
+                'Shared skill maps must not be modified; '
+                'use SkillMap.load_for_update().')
+
     def add_skill_to_lessons(self, skill, location_keys):
         """Add the skill to the given lessons."""
 
+        self._assert_not_shared()
         for loc in location_keys:
             _, lesson = resource.Key.fromstring(loc['key']).get_resource(
                 self._course)
@@ -1033,6 +1137,7 @@ class SkillMap(caching.RequestScopedSingleton):
         # pylint: enable=protected-access
 
     def delete_skill_from_lessons(self, skill):
+        self._assert_not_shared()
         if not self._lessons_by_skill.get(skill.id):
             return
         # pylint: disable=protected-access
@@ -1051,6 +1156,7 @@ class SkillMap(caching.RequestScopedSingleton):
             skill: SkillInfo. The skill to be added
             questions: List of {'id': str}.
         """
+        self._assert_not_shared()
         if not question_keys:
             return
         keys = [resource.Key.fromstring(x['key']) for x in question_keys]
@@ -1069,6 +1175,7 @@ class SkillMap(caching.RequestScopedSingleton):
     def delete_skill_from_questions(self, skill):
         """Delete the skill from all questions."""
 
+        self._assert_not_shared()
         # pylint: disable=protected-access
         if not self._questions_by_skill.get(skill.id):
             return
@@ -1154,7 +1261,7 @@ class SkillRestHandler(utils.BaseRESTHandler):
 
         skill_graph = SkillGraph.load()
 
-        skill_map = SkillMap.load(self.get_course())
+        skill_map = SkillMap.load_for_update(self.get_course())
         skill = skill_map.get_skill(key)
 
         # Note, first delete from lessons and questions and
@@ -1225,7 +1332,7 @@ class SkillRestHandler(utils.BaseRESTHandler):
             return
 
         key_after_save = skill.id
-        skill_map = SkillMap.load(course)
+        skill_map = SkillMap.load_for_update(course)
         skill = skill_map.get_skill(key_after_save)
 
         skill_map.delete_skill_from_lessons(skill)
@@ -0,0 +1,101 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timings of pages that use the skill map; not part of the test suite.
+
+These only log how long pages take, so they are not listed in the module's
+manifest. Run them on demand with:
+
+    sh scripts/suite.sh \
+        modules.skill_map.skill_map_benchmarks.SkillMapBenchmarks
+"""
+
+import logging
+import time
+
+from models import courses
+from models import models
+from modules.skill_map.constants import SKILLS_KEY
+from modules.skill_map.skill_map import ProcessScopedSkillMapCache
+from modules.skill_map.skill_map import Skill
+from modules.skill_map.skill_map import _SkillDao
+from modules.skill_map.skill_map_tests import ADMIN_EMAIL
+from modules.skill_map.skill_map_tests import BaseSkillMapTests
+from tests.functional import actions
+
+
+class SkillMapBenchmarks(BaseSkillMapTests):
+    """Times pages of a course with a large skill map."""
+
+    def tearDown(self):
+        self.course.clear_current()
+        super(SkillMapBenchmarks, self).tearDown()
+
+    def test_lesson_page(self):
+        """Times lesson pages of a course with 500 skills, 2,000 questions."""
+        num_skills = 500
+        num_questions = 2000
+        num_lessons = 50
+        repeats = 3
+
+        skills = [
+            Skill.build('skill %d' % i, 'description %d' % i)
+            for i in xrange(num_skills)]
+        skill_ids = _SkillDao.save_all(skills)
+        skills = [
+            Skill(skill_id, skill.dict)
+            for skill_id, skill in zip(skill_ids, skills)]
+        for index, skill in enumerate(skills):
+            if index % 10:
+                # pylint: disable=protected-access
+                skill._set_prerequisite_ids([skill_ids[index - 1]])
+        _SkillDao.save_all(skills)
+
+        questions = []
+        for index in xrange(num_questions):
+            question = models.QuestionDTO(None, {
+                'description': 'question %d' % index,
+                'type': models.QuestionDTO.MULTIPLE_CHOICE,
+                'choices': [{'text': 'answer', 'score': 1.0}],
+                'version': '1.5',
+                SKILLS_KEY: [skill_ids[index % num_skills]]})
+            questions.append(question)
+        models.QuestionDAO.save_all(questions)
+
+        unit = self.course.add_unit()
+        unit.availability = courses.AVAILABILITY_AVAILABLE
+        per_lesson = num_skills / num_lessons
+        for index in xrange(num_lessons):
+            lesson = self.course.add_lesson(unit)
+            lesson.title = 'Lesson %d' % index
+            lesson.availability = courses.AVAILABILITY_AVAILABLE
+            lesson.properties[SKILLS_KEY] = skill_ids[
+                index * per_lesson:(index + 1) * per_lesson]
+        self.course.save()
+
+        actions.login(ADMIN_EMAIL)
+        url = 'unit?unit=%s&lesson=%s' % (unit.unit_id, lesson.lesson_id)
+        timings = {'cold': 0, 'warm': 0}
+        for _ in xrange(repeats):
+            for name in ('cold', 'warm'):
+                if name == 'cold':
+                    ProcessScopedSkillMapCache.clear_instance()
+                start = time.time()
+                response = self.get(url)
+                timings[name] += time.time() - start
+                self.assertIn('skill %d' % (num_skills - 1), response.body)
+        logging.info(
+            'Lesson page with %d skills, %d questions (x%d): '
+            'cold %.3fs, warm %.3fs.', num_skills, num_questions, repeats,
+            timings['cold'], timings['warm'])
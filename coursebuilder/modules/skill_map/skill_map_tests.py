@@ -28,6 +28,7 @@ from babel.messages import pofile
 from networkx import DiGraph
 from xml.etree import cElementTree
 
+from common import caching
 from common import crypto
 from common import resource
 from common import users
@@ -516,6 +517,114 @@ class SkillMapTests(BaseSkillMapTests):
         self.assertEqual(self.sd.id, recommended[1].id)
 
 
+class SkillMapCacheTests(BaseSkillMapTests):
+    """Tests for the skill maps shared by requests in the process."""
+
+    def setUp(self):
+        super(SkillMapCacheTests, self).setUp()
+        self._create_lessons()
+        self.course.save()
+        self.user_id = 1
+
+    def tearDown(self):
+        self.course.clear_current()
+        super(SkillMapCacheTests, self).tearDown()
+
+    def _new_request(self):
+        caching.RequestScopedSingleton.clear_all()
+
+    def test_map_is_shared_by_requests(self):
+        self._build_sample_graph()
+        skill_map = SkillMap.load(self.course)
+        self._new_request()
+        self.assertIs(skill_map, SkillMap.load(self.course))
+        self.assertEqual(6, len(skill_map.skills()))
+
+    def test_map_is_rebuilt_when_skills_change(self):
+        self._build_sample_graph()
+        skill_map = SkillMap.load(self.course)
+        self._new_request()
+        SkillGraph.load().add(Skill.build(SKILL_NAME, SKILL_DESC))
+        self._new_request()
+        new_skill_map = SkillMap.load(self.course)
+        self.assertIsNot(skill_map, new_skill_map)
+        self.assertEqual(7, len(new_skill_map.skills()))
+
+    def test_map_is_rebuilt_when_course_or_questions_change(self):
+        self._build_sample_graph()
+        skill_map = SkillMap.load(self.course)
+        self.assertEqual([], skill_map.get_skills_for_lesson(
+            self.lesson1.lesson_id))
+
+        self.lesson1.properties[SKILLS_KEY] = [self.sa.id]
+        self.course.save()
+        self._new_request()
+        skill_map = SkillMap.load(self.course)
+        self.assertEqual(
+            [self.sa.id],
+            [s.id for s in skill_map.get_skills_for_lesson(
+                self.lesson1.lesson_id)])
+
+        question = self._create_mc_question('question')
+        question.dict[SKILLS_KEY] = [self.sa.id]
+        models.QuestionDAO.save(question)
+        self._new_request()
+        skill_map = SkillMap.load(self.course)
+        self.assertEqual(
+            [question.id],
+            [q.id for q in skill_map.get_questions_for_skill(self.sa)])
+
+    def test_map_is_not_built_from_course_loaded_before_save(self):
+        self._build_sample_graph()
+        stale_course = courses.Course(None, self.app_context)
+
+        self.lesson1.properties[SKILLS_KEY] = [self.sa.id]
+        self.course.save()
+        self._new_request()
+        skill_map = SkillMap.load(stale_course)
+        self.assertEqual(
+            [self.sa.id],
+            [s.id for s in skill_map.get_skills_for_lesson(
+                self.lesson1.lesson_id)])
+
+    def test_course_with_unsaved_changes_is_not_shared(self):
+        self._build_sample_graph()
+        self.course.add_unit()
+        skill_map = SkillMap.load(self.course)
+        self._new_request()
+        self.assertIsNot(skill_map, SkillMap.load(self.course))
+
+    def test_competency_measures_are_per_request(self):
+        self._build_sample_graph()
+        measure = competency.SuccessRateCompetencyMeasure.load(
+            self.user_id, self.sa.id)
+        measure.add_score(1.0)
+        measure.save()
+
+        skill_map = SkillMap.load(self.course, user_id=self.user_id)
+        self.assertTrue(skill_map.personalized())
+        self.assertEqual(1.0, skill_map.get_skill(self.sa.id).score)
+        self.assertEqual(0.0, skill_map.get_skill(self.sb.id).score)
+
+        self._new_request()
+        skill_map = SkillMap.load(self.course)
+        self.assertFalse(skill_map.personalized())
+        self.assertIsNone(skill_map.get_skill(self.sa.id).score)
+
+        self._new_request()
+        skill_map = SkillMap.load(self.course, user_id=self.user_id + 1)
+        self.assertEqual(0.0, skill_map.get_skill(self.sa.id).score)
+
+    def test_shared_map_is_read_only(self):
+        self._build_sample_graph()
+        skill_map = SkillMap.load(self.course)
+        with self.assertRaises(AssertionError):
+            skill_map.delete_skill_from_lessons(skill_map.get_skill(self.sa.id))
+
+        skill_map = SkillMap.load_for_update(self.course)
+        skill_map.delete_skill_from_lessons(skill_map.get_skill(self.sa.id))
+
+
 class SkillMapRdfHandlerTests(BaseSkillMapTests):
     DATA_URL = 'modules/skill_map/rdf/v1/data'
     SCHEMA_URL = '/modules/skill_map/rdf/v1/schema'
@@ -2569,6 +2678,39 @@ class EventListenerTests(BaseSkillMapTests):
             self.user.user_id(), self.sb.id)
         self.assertEqual(0.0, measure.score)
 
+    def test_measures_are_saved_in_one_batch(self):
+        saved = []
+        save_all = competency.CompetencyMeasureDao.save_all
+
+        def record_save_all(dtos):
+            saved.append([dto.id for dto in dtos])
+            return save_all(dtos)
+
+        self.swap(competency.CompetencyMeasureDao, 'save_all',
+                  staticmethod(record_save_all))
+        data = self._get_many_item_data(1, 1, 0)
+        self._record_and_expect('attempt-lesson', data, 1.0, 0.5)
+        self.assertEqual(1, len(saved))
+        self.assertEqual(2, len(saved[0]))
+
+    def test_deferred_updates(self):
+        with actions.OverriddenConfig(
+                competency.DEFER_COMPETENCY_UPDATES.name, True):
+            data = self._get_many_item_data(1, 1, 0)
+            competency.record_event_listener(
+                'attempt-lesson', self.user, data)
+        measure = competency.SuccessRateCompetencyMeasure.load(
+            self.user.user_id(), self.sa.id)
+        self.assertFalse(measure.attempted)
+
+        self.execute_all_deferred_tasks()
+        measure = competency.SuccessRateCompetencyMeasure.load(
+            self.user.user_id(), self.sa.id)
+        self.assertEqual(1.0, measure.score)
+        measure = competency.SuccessRateCompetencyMeasure.load(
+            self.user.user_id(), self.sb.id)
+        self.assertEqual(0.5, measure.score)
+
 
 class LessonHeaderTests(BaseSkillMapTests):
 
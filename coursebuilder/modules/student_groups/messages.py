@@ -42,6 +42,12 @@ tabs or newlines.
 Each student may only be in one group.
 """
 
+GROUP_MEMBERS_UPDATE_DESCRIPTION = """
+Progress of the latest change to the members of this group.  Changes to large
+groups are applied in the background; students not yet moved keep their
+previous group until then.
+"""
+
 EDIT_STUDENT_GROUPS_PERMISSION_DESCRIPTION = """
 Allows creation, deletion, and modification of membership in groups of students.
 Other permissions may be required to configure group-level settings to
@@ -28,9 +28,12 @@ import cgi
 import datetime
 import logging
 import os
+import time
 import urllib
+import zlib
 
 import appengine_config
+from common import caching
 from common import crypto
 from common import resource
 from common import safe_dom
@@ -61,7 +64,9 @@ from modules.oeditor import oeditor
 from modules.student_groups import graphql
 from modules.student_groups import messages
 
+from google.appengine.api import namespace_manager
 from google.appengine.ext import db
+from google.appengine.ext import deferred
 
 EDIT_STUDENT_GROUPS_PERMISSION = 'Edit Student Groups'
 STUDENT_GROUP_ID_TAG = 'student_group_id'
@@ -72,6 +77,16 @@ _TEMPLATES_DIR = os.path.join(
 
 custom_module = None
 
+# Group membership is changed this many email addresses (or Students) at a
+# time, so that each batch of lookups and puts stays small.
+MEMBERSHIP_CHUNK_SIZE = 500
+# Seconds of membership work done within the request that saves the group.
+# Whatever remains is handed off to a chain of background tasks.
+MEMBERSHIP_REQUEST_BUDGET_SECONDS = 10
+# Seconds of work one background membership task does before checkpointing
+# and handing off to a continuation task.
+MEMBERSHIP_TASK_BUDGET_SECONDS = 60
+
 
 AVAILABILITY_NO_OVERRIDE = 'no_override'
 AVAILABILITY_NO_OVERRIDE_OPTION = (AVAILABILITY_NO_OVERRIDE,
@@ -612,6 +627,13 @@ class StudentGroupMembership(models.BaseEntity):
     def set_members(cls, group_id, emails_to_assign):
         """Put the given emails into the nominated group.
 
+        The work is done in chunks of MEMBERSHIP_CHUNK_SIZE, checkpointed in
+        a StudentGroupMembershipUpdate.  Chunks are applied within the
+        current request for up to MEMBERSHIP_REQUEST_BUDGET_SECONDS, and the
+        rest by a chain of background tasks, each resuming from the last
+        checkpoint.  Every chunk can safely be re-applied, so a task that is
+        interrupted is simply retried.
+
         Note that due to transaction size constraints, the steps below are not
         100% transactionally secure against all possiblity of error.  If
         multiple admins are manipulating the same group at the same time, it's
@@ -631,40 +653,114 @@ class StudentGroupMembership(models.BaseEntity):
           emails_to_assign: List of email addresses to put into the group.
             Note that it is legitimate to make this the empty list -
             see delete_group().
+        Returns:
+          True if membership has been fully updated, or False if the rest of
+          the update has been handed off to background tasks.
         """
-        # Sequence of operation requires six DB round trips:
-        # 1: Look up students in group by filtered query.
-        # 3: Look up email -> UID (put, get-by-key-list, delete-by-key-list)
-        # 1: Look up registered students by UID
-        # 1: Delete entries from StudentGroupMembership by filtered query
-        # 1: Insert entries to StudentGroupMembership *and* update Student
-        #    records.
-        #
-        # Yes, this code results in a lot of round trips.  Note however that
-        # it's a fixed number, and not dependent on the number of users in the
-        # group.
-
-        # Get the Students currently in the group.
-        students_in_group = list(common_utils.iter_all(
-            models.Student.all().filter('group_id =', group_id)))
-
-        # Winnow: Match existing student emails to emails-to-assign, and
-        # get rid of matches.  This leaves us only with emails for people
-        # not yet in the group, and students leaving the group.
-        students_to_remove_from_group = []
-        emails_to_assign = set([e.lower() for e in emails_to_assign])
-        for student in students_in_group:
-            if not student.email in emails_to_assign:
-                student.group_id = None
-                students_to_remove_from_group.append(student)
-                models.StudentCache.remove(student.user_id)
-            elif student.email in emails_to_assign:
-                emails_to_assign.remove(student.email)
-
-        # For emails not yet in group, get UIDs, and thence students.
-        email_to_user_id = EmailToObfuscatedUserId.lookup(emails_to_assign)
+        update = StudentGroupMembershipUpdate.start(group_id, emails_to_assign)
+        namespace = namespace_manager.get_namespace()
+        try:
+            if not cls.continue_update(
+                update, MEMBERSHIP_REQUEST_BUDGET_SECONDS):
+                return True
+        except Exception:  # pylint: disable=broad-except
+            logging.exception(
+                'Membership update of student group %s failed; resuming in '
+                'background', group_id)
+        deferred.defer(
+            run_background_membership_update, namespace, group_id,
+            update.run_id)
+        return False
+
+    @classmethod
+    def continue_update(cls, update, budget_seconds):
+        """Apply chunks of an update from its checkpoint onwards.
+
+        Sequence of operation:
+        - Take Students not to be kept out of the group, a chunk at a time.
+        - Delete the group's StudentGroupMembership rows for emails not to be
+          kept, so that members who stay never lose their binding.
+        - For each chunk of emails to assign, look up email -> UID
+          (put, get-by-key-list, delete-by-key-list), and thence registered
+          Students; put those into the group, along with new
+          StudentGroupMembership rows for emails with no Student, and delete
+          the rows of emails that have one.
+        Whatever the number of members, each chunk needs a fixed number of
+        round trips, and affects at most 2 * MEMBERSHIP_CHUNK_SIZE entities.
+
+        Args:
+          update: StudentGroupMembershipUpdate holding the checkpoint.
+          budget_seconds: Seconds after which to stop at the next checkpoint.
+        Returns:
+          True if there is more work to do, False once the update is done or
+          has been superseded.
+        """
+        deadline = time.time() + budget_seconds
+        emails_to_assign = update.get_emails()
+        emails_to_keep = set(emails_to_assign)
+        while update.phase != update.PHASE_DONE:
+            if update.phase == update.PHASE_REMOVE_STUDENTS:
+                cls._remove_students_chunk(update, emails_to_keep)
+            elif update.phase == update.PHASE_REMOVE_BINDINGS:
+                cls._remove_bindings_chunk(update, emails_to_keep)
+            else:
+                cls._add_members_chunk(update, emails_to_assign)
+            cls._bump_memcache_version()
+            StudentGroupOverrides.clear_request_cache()
+            if not update.checkpoint():
+                return False
+            if update.phase != update.PHASE_DONE and time.time() >= deadline:
+                return True
+        update.finish()
+        return False
+
+    @classmethod
+    def _remove_students_chunk(cls, update, emails_to_keep):
+        query = models.Student.all().filter('group_id =', update.group_id)
+        if update.cursor:
+            query.with_cursor(update.cursor)
+        students = query.fetch(MEMBERSHIP_CHUNK_SIZE)
+        students_to_remove_from_group = [
+            student for student in students
+            if student.email not in emails_to_keep]
+        for student in students_to_remove_from_group:
+            student.group_id = None
+        entities.put(students_to_remove_from_group)
+        models.StudentCache.remove_multi(
+            [student.user_id for student in students_to_remove_from_group])
+        if len(students) < MEMBERSHIP_CHUNK_SIZE:
+            update.phase = update.PHASE_REMOVE_BINDINGS
+            update.cursor = None
+        else:
+            update.cursor = query.cursor()
+
+    @classmethod
+    def _remove_bindings_chunk(cls, update, emails_to_keep):
+        query = cls.all(keys_only=True).filter('group_id =', update.group_id)
+        if update.cursor:
+            query.with_cursor(update.cursor)
+        keys = query.fetch(MEMBERSHIP_CHUNK_SIZE)
+        entities.delete(
+            [key for key in keys if key.name() not in emails_to_keep])
+        if len(keys) < MEMBERSHIP_CHUNK_SIZE:
+            update.phase = update.PHASE_ADD_MEMBERS
+            update.cursor = None
+        else:
+            update.cursor = query.cursor()
+
+    @classmethod
+    def _add_members_chunk(cls, update, emails_to_assign):
+        group_id = update.group_id
+        emails = set(emails_to_assign[
+            update.position:update.position + MEMBERSHIP_CHUNK_SIZE])
+        if not emails:
+            update.phase = update.PHASE_DONE
+            return
+
+        # For emails in this chunk, get UIDs, and thence students.
+        email_to_user_id = EmailToObfuscatedUserId.lookup(emails)
         user_id_to_email = {v: k for k, v in email_to_user_id.iteritems() if v}
-        students_to_add_to_group = [
+        students = [
             student for student in models.Student.get(
                 [db.Key.from_path(models.Student.kind(), uid)
                  for uid in user_id_to_email])
@@ -675,21 +771,30 @@ class StudentGroupMembership(models.BaseEntity):
         # email is found by looking up in the uid->email map, not using the
         # email currently in the Student, as that may not match the email
         # entered by the admin -- more than one email can map to same UID.
-        for student in students_to_add_to_group:
-            student.group_id = group_id
-            emails_to_assign.remove(user_id_to_email[student.user_id])
-            models.StudentCache.remove(student.user_id)
+        # Students already in the group (e.g., when a chunk is re-applied)
+        # are left as they are.
+        students_to_add_to_group = []
+        student_emails = []
+        for student in students:
+            student_emails.append(user_id_to_email[student.user_id])
+            emails.discard(student_emails[-1])
+            if student.group_id != group_id:
+                student.group_id = group_id
+                students_to_add_to_group.append(student)
         emails_to_save = [cls(key_name=email, group_id=group_id)
-                          for email in emails_to_assign]
-
-        # DB operations.  Potentially up to
-        # 2 * StudentGroupAvailability.MAX_NUM_MEMBERS operations, which is
-        # over the max number of group leaders that can be affected within
-        # one transaction.
-        entities.delete(common_utils.iter_all(
-            cls.all(keys_only=True).filter('group_id =', group_id)))
-        entities.put(students_to_remove_from_group + students_to_add_to_group +
-                     emails_to_save)
+                          for email in emails]
+        entities.put(students_to_add_to_group + emails_to_save)
+        # A binding kept from before the update is no longer needed once
+        # its email has a Student.
+        entities.delete([
+            db.Key.from_path(cls.kind(), email) for email in student_emails])
+        models.StudentCache.remove_multi(
+            [student.user_id for student in students_to_add_to_group])
+
+        update.position += MEMBERSHIP_CHUNK_SIZE
+        if update.position >= len(emails_to_assign):
+            update.position = len(emails_to_assign)
+            update.phase = update.PHASE_DONE
 
     @classmethod
     def get_emails(cls, group_id):
@@ -770,11 +875,11 @@ class StudentGroupMembership(models.BaseEntity):
         # did not check non-Students, they might well be prevented from
         # becoming Students since the registration page availability is gated
         # on course availability.
-        binding = cls._get_by_email_address(user.email())
-        if binding:
+        group_id = cls._get_group_id_by_email_address(user.email())
+        if group_id:
             return model_caching.CacheFactory.get_manager_class(
                 MODULE_NAME_AS_IDENTIFIER).get(
-                    binding.group_id, app_context=app_context)
+                    group_id, app_context=app_context)
         return None
 
     @classmethod
@@ -827,6 +932,55 @@ class StudentGroupMembership(models.BaseEntity):
                 student.group_id, app_context=app_context)
         return student_group, True
 
+    @classmethod
+    def _memcache_version_key(cls):
+        return '(student-group-membership-version)'
+
+    @classmethod
+    def _get_memcache_version(cls):
+        version = models.MemcacheManager.get(cls._memcache_version_key())
+        if version is None:
+            version = cls._bump_memcache_version()
+        return version
+
+    @classmethod
+    def _bump_memcache_version(cls):
+        """Retires all cached email-to-group bindings of this course."""
+        return models.MemcacheManager.incr(
+            cls._memcache_version_key(), 1,
+            initial_value=int(time.time() * 1000 * 1000))
+
+    @classmethod
+    def _get_group_id_by_email_address(cls, email):
+        """Like _get_by_email_address(), but returns the group ID, cached."""
+        version = cls._get_memcache_version()
+        if version is None:
+            binding = cls._get_by_email_address(email)
+            return binding.group_id if binding else None
+        key = '(student-group-membership:%s:%s)' % (version, email.lower())
+        group_id = models.MemcacheManager.get(key)
+        if group_id is None:
+            binding = cls._get_by_email_address(email)
+            # Zero stands for no binding; group IDs are never zero.
+            group_id = binding.group_id if binding else 0
+            models.MemcacheManager.set(key, group_id)
+        return group_id or None
+
+    @classmethod
+    def get_student_group_id_for_user(cls, user):
+        """Returns the ID of the group the user is in, or None.
+
+        Unlike get_student_group_for_current_user(), this does not load the
+        group, nor check whether the group still exists.
+
+        Args:
+          user: users.User in session.
+        """
+        student = models.Student.get_by_user_id(user.user_id())
+        if student and not student.is_transient:
+            return student.group_id or None
+        return cls._get_group_id_by_email_address(user.email())
+
     @classmethod
     def _get_by_email_address(cls, email):
         key_names = []
@@ -852,6 +1006,118 @@ class StudentGroupMembership(models.BaseEntity):
                 return item
         return None
 
+
+class StudentGroupMembershipUpdate(models.BaseEntity):
+    """Progress of the latest change to the membership of one student group.
+
+    The key name is the group ID.  Starting a new change for the group
+    overwrites the entity with a fresh run_id, which stops tasks applying the
+    older change at their next checkpoint.  The entity is deleted once the
+    change is complete.
+    """
+
+    PHASE_REMOVE_STUDENTS = 'remove_students'
+    PHASE_REMOVE_BINDINGS = 'remove_bindings'
+    PHASE_ADD_MEMBERS = 'add_members'
+    PHASE_DONE = 'done'
+
+    STATE_RUNNING = 'running'
+    STATE_FAILED = 'failed'
+
+    run_id = db.StringProperty(indexed=False)
+    state = db.StringProperty(indexed=False)
+    # zlib-compressed JSON list of the lowercased emails to assign.
+    emails = db.BlobProperty()
+    num_members = db.IntegerProperty(indexed=False, default=0)
+    # Checkpoint: the phase, and the query cursor over the group's Students
+    # or the offset into emails from which the next chunk resumes.
+    phase = db.StringProperty(indexed=False)
+    cursor = db.TextProperty(indexed=False)
+    position = db.IntegerProperty(indexed=False, default=0)
+    error = db.TextProperty(indexed=False)
+    started_on = db.DateTimeProperty(indexed=False)
+    updated_on = db.DateTimeProperty(auto_now=True, indexed=False)
+
+    @classmethod
+    def start(cls, group_id, emails_to_assign):
+        emails = sorted(set([e.lower() for e in emails_to_assign]))
+        update = cls(
+            key_name=str(group_id),
+            run_id=datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S%f'),
+            state=cls.STATE_RUNNING, emails=zlib.compress(
+                transforms.dumps(emails)),
+            num_members=len(emails), phase=cls.PHASE_REMOVE_STUDENTS,
+            started_on=datetime.datetime.utcnow())
+        update.put()
+        return update
+
+    @classmethod
+    def get_running(cls, group_id, run_id):
+        update = cls.get_by_key_name(str(group_id))
+        if (not update or update.run_id != run_id or
+            update.state != cls.STATE_RUNNING):
+            logging.info('Membership update of student group %s run %s '
+                         'superseded; stopping', group_id, run_id)
+            return None
+        return update
+
+    @property
+    def group_id(self):
+        return int(self.key().name())
+
+    def get_emails(self):
+        return transforms.loads(zlib.decompress(self.emails))
+
+    def _is_current(self):
+        current = self.get_by_key_name(self.key().name())
+        return current and current.run_id == self.run_id
+
+    def checkpoint(self):
+        """Saves progress, unless a newer update of the group has started."""
+        def save():
+            if not self._is_current():
+                return False
+            self.put()
+            return True
+        return db.run_in_transaction(save)
+
+    def finish(self):
+        """Deletes this record, unless a newer update of the group started."""
+        def delete():
+            if self._is_current():
+                self.delete()
+        db.run_in_transaction(delete)
+
+    def fail(self, ex):
+        logging.exception('Membership update of student group %s run %s '
+                          'failed', self.group_id, self.run_id)
+        self.state = self.STATE_FAILED
+        self.error = unicode(ex)
+        self.checkpoint()
+
+    @property
+    def percent_done(self):
+        if self.phase == self.PHASE_ADD_MEMBERS and self.num_members:
+            return min(100, 100 * self.position / self.num_members)
+        return 100 if self.phase == self.PHASE_DONE else 0
+
+
+def run_background_membership_update(namespace, group_id, run_id):
+    """Apply the next chunks of a membership update, from its checkpoint."""
+    with common_utils.Namespace(namespace):
+        update = StudentGroupMembershipUpdate.get_running(group_id, run_id)
+        if not update:
+            return
+        try:
+            if StudentGroupMembership.continue_update(
+                update, MEMBERSHIP_TASK_BUDGET_SECONDS):
+                deferred.defer(
+                    run_background_membership_update, namespace, group_id,
+                    run_id)
+        except Exception as ex:  # pylint: disable=broad-except
+            update.fail(ex)
+
+
 class StudentGroupEntity(models.BaseEntity):
     """Overrides for per-group course-level settings.
 
@@ -1039,6 +1305,7 @@ class StudentGroupDAO(models.BaseJsonDao):
         # the dashboard even if the cache is enabled (which it is by default).
         model_caching.CacheFactory.get_cache_instance(
             MODULE_NAME_AS_IDENTIFIER).clear()
+        StudentGroupOverrides.clear_request_cache()
 
     @classmethod
     def create_new(cls, the_dict=None):
@@ -1053,6 +1320,7 @@ class StudentGroupDAO(models.BaseJsonDao):
         try:
             model_caching.CacheFactory.get_cache_instance(
                 MODULE_NAME_AS_IDENTIFIER).clear()
+            StudentGroupOverrides.clear_request_cache()
             cls.delete(dummy_group)
         except AttributeError:
             # Internally, delete() first loads the object and then deletes it,
@@ -1256,7 +1524,8 @@ class StudentGroupAvailabilityRestHandler(utils.BaseRESTHandler):
     ACTION = 'edit_student_group_availability'
     URL = '/rest/edit_student_group_availability'
     _MEMBERS = 'members'
-    MAX_NUM_MEMBERS = 100
+    _MEMBERS_UPDATE = 'members_update'
+    MAX_NUM_MEMBERS = 25000
 
     _arh = availability.AvailabilityRESTHandler
 
@@ -1364,6 +1633,12 @@ class StudentGroupAvailabilityRestHandler(utils.BaseRESTHandler):
             description=messages.GROUP_MEMBERS_DESCRIPTION,
             extra_schema_dict_values={
                 'wrapperClassName': cls._MEMBERS_WRAPPER_CSS}))
+        group_settings.add_property(schema_fields.SchemaField(
+            cls._MEMBERS_UPDATE, 'Membership Update', 'string',
+            optional=True, i18n=False, editable=False,
+            description=messages.GROUP_MEMBERS_UPDATE_DESCRIPTION,
+            extra_schema_dict_values={
+                'wrapperClassName': cls._MEMBERS_WRAPPER_CSS}))
 
         content_trigger = cls._arh.get_content_trigger_schema(
             course,
@@ -1467,11 +1742,19 @@ class StudentGroupAvailabilityRestHandler(utils.BaseRESTHandler):
             if not student_group:
                 transforms.send_json_response(self, 404, 'Not found.')
                 return
+            # While an update of the membership is being applied, show the
+            # members being assigned rather than those assigned so far.
+            update = StudentGroupMembershipUpdate.get_by_key_name(
+                str(student_group_id))
+            if update:
+                members = update.get_emails()
+            else:
+                members = StudentGroupMembership.get_emails(student_group_id)
             student_group_settings = {
                 self._ELEMENT_SETTINGS:
                     self._traverse_course(course, student_group),
-                'members': '\n'.join(
-                    StudentGroupMembership.get_emails(student_group_id)),
+                self._MEMBERS: '\n'.join(members),
+                self._MEMBERS_UPDATE: self._describe_members_update(update),
                 self._DEFAULT_COURSE_AVAILABILITY:
                     course.get_course_availability().title().replace('_', ' '),
                 self.COURSE_AVAILABILITY: student_group.get_override(
@@ -1489,6 +1772,14 @@ class StudentGroupAvailabilityRestHandler(utils.BaseRESTHandler):
             self, 200, 'OK.', payload_dict=entity,
             xsrf_token=crypto.XsrfTokenManager.create_xsrf_token(self.ACTION))
 
+    @classmethod
+    def _describe_members_update(cls, update):
+        if not update:
+            return ''
+        if update.state == StudentGroupMembershipUpdate.STATE_FAILED:
+            return 'Failed: %s  Save the group again to retry.' % update.error
+        return 'In progress: %d%% done.' % update.percent_done
+
     def put(self):
         request = transforms.loads(self.request.get('request'))
         payload = transforms.loads(request.get('payload', {}))
@@ -1553,9 +1844,12 @@ class StudentGroupAvailabilityRestHandler(utils.BaseRESTHandler):
         StudentGroupDAO.save(student_group)
 
         # Update references in join table.
-        StudentGroupMembership.set_members(int(student_group_id), members)
-
-        transforms.send_json_response(self, 200, 'Saved')
+        if StudentGroupMembership.set_members(int(student_group_id), members):
+            transforms.send_json_response(self, 200, 'Saved')
+        else:
+            transforms.send_json_response(
+                self, 200, 'Saved.  Membership is being updated in the '
+                'background; reload the group to see progress.')
 
 
 # ------------------------------------------------------------------------------
@@ -1648,11 +1942,134 @@ def _add_student_group_to_profile(handler, app_context, student):
     return ret
 
 
+# Largest size of the in-process cache of compiled group overrides.
+OVERRIDES_CACHE_MAX_SIZE_BYTES = 1024 * 1024
+
+
+class ProcessScopedStudentGroupOverridesCache(caching.ProcessScopedSingleton):
+    """This class holds in-process cache of StudentGroupOverrides objects."""
+
+    def __init__(self):
+        self.cache = caching.LRUCache(
+            max_size_bytes=OVERRIDES_CACHE_MAX_SIZE_BYTES,
+            name='student_group_overrides')
+
+
+class _RequestStudentGroupOverrides(caching.RequestScopedSingleton):
+    """Overrides found for each (namespace, user ID) during this request."""
+
+    def __init__(self):
+        self.by_user = {}
+
+
+class StudentGroupOverrides(object):
+    """A student group's overrides, compiled for applying to every request.
+
+    Course-level overrides are kept as the settings they write into the
+    course environ, and content overrides as a dict per content type from ID
+    to availability.  Compiled overrides are cached in-process per group
+    and version of the student group table, and remembered per user for the
+    rest of the request, so that availability checks of single units and
+    lessons do not look the group up again.
+    """
+
+    def __init__(self, student_group):
+        # Collect what the overrides write into the environ, by section.
+        env = {}
+        course_availability = student_group.get_override(
+            course_availability_key())
+        if (course_availability and
+            (course_availability != AVAILABILITY_NO_OVERRIDE)):
+            setting = courses.COURSE_AVAILABILITY_POLICIES[course_availability]
+            courses.Course.set_named_course_setting_in_environ(
+                'now_available', env, setting['now_available'])
+            courses.Course.set_named_course_setting_in_environ(
+                'browsable', env, setting['browsable'])
+            courses.Course.set_named_reg_setting_in_environ(
+                'can_register', env, setting['can_register'])
+        graphql.apply_overrides_to_environ(student_group, env)
+        self._env_settings = env
+
+        # Overrides are keyed as made by content_availability_key().
+        self._availability = {}
+        overrides = student_group.dict.get(
+            StudentGroupDTO.OVERRIDES_PROPERTY, {})
+        for content_type in ('unit', 'lesson'):
+            availabilities = {}
+            for content_id, fields in overrides.get(
+                    content_type, {}).iteritems():
+                availability = fields.get(CONTENT_AVAILABILITY_FIELD)
+                if availability and availability != AVAILABILITY_NO_OVERRIDE:
+                    availabilities[content_id] = availability
+            self._availability[content_type] = availabilities
+
+    def apply_to_environ(self, env):
+        for section, settings in self._env_settings.iteritems():
+            env.setdefault(section, {}).update(settings)
+
+    def apply_to_units_and_lessons(self, units, lessons):
+        unit_availability = self._availability['unit']
+        if unit_availability:
+            for unit in units:
+                availability = unit_availability.get(str(unit.unit_id))
+                if availability:
+                    unit.availability = availability
+        lesson_availability = self._availability['lesson']
+        if lesson_availability:
+            for lesson in lessons:
+                availability = lesson_availability.get(str(lesson.lesson_id))
+                if availability:
+                    lesson.availability = availability
+
+    @classmethod
+    def _get(cls, app_context, group_id):
+        """Returns compiled overrides of a group, or None if it is gone."""
+        namespace = app_context.get_namespace_name()
+        with common_utils.Namespace(namespace):
+            version = StudentGroupDAO.get_all_mapped_version()
+            if version is None:
+                group = StudentGroupDAO.load(group_id)
+                return cls(group) if group else None
+            key = '%s:%s:%s' % (namespace, group_id, version)
+            cache = ProcessScopedStudentGroupOverridesCache.instance().cache
+            found, overrides = cache.get(key)
+            if not found:
+                # Loaded by key rather than from the group cache, which can
+                # lag behind the version read above.
+                group = StudentGroupDAO.load(group_id)
+                overrides = cls(group) if group else None
+                cache.put(key, overrides)
+            return overrides
+
+    @classmethod
+    def get_for_current_user(cls, app_context):
+        """Returns the current user's group overrides, or None."""
+        # Admins never get their view modified by group restrictions.
+        if roles.Roles.is_course_admin(app_context):
+            return None
+        user = users.get_current_user()
+        if not user:
+            return None
+
+        by_user = _RequestStudentGroupOverrides.instance().by_user
+        key = (app_context.get_namespace_name(), user.user_id())
+        if key not in by_user:
+            with common_utils.Namespace(app_context.get_namespace_name()):
+                group_id = StudentGroupMembership.get_student_group_id_for_user(
+                    user)
+            by_user[key] = (
+                cls._get(app_context, group_id) if group_id else None)
+        return by_user[key]
+
+    @classmethod
+    def clear_request_cache(cls):
+        _RequestStudentGroupOverrides.clear_instance()
+
+
 def modify_course_environment(app_context, env):
     """Callback: Inject overrides into course-level environment settings."""
-    student_group = StudentGroupMembership.get_student_group_for_current_user(
-        app_context)
-    if not student_group:
+    overrides = StudentGroupOverrides.get_for_current_user(app_context)
+    if not overrides:
         return
 
     # Consider a user who has been added to a student group.  Now, whenever
@@ -1670,21 +2087,9 @@ def modify_course_environment(app_context, env):
             path.endswith(StudentGroupAvailabilityRestHandler.URL)):
             return
 
-    # Apply overrides as applicable.
-    # pylint: disable=protected-access
-    course_availability = student_group.get_override(course_availability_key())
-    if (course_availability and
-        (course_availability != AVAILABILITY_NO_OVERRIDE)):
-        setting = courses.COURSE_AVAILABILITY_POLICIES[course_availability]
-        courses.Course.set_named_course_setting_in_environ(
-            'now_available', env, setting['now_available'])
-        courses.Course.set_named_course_setting_in_environ(
-            'browsable', env, setting['browsable'])
-        courses.Course.set_named_reg_setting_in_environ(
-            'can_register', env, setting['can_register'])
-
-    # Override the course start/end dates displayed in the course explorer.
-    graphql.apply_overrides_to_environ(student_group, env)
+    # Apply course availability and the course start/end dates displayed in
+    # the course explorer.
+    overrides.apply_to_environ(env)
 
     # Users named by email into groups are implicitly also whitelisted into
     # the course.
@@ -1694,24 +2099,9 @@ def modify_course_environment(app_context, env):
 
 def modify_unit_and_lesson_attributes(course, units, lessons):
     """Callback from Course to modify a student's view of units, lessons."""
-    student_group = StudentGroupMembership.get_student_group_for_current_user(
-        course.app_context)
-    if not student_group:
-        return
-
-    # pylint: disable=protected-access
-    for unit in units:
-        unit_availability = student_group.get_override(
-            content_availability_key('unit', unit.unit_id))
-        if (unit_availability and
-            (unit_availability != AVAILABILITY_NO_OVERRIDE)):
-            unit.availability = unit_availability
-    for lesson in lessons:
-        lesson_availability = student_group.get_override(
-            content_availability_key('lesson', lesson.lesson_id))
-        if (lesson_availability and
-            (lesson_availability != AVAILABILITY_NO_OVERRIDE)):
-            lesson.availability = lesson_availability
+    overrides = StudentGroupOverrides.get_for_current_user(course.app_context)
+    if overrides:
+        overrides.apply_to_units_and_lessons(units, lessons)
 
 
 def act_on_all_triggers(course):
@@ -1738,6 +2128,22 @@ def act_on_all_triggers(course):
             logged_ns, content_acts, overrides_changed, save_settings)
 
 
+def get_pending_trigger_whens(unused_app_context):
+    """Returns UTC datetimes of the pending override triggers of all groups."""
+    whens = []
+    for group in StudentGroupDAO.get_all_iter():  # Not cache-affecting.
+        whens.extend(CourseOverrideTrigger.pending_whens(group))
+        whens.extend(ContentOverrideTrigger.pending_whens(group))
+    return whens
+
+
+def _update_availability_schedule(unused_student_groups):
+    app_context = sites.get_app_context_for_namespace(
+        namespace_manager.get_namespace())
+    if app_context:
+        availability_cron.update_schedule(app_context)
+
+
 class AddToStudentAggregate(
     student_aggregate.AbstractStudentAggregationComponent):
     """Callback to add student group info to student aggregate data source."""
@@ -1864,8 +2270,7 @@ class ResourceHandlerStudentGroup(resource.AbstractResourceHandler):
 CACHE_NAME = MODULE_NAME_AS_IDENTIFIER
 CACHE_LABEL = MODULE_NAME + " Caching"
 CACHE_DESCRPTION = messages.ENABLE_GROUP_CACHING
-CACHE_MAX_SIZE_BYTES = (
-    StudentGroupAvailabilityRestHandler.MAX_NUM_MEMBERS * 1024 * 4)
+CACHE_MAX_SIZE_BYTES = 400 * 1024
 CACHE_TTL_1_HOUR = 60 * 60
 
 
@@ -1974,6 +2379,9 @@ def register_module():
         # up course and content availabilities.
         availability_cron.UpdateAvailability.RUN_HOOKS[
             MODULE_NAME] = act_on_all_triggers
+        availability_cron.UpdateAvailability.PENDING_WHEN_HOOKS[
+            MODULE_NAME] = get_pending_trigger_whens
+        StudentGroupDAO.POST_SAVE_HOOKS.append(_update_availability_schedule)
 
     custom_module = custom_modules.Module(
         MODULE_NAME, 'Define and manage groups of students.',
@@ -869,6 +869,126 @@ class AvailabilityLifecycleTests(StudentGroupsTestBase):
             AvailabilityRestHandler._MEMBERS]
         self.assertEquals('', email_text)
 
+    def _get_members_and_update(self, group_id):
+        response = self._get_availability(group_id)
+        settings = transforms.loads(response['payload'])[
+            AvailabilityRestHandler._STUDENT_GROUP_SETTINGS]
+        return (sorted(settings[AvailabilityRestHandler._MEMBERS].split()),
+                settings[AvailabilityRestHandler._MEMBERS_UPDATE])
+
+    def _swap_membership_chunking(self):
+        self.swap(student_groups, 'MEMBERSHIP_CHUNK_SIZE', 10)
+        self.swap(student_groups, 'MEMBERSHIP_REQUEST_BUDGET_SECONDS', 0)
+
+    def test_large_group_updated_in_background(self):
+        self._swap_membership_chunking()
+        actions.login(self.ADMIN_EMAIL)
+        response = self._put_group(None, 'Big Group', 'lots of students')
+        group_id = transforms.loads(response['payload'])['key']
+        emails = ['test_user_%3.3d@example.com' % i for i in xrange(35)]
+        response = self._put_availability(group_id, emails)
+        self.assertEquals(200, response['status'])
+        self.assertIn('in the background', response['message'])
+
+        # While in progress, the editor shows the members being assigned.
+        members, update = self._get_members_and_update(group_id)
+        self.assertEquals(emails, members)
+        self.assertEquals('In progress: 0% done.', update)
+        self.assertIsNone(self._group_for_email(emails[-1]))
+
+        self.execute_all_deferred_tasks()
+        members, update = self._get_members_and_update(group_id)
+        self.assertEquals(emails, members)
+        self.assertEquals('', update)
+        for email in emails:
+            self.assertEquals(group_id, self._group_for_email(email))
+        with common_utils.Namespace(self.NAMESPACE):
+            self.assertIsNone(
+                student_groups.StudentGroupMembershipUpdate.all().get())
+
+        # Removing the group removes its members in the background, too.
+        self._delete_group(group_id)
+        self.execute_all_deferred_tasks()
+        with common_utils.Namespace(self.NAMESPACE):
+            self.assertIsNone(student_groups.StudentGroupMembership.all().get())
+
+    def test_reapplied_chunk_leaves_membership_unchanged(self):
+        actions.login(self.STUDENT_EMAIL)
+        actions.register(self, 'John Smith')
+        user_id = users.get_current_user().user_id()
+
+        self._swap_membership_chunking()
+        actions.login(self.ADMIN_EMAIL)
+        response = self._put_group(None, 'Big Group', 'lots of students')
+        group_id = transforms.loads(response['payload'])['key']
+        emails = [self.STUDENT_EMAIL] + [
+            'test_user_%3.3d@example.com' % i for i in xrange(25)]
+        self._put_availability(group_id, emails)
+
+        # As when a task is retried after being interrupted before its
+        # checkpoint was saved, apply the same chunk twice.
+        update_class = student_groups.StudentGroupMembershipUpdate
+        with common_utils.Namespace(self.NAMESPACE):
+            student_groups.StudentGroupMembership.continue_update(
+                update_class.get_by_key_name(str(group_id)), 0)
+            update = update_class.get_by_key_name(str(group_id))
+            self.assertEquals(update_class.PHASE_ADD_MEMBERS, update.phase)
+            self.assertEquals(0, update.position)
+            for _ in xrange(2):
+                update.checkpoint()  # Back to before the chunk.
+                student_groups.StudentGroupMembership.continue_update(
+                    update_class.get_by_key_name(str(group_id)), 0)
+        self.execute_all_deferred_tasks()
+
+        members, update = self._get_members_and_update(group_id)
+        self.assertEquals(sorted(e.lower() for e in emails), members)
+        self.assertEquals('', update)
+        with common_utils.Namespace(self.NAMESPACE):
+            self.assertEquals(
+                group_id, models.Student.get_by_user_id(user_id).group_id)
+            self.assertEquals(
+                25, student_groups.StudentGroupMembership.all().count())
+
+    def test_members_who_stay_keep_bindings_during_update(self):
+        self._swap_membership_chunking()
+        actions.login(self.ADMIN_EMAIL)
+        response = self._put_group(None, 'Big Group', 'lots of students')
+        group_id = transforms.loads(response['payload'])['key']
+        emails = ['test_user_%3.3d@example.com' % i for i in xrange(25)]
+        self._put_availability(group_id, emails)
+        self.execute_all_deferred_tasks()
+
+        # Adding one member does not take the others out of the group, even
+        # while the rest of the update is still to run in the background.
+        new_emails = emails[1:] + ['new_user@example.com']
+        response = self._put_availability(group_id, new_emails)
+        self.assertIn('in the background', response['message'])
+        for email in emails[1:]:
+            self.assertEquals(group_id, self._group_for_email(email))
+
+        self.execute_all_deferred_tasks()
+        members, update = self._get_members_and_update(group_id)
+        self.assertEquals(sorted(new_emails), members)
+        self.assertEquals('', update)
+        self.assertIsNone(self._group_for_email(emails[0]))
+
+    def test_newer_update_supersedes_running_one(self):
+        self._swap_membership_chunking()
+        actions.login(self.ADMIN_EMAIL)
+        response = self._put_group(None, 'Big Group', 'lots of students')
+        group_id = transforms.loads(response['payload'])['key']
+        old_emails = ['old_user_%3.3d@example.com' % i for i in xrange(25)]
+        new_emails = ['new_user_%3.3d@example.com' % i for i in xrange(15)]
+        self._put_availability(group_id, old_emails)
+        self._put_availability(group_id, new_emails)
+        self.execute_all_deferred_tasks()
+
+        members, update = self._get_members_and_update(group_id)
+        self.assertEquals(new_emails, members)
+        self.assertEquals('', update)
+        for email in old_emails:
+            self.assertIsNone(self._group_for_email(email))
+
     def test_availability_can_set_zero_members(self):
         actions.login(self.ADMIN_EMAIL)
         response = self._put_group(None, 'Big Group', 'lots of students')
@@ -1398,6 +1518,120 @@ class AvailabilityTests(StudentGroupsTestBase):
         self.assertEquals(response.status_int, 200)
 
 
+class OverridesCacheTests(StudentGroupsTestBase):
+    """Tests for compiled group overrides shared by requests."""
+
+    COURSE_URL = AvailabilityTests.COURSE_URL
+    LESSON_ONE_URL = AvailabilityTests.LESSON_ONE_URL
+    LESSON_TWO_URL = AvailabilityTests.LESSON_TWO_URL
+    IN_GROUP_STUDENT_EMAIL = AvailabilityTests.IN_GROUP_STUDENT_EMAIL
+
+    def setUp(self):
+        super(OverridesCacheTests, self).setUp()
+        self.course = courses.Course(None, app_context=self.app_context)
+        self.unit_one = self.course.add_unit()
+        self.unit_one.availability = courses.AVAILABILITY_COURSE
+        self.lesson_one = self.course.add_lesson(self.unit_one)
+        self.unit_two = self.course.add_unit()
+        self.unit_two.availability = courses.AVAILABILITY_COURSE
+        self.lesson_two = self.course.add_lesson(self.unit_two)
+        self.course.save()
+
+        actions.login(self.ADMIN_EMAIL)
+        self._put_course_availability()
+        response = self._put_group(None, 'Group One', 'this is my group')
+        self.group_id = transforms.loads(response['payload'])['key']
+        self._put_availability(
+            self.group_id, [self.IN_GROUP_STUDENT_EMAIL],
+            course_availability=(
+                courses.COURSE_AVAILABILITY_REGISTRATION_OPTIONAL),
+            element_settings=[
+             {'id': str(self.unit_two.unit_id),
+              'type': 'unit',
+              'availability': courses.AVAILABILITY_UNAVAILABLE},
+             {'id': str(self.lesson_two.lesson_id),
+              'type': 'lesson',
+              'availability': courses.AVAILABILITY_UNAVAILABLE}])
+        self.num_loads = 0
+        load = student_groups.StudentGroupDAO.load
+        def counting_load(*args, **kwargs):
+            self.num_loads += 1
+            return load(*args, **kwargs)
+        self.swap(student_groups.StudentGroupDAO, 'load', counting_load)
+
+    def test_compiled_overrides(self):
+        with common_utils.Namespace(self.NAMESPACE):
+            group = student_groups.StudentGroupDAO.load(self.group_id)
+        overrides = student_groups.StudentGroupOverrides(group)
+
+        env = {'course': {'title': 'Title', 'browsable': False}}
+        overrides.apply_to_environ(env)
+        self.assertEquals('Title', env['course']['title'])
+        self.assertTrue(env['course']['now_available'])
+        self.assertTrue(env['course']['browsable'])
+        self.assertTrue(env['reg_form']['can_register'])
+
+        course = self.course
+        overrides.apply_to_units_and_lessons(
+            course.get_units(), course.get_lessons_for_all_units())
+        self.assertEquals(
+            courses.AVAILABILITY_COURSE, course.find_unit_by_id(
+                self.unit_one.unit_id).availability)
+        self.assertEquals(
+            courses.AVAILABILITY_UNAVAILABLE, course.find_unit_by_id(
+                self.unit_two.unit_id).availability)
+        self.assertEquals(
+            courses.AVAILABILITY_UNAVAILABLE, course.find_lesson_by_id(
+                None, self.lesson_two.lesson_id).availability)
+
+    def test_group_compiled_once_across_requests(self):
+        with actions.OverriddenConfig(models.CAN_USE_MEMCACHE.name, True):
+            actions.login(self.IN_GROUP_STUDENT_EMAIL)
+            actions.register(self, 'John Smith')
+            self.num_loads = 0
+            for _ in xrange(3):
+                response = self.get(self.LESSON_ONE_URL)
+                self.assertEquals(response.status_int, 200)
+                response = self.get(self.LESSON_TWO_URL)
+                self.assertEquals(response.status_int, 302)
+            self.assertEquals(1, self.num_loads)
+
+    def test_changed_group_seen_by_next_request(self):
+        with actions.OverriddenConfig(models.CAN_USE_MEMCACHE.name, True):
+            actions.login(self.IN_GROUP_STUDENT_EMAIL)
+            actions.register(self, 'John Smith')
+            response = self.get(self.LESSON_TWO_URL)
+            self.assertEquals(response.status_int, 302)
+
+            actions.login(self.ADMIN_EMAIL)
+            self._put_availability(
+                self.group_id, [self.IN_GROUP_STUDENT_EMAIL],
+                element_settings=[
+                 {'id': str(self.unit_two.unit_id),
+                  'type': 'unit',
+                  'availability': courses.AVAILABILITY_AVAILABLE},
+                 {'id': str(self.lesson_two.lesson_id),
+                  'type': 'lesson',
+                  'availability': courses.AVAILABILITY_AVAILABLE}])
+            actions.login(self.IN_GROUP_STUDENT_EMAIL)
+            response = self.get(self.LESSON_TWO_URL)
+            self.assertEquals(response.status_int, 200)
+
+    def test_changed_membership_seen_by_next_request(self):
+        with actions.OverriddenConfig(models.CAN_USE_MEMCACHE.name, True):
+            # Not registered, so the group is found by email address, and
+            # only the group makes the course browsable.
+            actions.login(self.IN_GROUP_STUDENT_EMAIL)
+            response = self.get(self.LESSON_ONE_URL)
+            self.assertEquals(response.status_int, 200)
+
+            actions.login(self.ADMIN_EMAIL)
+            self._put_availability(self.group_id, [])
+            actions.login(self.IN_GROUP_STUDENT_EMAIL)
+            response = self.get(self.LESSON_ONE_URL)
+            self.assertEquals(response.status_int, 302)
+
+
 class I18nTests(StudentGroupsTestBase):
 
     COURSE_URL = 'http://localhost/%s/' % StudentGroupsTestBase.COURSE_NAME
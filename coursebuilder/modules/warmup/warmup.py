@@ -12,11 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Handle /_ah/warmup requests on instance start."""
+"""Handle /_ah/warmup requests on instance start.
+
+Modules marked lazy in their manifests are imported on the first request to
+one of their routes. The main Python modules of those listed in the
+GCB_WARMUP_MODULES variable in app.yaml are instead imported here, before
+the instance serves user requests.
+"""
 
 __author__ = 'Mike Gainer (mgainer@google.com)'
 
 import logging
+import os
 import urlparse
 import webapp2
 
@@ -36,6 +43,13 @@ class WarmupHandler(webapp2.RequestHandler):
     URL = '/_ah/warmup'
 
     def get(self):
+        for module_name in os.environ.get('GCB_WARMUP_MODULES', '').split():
+            try:
+                appengine_config.import_lazy_module(module_name)
+            except Exception:  # pylint: disable=broad-except
+                _LOG.exception('Failed to preload module %s', module_name)
+        appengine_config.log_module_startup_times()
+
         if not appengine_config.PRODUCTION_MODE:
             port = urlparse.urlparse(self.request.url).port
             _LOG.info(' -------------------------------')
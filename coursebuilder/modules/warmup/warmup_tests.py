@@ -16,12 +16,95 @@
 
 __author__ = 'Mike Gainer (mgainer@google.com)'
 
+import os
+import sys
+import types
+
+import webapp2
+import webtest
+
 import appengine_config
+from models import custom_modules
 from modules.warmup import warmup
 from tests.functional import actions
 
+LAZY_MODULE_NAME = 'modules.warmup.lazy_module_for_tests'
+
+
+class _LazyHandler(webapp2.RequestHandler):
+
+    def get(self):
+        self.response.write('Lazy module says hello')
+
+
 class WarmupTests(actions.TestBase):
 
+    def setUp(self):
+        super(WarmupTests, self).setUp()
+        self.registrations = []
+
+        def register_module():
+            self.registrations.append(LAZY_MODULE_NAME)
+            return custom_modules.Module(
+                'Lazy Module For Tests', 'A lazily imported module.',
+                [('/lazy_module_for_tests', _LazyHandler)], [])
+
+        lazy_module = types.ModuleType(LAZY_MODULE_NAME)
+        lazy_module.register_module = register_module
+        sys.modules[LAZY_MODULE_NAME] = lazy_module
+        # pylint: disable=protected-access
+        appengine_config._LAZY_MODULES[LAZY_MODULE_NAME] = [
+            '/lazy_module_for_tests']
+
+    def tearDown(self):
+        # pylint: disable=protected-access
+        del appengine_config._LAZY_MODULES[LAZY_MODULE_NAME]
+        appengine_config._LOADED_LAZY_MODULES.pop(LAZY_MODULE_NAME, None)
+        appengine_config._MODULE_STARTUP_TIMES.pop(LAZY_MODULE_NAME, None)
+        del sys.modules[LAZY_MODULE_NAME]
+        custom_modules.Registry.registered_modules.pop(
+            'Lazy Module For Tests', None)
+        custom_modules.Registry.enabled_module_names.discard(
+            'Lazy Module For Tests')
+        super(WarmupTests, self).tearDown()
+
+    def test_lazy_module_is_imported_on_first_request(self):
+        global_routes, _ = custom_modules.Registry.get_all_routes()
+        lazy_routes = [
+            (route, handler) for route, handler in global_routes
+            if route == '/lazy_module_for_tests']
+        self.assertEquals(1, len(lazy_routes))
+        self.assertEquals([], self.registrations)
+
+        app = webtest.TestApp(webapp2.WSGIApplication(lazy_routes))
+        for _ in xrange(2):
+            response = app.get('/lazy_module_for_tests')
+            self.assertEquals('Lazy module says hello', response.body)
+        self.assertEquals([LAZY_MODULE_NAME], self.registrations)
+        self.assertIn(
+            'Lazy Module For Tests',
+            custom_modules.Registry.enabled_module_names)
+
+    def test_warmup_preloads_configured_modules(self):
+        self.swap(os, 'environ', dict(
+            os.environ, GCB_WARMUP_MODULES=LAZY_MODULE_NAME))
+        self.get('http://localhost:8081' + warmup.WarmupHandler.URL)
+        self.assertEquals([LAZY_MODULE_NAME], self.registrations)
+        self.assertLogContains('Loaded lazy module %s' % LAZY_MODULE_NAME)
+
+    def test_warmup_logs_modules_that_are_not_lazy(self):
+        self.swap(os, 'environ', dict(
+            os.environ, GCB_WARMUP_MODULES='modules.warmup.warmup'))
+        self.get('http://localhost:8081' + warmup.WarmupHandler.URL)
+        self.assertLogContains('Failed to preload module modules.warmup.warmup')
+
+    def test_module_startup_times_are_recorded(self):
+        times = dict(appengine_config.get_module_startup_times())
+        self.assertIn('modules.warmup.warmup', times)
+        self.assertEquals(
+            set(['import', 'register', 'enable']),
+            set(times['modules.warmup.warmup'].keys()))
+
     def test_warmup_dev(self):
         self.get('http://localhost:8081' + warmup.WarmupHandler.URL)
         self.assertLogContains('Course Builder is now available')
@@ -57,11 +57,12 @@ ALL_TEST_CLASSES = {
     'tests.functional.common_crypto.PiiObfuscationHmac': 2,
     'tests.functional.common_crypto.GenCryptoKeyFromHmac': 2,
     'tests.functional.common_crypto.GetExternalUserIdTests': 4,
-    'tests.functional.common_manifest.ModuleManifestTests': 7,
+    'tests.functional.common_manifest.ModuleManifestTests': 8,
     'tests.functional.common_users.AppEnginePassthroughUsersServiceTest': 10,
     'tests.functional.common_users.AuthInterceptorAndRequestHooksTest': 2,
     'tests.functional.common_users.PublicExceptionsAndClassesIdentityTests': 2,
     'tests.functional.common_user_routes.TestUserRoutes': 9,
+    'tests.functional.controllers_utils.AbstractAllCoursesCronHandlerTest': 3,
     'tests.functional.controllers_utils.LocalizedGlobalHandlersTest': 4,
     'tests.functional.i18n.I18NCourseSettingsTests': 7,
     'tests.functional.i18n.I18NMultipleChoiceQuestionTests': 6,
@@ -73,24 +74,24 @@ ALL_TEST_CLASSES = {
     'tests.functional.model_config.ValueLoadingTests': 2,
     'tests.functional.model_courses.CourseCachingTest': 5,
     'tests.functional.model_courses.PermissionsTest': 4,
-    'tests.functional.model_data_sources.PaginatedTableTest': 17,
+    'tests.functional.model_data_sources.PaginatedTableTest': 18,
     'tests.functional.model_data_sources.PiiExportTest': 4,
     'tests.functional.model_entities.BaseEntityTestCase': 3,
     'tests.functional.model_entities.ExportEntityTestCase': 2,
     'tests.functional.model_entities.EntityTransformsTest': 4,
     'tests.functional.model_jobs.JobOperationsTest': 15,
     'tests.functional.model_jobs.MapReduceMethodTypeTests': 2,
-    'tests.functional.model_models.BaseJsonDaoTestCase': 1,
+    'tests.functional.model_models.BaseJsonDaoTestCase': 2,
     'tests.functional.model_models.ContentChunkTestCase': 16,
     'tests.functional.model_models.EventEntityTestCase': 1,
-    'tests.functional.model_models.MemcacheManagerTestCase': 4,
+    'tests.functional.model_models.MemcacheManagerTestCase': 5,
     'tests.functional.model_models.PersonalProfileTestCase': 1,
     'tests.functional.model_models.QuestionDAOTestCase': 3,
     'tests.functional.model_models.StudentAnswersEntityTestCase': 1,
     'tests.functional.model_models.StudentLifecycleObserverTestCase': 16,
     'tests.functional.model_models.StudentProfileDAOTestCase': 6,
     'tests.functional.model_models.StudentPropertyEntityTestCase': 1,
-    'tests.functional.model_models.StudentTestCase': 11,
+    'tests.functional.model_models.StudentTestCase': 12,
     'tests.functional.model_permissions.PermissionsTests': 4,
     'tests.functional.model_permissions.SimpleSchemaPermissionTests': 16,
     'tests.functional.model_student_work.KeyPropertyTest': 4,
@@ -121,7 +122,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.test_classes.CourseUrlRewritingTest': 44,
     'tests.functional.test_classes.DatastoreBackedCustomCourseTest': 6,
     'tests.functional.test_classes.DatastoreBackedSampleCourseTest': 44,
-    'tests.functional.test_classes.EtlMainTestCase': 46,
+    'tests.functional.test_classes.EtlMainTestCase': 50,
     'tests.functional.test_classes.EtlTranslationRoundTripTest': 1,
     'tests.functional.test_classes.ExtensionSwitcherTests': 3,
     'tests.functional.test_classes.InaccessiblePageHandlingTest': 7,
@@ -135,7 +136,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.test_classes.ProgressTests': 1,
     'tests.functional.test_classes.StaticHandlerTest': 3,
     'tests.functional.test_classes.StudentAspectTest': 19,
-    'tests.functional.test_classes.StudentKeyNameTest': 8,
+    'tests.functional.test_classes.StudentKeyNameTest': 10,
     'tests.functional.test_classes.TransformsEntitySchema': 1,
     'tests.functional.test_classes.TransformsJsonFileTestCase': 3,
     'tests.functional.test_classes.VirtualFileSystemTest': 44,
@@ -151,6 +152,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.whitelist.WhitelistTest': 14,
     'tests.unit.etl_mapreduce.HistogramTests': 5,
     'tests.unit.etl_mapreduce.FlattenJsonTests': 4,
+    'tests.unit.etl_mapreduce.LocalRunnerTests': 3,
     'tests.unit.etl_remote.EnvironmentTests': 3,
     'tests.unit.common_catch_and_log.CatchAndLogTests': 6,
     'tests.unit.common_locales.LocalesTests': 2,
@@ -178,9 +180,13 @@ ALL_TEST_CLASSES = {
     'tests.unit.common_utils.ZipAwareOpenTests': 2,
     'tests.unit.javascript_tests.AllJavaScriptTests': 2,
     'tests.unit.models_analytics.AnalyticsTests': 6,
+    'tests.unit.models_columnar.ColumnarTests': 8,
     'tests.unit.models_config.ValidateIntegerRangeTests': 3,
+    'tests.unit.models_courses.EnvironCopyTests': 7,
     'tests.unit.models_courses.WorkflowValidationTests': 13,
+    'tests.unit.models_courses.WorkflowCacheTests': 5,
     'tests.unit.models_transforms.JsonToDictTests': 13,
+    'tests.unit.models_transforms.JsonCodecTests': 8,
     'tests.unit.models_transforms.JsonParsingTests': 3,
     'tests.unit.models_transforms.SchemaValidationTests': 21,
     'tests.unit.models_transforms.StringValueConversionTests': 2,
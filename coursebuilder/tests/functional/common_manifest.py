@@ -72,7 +72,25 @@ class ModuleManifestTests(unittest.TestCase):
         # Verify default settings.
         self.assertIsNone(manifest.get_registration().main_module)
         self.assertTrue(manifest.get_registration().enabled)
+        self.assertFalse(manifest.get_registration().lazy)
 
+    def test_lazy_registration_is_parsed(self):
+        manifest_data = '''
+            registration:
+                main_module: modules.sample.sample
+                lazy: True
+                global_routes:
+                    - /sample/one
+                    - /sample/two
+            files:
+                - manifest.yaml
+            '''
+        manifest = manifests.ModuleManifest('sample',
+                                            manifest_data=manifest_data)
+        self.assertTrue(manifest.get_registration().lazy)
+        self.assertEquals(
+            ['/sample/one', '/sample/two'],
+            manifest.get_registration().global_routes)
 
     def test_module_manifest_is_validated_1(self):
         manifest_data = '''
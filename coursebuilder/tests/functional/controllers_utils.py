@@ -19,7 +19,9 @@ import os
 import appengine_config
 
 from common import users
+from controllers import sites
 from controllers import utils
+from models import jobs
 from tests.functional import actions
 
 
@@ -65,3 +67,102 @@ class LocalizedGlobalHandlersTest(actions.TestBase):
         response = self.testapp.get('/')
 
         self.assertIn('Success!', response.body)
+
+
+class CountingCronHandler(utils.AbstractAllCoursesCronHandler):
+
+    actions = []
+    fail_namespaces = set()
+    state_version = None
+
+    @classmethod
+    def is_globally_enabled(cls):
+        return True
+
+    @classmethod
+    def is_enabled_for_course(cls, app_context):
+        return app_context.get_namespace_name() in ('ns_first', 'ns_second')
+
+    @classmethod
+    def get_course_state_version(cls, app_context):
+        return cls.state_version
+
+    def cron_action(self, app_context, global_state):
+        namespace = app_context.get_namespace_name()
+        self.actions.append(namespace)
+        if namespace in self.fail_namespaces:
+            raise ValueError('Failed in %s' % namespace)
+
+
+class AbstractAllCoursesCronHandlerTest(actions.TestBase):
+
+    def setUp(self):
+        super(AbstractAllCoursesCronHandlerTest, self).setUp()
+        self.first = actions.simple_add_course(
+            'first', 'admin@example.com', 'First')
+        self.second = actions.simple_add_course(
+            'second', 'admin@example.com', 'Second')
+        CountingCronHandler.actions = []
+        CountingCronHandler.fail_namespaces = set()
+        CountingCronHandler.state_version = None
+
+    def tearDown(self):
+        sites.reset_courses()
+        super(AbstractAllCoursesCronHandlerTest, self).tearDown()
+
+    def _statuses(self):
+        return dict(
+            (ns, jobs.CronCourseStatusEntity.get_or_new(
+                CountingCronHandler.__name__, ns))
+            for ns in ['ns_first', 'ns_second'])
+
+    def test_serial_run_records_outcomes(self):
+        CountingCronHandler.fail_namespaces = set(['ns_second'])
+        CountingCronHandler._for_testing_only_get()
+
+        self.assertEquals(
+            ['ns_first', 'ns_second'], CountingCronHandler.actions)
+        statuses = self._statuses()
+        self.assertEquals(
+            jobs.CronCourseStatusEntity.OUTCOME_SUCCEEDED,
+            statuses['ns_first'].outcome)
+        self.assertEquals(
+            jobs.CronCourseStatusEntity.OUTCOME_FAILED,
+            statuses['ns_second'].outcome)
+        self.assertEquals('Failed in ns_second', statuses['ns_second'].error)
+
+    def test_unchanged_courses_are_skipped(self):
+        CountingCronHandler.state_version = 'v1'
+        CountingCronHandler._for_testing_only_get()
+        CountingCronHandler._for_testing_only_get()
+        self.assertEquals(
+            ['ns_first', 'ns_second'], CountingCronHandler.actions)
+        run_id = self._statuses()['ns_first'].run_id
+        self.assertEquals(
+            2, CountingCronHandler.get_run_summary(run_id)[
+                jobs.CronCourseStatusEntity.OUTCOME_UNCHANGED])
+
+        CountingCronHandler.state_version = 'v2'
+        CountingCronHandler._for_testing_only_get()
+        self.assertEquals(
+            ['ns_first', 'ns_second', 'ns_first', 'ns_second'],
+            CountingCronHandler.actions)
+
+    def test_fan_out_runs_each_course_in_its_own_task(self):
+        with actions.OverriddenConfig(
+            utils.CAN_FAN_OUT_ALL_COURSES_CRON.name, True):
+            CountingCronHandler._for_testing_only_get()
+
+        self.assertEquals([], CountingCronHandler.actions)
+        run_id = self._statuses()['ns_first'].run_id
+        self.assertEquals(
+            2, CountingCronHandler.get_run_summary(run_id)[
+                jobs.CronCourseStatusEntity.OUTCOME_QUEUED])
+
+        self.execute_all_deferred_tasks(
+            queue_name=CountingCronHandler.FAN_OUT_QUEUE_NAME)
+        self.assertEquals(
+            ['ns_first', 'ns_second'], sorted(CountingCronHandler.actions))
+        self.assertEquals(
+            2, CountingCronHandler.get_run_summary(run_id)[
+                jobs.CronCourseStatusEntity.OUTCOME_SUCCEEDED])
@@ -16,6 +16,7 @@
 
 __author__ = 'Mike Gainer (mgainer@google.com)'
 
+import cStringIO
 import time
 
 from webtest import app
@@ -23,6 +24,7 @@ from webtest import app
 from common import catch_and_log
 from common import crypto
 from common import utils as common_utils
+from models import columnar
 from models import data_sources
 from models import entities
 from models import transforms
@@ -178,6 +180,22 @@ class PaginatedTableTest(DataSourceTest):
         self.assertEquals([], response['params']['filters'])
         self.assertEquals([], response['params']['orderings'])
 
+    def test_columnar_read(self):
+        actions.login('admin@google.com', is_admin=True)
+
+        response = self.get('/rest/data/character/items?format=columnar')
+        self.assertEquals(columnar.CONTENT_TYPE, response.content_type)
+        reader = columnar.ColumnarReader(cStringIO.StringIO(response.body))
+        self.assertEquals(len(self.characters), reader.num_rows)
+        self.assertIn('rank', reader.column_names)
+        self.assertNotIn('name', reader.column_names)  # blacklisted
+        self._verify_data(self.characters, list(reader.iter_rows()))
+        self.assertEquals(
+            [c.rank for c in self.characters], list(reader.iter_column('rank')))
+        self.assertEquals('character', reader.metadata['source'])
+        self.assertEquals(0, reader.metadata['page_number'])
+        self.assertIn('source_context', reader.metadata)
+
     def test_admin_required(self):
         with self.assertRaisesRegexp(app.AppError, 'Bad response: 403'):
             self.get('/rest/data/character/items')
@@ -379,6 +379,17 @@ class MemcacheManagerTestCase(actions.TestBase):
         data = models.MemcacheManager.get_multi(['a', 'b', 'c'])
         self.assertEquals(0, len(data.keys()))
 
+    def test_incr_of_missing_key_is_seen_in_readonly_section(self):
+        models.MemcacheManager.begin_readonly()
+        try:
+            self.assertIsNone(models.MemcacheManager.get('stamp'))
+            value = models.MemcacheManager.incr(
+                'stamp', 1, initial_value=10)
+            self.assertEquals(11, value)
+            self.assertEquals(11, models.MemcacheManager.get('stamp'))
+        finally:
+            models.MemcacheManager.end_readonly()
+
 
 class TestEntity(entities.BaseEntity):
     data = db.TextProperty(indexed=False)
@@ -454,6 +465,30 @@ class BaseJsonDaoTestCase(actions.TestBase):
 
         assert_bulk_load_succeeds()
 
+    def test_get_all_mapped_is_sharded_across_memcache_entries(self):
+        # Ten entities of 300KB each need several memcache shards.
+        padding = 'x' * 300 * 1000
+        for i in xrange(10):
+            TestDao.save(TestDto('dto_%d' % i, {'a': i, 'padding': padding}))
+        self.assertEquals(10, len(TestDao.get_all_mapped()))
+
+        version_key = '(entity-get-all-version:TestEntity)'
+        version = models.MemcacheManager.get(version_key)
+        shards = models.MemcacheManager.get_multi(
+            TestDao._memcache_all_keys(version))
+        self.assertEquals(4, len(shards))
+
+        # Remove the entities behind the DAO's back; the cached copy is used.
+        db.delete(TestEntity.all(keys_only=True).fetch(None))
+        dtos = TestDao.get_all_mapped()
+        self.assertEquals(range(10), sorted(d.dict['a'] for d in dtos.values()))
+
+        # Saving bumps the version stamp, so the old shards are not used.
+        TestDao.save(TestDto('dto_10', {'a': 10}))
+        self.assertNotEquals(
+            version, models.MemcacheManager.get(version_key))
+        self.assertEquals(['dto_10'], TestDao.get_all_mapped().keys())
+
 
 class QuestionDAOTestCase(actions.TestBase):
     """Functional tests for QuestionDAO."""
@@ -525,6 +560,7 @@ class StudentTestCase(actions.ExportTestBase):
 
     def tearDown(self):
         users.UsersServiceManager.set(self.old_users_service)
+        config.Registry.test_overrides = {}
         super(StudentTestCase, self).tearDown()
 
     def test_federated_email_returns_and_caches_none_by_default(self):
@@ -677,6 +713,32 @@ class StudentTestCase(actions.ExportTestBase):
 
         self.assertEquals(old_enough, student.last_seen_on)
 
+    def test_get_by_user_id_caches_students_and_non_students(self):
+        config.Registry.test_overrides = {models.CAN_USE_MEMCACHE.name: True}
+
+        # A miss is cached, so a Student written behind the cache's back is
+        # not seen until the cache entry is removed.
+        self.assertIsNone(models.Student.get_by_user_id('1'))
+        db.put(models.Student(key_name='1', user_id='1', name='One'))
+        models.StudentCache.clear_all()
+        self.assertIsNone(models.Student.get_by_user_id('1'))
+
+        models.StudentCache.remove('1')
+        self.assertEquals('One', models.Student.get_by_user_id('1').name)
+
+        # A hit is cached across requests as well.
+        db.delete(db.Key.from_path(models.Student.kind(), '1'))
+        models.StudentCache.clear_all()
+        self.assertEquals('One', models.Student.get_by_user_id('1').name)
+
+        # Student.put() and delete() keep the cache up to date.
+        student = models.Student(key_name='2', user_id='2', name='Two')
+        self.assertIsNone(models.Student.get_by_user_id('2'))
+        student.put()
+        self.assertEquals('Two', models.Student.get_by_user_id('2').name)
+        student.delete()
+        self.assertIsNone(models.Student.get_by_user_id('2'))
+
 
 class StudentProfileDAOTestCase(actions.ExportTestBase):
 
@@ -47,6 +47,7 @@ from controllers import sites
 from controllers import utils
 from controllers.utils import XsrfTokenManager
 import main
+from models import columnar
 from models import config
 from models import courses
 from models import entities
@@ -2281,6 +2282,7 @@ class StudentKeyNameTest(actions.TestBase):
 
     def tearDown(self):
         models.Student._LEGACY_EMAIL_AS_KEY_NAME_ENABLED = self._old_enabled
+        models.StudentCache._MIGRATED_NAMESPACES.clear()
         super(StudentKeyNameTest, self).tearDown()
 
     def _assert_user_lookups_work(self, user, by_email=True):
@@ -2354,6 +2356,59 @@ class StudentKeyNameTest(actions.TestBase):
             email='user2@google.com', _user_id=user1.user_id()), by_email=False)
         self._assert_user_lookups_work(user2)
 
+    def test_legacy_student_keys_are_migrated(self):
+        models.Student._LEGACY_EMAIL_AS_KEY_NAME_ENABLED = True
+        user = actions.login('legacy_user@google.com')
+        actions.register(self, 'Legacy User')
+        self.assertEqual(
+            user.email(), models.Student.get_by_user(user).key().name())
+
+        models.Student._LEGACY_EMAIL_AS_KEY_NAME_ENABLED = False
+        app_context = sites.get_all_courses()[0]
+        models.LegacyStudentKeyMigrationJob(app_context).submit()
+        self.execute_all_deferred_tasks()
+
+        self.assertIsNone(models.Student.get_by_key_name(user.email()))
+        student = models.Student.get_by_user(user)
+        self.assertEqual(user.user_id(), student.key().name())
+        self.assertEqual(user.email(), student.email)
+        self.assertEqual('Legacy User', student.name)
+        self.assertTrue(student.is_enrolled)
+        self.assertIn(
+            app_context.get_namespace_name(),
+            models.StudentCache._MIGRATED_NAMESPACES)
+        self._assert_user_lookups_work(user)
+
+    def test_legacy_student_with_peer_review_data_is_not_migrated(self):
+        models.Student._LEGACY_EMAIL_AS_KEY_NAME_ENABLED = True
+        user = actions.login('legacy_user@google.com')
+        actions.register(self, 'Legacy User')
+        student = models.Student.get_by_user(user)
+        student_work.Submission.write('1', student.key(), 'submitted')
+        actions.logout()
+        other_user = actions.login('other_legacy_user@google.com')
+        actions.register(self, 'Other Legacy User')
+
+        models.Student._LEGACY_EMAIL_AS_KEY_NAME_ENABLED = False
+        app_context = sites.get_all_courses()[0]
+        job = models.LegacyStudentKeyMigrationJob(app_context)
+        job.submit()
+        self.execute_all_deferred_tasks()
+
+        student = models.Student.get_by_user(user)
+        self.assertEqual(user.email(), student.key().name())
+        self.assertEqual(
+            'submitted',
+            student_work.Submission.get_contents('1', student.key()))
+        self.assertEqual(
+            other_user.user_id(),
+            models.Student.get_by_user(other_user).key().name())
+        self.assertEqual(jobs.STATUS_CODE_FAILED, job.load().status_code)
+        self.assertNotIn(
+            app_context.get_namespace_name(),
+            models.StudentCache._MIGRATED_NAMESPACES)
+        self._assert_user_lookups_work(user)
+
     def test_two_users_with_identical_emails_can_register(self):
         self.assertEqual(0, len(models.Student.all().fetch(2)))
 
@@ -5253,6 +5308,106 @@ class EtlMainTestCase(testing.EtlTestBase, DatastoreBackedCourseTest):
                 self.reset_filesystem()
                 self._test_resume_download(what, archive_type)
 
+    def _get_parallel_download_args(self, *extra_args):
+        return etl.create_args_parser().parse_args(
+            [etl._MODE_DOWNLOAD] + self.common_datastore_args +
+            ['--datastore_types', 'QuestionEntity', '--batch_size', '5',
+             '--workers', '2'] + list(extra_args))
+
+    def test_parallel_download_datastore_round_trips(self):
+        with Namespace(self.namespace):
+            db.put([models.QuestionEntity() for _ in xrange(25)])
+        etl.main(
+            self._get_parallel_download_args('--shards_per_type', '2'),
+            testing=True)
+
+        archive = etl._init_archive(self.archive_path, etl.ARCHIVE_TYPE_ZIP)
+        archive.open('r')
+        paths = [e.path for e in archive.manifest.entities]
+        self.assertTrue(paths)
+        for path in paths:
+            self.assertTrue(path.startswith('models/QuestionEntity/'))
+            self.assertTrue(path.endswith(etl._PART_SUFFIX))
+        self.assertTrue(all(
+            shard['done'] for shard in
+            archive.manifest.shards['QuestionEntity']))
+        count, read_rows = etl._open_archived_rows(archive, 'QuestionEntity')
+        self.assertEqual(25, count)
+        self.assertEqual(25, len(list(read_rows(0))))
+
+        with Namespace(self.namespace):
+            db.delete(models.QuestionEntity.all(keys_only=True).run())
+        etl.main(etl.create_args_parser().parse_args(
+            [etl._MODE_UPLOAD] + self.common_datastore_args), testing=True)
+        with Namespace(self.namespace):
+            self.assertEqual(25, models.QuestionEntity.all().count())
+
+    def test_columnar_download_round_trips(self):
+        with Namespace(self.namespace):
+            db.put([models.QuestionEntity(data='q%d' % i) for i in xrange(7)])
+        etl.main(etl.create_args_parser().parse_args(
+            [etl._MODE_DOWNLOAD] + self.common_datastore_args +
+            ['--datastore_types', 'QuestionEntity', '--export_format',
+             'columnar']), testing=True)
+
+        archive = etl._init_archive(self.archive_path, etl.ARCHIVE_TYPE_ZIP)
+        archive.open('r')
+        self.assertEqual(
+            ['models/QuestionEntity.columnar'],
+            [e.path for e in archive.manifest.entities])
+        reader = columnar.ColumnarReader(cStringIO.StringIO(
+            archive.get('models/QuestionEntity.columnar')))
+        self.assertEqual(7, reader.num_rows)
+        self.assertEqual(
+            sorted('q%d' % i for i in xrange(7)),
+            sorted(reader.iter_column('data')))
+        archive.close()
+
+        with Namespace(self.namespace):
+            db.delete(models.QuestionEntity.all(keys_only=True).run())
+        etl.main(etl.create_args_parser().parse_args(
+            [etl._MODE_UPLOAD] + self.common_datastore_args), testing=True)
+        with Namespace(self.namespace):
+            self.assertEqual(
+                sorted('q%d' % i for i in xrange(7)),
+                sorted(q.data for q in models.QuestionEntity.all()))
+
+    def test_parallel_download_resumes_shards_from_manifest(self):
+        with Namespace(self.namespace):
+            db.put([models.QuestionEntity() for _ in xrange(25)])
+        args = self._get_parallel_download_args(
+            '--shards_per_type', '1', '--resume')
+        self.swap(etl, '_PART_ROWS', 5)
+
+        # Fail on the third batch, after two parts have been written.
+        fetch_shard_batch = etl._fetch_shard_batch
+        calls = []
+        def failing_fetch_shard_batch(*args):
+            calls.append(args)
+            if len(calls) == 3:
+                raise RuntimeError('Fake error for testing')
+            return fetch_shard_batch(*args)
+        self.swap(etl, '_fetch_shard_batch', failing_fetch_shard_batch)
+
+        with self.assertRaisesRegexp(RuntimeError, 'Fake error for testing'):
+            etl.main(args, testing=True)
+        archive = etl._init_archive(self.archive_path, etl.ARCHIVE_TYPE_ZIP)
+        archive.open('r')
+        shard = archive.manifest.shards['QuestionEntity'][0]
+        self.assertEqual(2, shard['parts'])
+        self.assertFalse(shard['done'])
+        archive.close()
+
+        etl.main(args, testing=True)
+        archive = etl._init_archive(self.archive_path, etl.ARCHIVE_TYPE_ZIP)
+        archive.open('r')
+        self.assertTrue(archive.manifest.shards['QuestionEntity'][0]['done'])
+        _, read_rows = etl._open_archived_rows(archive, 'QuestionEntity')
+        rows = list(read_rows(0))
+        self.assertEqual(25, len(rows))
+        self.assertEqual(rows[20:], list(read_rows(20)))
+        self.assertEqual(25, len(set(row['key.id'] for row in rows)))
+
     def test_download_datastore_with_privacy_maintains_references(self):
         """Test download of datastore data and archive creation."""
         unsafe_user_id = '1'
@@ -5743,6 +5898,10 @@ class EtlMainTestCase(testing.EtlTestBase, DatastoreBackedCourseTest):
         self.assertIn('All 2 entities already uploaded; skipping',
                       self.get_log())
 
+    def _set_upload_progress(self, offset, dirty_until):
+        progress = etl._UploadProgress.load(self.archive_path)
+        progress.set(self.namespace, 'EtlTestEntityPii', offset, dirty_until)
+
     def test_upload_resumption_with_batch_quantity(self):
         sites.setup_courses(self.raw)
         with Namespace(self.namespace):
@@ -5752,7 +5911,8 @@ class EtlMainTestCase(testing.EtlTestBase, DatastoreBackedCourseTest):
             db.put(batch_two)
         self._download_archive()
 
-        # Simulate 1st batch having partially succeeded, 2nd batch not at all.
+        # Simulate 1st batch having partially succeeded, 2nd batch not at all,
+        # without any progress having been recorded.
         self._clear_datastore()
         with Namespace(self.namespace):
             db.put([x for x in batch_one if x.score % 2])
@@ -5764,15 +5924,17 @@ class EtlMainTestCase(testing.EtlTestBase, DatastoreBackedCourseTest):
         self._clear_datastore()
         with Namespace(self.namespace):
             db.put(batch_one)
+        self._set_upload_progress(20, 20)
         self._upload_archive(['--resume'])
         self.assertIn('Resuming upload at item number 20 of 40.',
                       self.get_log())
 
-        # Simulate 1st batch having fully succeeded, 2nd batch partial
+        # Simulate 1st batch having fully succeeded, 2nd batch partial.
         self._clear_datastore()
         with Namespace(self.namespace):
             db.put(batch_one)
-            db.put([x for x in batch_one if x.score % 2])
+            db.put([x for x in batch_two if x.score % 2])
+        self._set_upload_progress(20, 40)
         self._upload_archive(['--resume'])
         self.assertIn('Resuming upload at item number 20 of 40.',
                       self.get_log())
@@ -5782,6 +5944,42 @@ class EtlMainTestCase(testing.EtlTestBase, DatastoreBackedCourseTest):
         self.assertIn('All 40 entities already uploaded; skipping',
                       self.get_log())
 
+        # Entities past those that may have been written are conflicts.
+        self._clear_datastore()
+        with Namespace(self.namespace):
+            db.put(batch_one)
+            db.put([x for x in batch_two if x.score % 2])
+        self._set_upload_progress(20, 20)
+        with self.assertRaises(SystemExit):
+            self._upload_archive(['--resume'])
+        self.assertLogContains('already exists')
+
+    def test_upload_in_parallel_records_progress(self):
+        sites.setup_courses(self.raw)
+        with Namespace(self.namespace):
+            for _ in xrange(3):
+                db.put(self._build_entity_batch())
+        self._download_archive()
+        self._clear_datastore()
+
+        self._upload_archive(['--workers', '3', '--batch_size', '7'])
+        with Namespace(self.namespace):
+            self.assertEqual(60, EtlTestEntityPii.all().count())
+        progress = etl._UploadProgress.load(self.archive_path)
+        offset, _ = progress.get(self.namespace, 'EtlTestEntityPii')
+        self.assertEqual(60, offset)
+
+        self._upload_archive(['--resume', '--workers', '3'])
+        self.assertIn('All 60 entities already uploaded; skipping',
+                      self.get_log())
+
+        # Downloading again makes the recorded progress stale.
+        self._download_archive(['--force_overwrite'])
+        self._clear_datastore()
+        self._upload_archive(['--resume'])
+        self.assertIn('Resuming upload at item number 0 of 60.',
+                      self.get_log())
+
     def test_is_identity_transform_when_privacy_false(self):
         self.assertEqual(
             1, etl._get_privacy_transform_fn(False, 'no_effect')(1))
@@ -16,12 +16,40 @@
 
 __author__ = 'juliaoh@google.com (Julia Oh)'
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from models import transforms
 from tools.etl import mapreduce
 
 
+class _CountByUser(mapreduce.MapReduceBase):
+
+    def map(self, unused_key, value):
+        json = self.json_parse(value)
+        if json:
+            yield json['user'], 1
+
+    def combine(self, unused_key, values):
+        yield sum(values)
+
+    def reduce(self, key, values):
+        yield {'user': key, 'count': sum(values)}
+
+
+class _CollectLineNumbers(mapreduce.MapReduceBase):
+
+    def map(self, key, value):
+        json = self.json_parse(value)
+        if json:
+            yield 'key', (key, json['index'])
+
+    def reduce(self, unused_key, values):
+        yield {'lines': sorted(values)}
+
+
 class HistogramTests(unittest.TestCase):
 
     def test_get_bin_number(self):
@@ -102,3 +130,52 @@ class FlattenJsonTests(unittest.TestCase):
         assert 'bar' == _flat.get('foo')
         assert 'bum' == _flat.get('good_json_bee')
         assert '{\'\'' == _flat.get('bad_json')
+
+
+class LocalRunnerTests(unittest.TestCase):
+
+    def setUp(self):
+        super(LocalRunnerTests, self).setUp()
+        self.output_dir = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.output_dir, 'input.json')
+        json_file = transforms.JsonFile(self.input_path)
+        json_file.open('w')
+        for index in xrange(1000):
+            json_file.write({'index': index, 'user': 'user%d' % (index % 7)})
+        json_file.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+        super(LocalRunnerTests, self).tearDown()
+
+    def _run(self, mapreduce_class):
+        path = mapreduce.LocalRunner(
+            mapreduce_class, self.input_path, self.output_dir, workers=3,
+            spill_pairs=50).run()
+        self.assertEquals(
+            ['input.json', 'output.json'], sorted(os.listdir(self.output_dir)))
+        with open(path) as fp:
+            return [transforms.loads(line) for line in fp]
+
+    def test_counts_are_combined_and_merged_in_key_order(self):
+        self.assertEquals(
+            [{'user': 'user%d' % n, 'count': 143 if n < 6 else 142}
+             for n in xrange(7)],
+            self._run(_CountByUser))
+
+    def test_keys_are_line_numbers_of_whole_file(self):
+        # The first line of the file opens the JSON object.
+        self.assertEquals(
+            [{'lines': [[index + 1, index] for index in xrange(1000)]}],
+            self._run(_CollectLineNumbers))
+
+    def test_can_run_only_single_phase_jobs(self):
+        self.assertTrue(mapreduce.LocalRunner.can_run(_CountByUser))
+        self.assertTrue(mapreduce.LocalRunner.can_run(mapreduce.CsvGenerator))
+
+        class _Pipeline(_CountByUser):
+
+            def run(self, job):
+                pass
+
+        self.assertFalse(mapreduce.LocalRunner.can_run(_Pipeline))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for models.columnar."""
+
+import collections
+import cStringIO
+import unittest
+
+from models import columnar
+from models import transforms
+
+
+class ColumnarTests(unittest.TestCase):
+
+    SCHEMA = collections.OrderedDict([
+        ('id', {'type': 'integer'}),
+        ('name', {'type': 'string'}),
+        ('score', {'type': 'number'}),
+        ('passed', {'type': 'boolean'}),
+        ('tags', {'type': 'array', 'items': {'type': 'string'}}),
+    ])
+
+    def _write(self, rows, row_group_rows=3, schema=None):
+        stream = cStringIO.StringIO()
+        writer = columnar.ColumnarWriter(
+            stream, schema or self.SCHEMA, metadata={'source': 'test'},
+            row_group_rows=row_group_rows)
+        for row in rows:
+            writer.write(row)
+        writer.close()
+        return columnar.ColumnarReader(cStringIO.StringIO(stream.getvalue()))
+
+    def _make_rows(self, count):
+        return [
+            {'id': i, 'name': u'nämé %d' % i if i % 4 else None,
+             'score': i / 4.0, 'passed': i % 2 == 0, 'tags': ['a', str(i)]}
+            for i in xrange(count)]
+
+    def test_round_trip(self):
+        rows = self._make_rows(10)
+        reader = self._write(rows)
+        self.assertEquals(10, reader.num_rows)
+        self.assertEquals(self.SCHEMA.keys(), reader.column_names)
+        self.assertEquals({'source': 'test'}, reader.metadata)
+        self.assertEquals(rows, list(reader.iter_rows()))
+
+    def test_empty(self):
+        reader = self._write([])
+        self.assertEquals(0, reader.num_rows)
+        self.assertEquals([], list(reader.iter_rows()))
+
+    def test_iter_column(self):
+        rows = self._make_rows(10)
+        reader = self._write(rows)
+        self.assertEquals(
+            [row['name'] for row in rows], list(reader.iter_column('name')))
+        self.assertEquals([7, 8, 9], list(reader.iter_column('id', skip=7)))
+
+    def test_skip_rows(self):
+        rows = self._make_rows(10)
+        reader = self._write(rows)
+        for skip in (0, 2, 3, 4, 9, 10, 11):
+            self.assertEquals(rows[skip:], list(reader.iter_rows(skip)))
+
+    def test_values_not_matching_type_are_kept_as_json(self):
+        rows = [{'id': 1}, {'id': 'two'}, {'id': 2 ** 70}, {'id': True}]
+        reader = self._write(rows, row_group_rows=1)
+        self.assertEquals(
+            [1, 'two', 2 ** 70, True], list(reader.iter_column('id')))
+
+    def test_columns_not_in_schema_are_dropped(self):
+        reader = self._write([{'id': 1, 'extra': 2}])
+        self.assertEquals(
+            [{'id': 1, 'name': None, 'score': None, 'passed': None,
+              'tags': None}],
+            list(reader.iter_rows()))
+
+    def test_smaller_than_json(self):
+        rows = self._make_rows(1000)
+        stream = cStringIO.StringIO()
+        writer = columnar.ColumnarWriter(stream, self.SCHEMA)
+        for row in rows:
+            writer.write(row)
+        writer.close()
+        self.assertLess(
+            len(stream.getvalue()), len(transforms.dumps({'rows': rows})) / 4)
+
+    def test_not_a_columnar_file(self):
+        with self.assertRaises(columnar.ColumnarFormatError):
+            columnar.ColumnarReader(cStringIO.StringIO('{"rows": []}'))
@@ -13,14 +13,18 @@
 # limitations under the License.
 
 
-"""Unit tests for the Workflow class in models.courses."""
+"""Unit tests for the Workflow class and helpers in models.courses."""
 
 __author__ = 'Sean Lip (sll@google.com)'
 
+import copy
+import datetime
+import pickle
 import unittest
 
 import yaml
 
+from models import courses
 from models.courses import LEGACY_HUMAN_GRADER_WORKFLOW
 from models.courses import Workflow
 
@@ -234,3 +238,134 @@ class WorkflowValidationTests(unittest.TestCase):
         workflow = Workflow(self.to_yaml(workflow_dict))
         workflow.validate(self.errors)
         self.assertFalse(self.errors)
+
+
+class EnvironCopyTests(unittest.TestCase):
+    """Unit tests for the copies of the course environ."""
+
+    def setUp(self):
+        self.base = {
+            'course': {'title': 'Base', 'now_available': False},
+            'reg_form': {'can_register': True, 'whitelist': ''},
+            'extra_locales': [{'locale': 'fr', 'availability': 'available'}],
+            'version': 13,
+        }
+        self.expected_base = copy.deepcopy(self.base)
+
+    def test_reads_see_base_values(self):
+        env = courses._EnvironCopy(self.base)
+        self.assertEqual(self.base, env)
+        self.assertEqual('Base', env['course']['title'])
+        self.assertEqual(13, env.get('version'))
+        self.assertIsNone(env.get('missing'))
+
+    def test_nested_writes_do_not_reach_base(self):
+        env = courses._EnvironCopy(self.base)
+        courses.Course.set_named_course_setting_in_environ(
+            'now_available', env, True)
+        courses.Course.set_whitelist_into_environ('a@example.com', env)
+        env['extra_locales'].append({'locale': 'de'})
+        env.setdefault('new', {})['key'] = 'value'
+        del env['version']
+        self.assertTrue(env['course']['now_available'])
+        self.assertEqual('a@example.com', env['reg_form']['whitelist'])
+        self.assertEqual(2, len(env['extra_locales']))
+        self.assertEqual({'key': 'value'}, env['new'])
+        self.assertNotIn('version', env)
+        self.assertEqual(self.expected_base, self.base)
+
+    def test_iteration_and_pop_do_not_expose_base(self):
+        env = courses._EnvironCopy(self.base)
+        for unused_key, value in env.iteritems():
+            if isinstance(value, dict):
+                value.clear()
+        for value in env.values():
+            if isinstance(value, list):
+                del value[:]
+        env.pop('course')['title'] = 'Popped'
+        self.assertEqual(self.expected_base, self.base)
+
+    def test_plain_dict_copies_do_not_expose_base(self):
+        env = courses._EnvironCopy(self.base)
+        copied = dict(env)
+        copied['course']['title'] = 'Copied'
+        updated = {}
+        updated.update(env)
+        updated['reg_form']['can_register'] = False
+        dict(**env)['extra_locales'].append({'locale': 'de'})
+        self.assertEqual(self.expected_base, self.base)
+
+    def test_values_set_by_holder_are_not_copied(self):
+        env = courses._EnvironCopy(self.base)
+        value = {'a': 1}
+        env['course'] = value
+        value['b'] = 2
+        self.assertIs(value, env['course'])
+
+    def test_copies_are_independent(self):
+        first = courses._EnvironCopy(self.base)
+        second = courses._EnvironCopy(self.base)
+        first['course']['title'] = 'First'
+        self.assertEqual('Base', second['course']['title'])
+
+    def test_serializes_as_plain_dict(self):
+        env = courses._EnvironCopy(self.base)
+        env['course']['title'] = 'Changed'
+        expected = copy.deepcopy(self.base)
+        expected['course']['title'] = 'Changed'
+        self.assertEqual(expected, yaml.safe_load(yaml.safe_dump(env)))
+        for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+            self.assertEqual(
+                expected, pickle.loads(pickle.dumps(env, protocol)))
+        self.assertEqual(expected, copy.deepcopy(env))
+        self.assertEqual(dict, type(copy.deepcopy(env)))
+
+
+class WorkflowCacheTests(unittest.TestCase):
+    """Unit tests for parsed workflows shared through the process cache."""
+
+    def setUp(self):
+        self.yaml_str = LEGACY_HUMAN_GRADER_WORKFLOW
+
+    def test_same_text_returns_same_workflow(self):
+        workflow = Workflow.get_cached(self.yaml_str)
+        self.assertIs(workflow, Workflow.get_cached(self.yaml_str))
+        self.assertIsNot(
+            workflow, Workflow.get_cached(courses.DEFAULT_AUTO_GRADER_WORKFLOW))
+
+    def test_getters_match_uncached_workflow(self):
+        cached = Workflow.get_cached(self.yaml_str)
+        uncached = Workflow(self.yaml_str)
+        self.assertEqual(datetime.datetime(2099, 3, 14, 12, 0),
+                         cached.get_submission_due_date())
+        for getter in (
+                'get_grader', 'get_matcher', 'is_single_submission',
+                'get_submission_due_date', 'show_feedback',
+                'get_review_due_date', 'get_review_min_count',
+                'get_review_window_mins', 'to_dict', 'to_yaml'):
+            self.assertEqual(
+                getattr(uncached, getter)(), getattr(cached, getter)())
+
+    def test_to_dict_returns_a_copy(self):
+        workflow = Workflow.get_cached(self.yaml_str)
+        workflow.to_dict()[courses.GRADER_KEY] = courses.AUTO_GRADER
+        self.assertEqual(courses.HUMAN_GRADER, workflow.get_grader())
+
+    def test_empty_workflow(self):
+        workflow = Workflow.get_cached('')
+        self.assertEqual({}, workflow.to_dict())
+        self.assertIsNone(workflow.get_grader())
+        self.assertIsNone(workflow.get_submission_due_date())
+
+    def test_invalid_date_is_reported_by_its_getter_only(self):
+        yaml_str = yaml.safe_dump({
+            courses.GRADER_KEY: courses.HUMAN_GRADER,
+            courses.SUBMISSION_DUE_DATE_KEY: 'not a date'})
+        workflow = Workflow.get_cached(yaml_str)
+        self.assertEqual(courses.HUMAN_GRADER, workflow.get_grader())
+        self.assertIsNone(workflow.get_review_due_date())
+        with self.assertRaises(ValueError):
+            workflow.get_submission_due_date()
+        errors = []
+        self.assertFalse(workflow.validate(errors))
+        self.assertEqual(1, len(errors))
@@ -1,3 +1,4 @@
+# -*- coding: utf-8 -*-
 # Copyright 2013 Google Inc. All Rights Reserved.
 #
 # Licensed under the Apache License, Version 2.0 (the "License");
@@ -18,6 +19,10 @@
 __author__ = 'John Orr (jorr@google.com)'
 
 import datetime
+import json
+import logging
+import StringIO
+import time
 import unittest
 
 from common import schema_fields
@@ -235,6 +240,193 @@ class JsonParsingTests(unittest.TestCase):
         assert _json.get('foo') == 'bar'
 
 
+def _legacy_dumps(*args, **kwargs):
+    """The dumps() implementation the fast path must stay identical to."""
+
+    def set_encoder(obj):
+        if isinstance(obj, set):
+            return list(obj)
+        return None
+
+    def string_escape(in_str):
+        out = StringIO.StringIO()
+        for c in in_str.decode('utf8'):
+            char_val = ord(c)
+            if char_val > 0x7f or c == '<' or c == '>':
+                out.write('\\u%04X' % char_val)
+            else:
+                out.write(c)
+        return out.getvalue()
+
+    class CustomJSONEncoder(json.JSONEncoder):
+
+        def default(self, obj):
+            for f in transforms.CUSTOM_JSON_ENCODERS + [set_encoder]:
+                value = f(obj)
+                if value is not None:
+                    return value
+            return super(CustomJSONEncoder, self).default(obj)
+
+    if 'cls' not in kwargs:
+        kwargs['cls'] = CustomJSONEncoder
+    return string_escape(json.dumps(*args, **kwargs))
+
+
+def _make_progress_payload(num_units=40, num_lessons=12):
+    """Returns a dict shaped like a StudentPropertyEntity progress blob."""
+    progress = {}
+    for unit in xrange(num_units):
+        progress['u.%d' % unit] = unit % 3
+        for lesson in xrange(num_lessons):
+            progress['u.%d.l.%d' % (unit, lesson)] = lesson % 3
+            progress['u.%d.l.%d.h.%d' % (unit, lesson, lesson)] = {
+                'c': {'activity-%d' % lesson: 2}}
+        progress['s.assessment-%d' % unit] = {'score': unit * 2.5}
+    return progress
+
+
+def _make_event_payload(num_answers=200):
+    """Returns a dict shaped like an EventEntity 'data' for an activity."""
+    return {
+        'type': 'activity-choice',
+        'location': 'https://example.com/course/unit?unit=3&lesson=7',
+        'user_agent': 'Mozilla/5.0 (X11; Linux x86_64) <script>',
+        'index': 4,
+        'value': u'Réponse «<b>juste</b>» 中文',
+        'answers': [
+            {'index': i, 'correct': i % 2 == 0, 'response': u'rép %d' % i,
+             'score': i / 7.0, 'tags': set(['t%d' % (i % 5)])}
+            for i in xrange(num_answers)],
+    }
+
+
+def _make_course_memento_payload(num_units=30, num_lessons=10):
+    """Returns a dict shaped like a course.json version 13 memento."""
+    units = []
+    lessons = []
+    for unit in xrange(num_units):
+        units.append({
+            'unit_id': unit, 'type': 'U', 'title': u'Unit №%d' % unit,
+            'release_date': '', 'now_available': unit % 4 != 0,
+            'labels': '1 2',
+            'html_content': '<p>Welcome to unit %d.</p>' % unit,
+            'workflow_yaml': 'grader: auto\n', 'weight': 1.0,
+            'pre_assessment': None, 'post_assessment': None})
+        for lesson in xrange(num_lessons):
+            lessons.append({
+                'lesson_id': unit * num_lessons + lesson, 'unit_id': unit,
+                'title': u'Leçon %d.%d' % (unit, lesson),
+                'objectives': (
+                    u'<p>Learn <i>%d</i> → %d \U0001F600</p>' % (
+                        lesson, lesson + 1)),
+                'video': 'Kdg2drcUjYI', 'notes': '', 'duration': '',
+                'activity_title': '', 'activity_listed': True,
+                'scored': False, 'properties': {}})
+    return {
+        'version': 13, 'next_id': num_units * (num_lessons + 1),
+        'units': units, 'lessons': lessons}
+
+
+_CODEC_PAYLOADS = {
+    'course_memento': _make_course_memento_payload,
+    'event': _make_event_payload,
+    'progress': _make_progress_payload,
+}
+
+
+class JsonCodecTests(unittest.TestCase):
+    """Checks dumps() and loads() against their previous implementation."""
+
+    def test_payloads_are_byte_identical(self):
+        for name, make_payload in sorted(_CODEC_PAYLOADS.iteritems()):
+            payload = make_payload()
+            expected = _legacy_dumps(payload)
+            actual = transforms.dumps(payload)
+            self.assertEqual(type(expected), type(actual), name)
+            self.assertEqual(expected, actual, name)
+
+    def test_keyword_arguments_are_byte_identical(self):
+        payload = _make_event_payload(num_answers=5)
+        for kwargs in (
+                {'sort_keys': True},
+                {'indent': 4},
+                {'separators': (',', ':')},
+                {'ensure_ascii': True, 'sort_keys': True, 'indent': 2}):
+            self.assertEqual(
+                _legacy_dumps(payload, **dict(kwargs)),
+                transforms.dumps(payload, **dict(kwargs)))
+
+    def test_without_ensure_ascii_is_byte_identical(self):
+        payload = {
+            'utf8': u'café 中文 <br> \U0001F600'.encode('utf8'),
+            'ascii': 'plain'}
+        for kwargs in ({'ensure_ascii': False},
+                       {'ensure_ascii': False, 'sort_keys': True}):
+            self.assertEqual(
+                _legacy_dumps(payload, **dict(kwargs)),
+                transforms.dumps(payload, **dict(kwargs)))
+
+    def test_scalars_are_byte_identical(self):
+        for value in (None, True, 0, -3, 2 ** 70, 1.5, '', '<>',
+                      u'é<', [], {}, set([1])):
+            self.assertEqual(_legacy_dumps(value), transforms.dumps(value))
+
+    def test_custom_encoders_added_after_import_are_used(self):
+
+        class Point(object):
+
+            def __init__(self, x, y):
+                self.x = x
+                self.y = y
+
+        def encode_point(obj):
+            if isinstance(obj, Point):
+                return [obj.x, obj.y]
+            return None
+
+        transforms.CUSTOM_JSON_ENCODERS.append(encode_point)
+        try:
+            self.assertEqual(
+                '{"p": [1, 2]}', transforms.dumps({'p': Point(1, 2)}))
+        finally:
+            transforms.CUSTOM_JSON_ENCODERS.remove(encode_point)
+        with self.assertRaises(TypeError):
+            transforms.dumps({'p': Point(1, 2)})
+
+    def test_loads_round_trips(self):
+        for name, make_payload in sorted(_CODEC_PAYLOADS.iteritems()):
+            text = transforms.dumps(make_payload())
+            self.assertEqual(json.loads(text), transforms.loads(text), name)
+            self.assertEqual(
+                json.loads(text),
+                transforms.loads(transforms.JSON_XSSI_PREFIX + text), name)
+
+    def test_loads_passes_keyword_arguments(self):
+        self.assertEqual(
+            [('a', 1)],
+            transforms.loads('{"a": 1}', object_pairs_hook=list))
+
+    def test_benchmark(self):
+        """Times both dumps() implementations; the output must not change."""
+        repeats = 20
+        for name, make_payload in sorted(_CODEC_PAYLOADS.iteritems()):
+            payload = make_payload()
+            timings = []
+            for dumps in (_legacy_dumps, transforms.dumps):
+                start = time.time()
+                for _ in xrange(repeats):
+                    result = dumps(payload)
+                timings.append(time.time() - start)
+                self.assertEqual(_legacy_dumps(payload), result)
+            start = time.time()
+            for _ in xrange(repeats):
+                transforms.loads(result)
+            logging.info(
+                'JSON codec %s (%d bytes, x%d): legacy dumps %.3fs, '
+                'dumps %.3fs, loads %.3fs.', name, len(result), repeats,
+                timings[0], timings[1], time.time() - start)
+
+
 class SchemaValidationTests(unittest.TestCase):
 
     def test_mandatory_scalar_missing(self):
@@ -45,6 +45,17 @@ By default, all data types are downloaded.  You can specifically select or
 skip specific types using the --datastore_types and --exclude_types flags,
 respectively.
 
+Large downloads can be run in parallel with --workers=<NNN>. Each type is then
+split into --shards_per_type key ranges, and the ranges of all types are
+fetched concurrently. Rows are added to the archive as they arrive, as gzipped
+files of newline-delimited JSON, and the manifest records how far each range
+got so that --resume continues from there.
+
+With --export_format=columnar, each type is instead written as a typed,
+compressed columnar file (see models/columnar.py), which is several times
+smaller than JSON and lets analyses read just the columns they need. Archives
+in either format can be uploaded.
+
 3. Upload of datastore entities.  This feature is experimental.
 
 $ python etl.py upload datastore /cs101 server.apppot.com \
@@ -61,6 +72,8 @@ the same --privacy_secret (or all with no secret).
 
 Other flags for uploading are recommended:
     --resume:  Use this flag to permit an upload to resume where it left off.
+      Uploads record how many rows of each type they have written in a file
+      named after the archive with a .upload-progress.json suffix.
     --force_overwrite:  Unless this flag is specified, every entity to be
       uploaded is checked to see whether an entity with this key already
       exists in the datastore.  This takes substantial additional time.
@@ -69,6 +82,9 @@ Other flags for uploading are recommended:
     --batch_size=<NNN>:  Set this to larger values to group uploaded entities
       together for efficiency.  Higher values help, but give diminishing
       returns.  Start at around 100.
+    --workers=<NNN>:  Number of threads putting batches of entities.  Rows
+      are read from the archive one at a time, so memory use depends on
+      --batch_size and --workers rather than on the size of the archive.
     --datastore_types:  and/or --exclude_types   By default, all types in the
       specified .zip file are uploaded.  You may select or ignore specific types
       with these flags, respectively.
@@ -158,13 +174,21 @@ __author__ = [
 ]
 
 import argparse
+import collections
+import contextlib
+import cStringIO
 import functools
+import gzip
+import itertools
 import logging
+from multiprocessing import pool
 import os
 import random
 import re
 import shutil
 import sys
+import tempfile
+import threading
 import time
 import traceback
 import zipfile
@@ -174,16 +198,19 @@ import yaml
 # Placeholders for modules we'll import after setting up sys.path. This allows
 # us to avoid lint suppressions at every callsite.
 appengine_config = None
+columnar = None
 common_utils = None
 config = None
 courses = None
 crypto = None
+datastore = None
 datastore_types = None
 db = None
 entity_transforms = None
 etl_lib = None
 memcache = None
 metadata = None
+namespace_manager = None
 remote = None
 sites = None
 transforms = None
@@ -203,6 +230,11 @@ _DELETE_DATASTORE_CONFIRMATION_INPUT = 'YES, DELETE'
 # Default value of --port passed to the dev appserver. Keep this in sync
 # with the value in scripts/parse_start_args.sh's CB_PORT.
 _DEV_APPSERVER_DEFAULT_PORT = 8081
+
+# Strings. Formats datastore types may be downloaded in.
+_EXPORT_FORMAT_COLUMNAR = 'columnar'
+_EXPORT_FORMAT_JSON = 'json'
+_EXPORT_FORMATS = [_EXPORT_FORMAT_JSON, _EXPORT_FORMAT_COLUMNAR]
 # List of types which are not to be downloaded.  These are types which
 # are either known to be transient, disposable state classes (e.g.,
 # map/reduce's "_AE_... classes), or legacy types no longer required.
@@ -251,14 +283,27 @@ _MODE_UPLOAD = 'upload'
 _MODES = [_MODE_DELETE, _MODE_DOWNLOAD, _MODE_RUN, _MODE_UPLOAD]
 # List of modes where --force_overwrite is supported:
 _FORCE_OVERWRITE_MODES = [_MODE_DOWNLOAD, _MODE_UPLOAD]
+# Int. Number of rows written to each compressed part file by parallel
+# downloads.
+_PART_ROWS = 5000
+# String. Suffix of the gzipped newline-delimited JSON part files written by
+# parallel downloads.
+_PART_SUFFIX = '.ndjson.gz'
 # Int. The number of times to retry remote_api calls.
 _RETRIES = 3
+# Int. Number of __scatter__ keys sampled per shard when splitting a kind into
+# key ranges.
+_SCATTER_OVERSAMPLE = 32
 # String. Identifier for type corresponding to course definition data.
 _TYPE_COURSE = 'course'
 # String. Identifier for type corresponding to datastore entities.
 _TYPE_DATASTORE = 'datastore'
 # Number of items upon which to emit upload rate statistics.
 _UPLOAD_CHUNK_SIZE = 1000
+
+# String. Suffix appended to the archive path to name the file in which an
+# upload records how far it got, for --resume.
+_UPLOAD_PROGRESS_SUFFIX = '.upload-progress.json'
 # We support .zip files as one archive format.
 ARCHIVE_TYPE_ZIP = 'zip'
 # We support plain UNIX directory structure as an archive format
@@ -325,6 +370,15 @@ def create_args_parser():
             'If mode is %s, pass this flag to skip authentication and remote '
             'environment setup. Should only pass for jobs that run entirely '
             'locally and do not require RPCs') % _MODE_RUN)
+    parser.add_argument(
+        '--export_format', choices=_EXPORT_FORMATS,
+        default=_EXPORT_FORMAT_JSON,
+        help=(
+            'If mode is %s and type is %s, format each type is written in. '
+            '"%s" writes typed, compressed columns, in row groups, that can '
+            'be scanned one column at a time; see models/columnar.py. Not '
+            'supported with --workers above 1' % (
+                _MODE_DOWNLOAD, _TYPE_DATASTORE, _EXPORT_FORMAT_COLUMNAR)))
     parser.add_argument(
         '--force_overwrite', action='store_true',
         help=(
@@ -371,6 +425,21 @@ def create_args_parser():
     parser.add_argument(
         '--verbose', action='store_true',
         help='Tell about each item uploaded/downloaded.')
+    parser.add_argument(
+        '--workers', default=1,
+        help=(
+            'Number of threads fetching or putting entities in parallel. If '
+            'mode is %s, values above 1 write each type as gzipped newline-'
+            'delimited JSON parts, split into --shards_per_type key ranges. '
+            'If mode is %s, up to twice this many batches are in flight' % (
+                _MODE_DOWNLOAD, _MODE_UPLOAD)),
+        type=int)
+    parser.add_argument(
+        '--shards_per_type', default=4,
+        help=(
+            'If mode is %s and --workers is above 1, number of key ranges '
+            'each type is split into for parallel download' % _MODE_DOWNLOAD),
+        type=int)
     parser.add_argument(
         INTERNAL_FLAG_NAME, action='store_true',
         help=('Enable control flags needed only by developers.  '
@@ -526,6 +595,19 @@ class _AbstractArchive(object):
         """
         raise NotImplementedError()
 
+    def open_stream(self, path):
+        """Return a file-like object reading the archive entity at path.
+
+        Returns None if path is not in the archive. Callers must close it.
+
+        Args:
+            path: string. Path of file to read from the archive.
+
+        Returns:
+            File-like object supporting read(), readline() and iteration.
+        """
+        raise NotImplementedError()
+
     def open(self, mode):
         """Opens archive in the mode given by mode string ('r', 'w', 'a')."""
         raise NotImplementedError()
@@ -595,6 +677,13 @@ class _ZipArchive(_AbstractArchive):
         except KeyError:
             pass
 
+    def open_stream(self, path):
+        assert self._zipfile
+        try:
+            return self._zipfile.open(path)
+        except KeyError:
+            pass
+
     def open(self, mode):
         """Opens archive in the mode given by mode string ('r', 'w', 'a')."""
         assert not self._zipfile
@@ -638,6 +727,12 @@ class _DirectoryArchive(_AbstractArchive):
         with open(path, 'rb') as fp:
             return fp.read()
 
+    def open_stream(self, filename):
+        path = os.path.join(self.path, filename)
+        if not os.path.exists(path):
+            return None
+        return open(path, 'rb')
+
     def open(self, mode):
         if mode in ('w', 'a'):
             if not os.path.exists(self.path):
@@ -665,6 +760,9 @@ class _Manifest(object):
         self._entities = []
         self._raw = raw
         self._version = version
+        # Map of type name to list of dicts holding the key range and progress
+        # of each shard of a parallel download of that type.
+        self.shards = {}
 
     @classmethod
     def from_json(cls, json):
@@ -673,6 +771,7 @@ class _Manifest(object):
         instance = cls(parsed['raw'], parsed['version'])
         for entity in parsed['entities']:
             instance.add(_ManifestEntity(entity['path'], entity['is_draft']))
+        instance.shards = parsed.get('shards', {})
         return instance
 
     def add(self, entity):
@@ -703,6 +802,8 @@ class _Manifest(object):
             'raw': self.raw,
             'version': self.version,
         }
+        if self.shards:
+            manifest['shards'] = self.shards
         return transforms.dumps(manifest, indent=2, sort_keys=2)
 
 
@@ -729,6 +830,64 @@ class _ReadWrapper(object):
         return self._data
 
 
+class _UploadConflictError(Exception):
+    """Raised when an uploaded entity would overwrite an existing one."""
+
+
+class _UploadProgress(object):
+    """How far uploads of each type have got, persisted next to the archive.
+
+    For each namespace and type, records the number of leading rows known to
+    have been written, and the end of the rows that batches still in flight
+    may have partly written. Progress recorded for a different archive, or for
+    the same path since downloaded again, is ignored.
+    """
+
+    def __init__(self, path, archive_id, types):
+        self._archive_id = archive_id
+        self._path = path
+        self._types = types
+
+    @classmethod
+    def load(cls, archive_path):
+        """Returns the progress recorded for the archive at archive_path."""
+        path = archive_path.rstrip(os.sep) + _UPLOAD_PROGRESS_SUFFIX
+        archive_id = cls._get_archive_id(archive_path)
+        types = {}
+        if os.path.exists(path):
+            with open(path) as fp:
+                saved = transforms.loads(fp.read())
+            if saved.get('archive') == archive_id:
+                types = saved['types']
+            else:
+                _LOG.info(
+                    'Ignoring upload progress in %s; it was recorded for a '
+                    'different archive', path)
+        return cls(path, archive_id, types)
+
+    @classmethod
+    def _get_archive_id(cls, archive_path):
+        if os.path.isdir(archive_path):
+            archive_path = os.path.join(archive_path, _MANIFEST_FILENAME)
+        stat = os.stat(archive_path)
+        return '%d:%r' % (stat.st_size, stat.st_mtime)
+
+    def get(self, namespace, type_name):
+        """Returns (rows written, end of rows maybe written) or None."""
+        saved = self._types.get('%s:%s' % (namespace, type_name))
+        return (saved['offset'], saved['dirty_until']) if saved else None
+
+    def set(self, namespace, type_name, offset, dirty_until):
+        """Records progress for a type and saves it."""
+        self._types['%s:%s' % (namespace, type_name)] = {
+            'offset': offset, 'dirty_until': dirty_until}
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'w') as fp:
+            fp.write(transforms.dumps(
+                {'archive': self._archive_id, 'types': self._types}))
+        os.rename(temp_path, self._path)
+
+
 def _confirm_delete_datastore_or_die(kind_names, namespace, title):
     """Asks user to confirm action."""
     context = {
@@ -820,7 +979,9 @@ def _open_archive_for_write(context, course, archive_path, params):
     if params.resume:
         archive.open('a')
         model_names = archive.listdir('models')
-        already_done_names.update([n.replace('.json', '') for n in model_names])
+        already_done_names.update([
+            os.path.splitext(n)[0] for n in model_names
+            if n.endswith('.json') or n.endswith(columnar.SUFFIX)])
         manifest = archive.manifest
     else:
         archive.open('w')
@@ -879,7 +1040,7 @@ def _download_course(context, course, params, archive, already_done_names,
         courses.ADDITIONAL_ENTITIES_FOR_COURSE_IMPORT)
     type_names = set([entity.__name__ for entity in all_entities])
     _download_types(archive, manifest, type_names, already_done_names,
-                    params.batch_size, _IDENTITY_TRANSFORM)
+                    params, _IDENTITY_TRANSFORM)
 
 def _download_datastore(context, course, params, archive, already_done_types,
                         manifest):
@@ -902,18 +1063,92 @@ def _download_datastore(context, course, params, archive, already_done_types,
         params.privacy, privacy_secret)
     found_types = (requested_types & available_types)
     _download_types(archive, manifest, found_types, already_done_types,
-                    params.batch_size, privacy_transform_fn)
+                    params, privacy_transform_fn)
 
 
 def _download_types(archive, manifest, type_names, already_done_names,
-                    batch_size, transform):
+                    params, transform):
     for type_name in type_names & already_done_names:
         _LOG.info('Skipping already-downloaded type %s', type_name)
     type_names -= already_done_names
     _verify_downloadability(type_names)
-    _finalize_manifest(type_names, manifest, archive)
+    if params.workers > 1:
+        _download_types_in_parallel(
+            archive, manifest, type_names, params, transform)
+        return
+    suffix = _get_export_suffix(params)
+    _finalize_manifest(type_names, manifest, archive, suffix)
     for type_name in sorted(type_names):
-        _download_type(archive, manifest, type_name, batch_size, transform)
+        if suffix == columnar.SUFFIX:
+            _download_type_as_columnar(
+                archive, type_name, params.batch_size, transform)
+        else:
+            _download_type(
+                archive, manifest, type_name, params.batch_size, transform)
+
+
+def _get_export_suffix(params):
+    if (vars(params).get('export_format', _EXPORT_FORMAT_JSON) ==
+        _EXPORT_FORMAT_COLUMNAR):
+        return columnar.SUFFIX
+    return '.json'
+
+
+def _download_types_in_parallel(
+    archive, manifest, type_names, params, privacy_transform_fn):
+    """Downloads key-range shards of several types on a pool of threads.
+
+    Each shard is written to the archive as a series of gzipped files of
+    newline-delimited JSON rows, added as soon as each one is full. After
+    every part, the manifest records the last key written for the shard, so
+    that a --resume picks each shard up where it left off. The manifest is
+    written to the archive when all shards have finished or one has failed.
+    """
+    for type_name in sorted(type_names):
+        if type_name not in manifest.shards:
+            manifest.shards[type_name] = [
+                {'start': start, 'end': end, 'last_key': None, 'parts': 0,
+                 'done': False}
+                for start, end in _get_shard_key_ranges(
+                    db.class_for_kind(type_name), params.shards_per_type)]
+
+    work = []
+    for type_name in sorted(type_names):
+        for index, shard in enumerate(manifest.shards[type_name]):
+            if shard['done']:
+                _LOG.info(
+                    'Skipping already-downloaded shard %d of type %s',
+                    index, type_name)
+            else:
+                work.append((type_name, index, shard))
+
+    lock = threading.Lock()
+    stop = threading.Event()
+    namespace = namespace_manager.get_namespace()
+
+    def download_shard(item):
+        type_name, index, shard = item
+        try:
+            with common_utils.Namespace(namespace):
+                _download_shard(
+                    archive, manifest, lock, stop, type_name, index, shard,
+                    params.batch_size, privacy_transform_fn)
+        except Exception:
+            stop.set()
+            raise
+
+    _LOG.info(
+        'Downloading %d shards of %d types with %d workers', len(work),
+        len(type_names), params.workers)
+    workers = pool.ThreadPool(params.workers)
+    try:
+        for _ in workers.imap_unordered(download_shard, work):
+            pass
+    finally:
+        workers.close()
+        workers.join()
+        with lock:
+            archive.add(_MANIFEST_FILENAME, str(manifest))
 
 
 def _verify_downloadability(type_names):
@@ -939,14 +1174,13 @@ def _verify_downloadability(type_names):
                  'or add them to the --exclude_types list.')
 
 
-def _finalize_manifest(type_names, manifest, archive):
+def _finalize_manifest(type_names, manifest, archive, suffix):
     if archive.manifest:
         return  # We are resuming; manifest has already been written.
 
     for type_name in type_names:
-        json_name = type_name + '.json'
         internal_path = _AbstractArchive.get_internal_path(
-            json_name, prefix=_ARCHIVE_PATH_PREFIX_MODELS)
+            type_name + suffix, prefix=_ARCHIVE_PATH_PREFIX_MODELS)
         manifest.add(_ManifestEntity(internal_path, False))
     archive.add(_MANIFEST_FILENAME, str(manifest))
 
@@ -979,6 +1213,44 @@ def _download_type(
     os.remove(json_file.name)
 
 
+def _download_type_as_columnar(
+    archive, type_name, batch_size, privacy_transform_fn):
+    """Downloads a type as a columnar file and adds it to the archive."""
+    model_class = db.class_for_kind(type_name)
+    path = os.path.join(
+        os.path.dirname(archive.path), type_name + columnar.SUFFIX)
+    _LOG.info(
+        'Adding entities of type %s to temporary file %s', type_name, path)
+    with open(path, 'wb') as fp:
+        writer = columnar.ColumnarWriter(
+            fp, _get_columnar_schema_properties(model_class),
+            metadata={'type': type_name})
+        _process_models(
+            model_class, batch_size,
+            model_map_fn=lambda model: writer.write(transforms.dict_to_json(
+                _get_entity_dict(model, privacy_transform_fn))))
+        writer.close()
+    internal_path = _AbstractArchive.get_internal_path(
+        os.path.basename(path), prefix=_ARCHIVE_PATH_PREFIX_MODELS)
+
+    _LOG.info('Adding %s to archive', internal_path)
+    archive.add_local_file(path, internal_path)
+
+    _LOG.info('Removing temporary file ' + path)
+    os.remove(path)
+
+
+def _get_columnar_schema_properties(model_class):
+    """Returns the columns of rows from _get_entity_dict for a class."""
+    properties = collections.OrderedDict([
+        ('key.id', {'type': 'integer'}),
+        ('key.name', {'type': 'string'})])
+    properties.update(
+        entity_transforms.get_schema_for_entity_unsafe(model_class)
+        .get_json_schema_dict()['properties'])
+    return properties
+
+
 def _filter_filesystem_files(files):
     """Filters out unnecessary files from a local filesystem.
 
@@ -1077,6 +1349,7 @@ def _import_modules_into_global_scope():
     # pylint: disable=global-variable-not-assigned,
     # pylint: disable=redefined-outer-name,unused-variable
     global appengine_config
+    global columnar
     global memcache
     global datastore_types
     global db
@@ -1087,7 +1360,9 @@ def _import_modules_into_global_scope():
     global config
     global courses
     global crypto
+    global datastore
     global models
+    global namespace_manager
     global sites
     global transforms
     global vfs
@@ -1096,11 +1371,14 @@ def _import_modules_into_global_scope():
     try:
         import appengine_config
         from google.appengine.api import memcache
+        from google.appengine.api import datastore
         from google.appengine.api import datastore_types
+        from google.appengine.api import namespace_manager
         from google.appengine.ext import db
         from google.appengine.ext.db import metadata
         from common import crypto
         from common import utils as common_utils
+        from models import columnar
         from models import config
         from controllers import sites
         from models import courses
@@ -1237,6 +1515,116 @@ def _process_models_batch(
     return count, cursor
 
 
+@_retry(message='Sampling key ranges failed; retrying')
+def _get_shard_key_ranges(model_class, shard_count):
+    """Splits the keys of a kind into up to shard_count contiguous ranges.
+
+    Uses the datastore's __scatter__ sample of keys, as the mapreduce library
+    does, to pick boundaries. Kinds too small to have scatter keys are not
+    split.
+
+    Args:
+        model_class: db.Model subclass. The kind to split.
+        shard_count: int. The desired number of ranges.
+
+    Returns:
+        List of (start, end) pairs of encoded key strings, where start is
+        inclusive, end is exclusive and None means unbounded.
+    """
+    if shard_count <= 1:
+        return [(None, None)]
+    query = datastore.Query(model_class.kind(), keys_only=True)
+    query.Order('__scatter__')
+    keys = sorted(query.Get(shard_count * _SCATTER_OVERSAMPLE))
+    step = len(keys) / float(shard_count)
+    boundaries = []
+    for i in xrange(1, shard_count):
+        key = keys[int(i * step)] if keys else None
+        if key and (not boundaries or key > boundaries[-1]):
+            boundaries.append(key)
+    boundaries = [None] + [str(key) for key in boundaries] + [None]
+    return zip(boundaries[:-1], boundaries[1:])
+
+
+def _download_shard(
+    archive, manifest, lock, stop, type_name, index, shard, batch_size,
+    privacy_transform_fn):
+    """Downloads one key range of a kind into gzipped NDJSON parts."""
+    model_class = db.class_for_kind(type_name)
+    rows = []
+    last_key = shard['last_key']
+    while not stop.is_set():
+        results = _fetch_shard_batch(
+            model_class, shard['start'], shard['end'], last_key, batch_size)
+        for model in results:
+            rows.append(transforms.dumps(transforms.dict_to_json(
+                _get_entity_dict(model, privacy_transform_fn))))
+        if results:
+            last_key = str(results[-1].key())
+        if len(rows) >= _PART_ROWS or (rows and len(results) < batch_size):
+            _add_shard_part(
+                archive, manifest, lock, type_name, index, shard, rows,
+                last_key)
+            rows = []
+        if len(results) < batch_size:
+            with lock:
+                shard['done'] = True
+            _LOG.info(
+                'Finished shard %d of type %s with %d parts', index,
+                type_name, shard['parts'])
+            return
+
+
+@_retry(message='Fetching datastore entity batch failed; retrying')
+def _fetch_shard_batch(model_class, start, end, last_key, batch_size):
+    query = model_class.all()
+    if last_key:
+        query.filter('__key__ >', db.Key(last_key))
+    elif start:
+        query.filter('__key__ >=', db.Key(start))
+    if end:
+        query.filter('__key__ <', db.Key(end))
+    query.order('__key__')
+    return query.fetch(limit=batch_size)
+
+
+def _add_shard_part(
+    archive, manifest, lock, type_name, index, shard, rows, last_key):
+    buf = cStringIO.StringIO()
+    gz = gzip.GzipFile(fileobj=buf, mode='wb')
+    for row in rows:
+        gz.write(row)
+        gz.write('\n')
+    gz.close()
+    with lock:
+        internal_path = _AbstractArchive.get_internal_path(
+            _get_part_name(type_name, index, shard['parts']),
+            prefix=_ARCHIVE_PATH_PREFIX_MODELS)
+        archive.add(internal_path, buf.getvalue())
+        manifest.add(_ManifestEntity(internal_path, False))
+        shard['parts'] += 1
+        shard['last_key'] = last_key
+    _LOG.info('Added %d rows to archive as %s', len(rows), internal_path)
+
+
+def _get_part_name(type_name, shard_index, part_index):
+    return '%s/%04d-%06d%s' % (type_name, shard_index, part_index, _PART_SUFFIX)
+
+
+def _iter_part_rows(data):
+    """Yields rows of a gzipped NDJSON part written by a parallel download."""
+    for line in gzip.GzipFile(fileobj=cStringIO.StringIO(data), mode='rb'):
+        line = line.strip()
+        if line:
+            yield transforms.loads(line)
+
+
+def _count_part_rows(data):
+    return sum(
+        1 for line in gzip.GzipFile(fileobj=cStringIO.StringIO(data), mode='rb')
+        if line.strip())
+
+
 def _get_entity_dict(model, privacy_transform_fn):
     key = model.safe_key(model.key(), privacy_transform_fn)
 
@@ -1316,7 +1704,8 @@ def _can_upload_entity_to_course(entity):
     head, tail = os.path.split(entity.path)
     if head == _ARCHIVE_PATH_PREFIX_MODELS and tail == _COURSE_YAML_PATH_SUFFIX:
         return True
-    return head != _ARCHIVE_PATH_PREFIX_MODELS
+    return (head != _ARCHIVE_PATH_PREFIX_MODELS and
+            not tail.endswith(_PART_SUFFIX))
 
 
 def _upload_course(context, params):
@@ -1425,7 +1814,9 @@ def _determine_type_names(params, included_type_names, archive):
     for entity in archive.manifest.entities:
         head, tail = os.path.split(entity.path)
         if head == _ARCHIVE_PATH_PREFIX_MODELS:
-            zipfile_type_names.add(tail.replace('.json', ''))
+            zipfile_type_names.add(os.path.splitext(tail)[0])
+        elif tail.endswith(_PART_SUFFIX):
+            zipfile_type_names.add(os.path.basename(head))
     if not zipfile_type_names:
         _die('No entity types to upload found in archive file "%s"' %
              params.archive_path)
@@ -1462,30 +1853,23 @@ def _upload_datastore(params, included_type_names):
 
     type_names = _determine_type_names(params, included_type_names, archive)
     entity_classes = _get_classes_for_type_names(type_names)
+    upload_progress = _UploadProgress.load(params.archive_path)
     total_count = 0
     total_start = time.time()
     for entity_class in entity_classes:
         _LOG.info('-------------------------------------------------------')
         _LOG.info('Adding entities of type %s', entity_class.__name__)
 
-        # Get JSON contents from .zip file
-        json_path = _AbstractArchive.get_internal_path(
-            '%s.json' % entity_class.__name__,
-            prefix=_ARCHIVE_PATH_PREFIX_MODELS)
-        _LOG.info('Fetching data from .zip archive')
-        json_text = archive.get(json_path)
-        if not json_text:
-            _LOG.info(
-                'Unable to find data file %s for entity %s; skipping',
-                json_path, entity_class.__name__)
+        archived_rows = _open_archived_rows(archive, entity_class.__name__)
+        if archived_rows is None:
             continue
-        _LOG.info('Parsing data into JSON')
-        json_object = transforms.loads(json_text)
+        num_entities, read_rows = archived_rows
         schema = (entity_transforms
                   .get_schema_for_entity(entity_class)
                   .get_json_schema_dict())
         total_count += _upload_entities_for_class(
-            entity_class, schema, json_object['rows'], params)
+            entity_class, schema, num_entities, read_rows, params,
+            upload_progress)
     _LOG.info('Flushing all caches')
     memcache.flush_all()
     total_end = time.time()
@@ -1495,116 +1879,222 @@ def _upload_datastore(params, included_type_names):
         'y' if total_count == 1 else 'ies', int(total_end - total_start))
 
 
-def _upload_entities_for_class(entity_class, schema, entities, params):
-    num_entities = len(entities)
-    i = 0
-    is_first_batch_after_resume = False
+def _open_archived_rows(archive, type_name):
+    """Returns the row count and a row reader for a type, or None if absent.
 
-    # Binary search to find first un-uploaded entity.
+    The reader takes the number of leading rows to skip and returns an
+    iterator over the rest. Rows are decoded one at a time as they are
+    iterated, so no type has to fit in memory.
+    """
+    part_paths = sorted(
+        entity.path for entity in archive.manifest.entities
+        if entity.path.endswith(_PART_SUFFIX) and
+        os.path.basename(os.path.dirname(entity.path)) == type_name)
+    if part_paths:
+        _LOG.info('Counting rows in %d archived parts', len(part_paths))
+        counts = [_count_part_rows(archive.get(path)) for path in part_paths]
+
+        def read_parts(skip):
+            for path, count in zip(part_paths, counts):
+                if skip >= count:
+                    skip -= count
+                    continue
+                rows = _iter_part_rows(archive.get(path))
+                for row in itertools.islice(rows, skip, None):
+                    yield row
+                skip = 0
+
+        return sum(counts), read_parts
+
+    columnar_path = _AbstractArchive.get_internal_path(
+        type_name + columnar.SUFFIX, prefix=_ARCHIVE_PATH_PREFIX_MODELS)
+    stream = archive.open_stream(columnar_path)
+    if stream:
+        _LOG.info('Reading columnar file %s', columnar_path)
+        reader = columnar.ColumnarReader(_get_seekable(stream))
+        return reader.num_rows, reader.iter_rows
+
+    json_path = _AbstractArchive.get_internal_path(
+        '%s.json' % type_name, prefix=_ARCHIVE_PATH_PREFIX_MODELS)
+    _LOG.info('Counting rows in archived file %s', json_path)
+    stream = archive.open_stream(json_path)
+    if not stream:
+        _LOG.info(
+            'Unable to find data file %s for entity %s; skipping',
+            json_path, type_name)
+        return None
+    with contextlib.closing(stream):
+        # Besides one line per row, there is a line each for the head and
+        # the tail of the enclosing JSON object.
+        count = max(0, sum(1 for _ in stream) - 2)
+
+    def read_json_file(skip):
+        json_file = transforms.JsonFile.for_stream(
+            archive.open_stream(json_path))
+        try:
+            json_file.skip(skip)
+            for row in json_file:
+                yield row
+        finally:
+            json_file.close()
+
+    return count, read_json_file
+
+
+def _get_seekable(stream):
+    """Returns stream, or a temporary file copy of it if it is not a file."""
+    if isinstance(stream, file):
+        return stream
+    with contextlib.closing(stream):
+        copy = tempfile.TemporaryFile()
+        shutil.copyfileobj(stream, copy)
+    return copy
+
+
+def _upload_entities_for_class(
+    entity_class, schema, num_entities, read_rows, params, upload_progress):
+    """Uploads the rows of a type as batches put by a pool of threads.
+
+    At most two batches per worker are in flight, so memory use does not
+    grow with the number of rows. Each time the oldest batch completes, the
+    count of leading rows written and the end of the rows that may have been
+    partly written are saved to upload_progress. --resume starts from the
+    former, and does not treat entities up to the latter as conflicts.
+    """
+    type_name = entity_class.__name__
+    namespace = namespace_manager.get_namespace()
+    i = 0
+    recover_until = 0
     if params.resume:
-        _LOG.info('Resuming upload; searching for first non-uploaded entry.')
-        start = 0
-        end = num_entities
-        while start < end:
-            guess = (start + end) / 2
-            if params.verbose:
-                _LOG.info('Checking whether instance %d exists', guess)
-            key, _ = _get_entity_key(entity_class, entities[guess])
-            if db.get(key):
-                start = guess + 1
-            else:
-                end = guess
-        i = start
-
-        # If we are doing things in batches, it is possible that the previous
-        # batch only partially completed.  Experiments on a dev instance show
-        # that partial writes do not proceed in the order the items are
-        # supplied.  I see no reason to trust that production will be any
-        # friendlier.  Check that there are no missed entities up to one
-        # chunk back from where we are planning on restarting the upload.
-        if params.batch_size > 1 and i > 0:
-            start = max(0, i - params.batch_size)
-            end = min(start + params.batch_size, len(entities))
-            is_first_batch_after_resume = True
-            existing = _find_existing_items(entity_class, entities, start, end)
-            if None in existing:
-                if start > 0:
-                    _LOG.info('Previous chunk only partially completed; '
-                              'backing up from found location by one full '
-                              'chunk just in case.')
-                i = start
-
+        saved = upload_progress.get(namespace, type_name)
+        if saved:
+            i, recover_until = saved
+            i = min(i, num_entities)
+        else:
+            # No progress recorded, as by an etl.py before it was, so any
+            # entity already present is taken to be from an earlier attempt.
+            _LOG.info('No upload progress recorded for %s; not overwriting '
+                      'entities that already exist.', type_name)
+            recover_until = num_entities
         if i < num_entities:
             _LOG.info('Resuming upload at item number %d of %d.', i,
                       num_entities)
         else:
             _LOG.info('All %d entities already uploaded; skipping.',
                       num_entities)
+    if i >= num_entities:
+        return 0
+
+    def upload_batch(rows, start):
+        with common_utils.Namespace(namespace):
+            return _upload_batch(
+                entity_class, schema, rows, start, recover_until, params)
 
-    # Proceed to end of entities (starting from 0 if not resuming)
     # pylint: disable=protected-access
     progress = etl_lib._ProgressReporter(
-        _LOG, 'Uploaded', entity_class.__name__, _UPLOAD_CHUNK_SIZE,
-        len(entities) - i)
-    if i < num_entities:
-        _LOG.info('Starting upload of entities')
-        while i < num_entities:
-            quantity = _upload_batch(entity_class, schema, entities, i,
-                                     is_first_batch_after_resume, params)
+        _LOG, 'Uploaded', type_name, _UPLOAD_CHUNK_SIZE, num_entities - i)
+    max_in_flight = 2 * params.workers
+    dirty_until = max(recover_until, i + max_in_flight * params.batch_size)
+    upload_progress.set(namespace, type_name, i, dirty_until)
+    _LOG.info('Starting upload of entities')
+    batches = _iter_batches(read_rows(i), params.batch_size)
+    pending = collections.deque()
+    submitted_until = i
+    workers = pool.ThreadPool(params.workers)
+    try:
+        while True:
+            rows = next(batches, None)
+            if rows:
+                pending.append(workers.apply_async(
+                    upload_batch, (rows, submitted_until)))
+                submitted_until += len(rows)
+                if len(pending) < max_in_flight:
+                    continue
+            if not pending:
+                break
+            quantity = pending.popleft().get()
             progress.count(quantity)
             i += quantity
-            is_first_batch_after_resume = False
-
-        progress.report()
-        _LOG.info('Upload of %s complete', entity_class.__name__)
+            # Until the next batch completes, at most one more is submitted.
+            dirty_until = max(
+                recover_until, submitted_until + params.batch_size)
+            upload_progress.set(namespace, type_name, i, dirty_until)
+    except _UploadConflictError as e:
+        _die(str(e))
+    finally:
+        workers.close()
+        workers.join()
+
+    progress.report()
+    _LOG.info('Upload of %s complete', type_name)
     return progress.get_count()
 
 
-def _find_existing_items(entity_class, entities, start, end):
-    keys = []
-    for i in xrange(start, end):
-        key, _ = _get_entity_key(entity_class, entities[i])
-        keys.append(key)
+def _iter_batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@_retry(message='Checking for existing entities failed; retrying')
+def _find_existing_items(keys):
     return db.get(keys)
 
 
 @_retry(message='Uploading batch of entities failed; retrying')
-def _upload_batch(entity_class, schema, entities, start,
-                  is_first_batch_after_resume, params):
-    end = min(start + params.batch_size, len(entities))
+def _put_entities(entities):
+    db.put(entities)
+
+
+def _upload_batch(entity_class, schema, rows, start, recover_until, params):
+    """Puts rows numbered from start as entities; returns how many.
+
+    Raises:
+        _UploadConflictError: if an entity already exists, unless
+            --force_overwrite is set or the row is below recover_until and so
+            may have been written by an earlier, interrupted upload.
+    """
+    keys = [_get_entity_key(entity_class, row) for row in rows]
 
     # See what elements we want to upload already exist in the datastore.
     if params.force_overwrite:
-        existing = []
+        existing = [None] * len(rows)
     else:
-        existing = _find_existing_items(entity_class, entities, start, end)
+        existing = _find_existing_items([key for key, _ in keys])
 
     # Build up array of things to batch-put to DB.
     to_put = []
-    for i in xrange(start, end):
-        key, id_or_name = _get_entity_key(entity_class, entities[i])
+    for offset, row in enumerate(rows):
+        i = start + offset
+        key, id_or_name = keys[offset]
         if params.force_overwrite:
             if params.verbose:
                 _LOG.info('Forcing write of object #%d with key %s',
                           i, id_or_name)
-        elif existing[i - start]:
-            if is_first_batch_after_resume:
+        elif existing[offset]:
+            if i < recover_until:
                 if params.verbose:
                     _LOG.info('Not overwriting object #%d with key %s '
-                              'written in previous batch which we are '
-                              'now recovering.', i, id_or_name)
+                              'written by the upload we are now '
+                              'recovering.', i, id_or_name)
                 continue
             else:
-                _die('Object #%d of class %s with key %s already exists.' % (
-                    i, entity_class.__name__, id_or_name))
+                raise _UploadConflictError(
+                    'Object #%d of class %s with key %s already exists.' % (
+                        i, entity_class.__name__, id_or_name))
         else:
             if params.verbose:
                 _LOG.info('Adding new object #%d with key %s', i, id_or_name)
-        to_put.append(_build_entity(entity_class, schema, entities[i], key))
+        to_put.append(_build_entity(entity_class, schema, row, key))
     if params.verbose:
-        _LOG.info('Sending batch of %d objects to DB', end - start)
-    db.put(to_put)
-    return end - start
+        _LOG.info('Sending batch of %d objects to DB', len(to_put))
+    _put_entities(to_put)
+    return len(rows)
 
 
 def _get_entity_key(entity_class, entity):
@@ -1638,6 +2128,14 @@ def _validate_arguments(parsed_args):
         _die('--archive_path missing')
     if parsed_args.batch_size < 1:
         _die('--batch_size must be a positive value')
+    if parsed_args.workers < 1 or parsed_args.shards_per_type < 1:
+        _die('--workers and --shards_per_type must be positive values')
+    if parsed_args.export_format != _EXPORT_FORMAT_JSON and (
+            parsed_args.mode != _MODE_DOWNLOAD or
+            parsed_args.type != _TYPE_DATASTORE or parsed_args.workers > 1):
+        _die(
+            '--export_format supported only if mode is %s, type is %s and '
+            '--workers is 1' % (_MODE_DOWNLOAD, _TYPE_DATASTORE))
     if (parsed_args.mode == _MODE_DOWNLOAD and
         os.path.exists(parsed_args.archive_path) and
         not parsed_args.force_overwrite and
@@ -19,9 +19,18 @@ __author__ = [
     'juliaoh@google.com (Julia Oh)',
 ]
 
+import cPickle
 import csv
+import heapq
+import itertools
+import logging
+import multiprocessing
+import operator
 import os
+import shutil
 import sys
+import tempfile
+import time
 from xml.etree import ElementTree
 
 import mrs
@@ -29,6 +38,15 @@ import mrs
 from models import transforms
 from tools.etl import etl_lib
 
+_LOG = logging.getLogger('coursebuilder.tools.etl')
+
+# Int. Number of map output pairs buffered per task before they are sorted and
+# spilled to disk.
+_SPILL_PAIRS = 100000
+
+# Int. Bytes read at a time when counting lines.
+_READ_SIZE = 1024 * 1024
+
 
 class MapReduceJob(etl_lib.Job):
     """Parent classes for custom jobs that run a mapreduce.
@@ -37,6 +55,9 @@ class MapReduceJob(etl_lib.Job):
     python etl.py run path.to.my.job / appid server.appspot.com \
         --disable_remote \
         --job_args='path_to_input_file path_to_output_directory'
+
+    Add --local_workers=<N> to --job_args to run the job with LocalRunner
+    on N local processes instead of with mrs.
     """
 
     # Subclass of mrs.MapReduce; override in child.
@@ -48,12 +69,26 @@ class MapReduceJob(etl_lib.Job):
             'file', help='Absolute path of the input file', type=str)
         self.parser.add_argument(
             'output', help='Absolute path of the output directory', type=str)
+        self.parser.add_argument(
+            '--local_workers', default=0, type=int,
+            help=(
+                'If set, run map() and reduce() with LocalRunner on this many '
+                'local processes rather than with mrs'))
 
     def main(self):
         if not os.path.exists(self.args.file):
             sys.exit('Input file %s not found' % self.args.file)
         if not os.path.exists(self.args.output):
             sys.exit('Output directory %s not found' % self.args.output)
+        if self.args.local_workers:
+            if not LocalRunner.can_run(self.MAPREDUCE_CLASS):
+                sys.exit(
+                    '%s overrides run(); it cannot be run with '
+                    '--local_workers' % self.MAPREDUCE_CLASS.__name__)
+            LocalRunner(
+                self.MAPREDUCE_CLASS, self.args.file, self.args.output,
+                workers=self.args.local_workers).run()
+            return
         mrs.main(self.MAPREDUCE_CLASS, args=self._parsed_etl_args.job_args)
 
 
@@ -443,3 +478,263 @@ mrs.fileformats.writer_map['csv'] = CsvWriter
 mrs.fileformats.writer_map['json'] = JsonWriter
 mrs.fileformats.writer_map['txt'] = TextWriter
 mrs.fileformats.writer_map['xml'] = XmlWriter
+
+
+class LocalRunner(object):
+    """Runs the map() and reduce() of a MapReduceBase on local processes.
+
+    The input file is cut into byte ranges on line boundaries, one or more per
+    worker. Each map task calls map() on the lines of its range, keyed by line
+    number as mrs does, and hash-partitions the output pairs by key. Whenever
+    a task has buffered spill_pairs pairs, it passes each key's values
+    through combine(), if the class has one, sorts them by key and spills them
+    to a file per partition. Each reduce task merges the sorted spill files of
+    its partition and calls reduce() once per key, writing its output pairs in
+    key order. Finally the outputs of all partitions are merged, still in key
+    order, through the class's WRITER_CLASS into one file in the output
+    directory.
+
+    Throughput of each phase is logged as tasks complete.
+
+    Only jobs whose work is done by the standard single map and reduce can be
+    run this way; see can_run().
+    """
+
+    def __init__(self, mapreduce_class, input_path, output_dir, workers=None,
+                 spill_pairs=_SPILL_PAIRS, splits_per_worker=4):
+        """Constructs a new runner.
+
+        Args:
+            mapreduce_class: subclass of MapReduceBase to run. Must be
+                importable by worker processes.
+            input_path: string. Path of the file whose lines are mapped.
+            output_dir: string. Directory to write the output file to.
+            workers: int or None. Number of processes; None means one per CPU.
+            spill_pairs: int. Map output pairs buffered before spilling.
+            splits_per_worker: int. Input ranges per worker; more balance the
+                load better when rows vary in cost.
+        """
+        self._mapreduce_class = mapreduce_class
+        self._input_path = input_path
+        self._output_dir = output_dir
+        self._workers = workers or multiprocessing.cpu_count()
+        self._spill_pairs = spill_pairs
+        self._splits_per_worker = splits_per_worker
+
+    @classmethod
+    def can_run(cls, mapreduce_class):
+        """Whether mapreduce_class leaves run() to mrs, so has one map phase."""
+        return (mapreduce_class.run.im_func is
+                mrs.MapReduce.run.im_func)
+
+    def run(self):
+        """Runs the job; returns the path of the output file."""
+        start = time.time()
+        spill_dir = tempfile.mkdtemp(dir=self._output_dir)
+        pool = multiprocessing.Pool(self._workers)
+        try:
+            ranges = self._get_ranges()
+            first_line_numbers = [0]
+            for count in pool.map(_count_lines, [
+                    (self._input_path, range_start, range_end)
+                    for range_start, range_end in ranges]):
+                first_line_numbers.append(first_line_numbers[-1] + count)
+            num_partitions = self._workers
+            map_tasks = [
+                (self._mapreduce_class, self._input_path, range_start,
+                 range_end, first_line_numbers[index], num_partitions,
+                 os.path.join(spill_dir, 'map-%05d' % index),
+                 self._spill_pairs)
+                for index, (range_start, range_end) in enumerate(ranges)]
+            spills = [[] for _ in xrange(num_partitions)]
+            progress = _PhaseProgress('Mapped', 'lines', len(map_tasks))
+            for lines, pairs, task_spills in pool.imap_unordered(
+                    _run_map_task, map_tasks):
+                progress.add(lines, pairs)
+                for partition, paths in enumerate(task_spills):
+                    spills[partition].extend(paths)
+            progress.report_done()
+
+            reduce_tasks = [
+                (self._mapreduce_class, paths,
+                 os.path.join(spill_dir, 'reduce-%05d' % partition))
+                for partition, paths in enumerate(spills)]
+            progress = _PhaseProgress('Reduced', 'keys', len(reduce_tasks))
+            reduce_outputs = []
+            for keys, outputs, path in pool.imap_unordered(
+                    _run_reduce_task, reduce_tasks):
+                progress.add(keys, outputs)
+                reduce_outputs.append(path)
+            progress.report_done()
+            pool.close()
+
+            output_path = self._write_output(reduce_outputs)
+        except:  # Stop workers on any failure. pylint: disable=bare-except
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            shutil.rmtree(spill_dir)
+        _LOG.info(
+            'Wrote %s; %d input lines in %.1f seconds', output_path,
+            first_line_numbers[-1], time.time() - start)
+        return output_path
+
+    def _get_ranges(self):
+        """Returns (start, end) byte ranges of the input on line boundaries."""
+        size = os.path.getsize(self._input_path)
+        num_splits = max(1, self._workers * self._splits_per_worker)
+        boundaries = [0]
+        with open(self._input_path, 'rb') as fp:
+            for index in xrange(1, num_splits):
+                offset = size * index / num_splits
+                if offset <= boundaries[-1]:
+                    continue
+                fp.seek(offset - 1)
+                fp.readline()
+                if fp.tell() > boundaries[-1] and fp.tell() < size:
+                    boundaries.append(fp.tell())
+        boundaries.append(size)
+        return zip(boundaries[:-1], boundaries[1:])
+
+    def _write_output(self, reduce_outputs):
+        writer_class = self._mapreduce_class.WRITER_CLASS
+        path = os.path.join(self._output_dir, 'output.%s' % writer_class.ext)
+        with open(path, 'wb') as fp:
+            writer = writer_class(fp)
+            for key, _, _, value in heapq.merge(
+                    *[_iter_run(index, output_path)
+                      for index, output_path in enumerate(reduce_outputs)]):
+                writer.writepair((key, value))
+            writer.finish()
+        return path
+
+
+class _PhaseProgress(object):
+    """Logs the throughput of a phase of LocalRunner as its tasks complete."""
+
+    def __init__(self, verb, noun, num_tasks):
+        self._verb = verb
+        self._noun = noun
+        self._num_tasks = num_tasks
+        self._done_tasks = 0
+        self._inputs = 0
+        self._outputs = 0
+        self._start = time.time()
+
+    def add(self, inputs, outputs):
+        self._done_tasks += 1
+        self._inputs += inputs
+        self._outputs += outputs
+        elapsed = max(time.time() - self._start, 1e-6)
+        _LOG.info(
+            '%s %d of %d tasks: %d %s, %d outputs, %d %s/second',
+            self._verb, self._done_tasks, self._num_tasks, self._inputs,
+            self._noun, self._outputs, self._inputs / elapsed, self._noun)
+
+    def report_done(self):
+        _LOG.info(
+            '%s %d %s in %.1f seconds', self._verb, self._inputs, self._noun,
+            time.time() - self._start)
+
+
+def _count_lines((path, start, end)):
+    """Returns the number of lines starting in [start, end) of a file."""
+    count = 0
+    last = '\n'
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = fp.read(min(_READ_SIZE, remaining))
+            if not data:
+                break
+            count += data.count('\n')
+            last = data[-1]
+            remaining -= len(data)
+    return count + (0 if last == '\n' else 1)
+
+
+def _run_map_task((mapreduce_class, path, start, end, first_line_number,
+                   num_partitions, spill_prefix, spill_pairs)):
+    """Maps the lines in [start, end) of a file; spills sorted partitions."""
+    job = mapreduce_class(None, [path])
+    combine = getattr(job, 'combine', None)
+    buffers = [[] for _ in xrange(num_partitions)]
+    spills = [[] for _ in xrange(num_partitions)]
+    buffered = 0
+    lines = 0
+    pairs = 0
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        while fp.tell() < end:
+            line = fp.readline()
+            if not line:
+                break
+            for key, value in job.map(first_line_number + lines, line):
+                buffers[hash(key) % num_partitions].append((key, value))
+                buffered += 1
+            lines += 1
+            if buffered >= spill_pairs:
+                _spill(buffers, spills, spill_prefix, combine)
+                pairs += buffered
+                buffered = 0
+    _spill(buffers, spills, spill_prefix, combine)
+    return lines, pairs + buffered, spills
+
+
+def _spill(buffers, spills, spill_prefix, combine):
+    """Sorts, combines and writes buffered pairs to a new file per partition."""
+    for partition, buffered_pairs in enumerate(buffers):
+        if not buffered_pairs:
+            continue
+        buffered_pairs.sort(key=operator.itemgetter(0))
+        if combine:
+            buffered_pairs = (
+                (key, value)
+                for key, group in itertools.groupby(
+                    buffered_pairs, key=operator.itemgetter(0))
+                for value in combine(key, (value for _, value in group)))
+        path = '%s-%05d-%05d' % (
+            spill_prefix, partition, len(spills[partition]))
+        _write_run(path, buffered_pairs)
+        spills[partition].append(path)
+        buffers[partition] = []
+
+
+def _run_reduce_task((mapreduce_class, spill_paths, output_path)):
+    """Merges the sorted spills of a partition and reduces each key."""
+    job = mapreduce_class(None, [])
+    merged = heapq.merge(
+        *[_iter_run(index, path) for index, path in enumerate(spill_paths)])
+    keys = 0
+    outputs = 0
+    with open(output_path, 'wb') as fp:
+        for key, group in itertools.groupby(
+                merged, key=operator.itemgetter(0)):
+            keys += 1
+            for value in job.reduce(key, (item[3] for item in group)):
+                cPickle.dump((key, value), fp, cPickle.HIGHEST_PROTOCOL)
+                outputs += 1
+    return keys, outputs, output_path
+
+
+def _write_run(path, pairs):
+    with open(path, 'wb') as fp:
+        for pair in pairs:
+            cPickle.dump(pair, fp, cPickle.HIGHEST_PROTOCOL)
+
+
+def _iter_run(run_index, path):
+    """Yields (key, run_index, sequence, value) from a file of sorted pairs.
+
+    The run index and sequence number order pairs with equal keys without
+    comparing their values, and keep the order they were written in.
+    """
+    with open(path, 'rb') as fp:
+        for sequence in itertools.count():
+            try:
+                key, value = cPickle.load(fp)
+            except EOFError:
+                return
+            yield key, run_index, sequence, value